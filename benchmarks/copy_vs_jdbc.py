@@ -0,0 +1,143 @@
+"""
+Benchmark the COPY extraction engine against Spark's JDBC reader.
+
+Needs a local Postgres and Java. Both engines read the same generated table
+with the same partition strategy, and each read is forced with Spark's noop
+writer so only extraction is timed.
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+    python benchmarks/copy_vs_jdbc.py --rows 5000000
+"""
+
+import argparse
+from contextlib import closing
+import time
+
+from pyspark.sql import SparkSession
+
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs, connect_dbapi
+from nextdata.core.glue.copy_extractor import extract_with_copy
+from nextdata.core.glue.partitioning import get_partition_strategy, introspect_source
+
+TABLE = "copy_benchmark"
+
+
+def create_source_table(connection, rows: int) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cursor.execute(
+            f"""
+            CREATE TABLE {TABLE} AS
+            SELECT
+                i::bigint AS id,
+                md5(i::text) AS title,
+                i % 2 = 0 AS in_stock,
+                (random() * 1000)::numeric(10, 2) AS price,
+                now() - (i || ' seconds')::interval AS created_at,
+                current_date - (i % 365) AS published
+            FROM generate_series(1, %(rows)s) AS i
+            """,
+            {"rows": rows},
+        )
+        cursor.execute(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id)")
+        cursor.execute(f"ANALYZE {TABLE}")
+    connection.commit()
+
+
+def timed(label: str, df) -> float:
+    start = time.perf_counter()
+    df.write.format("noop").mode("overwrite").save()
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed:.1f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--database", default="postgres")
+    parser.add_argument("--username", default="postgres")
+    parser.add_argument("--password", default="postgres")
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    connection_conf = JDBCGlueJobArgs(
+        protocol="postgresql",
+        host=args.host,
+        port=args.port,
+        database=args.database,
+        username=args.username,
+        password=args.password,
+    )
+    with closing(connect_dbapi(connection_conf, sslmode="disable")) as connection:
+        create_source_table(connection, args.rows)
+        source = introspect_source(connection, TABLE)
+        # A tiny target size makes the planner use exactly --partitions
+        strategy = get_partition_strategy(
+            connection, source, target_partition_bytes=1, max_partitions=args.partitions
+        )
+    print(f"{args.rows} rows, strategy: {strategy}")
+
+    spark = (
+        SparkSession.builder.appName("copy-vs-jdbc")
+        .master(f"local[{args.partitions}]")
+        .config("spark.jars.packages", "org.postgresql:postgresql:42.6.0")
+        .getOrCreate()
+    )
+    url = f"jdbc:postgresql://{args.host}:{args.port}/{args.database}"
+    properties = {
+        "user": args.username,
+        "password": args.password,
+        "driver": "org.postgresql.Driver",
+        "fetchsize": "10000",
+    }
+
+    def jdbc_df():
+        if strategy.predicates:
+            return spark.read.jdbc(
+                url=url,
+                table=TABLE,
+                predicates=strategy.predicates,
+                properties=properties,
+            )
+        return spark.read.jdbc(
+            url=url,
+            table=TABLE,
+            column=strategy.column,
+            lowerBound=strategy.lower_bound,
+            upperBound=strategy.upper_bound,
+            numPartitions=strategy.num_partitions,
+            properties=properties,
+        )
+
+    def copy_df():
+        return extract_with_copy(
+            spark,
+            connection_conf,
+            args.password,
+            source,
+            TABLE,
+            strategy,
+            jdbc_df().schema,
+            sslmode="disable",
+        )
+
+    # Warm up the JVM and both code paths before timing
+    timed("jdbc (warm-up)", jdbc_df())
+    timed("copy (warm-up)", copy_df())
+    results = {"jdbc": [], "copy": []}
+    for run in range(args.runs):
+        results["jdbc"].append(timed(f"jdbc run {run + 1}", jdbc_df()))
+        results["copy"].append(timed(f"copy run {run + 1}", copy_df()))
+
+    best = {engine: min(times) for engine, times in results.items()}
+    for engine, seconds in best.items():
+        print(f"{engine}: best {seconds:.1f}s, {args.rows / seconds:,.0f} rows/s")
+    print(f"copy speedup: {best['jdbc'] / best['copy']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark merging an incremental delta against overwriting the whole table.
+
+Needs Java. Runs Spark locally with an Iceberg Hadoop catalog in a temporary
+directory, registered under the catalog name SparkManager writes to, so the
+timed writes go through SparkManager.write_to_table.
+
+For each delta ratio a fresh table is loaded, then the same delta (half
+updates to existing keys, half new keys) is applied three ways: a full
+overwrite with the delta folded in, a copy-on-write MERGE, and a
+merge-on-read MERGE.
+
+    python benchmarks/merge_vs_overwrite.py --rows 2000000
+"""
+
+import argparse
+import tempfile
+import time
+
+from pyspark.sql import DataFrame, SparkSession
+import pyspark.sql.functions as F
+
+from nextdata.core.connections.spark import SparkManager
+
+TABLE = "merge_benchmark"
+
+
+class LocalSparkManager(SparkManager):
+    def __init__(self, warehouse: str, partitions: int):
+        self.warehouse = warehouse
+        self.partitions = partitions
+        super().__init__(bucket_arn=warehouse, namespace="benchmark")
+        self.spark.sql(
+            f"CREATE NAMESPACE IF NOT EXISTS s3tablesbucket.{self.namespace}"
+        )
+
+    def create_spark_session(self) -> SparkSession:
+        return (
+            SparkSession.builder.appName("merge-vs-overwrite")
+            .master(f"local[{self.partitions}]")
+            .config(
+                "spark.jars.packages",
+                "org.apache.iceberg:iceberg-spark-runtime-3.5_2.12:1.6.1",
+            )
+            .config(
+                "spark.sql.catalog.s3tablesbucket",
+                "org.apache.iceberg.spark.SparkCatalog",
+            )
+            .config("spark.sql.catalog.s3tablesbucket.type", "hadoop")
+            .config("spark.sql.catalog.s3tablesbucket.warehouse", self.warehouse)
+            .config(
+                "spark.sql.extensions",
+                "org.apache.iceberg.spark.extensions.IcebergSparkSessionExtensions",
+            )
+            .config("spark.sql.shuffle.partitions", str(self.partitions))
+            .getOrCreate()
+        )
+
+
+def generate(spark: SparkSession, start: int, end: int, version: int) -> DataFrame:
+    return spark.range(start, end).select(
+        F.col("id"),
+        F.md5(F.concat(F.col("id").cast("string"), F.lit(version))).alias("title"),
+        (F.rand(version) * 1000).cast("decimal(10,2)").alias("price"),
+        F.lit(version).alias("version"),
+        F.current_date().alias("ds"),
+    )
+
+
+def load_base(manager: LocalSparkManager, rows: int) -> None:
+    manager.delete_table(TABLE)
+    manager.write_to_table(
+        TABLE, generate(manager.spark, 0, rows, 0).localCheckpoint(), sample_size=0
+    )
+
+
+def timed(label: str, write) -> float:
+    start = time.perf_counter()
+    write()
+    elapsed = time.perf_counter() - start
+    print(f"  {label}: {elapsed:.1f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument(
+        "--ratios", type=float, nargs="+", default=[0.001, 0.01, 0.1, 0.5]
+    )
+    parser.add_argument("--partitions", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as warehouse:
+        manager = LocalSparkManager(warehouse, args.partitions)
+        spark = manager.spark
+        results = []
+        for ratio in args.ratios:
+            delta_rows = max(2, int(args.rows * ratio))
+            # Half of the delta updates existing rows, half inserts new ones
+            delta = generate(
+                spark, args.rows - delta_rows // 2, args.rows + delta_rows // 2, 1
+            ).localCheckpoint()
+            print(f"delta ratio {ratio} ({delta_rows} rows)")
+
+            def overwrite():
+                current = manager.get_table(TABLE).join(delta, "id", "left_anti")
+                # Materialized first, a table can't be overwritten while
+                # it's being read
+                merged = current.unionByName(delta).localCheckpoint()
+                manager.write_to_table(TABLE, merged, sample_size=0)
+
+            def merge(strategy: str):
+                return lambda: manager.write_to_table(
+                    TABLE,
+                    delta,
+                    mode="merge",
+                    merge_keys=["id"],
+                    merge_strategy=strategy,
+                    sample_size=0,
+                )
+
+            timings = {}
+            for label, write in [
+                ("overwrite", overwrite),
+                ("copy-on-write", merge("copy-on-write")),
+                ("merge-on-read", merge("merge-on-read")),
+            ]:
+                load_base(manager, args.rows)
+                timings[label] = timed(label, write)
+            results.append((ratio, timings))
+
+        print(f"\n{'ratio':>8} {'overwrite':>10} {'cow':>8} {'mor':>8}")
+        for ratio, timings in results:
+            print(
+                f"{ratio:>8} {timings['overwrite']:>9.1f}s "
+                f"{timings['copy-on-write']:>7.1f}s {timings['merge-on-read']:>7.1f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark pushing a day's changes to a table against pushing all of it.
+
+Needs a local Postgres, but not Java: each "task" is a thread copying its
+share of the rows with reverse_etl.write_copy over its own connection, as
+the Spark tasks of a reverse ETL job do. The target has a primary key and
+two secondary indexes. A full push truncates it and copies every row, an
+incremental push copies only the changed rows, --changes of the table split
+into updates, inserts and deletes, and applies them with the upsert and
+delete of change_statements. Reading the changes from Iceberg isn't timed.
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+    python benchmarks/retl_incremental.py --rows 5000000 --changes 0.01
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from nextdata.core.connections.spark import CHANGE_TYPE_COLUMN
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs, connect_dbapi
+from nextdata.core.glue.reverse_etl import (
+    CHANGES_TABLE,
+    change_statements,
+    copy_statement,
+    execute,
+    write_copy,
+)
+
+TABLE = "retl_incremental_benchmark"
+COLUMNS = ["id", "title", "price", "published"]
+BATCH_ROWS = 64 * 1024
+
+
+def create_target_table(connection, rows: int) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cursor.execute(
+            f"""
+            CREATE TABLE {TABLE} (
+                id bigint PRIMARY KEY,
+                title text NOT NULL,
+                price numeric(10, 2),
+                published date
+            )
+            """
+        )
+        cursor.execute(f"CREATE INDEX {TABLE}_title ON {TABLE} (title)")
+        cursor.execute(f"CREATE INDEX {TABLE}_published ON {TABLE} (published)")
+    connection.commit()
+
+
+def book_batch(ids: pa.Array, change_type: str = None) -> pa.RecordBatch:
+    columns = [
+        ids,
+        pc.binary_join_element_wise("book-", pc.cast(ids, pa.string()), ""),
+        pc.cast(pc.divide(pc.cast(ids, pa.float64()), 7), pa.decimal128(10, 2)),
+        pc.cast(pc.cast(pc.divide(ids, 1000), pa.int32()), pa.date32()),
+    ]
+    names = list(COLUMNS)
+    if change_type:
+        columns.append(pa.array([change_type] * len(ids), pa.string()))
+        names.append(CHANGE_TYPE_COLUMN)
+    return pa.record_batch(columns, names=names)
+
+
+def table_batches(task: int, tasks: int, rows: int):
+    """Task's share of every row of the table, every tasks-th id"""
+    for start in range(task, rows, BATCH_ROWS * tasks):
+        yield book_batch(
+            pa.array(range(start, min(start + BATCH_ROWS * tasks, rows), tasks))
+        )
+
+
+def change_batches(task: int, tasks: int, rows: int, changed: int):
+    """
+    Task's share of the changes: half of them updates to existing rows, a
+    quarter new rows and a quarter deleted rows
+    """
+    step = max(rows // changed, 1)
+    ids = list(range(task * step, rows, tasks * step))
+    updates = [id for i, id in enumerate(ids) if i % 4 < 2]
+    deletes = ids[2::4]
+    inserts = [rows + id for id in ids[3::4]]
+    for change_ids, change_type in (
+        (updates, "INSERT"),
+        (inserts, "INSERT"),
+        (deletes, "DELETE"),
+    ):
+        if change_ids:
+            yield book_batch(pa.array(change_ids, pa.int64()), change_type)
+
+
+def run_tasks(connection_conf, tasks: int, run_task) -> int:
+    def run(task: int) -> int:
+        with closing(connect_dbapi(connection_conf, sslmode="disable")) as connection:
+            return run_task(connection, task)
+
+    with ThreadPoolExecutor(tasks) as pool:
+        return sum(pool.map(run, range(tasks)))
+
+
+def full_push(connection_conf, tasks: int, rows: int) -> int:
+    execute(connection_conf, None, [f"TRUNCATE {TABLE}"], sslmode="disable")
+    statement = copy_statement(TABLE, COLUMNS)
+    return run_tasks(
+        connection_conf,
+        tasks,
+        lambda connection, task: write_copy(
+            connection, statement, table_batches(task, tasks, rows)
+        ),
+    )
+
+
+def incremental_push(connection_conf, tasks: int, rows: int, changed: int) -> int:
+    before, after = change_statements(TABLE, COLUMNS, ["id"])
+    statement = copy_statement(CHANGES_TABLE, COLUMNS + [CHANGE_TYPE_COLUMN])
+    return run_tasks(
+        connection_conf,
+        tasks,
+        lambda connection, task: write_copy(
+            connection,
+            statement,
+            change_batches(task, tasks, rows, changed),
+            before,
+            after,
+        ),
+    )
+
+
+def timed(label: str, push) -> float:
+    start = time.perf_counter()
+    pushed = push()
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed:.2f}s, {pushed} rows")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--changes", type=float, default=0.01)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--database", default="postgres")
+    parser.add_argument("--username", default="postgres")
+    parser.add_argument("--password", default="postgres")
+    parser.add_argument("--tasks", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    connection_conf = JDBCGlueJobArgs(
+        protocol="postgresql",
+        host=args.host,
+        port=args.port,
+        database=args.database,
+        username=args.username,
+        password=args.password,
+    )
+    with closing(connect_dbapi(connection_conf, sslmode="disable")) as connection:
+        create_target_table(connection, args.rows)
+    changed = int(args.rows * args.changes)
+    print(f"{args.rows} rows, {changed} changes, {args.tasks} tasks")
+
+    results = {"full": [], "incremental": []}
+    for run in range(args.runs):
+        results["full"].append(
+            timed(
+                f"full run {run + 1}",
+                lambda: full_push(connection_conf, args.tasks, args.rows),
+            )
+        )
+        results["incremental"].append(
+            timed(
+                f"incremental run {run + 1}",
+                lambda: incremental_push(
+                    connection_conf, args.tasks, args.rows, changed
+                ),
+            )
+        )
+
+    best = {push: min(times) for push, times in results.items()}
+    for push, seconds in best.items():
+        print(f"{push}: best {seconds:.2f}s")
+    print(f"incremental speedup: {best['full'] / best['incremental']:.1f}x")
+
+    with closing(connect_dbapi(connection_conf, sslmode="disable")) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {TABLE}")
+        connection.commit()
+
+
+if __name__ == "__main__":
+    main()
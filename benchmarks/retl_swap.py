@@ -0,0 +1,203 @@
+"""
+Benchmark reloading an indexed table by staging-table swap against in place.
+
+Needs a local Postgres, but not Java: each "task" is a thread copying its
+share of the rows with reverse_etl.write_copy over its own connection, as
+the Spark tasks of a reverse ETL job do. The target has a primary key and
+two secondary indexes. In place, it's truncated and copied into with its
+indexes maintained row by row. Swapped, the rows are copied into an
+unindexed staging table that's indexed and renamed into place.
+
+A reader queries the table throughout each reload and reports the fewest
+rows it saw and its slowest query, i.e. how long it was blocked.
+
+    docker run -d -p 5432:5432 -e POSTGRES_PASSWORD=postgres postgres:16
+    python benchmarks/retl_swap.py --rows 5000000
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs, connect_dbapi
+from nextdata.core.glue.reverse_etl import copy_statement, execute, write_copy
+from nextdata.core.glue.table_swap import abort_swap, finish_swap, prepare_swap
+
+TABLE = "retl_swap_benchmark"
+BATCH_ROWS = 64 * 1024
+
+
+def create_target_table(connection, rows: int) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cursor.execute(
+            f"""
+            CREATE TABLE {TABLE} (
+                id bigint PRIMARY KEY,
+                title text NOT NULL,
+                price numeric(10, 2),
+                published date
+            )
+            """
+        )
+        cursor.execute(f"CREATE INDEX {TABLE}_title ON {TABLE} (title)")
+        cursor.execute(f"CREATE INDEX {TABLE}_published ON {TABLE} (published)")
+        cursor.execute(
+            f"""
+            INSERT INTO {TABLE}
+            SELECT i, md5(i::text), (random() * 1000)::numeric(10, 2),
+                current_date - (i %% 365)
+            FROM generate_series(1, %(rows)s) AS i
+            """,
+            {"rows": rows},
+        )
+        cursor.execute(f"ANALYZE {TABLE}")
+    connection.commit()
+
+
+def batches(task: int, tasks: int, rows: int):
+    """Task's share of the new rows, every tasks-th id"""
+    for start in range(task, rows, BATCH_ROWS * tasks):
+        ids = pa.array(range(start, min(start + BATCH_ROWS * tasks, rows), tasks))
+        titles = pc.binary_join_element_wise("book-", pc.cast(ids, pa.string()), "")
+        yield pa.record_batch(
+            [
+                ids,
+                titles,
+                pc.cast(pc.divide(pc.cast(ids, pa.float64()), 7), pa.decimal128(10, 2)),
+                pc.cast(pc.cast(pc.divide(ids, 1000), pa.int32()), pa.date32()),
+            ],
+            names=["id", "title", "price", "published"],
+        )
+
+
+def copy_rows(connection_conf, target_table: str, tasks: int, rows: int) -> None:
+    statement = copy_statement(target_table, ["id", "title", "price", "published"])
+
+    def run_task(task: int) -> int:
+        with closing(connect_dbapi(connection_conf, sslmode="disable")) as connection:
+            return write_copy(connection, statement, batches(task, tasks, rows))
+
+    with ThreadPoolExecutor(tasks) as pool:
+        assert sum(pool.map(run_task, range(tasks))) == rows
+
+
+class Reader(threading.Thread):
+    """Counts the table's rows, over and over, until stopped"""
+
+    def __init__(self, connection_conf):
+        super().__init__(daemon=True)
+        self.connection_conf = connection_conf
+        self.stopped = threading.Event()
+        self.fewest_rows = None
+        self.slowest = 0.0
+
+    def run(self):
+        with closing(
+            connect_dbapi(self.connection_conf, sslmode="disable")
+        ) as connection:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                while not self.stopped.is_set():
+                    start = time.perf_counter()
+                    cursor.execute(
+                        f"SELECT count(*) FROM {TABLE} WHERE published IS NOT NULL"
+                    )
+                    (rows,) = cursor.fetchone()
+                    self.slowest = max(self.slowest, time.perf_counter() - start)
+                    if self.fewest_rows is None or rows < self.fewest_rows:
+                        self.fewest_rows = rows
+                    time.sleep(0.01)
+
+
+def in_place(connection_conf, tasks: int, rows: int) -> None:
+    execute(connection_conf, None, [f"TRUNCATE {TABLE}"], sslmode="disable")
+    copy_rows(connection_conf, TABLE, tasks, rows)
+    execute(connection_conf, None, [f"ANALYZE {TABLE}"], sslmode="disable")
+
+
+def swapped(connection_conf, tasks: int, rows: int) -> None:
+    with closing(connect_dbapi(connection_conf, sslmode="disable")) as connection:
+        swap = prepare_swap(connection, TABLE)
+        try:
+            copy_rows(connection_conf, swap.staging, tasks, rows)
+            finish_swap(connection, swap)
+        except BaseException:
+            abort_swap(connection, swap)
+            raise
+
+
+def timed(label: str, reload, connection_conf, tasks: int, rows: int) -> float:
+    reader = Reader(connection_conf)
+    reader.start()
+    start = time.perf_counter()
+    reload(connection_conf, tasks, rows)
+    elapsed = time.perf_counter() - start
+    reader.stopped.set()
+    reader.join()
+    print(
+        f"{label}: {elapsed:.1f}s, readers saw as few as {reader.fewest_rows} "
+        f"rows and waited up to {reader.slowest:.2f}s"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--database", default="postgres")
+    parser.add_argument("--username", default="postgres")
+    parser.add_argument("--password", default="postgres")
+    parser.add_argument("--tasks", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    connection_conf = JDBCGlueJobArgs(
+        protocol="postgresql",
+        host=args.host,
+        port=args.port,
+        database=args.database,
+        username=args.username,
+        password=args.password,
+    )
+    with closing(connect_dbapi(connection_conf, sslmode="disable")) as connection:
+        create_target_table(connection, args.rows)
+    print(f"{args.rows} rows, {args.tasks} tasks")
+
+    results = {"in place": [], "swap": []}
+    for run in range(args.runs):
+        results["in place"].append(
+            timed(
+                f"in place run {run + 1}",
+                in_place,
+                connection_conf,
+                args.tasks,
+                args.rows,
+            )
+        )
+        results["swap"].append(
+            timed(
+                f"swap run {run + 1}", swapped, connection_conf, args.tasks, args.rows
+            )
+        )
+
+    best = {mode: min(times) for mode, times in results.items()}
+    for mode, seconds in best.items():
+        print(f"{mode}: best {seconds:.1f}s, {args.rows / seconds:,.0f} rows/s")
+    print(f"swap speedup: {best['in place'] / best['swap']:.2f}x")
+
+    with closing(connect_dbapi(connection_conf, sslmode="disable")) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {TABLE}")
+        connection.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark scan latency and file layout under different write settings.
+
+Needs Java. Uses the same local Iceberg Hadoop catalog as
+merge_vs_overwrite.py, so the writes go through SparkManager.write_to_table
+and its table properties.
+
+The source DataFrame is split into many small partitions, like a JDBC read
+with a high numPartitions. Each setting writes the same rows to a fresh
+table, then a full scan and a selective range scan are timed.
+
+    python benchmarks/write_tuning.py --rows 5000000 --source-partitions 200
+"""
+
+import argparse
+import tempfile
+import time
+
+from pyspark.sql import DataFrame, SparkSession
+import pyspark.sql.functions as F
+
+from nextdata.core.connections.spark import write_properties
+from merge_vs_overwrite import LocalSparkManager
+
+TABLE = "write_tuning_benchmark"
+MIB = 1024 * 1024
+
+# Name, table properties and sort order of each setting
+SETTINGS = [
+    (
+        "untuned",
+        write_properties(distribution_mode="none", compression_codec="snappy"),
+        None,
+    ),
+    ("zstd", write_properties(distribution_mode="none"), None),
+    ("hash 128MiB", write_properties(target_file_size_bytes=128 * MIB), None),
+    ("hash 512MiB", write_properties(target_file_size_bytes=512 * MIB), None),
+    ("hash 8MiB row groups", write_properties(row_group_size_bytes=8 * MIB), None),
+    ("range by id", write_properties(distribution_mode="range"), ["id"]),
+]
+
+
+def generate(spark: SparkSession, rows: int, partitions: int) -> DataFrame:
+    return (
+        spark.range(0, rows).select(
+            F.col("id"),
+            (F.col("id") % 1000).alias("category"),
+            F.md5(F.col("id").cast("string")).alias("payload"),
+            (F.rand(0) * 1000).cast("decimal(10,2)").alias("price"),
+            F.current_date().alias("ds"),
+        )
+        # Shuffled, as rows arrive from a source that isn't clustered on id
+        .repartition(partitions)
+    )
+
+
+def timed(query) -> float:
+    start = time.perf_counter()
+    query()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--source-partitions", type=int, default=200)
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as warehouse:
+        manager = LocalSparkManager(warehouse, args.partitions)
+        spark = manager.spark
+        source = generate(spark, args.rows, args.source_partitions).localCheckpoint()
+        table_path = f"s3tablesbucket.{manager.namespace}.{TABLE}"
+        low, high = args.rows // 2, args.rows // 2 + args.rows // 1000
+        results = []
+        for label, properties, sort_order in SETTINGS:
+            manager.delete_table(TABLE)
+            write_seconds = timed(
+                lambda: manager.write_to_table(
+                    TABLE,
+                    source,
+                    partition_by=["ds"],
+                    sort_order=sort_order,
+                    table_properties=properties,
+                    sample_size=0,
+                )
+            )
+            files, size = spark.sql(
+                f"SELECT COUNT(*), SUM(file_size_in_bytes) FROM {table_path}.files"
+            ).collect()[0]
+            full_scan = min(
+                timed(
+                    lambda: spark.sql(
+                        f"SELECT category, SUM(price) FROM {table_path} GROUP BY category"
+                    ).collect()
+                )
+                for _ in range(args.repeat)
+            )
+            range_scan = min(
+                timed(
+                    lambda: spark.sql(
+                        f"SELECT COUNT(*) FROM {table_path} "
+                        f"WHERE id BETWEEN {low} AND {high}"
+                    ).collect()
+                )
+                for _ in range(args.repeat)
+            )
+            print(f"{label}: {files} files, {size / MIB:.1f} MiB")
+            results.append((label, files, size, write_seconds, full_scan, range_scan))
+
+        print(
+            f"\n{'setting':<22} {'files':>6} {'MiB':>8} {'write':>8} "
+            f"{'full scan':>10} {'range scan':>11}"
+        )
+        for label, files, size, write_seconds, full_scan, range_scan in results:
+            print(
+                f"{label:<22} {files:>6} {size / MIB:>8.1f} {write_seconds:>7.1f}s "
+                f"{full_scan:>9.2f}s {range_scan:>10.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import Optional
+
+import asyncclick as click
+
+from nextdata.core.connections.emr import EmrServerlessManager
+from nextdata.core.db.db_manager import DatabaseManager
+from nextdata.core.project_config import NextDataConfig
+
+DATETIME_FORMATS = ["%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"]
+
+
+@click.command()
+@click.argument("table_name")
+@click.option(
+    "--from",
+    "start",
+    type=click.DateTime(DATETIME_FORMATS),
+    required=True,
+    help="Start of the window to re-extract",
+)
+@click.option(
+    "--to",
+    "end",
+    type=click.DateTime(DATETIME_FORMATS),
+    required=True,
+    help="End of the window to re-extract, exclusive",
+)
+@click.option(
+    "--granularity",
+    type=click.Choice(["day", "hour"]),
+    default=None,
+    help="Read one day or hour of the window per partition",
+)
+@click.option(
+    "--max-connections",
+    type=int,
+    default=None,
+    help="Upper bound on concurrent connections to the source database",
+)
+@click.option(
+    "--restart",
+    is_flag=True,
+    help="Abandon the window's unfinished backfill instead of resuming it",
+)
+def backfill(
+    table_name: str,
+    start: datetime,
+    end: datetime,
+    granularity: Optional[str],
+    max_connections: Optional[int],
+    restart: bool,
+):
+    """Re-extract a window of a table's incremental column"""
+    if end <= start:
+        raise click.BadParameter("--to must be after --from")
+    config = NextDataConfig.from_env()
+    db_manager = DatabaseManager(config.project_dir / "nextdata.db")
+    table = db_manager.get_table_by_name(table_name)
+    job = next(
+        (
+            job
+            for job in (table.upstream_jobs if table else [])
+            if job.incremental_column
+        ),
+        None,
+    )
+    if not job:
+        raise click.ClickException(
+            f"{table_name} has no etl.py with an incremental column"
+        )
+    emr_manager = EmrServerlessManager(db_manager, role_session_name="cli-backfill")
+    emr_manager.ensure_application_started()
+    response = emr_manager.start_job(
+        job,
+        backfill_from=start,
+        backfill_to=end,
+        backfill_granularity=granularity,
+        max_connections=max_connections,
+        restart_extraction=restart,
+    )
+    click.echo(
+        f"Started backfill of {table_name} from {start} to {end}: {response['jobRunId']}"
+    )
@@ -0,0 +1,107 @@
+import asyncio
+from contextlib import closing
+import json
+
+import asyncclick as click
+
+from nextdata.core.cdc import DEFAULT_MAX_CHANGES, ReplicationSlot, sync_changes
+from nextdata.core.connections.spark import SparkManager
+from nextdata.core.db.db_manager import DatabaseManager
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs, connect_dbapi
+from nextdata.core.glue.partitioning import introspect_source
+from nextdata.core.project_config import NextDataConfig
+from nextdata.util.s3_tables_utils import get_s3_table_path
+
+
+@click.group()
+def cdc():
+    """Change data capture commands"""
+    pass
+
+
+@cdc.command(name="sync")
+@click.argument("table_name")
+@click.option(
+    "--max-changes",
+    type=int,
+    default=DEFAULT_MAX_CHANGES,
+    help="Changes to read from the replication slot per batch",
+)
+@click.option("--follow", is_flag=True, help="Keep polling the slot for changes")
+@click.option("--interval", type=float, default=5.0, help="Seconds between polls")
+async def sync(table_name: str, max_changes: int, follow: bool, interval: float):
+    """Apply changes from a table's replication slot to its Iceberg table"""
+    config = NextDataConfig.from_env()
+    db_manager = DatabaseManager(config.project_dir / "nextdata.db")
+    table = db_manager.get_table_by_name(table_name)
+    job = next(
+        (
+            job
+            for job in (table.upstream_jobs if table else [])
+            if job.ingestion_mode == "cdc"
+        ),
+        None,
+    )
+    if not job:
+        raise click.ClickException(
+            f'{table_name} has no etl.py with ingestion_mode = "cdc"'
+        )
+    connection_properties = job.connection_properties
+    if isinstance(connection_properties, str):
+        connection_properties = json.loads(connection_properties)
+    if job.connection_type.value != "jdbc" or (
+        connection_properties.get("protocol") != "postgresql"
+    ):
+        raise click.ClickException(
+            "CDC needs a Postgres JDBC connection with logical replication"
+        )
+    connection_conf = JDBCGlueJobArgs(**connection_properties)
+
+    with closing(connect_dbapi(connection_conf)) as connection:
+        # Replication slot functions can't run inside a transaction block
+        connection.autocommit = True
+        slot = ReplicationSlot(
+            connection, f"nextdata_{job.sql_table}", job.sql_table, job.cdc_plugin
+        )
+        spark_manager = SparkManager()
+        table_path = get_s3_table_path(spark_manager.namespace, table_name)
+        if slot.ensure():
+            # Changes made before the slot existed are only in a full load
+            click.echo(
+                f"Created replication slot {slot.slot_name}. Run a full load of "
+                f"{table_name}, then sync again to apply changes made since."
+            )
+            return
+        if not spark_manager.spark.catalog.tableExists(table_path):
+            raise click.ClickException(
+                f"{table_name} doesn't exist yet, run a full load before syncing"
+            )
+        key_columns = [
+            column.name
+            for column in introspect_source(connection, job.sql_table).primary_key
+        ]
+        if not key_columns:
+            raise click.ClickException(
+                f"{job.sql_table} needs a primary key to apply changes"
+            )
+
+        stored = db_manager.get_cdc_checkpoint(table_name)
+        checkpoint = stored.lsn if stored else None
+        while True:
+            previous = checkpoint
+            checkpoint = sync_changes(
+                slot,
+                spark_manager,
+                key_columns,
+                checkpoint,
+                lambda lsn: db_manager.set_cdc_checkpoint(
+                    table_name, slot.slot_name, lsn
+                ),
+                max_changes,
+            )
+            if checkpoint != previous:
+                click.echo(f"Applied changes to {table_name} up to {checkpoint}")
+            elif follow:
+                await asyncio.sleep(interval)
+            else:
+                break
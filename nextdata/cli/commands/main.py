@@ -12,6 +12,9 @@ from ..project_generator import NextDataGenerator
 from .pulumi import pulumi
 from .dev_server import dev_server
 from .aws import aws
+from .cdc import cdc
+from .backfill import backfill
+from .maintain import maintain
 
 dotenv.load_dotenv(Path.cwd() / ".env")
 
@@ -26,6 +29,9 @@ cli.add_command(pulumi)
 cli.add_command(dev_server)
 cli.add_command(spark)
 cli.add_command(aws)
+cli.add_command(cdc)
+cli.add_command(backfill)
+cli.add_command(maintain)
 
 
 @cli.command(name="create-ndx-app")
@@ -0,0 +1,111 @@
+import asyncio
+from datetime import timedelta
+from typing import Optional
+
+import asyncclick as click
+
+from nextdata.core.connections.spark import SparkManager
+from nextdata.core.db.db_manager import DatabaseManager
+from nextdata.core.maintenance import ACTIONS, MaintenanceThresholds, TableMaintenance
+from nextdata.core.project_config import NextDataConfig
+from nextdata.util.s3_tables_utils import get_s3_table_path
+
+
+@click.group()
+def maintain():
+    """Iceberg table maintenance commands"""
+    pass
+
+
+@maintain.command(name="run")
+@click.argument("table_names", nargs=-1)
+@click.option(
+    "--action",
+    "actions",
+    multiple=True,
+    type=click.Choice(ACTIONS),
+    help="Run this action whatever the thresholds say, can be repeated",
+)
+@click.option("--dry-run", is_flag=True, help="Only report what is due")
+@click.option(
+    "--small-files",
+    type=int,
+    default=MaintenanceThresholds.small_files,
+    help="Compact data files once a table has this many small ones",
+)
+@click.option(
+    "--manifests",
+    type=int,
+    default=MaintenanceThresholds.manifests,
+    help="Rewrite manifests once a table has this many",
+)
+@click.option(
+    "--snapshots",
+    type=int,
+    default=MaintenanceThresholds.snapshots,
+    help="Expire snapshots once a table has this many",
+)
+@click.option(
+    "--retention-days",
+    type=float,
+    default=MaintenanceThresholds.snapshot_retention.days,
+    help="Keep snapshots committed in the last this many days",
+)
+@click.option(
+    "--every",
+    type=float,
+    default=None,
+    help="Keep running maintenance every this many hours",
+)
+async def run(
+    table_names: tuple[str, ...],
+    actions: tuple[str, ...],
+    dry_run: bool,
+    small_files: int,
+    manifests: int,
+    snapshots: int,
+    retention_days: float,
+    every: Optional[float],
+):
+    """Compact files, rewrite manifests and expire snapshots of tables that need it"""
+    config = NextDataConfig.from_env()
+    db_manager = DatabaseManager(config.project_dir / "nextdata.db")
+    table_names = table_names or [table.name for table in db_manager.get_tables()]
+    spark_manager = SparkManager()
+    maintenance = TableMaintenance(
+        spark_manager,
+        MaintenanceThresholds(
+            small_files=small_files,
+            manifests=manifests,
+            snapshots=snapshots,
+            snapshot_retention=timedelta(days=retention_days),
+        ),
+    )
+    while True:
+        failed = []
+        for table_name in table_names:
+            # One table failing doesn't stop the others, or the next round
+            try:
+                table_path = get_s3_table_path(spark_manager.namespace, table_name)
+                if not spark_manager.spark.catalog.tableExists(table_path):
+                    click.echo(f"{table_name}: not loaded yet, skipping")
+                    continue
+                report = maintenance.run(table_name, list(actions) or None, dry_run)
+            except Exception as e:
+                click.echo(f"{table_name}: maintenance failed: {e}", err=True)
+                failed.append(table_name)
+                continue
+            if dry_run:
+                click.echo(
+                    f"{table_name}: {report.before}, due: "
+                    f"{', '.join(report.actions) or 'nothing'}"
+                )
+            else:
+                click.echo(str(report))
+        if not every:
+            if failed:
+                raise click.ClickException(
+                    f"Maintenance failed for {', '.join(failed)}"
+                )
+            break
+        await asyncio.sleep(every * 3600)
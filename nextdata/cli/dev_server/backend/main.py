@@ -1,24 +1,31 @@
-import json
+from dataclasses import asdict
+import shutil
 import tempfile
 import time
-from typing import Annotated
-from fastapi import FastAPI, Form, Query
+import uuid
+from typing import Annotated, Optional
+from fastapi import BackgroundTasks, FastAPI, Form, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 
 from nextdata.cli.dev_server.backend.deps.get_db import get_db_dependency
 from nextdata.core.db.db_manager import DatabaseManager
-from nextdata.core.db.models import HumanReadableName
-from nextdata.core.glue.glue_entrypoint import GlueJobArgs
+from nextdata.core.db.models import DataQualityResult, HumanReadableName
+from nextdata.core.connections.emr import EmrServerlessManager
 from nextdata.core.connections.spark import SparkManager
-import boto3
+from nextdata.core.glue.expectations import read_results
+from nextdata.core.maintenance import TableMaintenance
+from nextdata.util.data_files import arrow_to_parquet, upload_format
+from nextdata.util.schema_inference import infer_csv_schema, spark_schema
 from .deps.get_pyspark_connection import pyspark_connection_dependency
-from nextdata.cli.types import Checker, UploadCsvRequest
+from nextdata.cli.types import Checker, SparkSchemaSpec, UploadCsvRequest
 from pathlib import Path
 from fastapi import Depends, File, UploadFile, Path as FastAPI_Path
 
 
 app_state = {}
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
 app = FastAPI()
 
 
@@ -108,12 +115,68 @@ async def get_table_jobs(
     ]
 
 
+def write_upload(
+    spark: SparkManager,
+    db_manager: DatabaseManager,
+    upload_id: str,
+    file_path: Path,
+    file_format: str,
+    form_data: UploadCsvRequest,
+):
+    """Write an uploaded file to its table, recording the outcome in app_state"""
+    upload = app_state["uploads"][upload_id]
+    schema = form_data.schema
+    try:
+        if file_format == "csv":
+            # The table's schema is inferred from a sample of its first upload
+            # and reused for the ones after it
+            table = db_manager.get_table_by_name(form_data.table_name)
+            if schema is None and table and table.schema:
+                schema = SparkSchemaSpec(schema=table.schema)
+            if schema is None:
+                schema = SparkSchemaSpec(
+                    schema=spark_schema(infer_csv_schema(file_path))
+                )
+                logging.info(f"Inferred schema of {file_path.name}: {schema.schema}")
+            if table and not table.schema:
+                db_manager.set_table_schema(form_data.table_name, schema.schema)
+        if file_format == "arrow":
+            parquet_path = file_path.with_suffix(".parquet")
+            arrow_to_parquet(file_path, parquet_path)
+            file_path.unlink()
+            file_path, file_format = parquet_path, "parquet"
+        if file_format == "parquet":
+            df = spark.read_from_parquet(str(file_path), schema)
+        else:
+            df = spark.read_from_csv(str(file_path), schema)
+        metrics = spark.write_to_table(
+            form_data.table_name,
+            df,
+            schema=schema,
+        )
+        upload.update(status="success", rows=metrics.rows)
+    except Exception as e:
+        logging.exception(f"Upload {upload_id} to {form_data.table_name} failed")
+        upload.update(status="error", error=str(e))
+    finally:
+        file_path.unlink(missing_ok=True)
+        upload["finished_at"] = time.time()
+
+
 @app.post("/api/upload_csv")
 async def upload_csv(
     spark: Annotated[SparkManager, Depends(pyspark_connection_dependency)],
+    db_manager: Annotated[DatabaseManager, Depends(get_db_dependency)],
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     form_data: UploadCsvRequest = Depends(Checker(UploadCsvRequest)),
 ):
+    """
+    Upload a CSV, gzipped CSV, Parquet or Arrow IPC file to a table.
+
+    The file is copied to disk in chunks and written to the table in the
+    background. Poll /api/uploads/{upload_id} for the outcome.
+    """
     data_dir = Path.cwd() / "data"
     valid_directories = [d.name for d in data_dir.iterdir() if d.is_dir()]
     table_name_is_valid = form_data.table_name in valid_directories
@@ -124,19 +187,40 @@ async def upload_csv(
             "error": f"Table name {form_data.table_name} is not a valid directory",
         }
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as temp_file:
-            temp_file.write(file.file.read())
-            temp_file_path = temp_file.name
-            df = spark.read_from_csv(temp_file_path)
-        logging.error(form_data.model_dump_json())
-        spark.write_to_table(
-            form_data.table_name,
-            df,
-            schema=form_data.schema,
-        )
-        return {"status": "success", "filename": file.filename}
-    except Exception as e:
+        file_format, suffix = upload_format(file.filename or "")
+    except ValueError as e:
         return {"status": "error", "error": str(e)}
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        # Copied in a worker thread, so the event loop isn't blocked and only
+        # one chunk of the upload is in memory at a time
+        await run_in_threadpool(
+            shutil.copyfileobj, file.file, temp_file, UPLOAD_CHUNK_BYTES
+        )
+    upload_id = uuid.uuid4().hex
+    app_state.setdefault("uploads", {})[upload_id] = {
+        "status": "running",
+        "table_name": form_data.table_name,
+        "filename": file.filename,
+        "started_at": time.time(),
+    }
+    background_tasks.add_task(
+        write_upload,
+        spark,
+        db_manager,
+        upload_id,
+        Path(temp_file.name),
+        file_format,
+        form_data,
+    )
+    return {"status": "accepted", "upload_id": upload_id, "filename": file.filename}
+
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload_status(upload_id: str = FastAPI_Path(...)):
+    upload = app_state.get("uploads", {}).get(upload_id)
+    if upload is None:
+        return {"status": "error", "error": f"Unknown upload {upload_id}"}
+    return {"upload_id": upload_id, **upload}
 
 
 @app.get("/api/table/{table_name}/metadata")
@@ -161,126 +245,90 @@ async def get_sample_data(
     )
 
 
+@app.post("/api/table/{table_name}/maintain")
+async def maintain_table(
+    spark: Annotated[SparkManager, Depends(pyspark_connection_dependency)],
+    table_name: str = FastAPI_Path(...),
+    actions: Optional[list[str]] = Form(None),
+    dry_run: bool = Form(False),
+):
+    """Run the maintenance a table is due for, or the given actions"""
+    try:
+        # Compaction can take minutes, keep it off the event loop
+        report = await run_in_threadpool(
+            TableMaintenance(spark).run, table_name, actions, dry_run
+        )
+    except ValueError as e:
+        return {"status": "error", "error": str(e)}
+    return {"status": "success", **asdict(report)}
+
+
+@app.get("/api/table/{table_name}/checks")
+async def get_table_checks(
+    spark: Annotated[SparkManager, Depends(pyspark_connection_dependency)],
+    db_manager: Annotated[DatabaseManager, Depends(get_db_dependency)],
+    table_name: str = FastAPI_Path(...),
+    limit: int = Query(100),
+):
+    """Data quality check results of a table's loads, newest first"""
+    # Results are written by the ETL job, pick up the ones since the last sync
+    stored = db_manager.get_data_quality_results(table_name, limit=1)
+    db_manager.add_data_quality_results(
+        [
+            DataQualityResult(**row)
+            for row in read_results(
+                spark, table_name, stored[0].checked_at if stored else None
+            )
+        ]
+    )
+    return [
+        {
+            "run_id": result.run_id,
+            "check": result.check_type,
+            "column": result.column_name,
+            "severity": result.severity,
+            "passed": result.passed,
+            "observed": result.observed,
+            "message": result.message,
+            "checked_at": result.checked_at,
+        }
+        for result in db_manager.get_data_quality_results(table_name, limit)
+    ]
+
+
 @app.post("/api/jobs/trigger")
 async def trigger_job(
     db_manager: Annotated[DatabaseManager, Depends(get_db_dependency)],
     job_name: str = Form(...),
+    restart_extraction: bool = Form(False),
 ):
-    sts_client = boto3.client("sts")
     job = db_manager.get_job(job_name)
     logging.error(f"Running Job: {job.__dict__}")
-    glue_role_arn = db_manager.get_resource_by_name(
-        HumanReadableName.GLUE_ROLE
-    ).resource_arn
-    emr_app_id = db_manager.get_resource_by_name(HumanReadableName.EMR_APP).resource_arn
-    emr_app_id = emr_app_id.split("/")[-1]
-    assumed_role = sts_client.assume_role(
-        RoleArn=glue_role_arn,
-        RoleSessionName="dashboard-job-trigger",
-    )
-    s3_bucket_arn = db_manager.get_resource_by_name(
-        HumanReadableName.S3_TABLE_BUCKET
-    ).resource_arn
-    s3_bucket_namespace = db_manager.get_resource_by_name(
-        HumanReadableName.S3_TABLE_NAMESPACE
-    ).name
-
-    # Create EMR client with the assumed role credentials
-    emr_client = boto3.client(
-        "emr-serverless",
-        aws_access_key_id=assumed_role["Credentials"]["AccessKeyId"],
-        aws_secret_access_key=assumed_role["Credentials"]["SecretAccessKey"],
-        aws_session_token=assumed_role["Credentials"]["SessionToken"],
-    )
-
-    app_ready = False
-    sent_start_request = False
-    logging.error(f"App ID: {emr_app_id}")
-    timeout = time.time() + 30
-    while not app_ready:
-        emr_app_state = emr_client.get_application(applicationId=emr_app_id)
-        logging.error(f"App State: {emr_app_state}")
-        if (
-            emr_app_state["application"]["state"] == "CREATED"
-            or emr_app_state["application"]["state"] == "STARTED"
-        ):
-
-            app_ready = True
-        else:
-            if not sent_start_request:
-                emr_client.start_application(applicationId=emr_app_id)
-                sent_start_request = True
-            time.sleep(1)
-        if time.time() > timeout:
-            raise Exception("App did not start in time")
+    emr = EmrServerlessManager(db_manager)
+    emr.ensure_application_started()
     logging.error(f"Connection Properties:\n{job.connection_properties}")
-    args = GlueJobArgs(
-        job_name=job.name,
-        connection_name=job.connection_name,
-        connection_type=job.connection_type.value,
-        connection_properties=job.connection_properties,
-        sql_table=job.sql_table,
-        incremental_column=job.incremental_column,
-        is_full_load=job.is_full_load,
-        bucket_arn=s3_bucket_arn,
-        namespace=s3_bucket_namespace,
-    )
-    args_list = []
-    for name, value in args.model_dump().items():
-        if value is None:
-            continue
-        if isinstance(value, dict):
-            value = json.dumps(value)
-        elif isinstance(value, bool):
-            value = str(value).lower()  # Convert True/False to 'true'/'false'
-        elif isinstance(value, str) and " " in value:
-            value = f"'{value}'"  # Wrap strings containing spaces in quotes
-        args_list.append(f"--{name}")  # Add argument name separately
-        args_list.append(str(value))  # Add value separately
-    logging.error(f"Args List:\n{args_list}")
-    packages = [
-        "org.postgresql:postgresql:42.6.0",
-        "org.apache.iceberg:iceberg-spark-runtime-3.5_2.12:1.6.1",
-        "software.amazon.s3tables:s3-tables-catalog-for-iceberg-runtime:0.1.3",
-        "software.amazon.awssdk:bundle:2.21.1",
-    ]
-    response = emr_client.start_job_run(
-        applicationId=emr_app_id,
-        executionRoleArn=glue_role_arn,
-        jobDriver={
-            "sparkSubmit": {
-                "entryPoint": f"s3://{job.script.bucket}/{job.script.s3_path}",
-                "entryPointArguments": args_list,
-                "sparkSubmitParameters": (
-                    "--conf spark.executor.cores=1 "
-                    "--conf spark.executor.memory=4G "
-                    "--conf spark.executor.instances=1 "
-                    "--conf spark.driver.cores=1 "
-                    "--conf spark.driver.memory=4G "
-                    # Add dependencies using Maven coordinates
-                    f"--conf spark.jars.packages={','.join(packages)} "
-                    # Add iceberg and s3 extensions
-                    "--conf spark.sql.catalog.s3tablesbucket=org.apache.iceberg.spark.SparkCatalog "
-                    "--conf spark.sql.catalog.s3tablesbucket.catalog-impl=software.amazon.s3tables.iceberg.S3TablesCatalog "
-                    f"--conf spark.sql.catalog.s3tablesbucket.warehouse={args.bucket_arn} "
-                    "--conf spark.sql.extensions=org.apache.iceberg.spark.extensions.IcebergSparkSessionExtensions "
-                    # Add environment
-                    f"--conf spark.archives=s3://{job.script.bucket}/{job.venv_s3_path}#environment "
-                    f"--conf spark.emr-serverless.driverEnv.PYSPARK_DRIVER_PYTHON=./environment/bin/python "
-                    f"--conf spark.emr-serverless.driverEnv.PYSPARK_PYTHON=./environment/bin/python "
-                    "--conf spark.executorEnv.PYSPARK_PYTHON=./environment/bin/python "
-                ),
-            }
-        },
-        configurationOverrides={
-            "monitoringConfiguration": {
-                "s3MonitoringConfiguration": {
-                    "logUri": f"s3://{job.script.bucket}/logs/"
-                }
-            }
-        },
-    )
-    return {"jobRunId": response["jobRunId"], "applicationId": emr_app_id}
+    # restart_extraction abandons the checkpointed extraction a failed run left
+    return emr.start_job(job, restart_extraction=restart_extraction)
+
+
+@app.post("/api/jobs/trigger_batch")
+async def trigger_batch(
+    db_manager: Annotated[DatabaseManager, Depends(get_db_dependency)],
+    job_names: list[str] = Form(...),
+    max_concurrency: Optional[int] = Form(None),
+):
+    """Run several tables' ETL jobs in one EMR job run"""
+    jobs = [db_manager.get_job(job_name) for job_name in job_names]
+    missing = [name for name, job in zip(job_names, jobs) if job is None]
+    if missing:
+        return {"status": "error", "error": f"Jobs not found: {missing}"}
+    logging.error(f"Running batch: {job_names}")
+    emr = EmrServerlessManager(db_manager)
+    try:
+        emr.ensure_application_started()
+        return emr.start_batch(jobs, max_concurrency)
+    except ValueError as e:
+        return {"status": "error", "error": str(e)}
 
 
 # {"jobRunId": "00fpj4tr265sbo0b", "applicationId": "00fpec96ec8sbg09"}
@@ -293,34 +341,15 @@ async def get_job_status(
     job_run_id: str,
 ):
     """Get the status of a job run"""
-    sts_client = boto3.client("sts")
-    glue_role_arn = db_manager.get_resource_by_name(
-        HumanReadableName.GLUE_ROLE
-    ).resource_arn
-
-    assumed_role = sts_client.assume_role(
-        RoleArn=glue_role_arn,
-        RoleSessionName="dashboard-job-status",
-    )
-
-    emr_client = boto3.client(
-        "emr-serverless",
-        aws_access_key_id=assumed_role["Credentials"]["AccessKeyId"],
-        aws_secret_access_key=assumed_role["Credentials"]["SecretAccessKey"],
-        aws_session_token=assumed_role["Credentials"]["SessionToken"],
-    )
-
+    emr = EmrServerlessManager(db_manager, role_session_name="dashboard-job-status")
     try:
-        response = emr_client.get_job_run(
-            applicationId=application_id,
-            jobRunId=job_run_id,
-        )
+        job_run = emr.get_job_run(job_run_id, application_id)
         return {
-            "status": response["jobRun"]["state"],
-            "stateDetails": response["jobRun"].get("stateDetails", ""),
-            "failureReason": response["jobRun"].get("failureReason", ""),
-            "startTime": response["jobRun"].get("startTime", ""),
-            "endTime": response["jobRun"].get("endTime", ""),
+            "status": job_run["state"],
+            "stateDetails": job_run.get("stateDetails", ""),
+            "failureReason": job_run.get("failureReason", ""),
+            "startTime": job_run.get("startTime", ""),
+            "endTime": job_run.get("endTime", ""),
         }
     except Exception as e:
         return {"error": str(e)}
@@ -333,78 +362,10 @@ async def get_job_logs(
     job_run_id: str,
 ):
     """Get the logs for a job run"""
-    sts_client = boto3.client("sts")
-    glue_role_arn = db_manager.get_resource_by_name(
-        HumanReadableName.GLUE_ROLE
-    ).resource_arn
-
-    assumed_role = sts_client.assume_role(
-        RoleArn=glue_role_arn,
-        RoleSessionName="dashboard-job-logs",
-    )
-
-    emr_client = boto3.client(
-        "emr-serverless",
-        aws_access_key_id=assumed_role["Credentials"]["AccessKeyId"],
-        aws_secret_access_key=assumed_role["Credentials"]["SecretAccessKey"],
-        aws_session_token=assumed_role["Credentials"]["SessionToken"],
-    )
-
+    emr = EmrServerlessManager(db_manager, role_session_name="dashboard-job-logs")
     try:
-        response = emr_client.get_job_run(
-            applicationId=application_id,
-            jobRunId=job_run_id,
-        )
-
-        # Get the CloudWatch logs
-        logs_client = boto3.client(
-            "logs",
-            aws_access_key_id=assumed_role["Credentials"]["AccessKeyId"],
-            aws_secret_access_key=assumed_role["Credentials"]["SecretAccessKey"],
-            aws_session_token=assumed_role["Credentials"]["SessionToken"],
-        )
-
-        log_groups = [
-            f"/aws-emr-serverless-logs/{application_id}/{job_run_id}/spark-job-driver",
-            f"/aws-emr-serverless-logs/{application_id}/{job_run_id}/spark-job-executor",
-        ]
-
-        all_logs = []
-        for log_group in log_groups:
-            try:
-                log_streams = logs_client.describe_log_streams(
-                    logGroupName=log_group,
-                    orderBy="LastEventTime",
-                    descending=True,
-                    limit=1,
-                )
-
-                if log_streams.get("logStreams"):
-                    for stream in log_streams["logStreams"]:
-                        logs = logs_client.get_log_events(
-                            logGroupName=log_group,
-                            logStreamName=stream["logStreamName"],
-                            startFromHead=True,
-                        )
-
-                        for event in logs["events"]:
-                            all_logs.append(
-                                {
-                                    "timestamp": event["timestamp"],
-                                    "message": event["message"],
-                                    "type": (
-                                        "driver"
-                                        if "driver" in log_group
-                                        else "executor"
-                                    ),
-                                }
-                            )
-            except logs_client.exceptions.ResourceNotFoundException:
-                continue
-
-        # Sort logs by timestamp
-        all_logs.sort(key=lambda x: x["timestamp"])
-
-        return {"status": response["jobRun"]["state"], "logs": all_logs}
+        job_run = emr.get_job_run(job_run_id, application_id)
+        logs = emr.get_job_logs(job_run_id, application_id)
+        return {"status": job_run["state"], "logs": logs}
     except Exception as e:
         return {"error": str(e)}
@@ -1,19 +1,48 @@
 import boto3
 from botocore.exceptions import ClientError
-import pandas as pd
+from dataclasses import asdict, dataclass
 import pyarrow as pa
-import pyarrow.dataset as ds
 from pyiceberg.catalog import load_catalog
+from pyiceberg.expressions import AlwaysTrue, In
 from pyiceberg.schema import Schema
 from pyiceberg.types import (
+    BooleanType,
+    DateType,
+    DecimalType,
+    DoubleType,
+    IcebergType,
     NestedField,
     StringType,
     TimestampType,
+    TimestamptzType,
     LongType,
 )
-import json
-from typing import Optional, Dict, Any
-from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from watchdog.events import FileSystemEventHandler
+
+from nextdata.core.db.db_manager import DatabaseManager
+from nextdata.core.db.models import SyncedFile
+from nextdata.core.project_config import NextDataConfig
+from nextdata.util.data_files import (
+    DEFAULT_CHUNK_BYTES,
+    SOURCE_FILE_COLUMN,
+    FileState,
+    changed_files,
+    chunk_batches,
+    data_files,
+    open_dataset,
+    scan_batches,
+)
+
+
+@dataclass
+class DirectorySync:
+    """Files whose state changed in a sync, and the files no longer there"""
+
+    files: list[FileState]
+    removed: list[str]
+    rows: int = 0
 
 
 class S3TablesManager:
@@ -58,60 +87,123 @@ class S3TablesManager:
             print(f"Error creating table: {str(e)}")
             raise e
 
-    def infer_schema_from_data(self, data: pd.DataFrame) -> Schema:
-        """Infer Iceberg schema from pandas DataFrame"""
+    def infer_schema_from_data(self, schema: pa.Schema) -> Schema:
+        """Iceberg schema for Arrow data"""
         fields = []
 
-        for column, dtype in data.dtypes.items():
-            if pd.api.types.is_datetime64_any_dtype(dtype):
-                field_type = TimestampType()
-            elif pd.api.types.is_integer_dtype(dtype):
-                field_type = LongType()
-            else:
-                field_type = StringType()
-
+        for arrow_field in schema:
             fields.append(
-                NestedField.required(
-                    field_id=len(fields) + 1, name=column, field_type=field_type
+                NestedField(
+                    field_id=len(fields) + 1,
+                    name=arrow_field.name,
+                    field_type=self._iceberg_type(arrow_field.type),
+                    required=False,
                 )
             )
 
         return Schema(*fields)
 
-    def sync_directory(self, directory_path: str, table_name: str) -> None:
-        """Sync a local directory to an S3 table"""
-        # Ensure table bucket exists
-        self.ensure_table_bucket_exists()
+    @staticmethod
+    def _iceberg_type(arrow_type: pa.DataType) -> IcebergType:
+        if pa.types.is_timestamp(arrow_type):
+            return TimestamptzType() if arrow_type.tz else TimestampType()
+        if pa.types.is_date(arrow_type):
+            return DateType()
+        if pa.types.is_integer(arrow_type):
+            return LongType()
+        if pa.types.is_decimal(arrow_type):
+            return DecimalType(arrow_type.precision, arrow_type.scale)
+        if pa.types.is_floating(arrow_type):
+            return DoubleType()
+        if pa.types.is_boolean(arrow_type):
+            return BooleanType()
+        return StringType()
 
-        # Read all CSV files in directory
-        dfs = []
-        for file in directory_path.glob("*.csv"):
-            df = pd.read_csv(file)
-            dfs.append(df)
+    def sync_directory(
+        self,
+        directory_path: Path,
+        table_name: str,
+        synced: Optional[dict[str, FileState]] = None,
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+    ) -> DirectorySync:
+        """
+        Sync the CSV, Parquet and NDJSON files in a local directory to an S3 table.
 
-        if not dfs:
-            print(f"No CSV files found in {directory_path}")
-            return
+        synced holds the files as they were when last synced. Only new and
+        changed files are read, and the rows of changed and removed files are
+        replaced through the table's source file column. Without synced, an
+        existing table's rows are all replaced.
 
-        # Combine all DataFrames
-        combined_df = pd.concat(dfs, ignore_index=True)
+        Files are streamed in batches and appended chunk_bytes at a time in
+        one transaction, so memory stays bounded whatever the directory's size.
+        """
+        # Ensure table bucket exists
+        self.ensure_table_bucket_exists()
 
-        # Infer schema if table doesn't exist
+        synced = synced or {}
+        files = data_files(directory_path)
+        states, changed = changed_files(files, synced)
+        present = {path.name for paths in files.values() for path in paths}
+        removed = [name for name in synced if name not in present]
+        if not changed and not removed:
+            return DirectorySync(states, removed)
+        changed_names = {path.name for path in changed}
+        changed_files_by_format = {
+            file_format: [path for path in paths if path.name in changed_names]
+            for file_format, paths in files.items()
+        }
+        changed_files_by_format = {
+            file_format: paths
+            for file_format, paths in changed_files_by_format.items()
+            if paths
+        }
+
+        # Existing tables read the files with their own schema, new ones are
+        # created from the schema inferred from the files
+        identifier = f"{self.bucket_name}.{table_name}"
         try:
-            table = self.catalog.load_table(f"{self.bucket_name}.{table_name}")
+            table = self.catalog.load_table(identifier)
         except Exception:
-            schema = self.infer_schema_from_data(combined_df)
-            self.create_table(table_name, schema)
-            table = self.catalog.load_table(f"{self.bucket_name}.{table_name}")
-
-        # Convert DataFrame to PyArrow table
-        table = pa.Table.from_pandas(combined_df)
+            table = None
+        if table is None:
+            if not changed:
+                return DirectorySync(states, removed)
+            inferred = open_dataset(changed_files_by_format).schema
+            self.create_table(
+                table_name,
+                self.infer_schema_from_data(
+                    inferred.append(pa.field(SOURCE_FILE_COLUMN, pa.string()))
+                ),
+            )
+            table = self.catalog.load_table(identifier)
+            replace_filter = None
+        elif not synced:
+            replace_filter = AlwaysTrue()
+        else:
+            replaced = [name for name in synced if name in changed_names] + removed
+            replace_filter = In(SOURCE_FILE_COLUMN, replaced) if replaced else None
+        if SOURCE_FILE_COLUMN not in table.schema().column_names:
+            with table.update_schema() as update:
+                update.add_column(SOURCE_FILE_COLUMN, StringType())
+        schema = table.schema().as_arrow()
 
-        # Write to S3 Tables using Iceberg
-        with table.write_to(f"s3://tables/{self.bucket_name}/{table_name}") as writer:
-            writer.write_table(table)
+        rows = 0
+        with table.transaction() as transaction:
+            if replace_filter is not None:
+                transaction.delete(replace_filter)
+            if changed:
+                dataset = open_dataset(changed_files_by_format, schema)
+                for chunk in chunk_batches(
+                    scan_batches(dataset, SOURCE_FILE_COLUMN), schema, chunk_bytes
+                ):
+                    transaction.append(chunk)
+                    rows += chunk.num_rows
 
-        print(f"Synced {len(combined_df)} rows to table: {table_name}")
+        print(
+            f"Synced {rows} rows from {len(changed)} files to table: {table_name}"
+            + (f", removed rows of {len(removed)} files" if removed else "")
+        )
+        return DirectorySync(states, removed, rows)
 
 
 class EnhancedDataDirectoryHandler(FileSystemEventHandler):
@@ -119,6 +211,7 @@ class EnhancedDataDirectoryHandler(FileSystemEventHandler):
         self.data_dir = data_dir
         self.config = config
         self.s3_manager = None
+        self.db_manager = DatabaseManager(config.project_dir / "nextdata.db")
 
         if config.config["aws"]["table_bucket"]:
             self.s3_manager = S3TablesManager(
@@ -143,6 +236,21 @@ class EnhancedDataDirectoryHandler(FileSystemEventHandler):
 
         try:
             table_name = directory.relative_to(self.data_dir).name
-            self.s3_manager.sync_directory(directory, table_name)
+            # Only files that changed since the last sync are ingested
+            synced = {
+                file.name: FileState(
+                    file.name, file.size, file.mtime, file.content_hash
+                )
+                for file in self.db_manager.get_synced_files(table_name)
+            }
+            result = self.s3_manager.sync_directory(directory, table_name, synced)
+            self.db_manager.set_synced_files(
+                table_name,
+                [
+                    SyncedFile(table_name=table_name, **asdict(state))
+                    for state in result.files
+                ],
+                result.removed,
+            )
         except Exception as e:
             print(f"Error syncing directory: {str(e)}")
@@ -1,7 +1,7 @@
-from typing import Literal, Optional
+from typing import Annotated, Literal, Optional, Union
 from fastapi import Form, HTTPException
 from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel, StringConstraints, ValidationError
 
 
 class StackOutputs(BaseModel):
@@ -21,15 +21,22 @@ class StackOutputs(BaseModel):
 class SparkSchemaSpec(BaseModel):
     schema: dict[
         str,
-        Literal[
-            "STRING",
-            "DOUBLE",
-            "INT",
-            "FLOAT",
-            "BOOLEAN",
-            "TIMESTAMP",
-            "DATE",
-            "LONG",
+        Union[
+            Literal[
+                "STRING",
+                "DOUBLE",
+                "INT",
+                "FLOAT",
+                "BOOLEAN",
+                "TIMESTAMP",
+                "TIMESTAMP_NTZ",
+                "DATE",
+                "LONG",
+            ],
+            # DECIMAL(precision,scale)
+            Annotated[
+                str, StringConstraints(pattern=r"^DECIMAL\(\d{1,2},\s*\d{1,2}\)$")
+            ],
         ],
     ]
 
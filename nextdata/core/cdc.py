@@ -0,0 +1,480 @@
+"""
+Log-based change data capture from Postgres into Iceberg tables.
+
+Changes are read from a logical replication slot with the SQL slot functions,
+decoded from pgoutput or wal2json, compacted to the last change per primary
+key and applied to the Iceberg table with a single MERGE per batch.
+
+The slot is peeked rather than consumed, and only advanced once the MERGE has
+committed and the LSN checkpoint has been saved to nextdata.db. A crash in
+between replays the batch, which is harmless: applying the last change per
+key is idempotent, and transactions at or below the checkpoint are skipped.
+"""
+
+from dataclasses import dataclass, field
+import json
+import logging
+import struct
+from typing import Any, Callable, Iterator, Literal, Optional
+
+from pyspark.sql.types import ArrayType, StringType, StructField, StructType
+
+from nextdata.core.connections.spark import SparkManager, WriteMetrics
+from nextdata.util.s3_tables_utils import get_s3_table_path
+
+logger = logging.getLogger(__name__)
+
+CdcPlugin = Literal["pgoutput", "wal2json"]
+Operation = Literal["insert", "update", "delete"]
+
+DEFAULT_MAX_CHANGES = 10000
+
+
+def lsn_to_int(lsn: str) -> int:
+    """Convert a textual LSN like 16/B374D848 to an int for comparisons"""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+@dataclass
+class Change:
+    """A row change, with every value in its Postgres text form"""
+
+    operation: Operation
+    table: str
+    values: dict[str, Optional[str]]
+    # Replica identity of the row before an update or delete, if it was sent
+    old_key: Optional[dict[str, Optional[str]]] = None
+    # TOASTed columns an update left untouched, whose values aren't sent
+    unchanged: set[str] = field(default_factory=set)
+
+
+@dataclass
+class Transaction:
+    commit_lsn: str
+    changes: list[Change] = field(default_factory=list)
+
+
+class PgOutputDecoder:
+    """
+    Decoder for version 1 of the pgoutput logical replication protocol.
+
+    Relation messages are cached so later row messages can be mapped to the
+    table and column names they refer to.
+    """
+
+    def __init__(self):
+        self.relations: dict[int, tuple[str, list[str]]] = {}
+
+    def decode(self, data: bytes) -> Optional[tuple[str, Optional[Change]]]:
+        """Decode one message into (kind, change), or None if it's ignored"""
+        data = bytes(data)
+        kind = chr(data[0])
+        if kind == "B":
+            return "begin", None
+        if kind == "C":
+            return "commit", None
+        if kind == "R":
+            self._decode_relation(data)
+            return None
+        if kind in ("I", "U", "D"):
+            return "change", self._decode_row(kind, data)
+        # Truncate, type, origin and message payloads don't change rows we track
+        if kind == "T":
+            logger.warning("Ignoring TRUNCATE in the change stream")
+        return None
+
+    def _decode_relation(self, data: bytes) -> None:
+        (relation_id,) = struct.unpack_from("!I", data, 1)
+        offset = 5
+        _, offset = self._read_string(data, offset)
+        table, offset = self._read_string(data, offset)
+        # Replica identity setting
+        offset += 1
+        (num_columns,) = struct.unpack_from("!H", data, offset)
+        offset += 2
+        columns = []
+        for _ in range(num_columns):
+            # Flags, then name, type oid and type modifier
+            name, offset = self._read_string(data, offset + 1)
+            offset += 8
+            columns.append(name)
+        self.relations[relation_id] = (table, columns)
+
+    def _decode_row(self, kind: str, data: bytes) -> Change:
+        (relation_id,) = struct.unpack_from("!I", data, 1)
+        table, columns = self.relations[relation_id]
+        offset = 5
+        old_values = None
+        if chr(data[offset]) in ("K", "O"):
+            old_values, _, offset = self._read_tuple(data, offset + 1, columns)
+        if kind == "D":
+            return Change("delete", table, old_values, old_key=old_values)
+        # Skip the 'N' that marks the new tuple
+        values, unchanged, _ = self._read_tuple(data, offset + 1, columns)
+        operation = "insert" if kind == "I" else "update"
+        return Change(operation, table, values, old_key=old_values, unchanged=unchanged)
+
+    @staticmethod
+    def _read_string(data: bytes, offset: int) -> tuple[str, int]:
+        end = data.index(b"\0", offset)
+        return data[offset:end].decode(), end + 1
+
+    @staticmethod
+    def _read_tuple(
+        data: bytes, offset: int, columns: list[str]
+    ) -> tuple[dict[str, Optional[str]], set[str], int]:
+        (num_columns,) = struct.unpack_from("!H", data, offset)
+        offset += 2
+        values: dict[str, Optional[str]] = {}
+        unchanged = set()
+        for column in columns[:num_columns]:
+            kind = chr(data[offset])
+            offset += 1
+            if kind == "n":
+                values[column] = None
+            elif kind == "u":
+                unchanged.add(column)
+            else:
+                (length,) = struct.unpack_from("!I", data, offset)
+                offset += 4
+                values[column] = data[offset : offset + length].decode()
+                offset += length
+        return values, unchanged, offset
+
+
+class Wal2JsonDecoder:
+    """Decoder for wal2json's format-version 2, one JSON object per change"""
+
+    OPERATIONS = {"I": "insert", "U": "update", "D": "delete"}
+
+    def decode(self, data: str) -> Optional[tuple[str, Optional[Change]]]:
+        message = json.loads(data)
+        action = message["action"]
+        if action == "B":
+            return "begin", None
+        if action == "C":
+            return "commit", None
+        if action not in self.OPERATIONS:
+            if action == "T":
+                logger.warning("Ignoring TRUNCATE in the change stream")
+            return None
+
+        def to_text(columns: list[dict]) -> dict[str, Optional[str]]:
+            return {
+                column["name"]: (
+                    None if column["value"] is None else str(column["value"])
+                )
+                for column in columns
+            }
+
+        old_key = to_text(message["identity"]) if "identity" in message else None
+        if action == "D":
+            return "change", Change("delete", message["table"], old_key, old_key)
+        return "change", Change(
+            self.OPERATIONS[action],
+            message["table"],
+            to_text(message["columns"]),
+            old_key=old_key,
+        )
+
+
+class ReplicationSlot:
+    """
+    A logical replication slot read with the SQL slot functions.
+
+    Needs a connection in autocommit mode from a role with the REPLICATION
+    attribute, on a server running with wal_level = logical.
+    """
+
+    def __init__(
+        self,
+        connection,
+        slot_name: str,
+        table_name: str,
+        plugin: CdcPlugin = "pgoutput",
+    ):
+        self.connection = connection
+        self.slot_name = slot_name
+        self.table_name = table_name
+        self.plugin = plugin
+
+    @property
+    def publication_name(self) -> str:
+        return self.slot_name
+
+    def ensure(self) -> bool:
+        """Create the slot (and pgoutput publication) if needed, True if created"""
+        with self.connection.cursor() as cursor:
+            if self.plugin == "pgoutput":
+                cursor.execute(
+                    "SELECT 1 FROM pg_publication WHERE pubname = %s",
+                    (self.publication_name,),
+                )
+                if not cursor.fetchone():
+                    cursor.execute(
+                        f"CREATE PUBLICATION {self.publication_name} "
+                        f"FOR TABLE {self.table_name}"
+                    )
+            cursor.execute(
+                "SELECT 1 FROM pg_replication_slots WHERE slot_name = %s",
+                (self.slot_name,),
+            )
+            if cursor.fetchone():
+                return False
+            cursor.execute(
+                "SELECT pg_create_logical_replication_slot(%s, %s)",
+                (self.slot_name, self.plugin),
+            )
+        logger.info(f"Created replication slot {self.slot_name} ({self.plugin})")
+        return True
+
+    def peek(self, max_changes: int = DEFAULT_MAX_CHANGES) -> list[tuple[str, Any]]:
+        """
+        (lsn, message) pairs from the slot without consuming them.
+
+        Postgres stops after the transaction that contains the max_changes-th
+        change, so a batch always ends on a commit.
+        """
+        if self.plugin == "pgoutput":
+            query = """
+            SELECT lsn::text, data
+            FROM pg_logical_slot_peek_binary_changes(
+                %s, NULL, %s, 'proto_version', '1', 'publication_names', %s
+            )
+            """
+            params = (self.slot_name, max_changes, self.publication_name)
+        else:
+            query = """
+            SELECT lsn::text, data
+            FROM pg_logical_slot_peek_changes(
+                %s, NULL, %s, 'format-version', '2', 'add-tables', %s
+            )
+            """
+            params = (self.slot_name, max_changes, f"*.{self.table_name}")
+        with self.connection.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def advance(self, lsn: str) -> None:
+        """Let Postgres discard WAL up to lsn"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_replication_slot_advance(%s, %s::pg_lsn)",
+                (self.slot_name, lsn),
+            )
+
+    def drop(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT pg_drop_replication_slot(%s)", (self.slot_name,))
+            if self.plugin == "pgoutput":
+                cursor.execute(f"DROP PUBLICATION IF EXISTS {self.publication_name}")
+
+
+def read_transactions(
+    messages: list[tuple[str, Any]],
+    plugin: CdcPlugin,
+    table_name: str,
+    after_lsn: Optional[str] = None,
+) -> Iterator[Transaction]:
+    """
+    Group decoded messages into committed transactions on table_name.
+
+    Transactions that committed at or before after_lsn were already applied
+    and are skipped.
+    """
+    decoder = PgOutputDecoder() if plugin == "pgoutput" else Wal2JsonDecoder()
+    after = lsn_to_int(after_lsn) if after_lsn else -1
+    changes: list[Change] = []
+    for lsn, data in messages:
+        decoded = decoder.decode(data)
+        if decoded is None:
+            continue
+        kind, change = decoded
+        if kind == "begin":
+            changes = []
+        elif kind == "change" and change.table == table_name:
+            changes.append(change)
+        elif kind == "commit":
+            if lsn_to_int(lsn) > after:
+                yield Transaction(commit_lsn=lsn, changes=changes)
+            changes = []
+
+
+def compact(changes: list[Change], key_columns: list[str]) -> list[Change]:
+    """
+    Reduce a batch to the last change per primary key, in commit order.
+
+    An update that changes the key also deletes the row under its old key.
+    Unchanged TOAST values are filled in from earlier changes in the batch
+    when possible, so only the first change to a key can carry them.
+    """
+
+    def key_of(values: dict[str, Optional[str]]) -> tuple:
+        return tuple(values.get(column) for column in key_columns)
+
+    latest: dict[tuple, Change] = {}
+    for change in changes:
+        key = key_of(change.values)
+        if change.old_key and all(column in change.old_key for column in key_columns):
+            old_key = key_of(change.old_key)
+            if old_key != key:
+                latest.pop(old_key, None)
+                latest[old_key] = Change("delete", change.table, change.old_key)
+        previous = latest.pop(key, None)
+        if change.unchanged and previous and previous.operation != "delete":
+            filled = {
+                column: previous.values[column]
+                for column in change.unchanged
+                if column in previous.values
+            }
+            change = Change(
+                change.operation,
+                change.table,
+                {**change.values, **filled},
+                old_key=change.old_key,
+                unchanged=change.unchanged - set(filled),
+            )
+        latest[key] = change
+    return list(latest.values())
+
+
+def merge_statement(
+    table_path: str,
+    source_view: str,
+    key_columns: list[str],
+    columns: list[str],
+    extra_columns: dict[str, str],
+) -> str:
+    """
+    MERGE applying compacted changes from source_view.
+
+    extra_columns maps target columns that don't come from the source to the
+    expression they take when a row is inserted or updated.
+    """
+    condition = " AND ".join(f"t.{column} = s.{column}" for column in key_columns)
+    updates = [
+        f"{column} = CASE WHEN array_contains(s._unchanged, '{column}') "
+        f"THEN t.{column} ELSE s.{column} END"
+        for column in columns
+    ] + [f"{column} = {expression}" for column, expression in extra_columns.items()]
+    insert_columns = columns + list(extra_columns)
+    insert_values = [f"s.{column}" for column in columns] + list(extra_columns.values())
+    return f"""
+    MERGE INTO {table_path} t
+    USING {source_view} s
+    ON {condition}
+    WHEN MATCHED AND s._op = 'delete' THEN DELETE
+    WHEN MATCHED THEN UPDATE SET {", ".join(updates)}
+    WHEN NOT MATCHED AND s._op != 'delete' THEN
+        INSERT ({", ".join(insert_columns)}) VALUES ({", ".join(insert_values)})
+    """
+
+
+def apply_changes(
+    spark_manager: SparkManager,
+    table_name: str,
+    changes: list[Change],
+    key_columns: list[str],
+    commit_lsn: str,
+) -> WriteMetrics:
+    """
+    Apply compacted changes to the Iceberg table in one MERGE.
+
+    Values arrive as text and are cast to the types of the target table, so
+    the table has to exist, e.g. from an initial full load.
+    """
+    table_path = get_s3_table_path(spark_manager.namespace, table_name)
+    spark = spark_manager.spark
+    target_schema = spark.table(table_path).schema
+    source_columns = [
+        field.name
+        for field in target_schema.fields
+        if any(field.name in change.values for change in changes)
+        or field.name in key_columns
+    ]
+    # The ETL job stamps every row with its load date
+    extra_columns = (
+        {"ds": "current_date()"}
+        if "ds" in target_schema.fieldNames() and "ds" not in source_columns
+        else {}
+    )
+    # Columns an update didn't send (unchanged TOAST values, or columns
+    # wal2json left out) keep their current value
+    rows = [
+        [change.values.get(column) for column in source_columns]
+        + [
+            change.operation,
+            sorted(
+                change.unchanged
+                | {column for column in source_columns if column not in change.values}
+                if change.operation == "update"
+                else change.unchanged
+            ),
+        ]
+        for change in changes
+    ]
+    text_schema = StructType(
+        [StructField(column, StringType()) for column in source_columns]
+        + [
+            StructField("_op", StringType()),
+            StructField("_unchanged", ArrayType(StringType())),
+        ]
+    )
+    types = {field.name: field.dataType.simpleString() for field in target_schema}
+    source_df = spark.createDataFrame(rows, text_schema).selectExpr(
+        *[
+            f"CAST({column} AS {types[column]}) AS {column}"
+            for column in source_columns
+        ],
+        "_op",
+        "_unchanged",
+    )
+    view = f"_cdc_{table_name}"
+    source_df.createOrReplaceTempView(view)
+    try:
+        spark.sql(
+            merge_statement(
+                table_path, view, key_columns, source_columns, extra_columns
+            )
+        )
+    finally:
+        spark.catalog.dropTempView(view)
+    metrics = spark_manager.get_write_metrics(table_name, len(changes), sample_size=0)
+    logger.info(f"Applied changes up to {commit_lsn}: {metrics}")
+    return metrics
+
+
+def sync_changes(
+    slot: ReplicationSlot,
+    spark_manager: SparkManager,
+    key_columns: list[str],
+    checkpoint: Optional[str],
+    save_checkpoint: Callable[[str], None],
+    max_changes: int = DEFAULT_MAX_CHANGES,
+) -> Optional[str]:
+    """
+    Apply one batch of changes from the slot and return the new checkpoint.
+
+    The checkpoint is saved before the slot is advanced, so the slot never
+    gets ahead of what has been applied to the table.
+    """
+    messages = slot.peek(max_changes)
+    if not messages:
+        return checkpoint
+    transactions = list(
+        read_transactions(messages, slot.plugin, slot.table_name, checkpoint)
+    )
+    # Batches end on a commit, so the last message is the furthest position
+    last_lsn = messages[-1][0]
+    changes = compact(
+        [change for transaction in transactions for change in transaction.changes],
+        key_columns,
+    )
+    if changes:
+        apply_changes(spark_manager, slot.table_name, changes, key_columns, last_lsn)
+    if not checkpoint or lsn_to_int(last_lsn) > lsn_to_int(checkpoint):
+        save_checkpoint(last_lsn)
+        checkpoint = last_lsn
+    slot.advance(last_lsn)
+    return checkpoint
@@ -0,0 +1,290 @@
+import json
+import logging
+import time
+from typing import Any, Optional
+
+import boto3
+from pydantic import BaseModel
+
+from nextdata.core.db.db_manager import DatabaseManager
+from nextdata.core.db.models import EmrJob, HumanReadableName
+from nextdata.core.glue.batch_etl_script import (
+    DEFAULT_MAX_CONCURRENCY,
+    BatchGlueJobArgs,
+)
+from nextdata.core.glue.dialects import get_dialect
+from nextdata.core.glue.glue_entrypoint import GlueJobArgs
+
+DEFAULT_SCRIPT_NAME = "scripts/default_etl_script.py"
+BATCH_SCRIPT_NAME = "scripts/batch_etl_script.py"
+
+PACKAGES = [
+    "org.apache.iceberg:iceberg-spark-runtime-3.5_2.12:1.6.1",
+    "software.amazon.s3tables:s3-tables-catalog-for-iceberg-runtime:0.1.3",
+    "software.amazon.awssdk:bundle:2.21.1",
+]
+
+
+def to_argument_list(args: BaseModel) -> list[str]:
+    """Render job arguments as the --name value pairs the glue_job parser reads"""
+    args_list = []
+    for name, value in args.model_dump().items():
+        if value is None:
+            continue
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        elif isinstance(value, bool):
+            value = str(value).lower()  # Convert True/False to 'true'/'false'
+        # Arguments are passed to the job as a list, not through a shell, so
+        # values with spaces (e.g. a source_filter) must not be quoted
+        args_list.append(f"--{name}")  # Add argument name separately
+        args_list.append(str(value))  # Add value separately
+    return args_list
+
+
+def driver_package(job: EmrJob) -> str:
+    """Maven package of the JDBC driver for a job's source database"""
+    connection_properties = job.connection_properties or {}
+    if isinstance(connection_properties, str):
+        connection_properties = json.loads(connection_properties)
+    protocol = connection_properties.get("protocol", "postgresql")
+    return get_dialect(protocol).driver_package
+
+
+class EmrServerlessManager:
+    """Submits ETL jobs to the project's EMR Serverless application"""
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        role_session_name: str = "dashboard-job-trigger",
+    ):
+        self.db_manager = db_manager
+        self.glue_role_arn = db_manager.get_resource_by_name(
+            HumanReadableName.GLUE_ROLE
+        ).resource_arn
+        emr_app_arn = db_manager.get_resource_by_name(
+            HumanReadableName.EMR_APP
+        ).resource_arn
+        self.application_id = emr_app_arn.split("/")[-1]
+        self.bucket_arn = db_manager.get_resource_by_name(
+            HumanReadableName.S3_TABLE_BUCKET
+        ).resource_arn
+        self.namespace = db_manager.get_resource_by_name(
+            HumanReadableName.S3_TABLE_NAMESPACE
+        ).name
+
+        sts_client = boto3.client("sts")
+        assumed_role = sts_client.assume_role(
+            RoleArn=self.glue_role_arn,
+            RoleSessionName=role_session_name,
+        )
+        self.credentials = {
+            "aws_access_key_id": assumed_role["Credentials"]["AccessKeyId"],
+            "aws_secret_access_key": assumed_role["Credentials"]["SecretAccessKey"],
+            "aws_session_token": assumed_role["Credentials"]["SessionToken"],
+        }
+        # Create EMR client with the assumed role credentials
+        self.emr_client = boto3.client("emr-serverless", **self.credentials)
+
+    def ensure_application_started(self, timeout: int = 30) -> None:
+        """Start the EMR application if it isn't running, and wait for it"""
+        sent_start_request = False
+        deadline = time.time() + timeout
+        while True:
+            emr_app_state = self.emr_client.get_application(
+                applicationId=self.application_id
+            )
+            logging.error(f"App State: {emr_app_state}")
+            if emr_app_state["application"]["state"] in ("CREATED", "STARTED"):
+                return
+            if not sent_start_request:
+                self.emr_client.start_application(applicationId=self.application_id)
+                sent_start_request = True
+            if time.time() > deadline:
+                raise Exception("App did not start in time")
+            time.sleep(1)
+
+    def job_args(self, job: EmrJob) -> GlueJobArgs:
+        """Arguments for the default ETL script from a job's configuration"""
+        return GlueJobArgs(
+            job_name=job.name,
+            connection_name=job.connection_name,
+            connection_type=job.connection_type.value,
+            connection_properties=job.connection_properties,
+            sql_table=job.sql_table,
+            incremental_column=job.incremental_column,
+            is_full_load=job.is_full_load,
+            max_partitions=job.max_partitions,
+            target_partition_bytes=job.target_partition_bytes,
+            checkpoint_partitions=job.checkpoint_partitions,
+            extraction_engine=job.extraction_engine,
+            write_mode=job.write_mode,
+            merge_strategy=job.merge_strategy,
+            columns=job.columns,
+            source_filter=job.source_filter,
+            partition_by=job.partition_by,
+            sort_order=job.sort_order,
+            write_tuning=job.write_tuning,
+            expectations=job.expectations,
+            max_connections=job.max_connections,
+            retl_mode=job.retl_mode,
+            bucket_arn=self.bucket_arn,
+            namespace=self.namespace,
+        )
+
+    def submit(
+        self,
+        name: str,
+        entry_point: str,
+        arguments: list[str],
+        bucket: str,
+        venv_s3_path: str,
+        spark_conf: Optional[dict[str, str]] = None,
+        driver_packages: Optional[list[str]] = None,
+    ) -> dict[str, str]:
+        """
+        Start a job run of a PySpark script with the project's Spark setup,
+        plus the JDBC drivers in driver_packages.
+        """
+        spark_conf = {
+            "spark.executor.cores": "1",
+            "spark.executor.memory": "4G",
+            "spark.executor.instances": "1",
+            "spark.driver.cores": "1",
+            "spark.driver.memory": "4G",
+            # Add dependencies using Maven coordinates
+            "spark.jars.packages": ",".join(
+                PACKAGES + sorted(set(driver_packages or []))
+            ),
+            # Add iceberg and s3 extensions
+            "spark.sql.catalog.s3tablesbucket": "org.apache.iceberg.spark.SparkCatalog",
+            "spark.sql.catalog.s3tablesbucket.catalog-impl": "software.amazon.s3tables.iceberg.S3TablesCatalog",
+            "spark.sql.catalog.s3tablesbucket.warehouse": self.bucket_arn,
+            "spark.sql.extensions": "org.apache.iceberg.spark.extensions.IcebergSparkSessionExtensions",
+            # Add environment
+            "spark.archives": f"s3://{bucket}/{venv_s3_path}#environment",
+            "spark.emr-serverless.driverEnv.PYSPARK_DRIVER_PYTHON": "./environment/bin/python",
+            "spark.emr-serverless.driverEnv.PYSPARK_PYTHON": "./environment/bin/python",
+            "spark.executorEnv.PYSPARK_PYTHON": "./environment/bin/python",
+            **(spark_conf or {}),
+        }
+        logging.error(f"Args List:\n{arguments}")
+        response = self.emr_client.start_job_run(
+            applicationId=self.application_id,
+            executionRoleArn=self.glue_role_arn,
+            name=name,
+            jobDriver={
+                "sparkSubmit": {
+                    "entryPoint": entry_point,
+                    "entryPointArguments": arguments,
+                    "sparkSubmitParameters": " ".join(
+                        f"--conf {key}={value}" for key, value in spark_conf.items()
+                    ),
+                }
+            },
+            configurationOverrides={
+                "monitoringConfiguration": {
+                    "s3MonitoringConfiguration": {"logUri": f"s3://{bucket}/logs/"}
+                }
+            },
+        )
+        return {"jobRunId": response["jobRunId"], "applicationId": self.application_id}
+
+    def start_job(self, job: EmrJob, **overrides: Any) -> dict[str, str]:
+        """Run one table's job, with overrides replacing some of its arguments"""
+        return self.submit(
+            job.name,
+            f"s3://{job.script.bucket}/{job.script.s3_path}",
+            to_argument_list(self.job_args(job).model_copy(update=overrides)),
+            job.script.bucket,
+            job.venv_s3_path,
+            driver_packages=[driver_package(job)],
+        )
+
+    def get_job_run(
+        self, job_run_id: str, application_id: Optional[str] = None
+    ) -> dict[str, Any]:
+        """A job run of the project's application, or of application_id"""
+        return self.emr_client.get_job_run(
+            applicationId=application_id or self.application_id,
+            jobRunId=job_run_id,
+        )["jobRun"]
+
+    def get_job_logs(
+        self, job_run_id: str, application_id: Optional[str] = None
+    ) -> list[dict[str, Any]]:
+        """The driver's and executors' log events of a job run, oldest first"""
+        application_id = application_id or self.application_id
+        logs_client = boto3.client("logs", **self.credentials)
+        log_groups = [
+            f"/aws-emr-serverless-logs/{application_id}/{job_run_id}/spark-job-driver",
+            f"/aws-emr-serverless-logs/{application_id}/{job_run_id}/spark-job-executor",
+        ]
+
+        all_logs = []
+        for log_group in log_groups:
+            try:
+                log_streams = logs_client.describe_log_streams(
+                    logGroupName=log_group,
+                    orderBy="LastEventTime",
+                    descending=True,
+                    limit=1,
+                )
+                for stream in log_streams.get("logStreams", []):
+                    logs = logs_client.get_log_events(
+                        logGroupName=log_group,
+                        logStreamName=stream["logStreamName"],
+                        startFromHead=True,
+                    )
+                    for event in logs["events"]:
+                        all_logs.append(
+                            {
+                                "timestamp": event["timestamp"],
+                                "message": event["message"],
+                                "type": (
+                                    "driver" if "driver" in log_group else "executor"
+                                ),
+                            }
+                        )
+            except logs_client.exceptions.ResourceNotFoundException:
+                continue
+
+        all_logs.sort(key=lambda x: x["timestamp"])
+        return all_logs
+
+    def start_batch(
+        self, jobs: list[EmrJob], max_concurrency: Optional[int] = None
+    ) -> dict[str, str]:
+        """
+        Run several tables' jobs in one job run with the batch ETL script.
+
+        Only tables that use the default ETL script can be batched; tables
+        with a custom script still need a run of their own.
+        """
+        custom = [job.name for job in jobs if job.script.name != DEFAULT_SCRIPT_NAME]
+        if custom:
+            raise ValueError(f"Jobs with a custom script can't be batched: {custom}")
+        batch_args = BatchGlueJobArgs(
+            jobs=[self.job_args(job) for job in jobs],
+            max_concurrency=max_concurrency or DEFAULT_MAX_CONCURRENCY,
+            bucket_arn=self.bucket_arn,
+            namespace=self.namespace,
+        )
+        script = self.db_manager.get_script_by_name(BATCH_SCRIPT_NAME)
+        return self.submit(
+            f"batch-{'-'.join(job.sql_table for job in jobs)}"[:256],
+            f"s3://{script.bucket}/{script.s3_path}",
+            to_argument_list(batch_args),
+            script.bucket,
+            # Every job is built from the same glue requirements
+            jobs[0].venv_s3_path,
+            # Share executors fairly between the tables running at once
+            spark_conf={
+                "spark.scheduler.mode": "FAIR",
+                "spark.executor.instances": str(
+                    max(1, min(len(jobs), batch_args.max_concurrency))
+                ),
+            },
+            driver_packages=[driver_package(job) for job in jobs],
+        )
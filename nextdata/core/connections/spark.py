@@ -1,11 +1,161 @@
+from dataclasses import dataclass, field
+from datetime import datetime
 import logging
-from typing import Literal, Optional
-from pyspark.sql import DataFrame, SparkSession
+import re
+from typing import Any, Callable, Literal, Optional
+import uuid
+from pyspark.sql import Column, DataFrame, Observation, SparkSession
+import pyspark.sql.functions as F
 
 from nextdata.cli.types import SparkSchemaSpec
 from nextdata.core.pulumi_context_manager import PulumiContextManager
 from nextdata.util.s3_tables_utils import get_s3_table_path
 
+WriteMode = Literal["overwrite", "append", "merge"]
+MergeStrategy = Literal["copy-on-write", "merge-on-read"]
+DistributionMode = Literal["none", "hash", "range"]
+
+# Write tuning every table gets unless its etl.py overrides it. Hash
+# distribution shuffles rows to their partition before writing, and the
+# advisory partition size lets adaptive execution coalesce that shuffle into
+# tasks of about one target file each, so a load writes a few large files per
+# partition instead of one small file per source partition.
+DEFAULT_TARGET_FILE_SIZE_BYTES = 512 * 1024 * 1024
+DEFAULT_TABLE_PROPERTIES = {
+    "write.target-file-size-bytes": str(DEFAULT_TARGET_FILE_SIZE_BYTES),
+    "write.spark.advisory-partition-size-bytes": str(DEFAULT_TARGET_FILE_SIZE_BYTES),
+    "write.distribution-mode": "hash",
+    "write.parquet.compression-codec": "zstd",
+    "write.parquet.row-group-size-bytes": str(128 * 1024 * 1024),
+}
+
+# Column of a changelog view saying whether its row was inserted or deleted
+CHANGE_TYPE_COLUMN = "_change_type"
+
+# Iceberg partition transforms, e.g. days(created_at), bucket(16, id) or a
+# bare column name. identity(ds) is accepted as another name for ds.
+PARTITION_TRANSFORM = re.compile(
+    r"^(?:(?:identity|years?|months?|days?|hours?)\(\s*\w+\s*\)"
+    r"|(?:bucket|truncate)\(\s*\d+\s*,\s*\w+\s*\)"
+    r"|\w+)$",
+    re.IGNORECASE,
+)
+SORT_DIRECTION = re.compile(
+    r"\s+(?:ASC|DESC)(?:\s+NULLS\s+(?:FIRST|LAST))?$|\s+NULLS\s+(?:FIRST|LAST)$",
+    re.IGNORECASE,
+)
+
+
+def partition_field(spec: str) -> str:
+    """Validate a partition transform and render it for PARTITIONED BY"""
+    spec = spec.strip()
+    if not PARTITION_TRANSFORM.match(spec):
+        raise ValueError(f"Invalid partition transform: {spec}")
+    identity = re.match(r"^identity\(\s*(\w+)\s*\)$", spec, re.IGNORECASE)
+    return identity.group(1) if identity else spec
+
+
+def sort_field(spec: str) -> str:
+    """
+    Validate a sort field for WRITE ORDERED BY: a column or partition
+    transform, optionally followed by ASC/DESC and NULLS FIRST/LAST.
+    """
+    spec = spec.strip()
+    direction = SORT_DIRECTION.search(spec)
+    expression = spec[: direction.start()] if direction else spec
+    if not PARTITION_TRANSFORM.match(expression):
+        raise ValueError(f"Invalid sort order: {spec}")
+    return f"{partition_field(expression)}{direction.group(0) if direction else ''}"
+
+
+def write_properties(
+    target_file_size_bytes: Optional[int] = None,
+    distribution_mode: Optional[DistributionMode] = None,
+    compression_codec: Optional[str] = None,
+    row_group_size_bytes: Optional[int] = None,
+) -> dict[str, str]:
+    """Iceberg table properties for the write settings that are set"""
+    properties = {}
+    if target_file_size_bytes:
+        properties["write.target-file-size-bytes"] = str(target_file_size_bytes)
+        properties["write.spark.advisory-partition-size-bytes"] = str(
+            target_file_size_bytes
+        )
+    if distribution_mode:
+        properties["write.distribution-mode"] = distribution_mode
+    if compression_codec:
+        properties["write.parquet.compression-codec"] = compression_codec
+    if row_group_size_bytes:
+        properties["write.parquet.row-group-size-bytes"] = str(row_group_size_bytes)
+    return properties
+
+
+def properties_clause(properties: dict[str, str]) -> str:
+    return ", ".join(f"'{key}' = '{value}'" for key, value in properties.items())
+
+
+def upsert_statement(table_path: str, source_view: str, key_columns: list[str]) -> str:
+    """MERGE that updates rows of source_view whose key exists and inserts the rest"""
+    condition = " AND ".join(f"t.{column} = s.{column}" for column in key_columns)
+    return f"""
+    MERGE INTO {table_path} t
+    USING {source_view} s
+    ON {condition}
+    WHEN MATCHED THEN UPDATE SET *
+    WHEN NOT MATCHED THEN INSERT *
+    """
+
+
+@dataclass
+class WriteMetrics:
+    """
+    What a single write committed, gathered without re-reading the source.
+
+    rows is observed while the write pass runs. Everything else comes from
+    the summary of the Iceberg snapshot the write created.
+    """
+
+    table_name: str
+    rows: Optional[int] = None
+    snapshot_id: Optional[int] = None
+    added_records: Optional[int] = None
+    added_files: Optional[int] = None
+    added_bytes: Optional[int] = None
+    total_records: Optional[int] = None
+    sample: list[dict[str, Any]] = field(default_factory=list)
+    # Every metric observed during the write pass, including rows
+    observed: dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_summary(
+        cls,
+        table_name: str,
+        rows: Optional[int],
+        snapshot_id: Optional[int],
+        summary: dict[str, str],
+    ) -> "WriteMetrics":
+        def to_int(key: str) -> Optional[int]:
+            value = summary.get(key)
+            return int(value) if value is not None else None
+
+        return cls(
+            table_name=table_name,
+            rows=rows,
+            snapshot_id=snapshot_id,
+            added_records=to_int("added-records"),
+            added_files=to_int("added-data-files"),
+            added_bytes=to_int("added-files-size"),
+            total_records=to_int("total-records"),
+        )
+
+    def __str__(self) -> str:
+        rows = "" if self.rows is None else f"{self.rows} rows "
+        return (
+            f"Wrote {rows}to {self.table_name} "
+            f"(snapshot {self.snapshot_id}: {self.added_records} records, "
+            f"{self.added_files} files, {self.added_bytes} bytes)"
+        )
+
 
 class SparkManager:
     def __init__(
@@ -62,43 +212,327 @@ class SparkManager:
         table_name: str,
         df: DataFrame,
         schema: Optional[SparkSchemaSpec] = None,
-        partition_keys: Optional[list[str]] = None,
-    ) -> None:
-        """Create a table"""
+        partition_by: Optional[list[str]] = None,
+        sort_order: Optional[list[str]] = None,
+        table_properties: Optional[dict[str, str]] = None,
+    ) -> bool:
+        """
+        Create a table if it doesn't exist yet. Returns whether it was created.
+
+        partition_by holds Iceberg partition transforms, e.g. days(created_at),
+        bucket(16, id) or ds, and sort_order the fields writes are ordered by,
+        e.g. created_at or id DESC. Both only take effect when the table is
+        created, an existing table keeps its partition spec and sort order.
+        table_properties are set on the new table.
+        """
         table_path = get_s3_table_path(self.namespace, table_name)
+        if self.spark.catalog.tableExists(table_path):
+            return False
+        partition_fields = [partition_field(spec) for spec in partition_by or []]
+        sort_fields = [sort_field(spec) for spec in sort_order or []]
         if schema:
             logging.error(
                 f"Creating table {table_name} with schema {schema.model_dump_json()}"
             )
-            self.spark.sql(
-                f"CREATE TABLE IF NOT EXISTS {table_path} "
-                f"({', '.join([f'{col} {dtype}' for col, dtype in schema.schema.items()])})"
-                f"USING iceberg"
-            )
+            columns = schema.schema.items()
         else:
+            columns = df.dtypes
+        partitioned_by = (
+            f" PARTITIONED BY ({', '.join(partition_fields)})"
+            if partition_fields
+            else ""
+        )
+        tblproperties = (
+            f" TBLPROPERTIES ({properties_clause(table_properties)})"
+            if table_properties
+            else ""
+        )
+        self.spark.sql(
+            f"CREATE TABLE IF NOT EXISTS {table_path} "
+            f"({', '.join([f'{col} {dtype}' for col, dtype in columns])}) "
+            f"USING iceberg{partitioned_by}{tblproperties}"
+        )
+        if sort_fields:
+            # Iceberg only sets a sort order through ALTER TABLE
             self.spark.sql(
-                f"CREATE TABLE IF NOT EXISTS {table_path} "
-                f"({', '.join([f'{col} {dtype}' for col, dtype in df.dtypes])})"
-                f"USING iceberg"
+                f"ALTER TABLE {table_path} WRITE ORDERED BY {', '.join(sort_fields)}"
             )
-        if partition_keys:
+        return True
+
+    def set_table_properties(
+        self, table_name: str, properties: dict[str, str]
+    ) -> dict[str, str]:
+        """
+        Set the properties that differ from the table's current ones, so an
+        unchanged table doesn't get a metadata commit on every write. Returns
+        the properties that were changed.
+        """
+        table_path = get_s3_table_path(self.namespace, table_name)
+        current = {
+            row["key"]: row["value"]
+            for row in self.spark.sql(f"SHOW TBLPROPERTIES {table_path}").collect()
+        }
+        changed = {
+            key: value for key, value in properties.items() if current.get(key) != value
+        }
+        if changed:
+            logging.error(f"Setting properties of {table_name}: {changed}")
             self.spark.sql(
-                f"ALTER TABLE {table_path} SET PARTITION_BY ({', '.join(partition_keys)})"
+                f"ALTER TABLE {table_path} SET TBLPROPERTIES "
+                f"({properties_clause(changed)})"
             )
+        return changed
+
+    def get_partition_spec(self, table_name: str) -> list[str]:
+        """The table's partition transforms, e.g. ["days(created_at)"]"""
+        table_path = get_s3_table_path(self.namespace, table_name)
+        spec = []
+        in_partitioning = False
+        for row in self.spark.sql(f"DESCRIBE TABLE {table_path}").collect():
+            if row["col_name"] == "# Partitioning":
+                in_partitioning = True
+            elif in_partitioning:
+                if not row["col_name"].startswith("Part "):
+                    break
+                spec.append(row["data_type"])
+        return spec
 
     def write_to_table(
         self,
         table_name: str,
         df: DataFrame,
-        mode: Literal["overwrite", "append"] = "overwrite",
+        mode: WriteMode = "overwrite",
         schema: Optional[SparkSchemaSpec] = None,
-    ) -> None:
-        """Write data to a table"""
+        snapshot_properties: Optional[dict[str, str]] = None,
+        sample_size: int = 10,
+        merge_keys: Optional[list[str]] = None,
+        merge_strategy: Optional[MergeStrategy] = None,
+        partition_by: Optional[list[str]] = None,
+        sort_order: Optional[list[str]] = None,
+        table_properties: Optional[dict[str, str]] = None,
+        observed_metrics: Optional[dict[str, Column]] = None,
+        audit: Optional[Callable[[dict[str, Any]], None]] = None,
+        overwrite_filter: Optional[str] = None,
+        staged_metrics: Optional[dict[str, Column]] = None,
+    ) -> WriteMetrics:
+        """
+        Write data to a table in a single pass over df.
+
+        A table that doesn't exist yet is created with partition_by and
+        sort_order, see create_table_from_df. Overwrites replace the table's
+        rows but keep its partition spec and sort order.
+
+        table_properties, on top of DEFAULT_TABLE_PROPERTIES, set the file
+        size, distribution and compression of the write. They're applied to
+        existing tables too, before the write.
+
+        snapshot_properties are added to the summary of the Iceberg snapshot
+        created by the write, so they are committed atomically with the data.
+
+        Nothing else is computed on df: the row count is observed during the
+        write, and the sample is read back from the committed snapshot rather
+        than from df, which for JDBC sources would query the database again.
+        observed_metrics are aggregates observed in the same pass, by name.
+
+        With audit, the write is staged on a branch of the table and audit is
+        called with the observed metrics before it's published to main. If
+        audit raises, the branch is dropped and main never sees the write.
+        staged_metrics are aggregated over the branch, i.e. the whole table as
+        it would be published, and passed to audit with them. They cost a read
+        of the table but, unlike observed metrics, may be distinct aggregates.
+
+        With overwrite_filter, a Spark SQL condition, an overwrite only replaces
+        the rows matching it. They're deleted and df appended on a branch,
+        published to main in one commit, so the filter needn't line up with
+        the table's partitions.
+
+        In merge mode df is upserted on merge_keys instead, see merge_into_table.
+        Merges are audited on the delta before the MERGE runs.
+        """
         logging.error(f"Writing to table {table_name} in namespace {self.namespace}")
-        logging.error(f"Sample data:\n{df.limit(10).show()}")
         table_path = get_s3_table_path(self.namespace, table_name)
-        self.create_table_from_df(table_name, df, schema)
-        df.write.mode(mode).saveAsTable(table_path)
+        properties = {**DEFAULT_TABLE_PROPERTIES, **(table_properties or {})}
+        if not self.create_table_from_df(
+            table_name, df, schema, partition_by, sort_order, properties
+        ):
+            self.set_table_properties(table_name, properties)
+        if mode == "merge":
+            return self.merge_into_table(
+                table_name,
+                df,
+                merge_keys,
+                snapshot_properties,
+                sample_size,
+                merge_strategy,
+                observed_metrics,
+                audit,
+                staged_metrics,
+            )
+        observation = Observation(f"write_{table_name}")
+        df = df.observe(
+            observation,
+            F.count(F.lit(1)).alias("rows"),
+            *[metric.alias(name) for name, metric in (observed_metrics or {}).items()],
+        )
+        replace_rows = mode == "overwrite" and overwrite_filter
+        branch = (
+            self.create_audit_branch(table_name, df) if audit or replace_rows else None
+        )
+        try:
+            target = f"{table_path}.branch_{branch}" if branch else table_path
+            if replace_rows:
+                self.spark.sql(f"DELETE FROM {target} WHERE {overwrite_filter}")
+            writer = df.writeTo(target)
+            for key, value in (snapshot_properties or {}).items():
+                writer = writer.option(f"snapshot-property.{key}", value)
+            if mode == "overwrite" and not replace_rows:
+                writer.overwrite(F.lit(True))
+            else:
+                writer.append()
+            observed = observation.get
+            if audit and staged_metrics:
+                staged = self.spark.table(target).agg(
+                    *[metric.alias(name) for name, metric in staged_metrics.items()]
+                )
+                observed = {**observed, **staged.first().asDict()}
+            metrics = self.get_write_metrics(
+                table_name, observed.get("rows"), sample_size
+            )
+            metrics.observed = observed
+            if branch:
+                if audit:
+                    audit(observed)
+                self.call_procedure(
+                    table_name, "fast_forward", branch="'main'", to=f"'{branch}'"
+                )
+        finally:
+            if branch:
+                self.spark.sql(
+                    f"ALTER TABLE {table_path} DROP BRANCH IF EXISTS {branch}"
+                )
+        return metrics
+
+    def create_audit_branch(self, table_name: str, df: DataFrame) -> str:
+        """
+        Branch off main to stage a write on. A table without snapshots gets an
+        empty commit first, so there is a main to branch from and publish to.
+        """
+        table_path = get_s3_table_path(self.namespace, table_name)
+        if not self.spark.sql(
+            f"SELECT 1 FROM {table_path}.refs WHERE name = 'main'"
+        ).collect():
+            self.spark.createDataFrame([], df.schema).writeTo(table_path).append()
+        branch = f"audit_{uuid.uuid4().hex}"
+        self.spark.sql(f"ALTER TABLE {table_path} CREATE BRANCH {branch}")
+        return branch
+
+    def merge_into_table(
+        self,
+        table_name: str,
+        df: DataFrame,
+        merge_keys: Optional[list[str]],
+        snapshot_properties: Optional[dict[str, str]] = None,
+        sample_size: int = 10,
+        merge_strategy: Optional[MergeStrategy] = None,
+        observed_metrics: Optional[dict[str, Column]] = None,
+        audit: Optional[Callable[[dict[str, Any]], None]] = None,
+        staged_metrics: Optional[dict[str, Column]] = None,
+    ) -> WriteMetrics:
+        """
+        Upsert df into a table with an Iceberg MERGE on merge_keys.
+
+        df must have at most one row per key. The MERGE can scan its source
+        more than once, to join it with the table and to check that no table
+        row matches two source rows, so df is local-checkpointed first and
+        staged as a temp view over the checkpoint. That reads df, and the
+        source database behind it, exactly once.
+
+        The row count, observed_metrics and staged_metrics are aggregated over
+        the checkpoint, and with audit, audit is called with them before the
+        MERGE runs. If audit raises, the table isn't touched.
+
+        merge_strategy sets whether the table's merges, updates and deletes
+        rewrite data files (copy-on-write) or write delete files that readers
+        apply (merge-on-read).
+
+        Spark SQL can't attach snapshot properties to a MERGE, so they are
+        committed by an empty append right after it. Merging the same rows
+        again is a no-op, so a run that fails in between can simply be
+        retried.
+        """
+        if not merge_keys:
+            raise ValueError(f"Merging into {table_name} needs merge keys")
+        table_path = get_s3_table_path(self.namespace, table_name)
+        if merge_strategy:
+            self.set_table_properties(
+                table_name,
+                {
+                    "write.merge.mode": merge_strategy,
+                    "write.update.mode": merge_strategy,
+                    "write.delete.mode": merge_strategy,
+                },
+            )
+        view = f"_merge_{table_name}"
+        delta = df.localCheckpoint()
+        try:
+            observed = (
+                delta.agg(
+                    F.count(F.lit(1)).alias("rows"),
+                    *[
+                        metric.alias(name)
+                        for name, metric in {
+                            **(observed_metrics or {}),
+                            **(staged_metrics or {}),
+                        }.items()
+                    ],
+                )
+                .first()
+                .asDict()
+            )
+            if audit:
+                audit(observed)
+            delta.createOrReplaceTempView(view)
+            self.spark.sql(upsert_statement(table_path, view, merge_keys))
+        finally:
+            self.spark.catalog.dropTempView(view)
+            delta.unpersist()
+        metrics = self.get_write_metrics(table_name, observed["rows"], sample_size)
+        metrics.observed = observed
+        if snapshot_properties:
+            writer = self.spark.createDataFrame([], df.schema).writeTo(table_path)
+            for key, value in snapshot_properties.items():
+                writer = writer.option(f"snapshot-property.{key}", value)
+            writer.append()
+        return metrics
+
+    def get_write_metrics(
+        self, table_name: str, rows: Optional[int] = None, sample_size: int = 10
+    ) -> WriteMetrics:
+        """Metrics for the latest commit to a table, from its snapshot summary"""
+        table_path = get_s3_table_path(self.namespace, table_name)
+        snapshots = self.spark.sql(
+            f"""
+            SELECT snapshot_id, summary
+            FROM {table_path}.snapshots
+            ORDER BY committed_at DESC
+            LIMIT 1
+            """
+        ).collect()
+        if not snapshots:
+            return WriteMetrics(table_name=table_name, rows=rows)
+        snapshot = snapshots[0]
+        metrics = WriteMetrics.from_summary(
+            table_name, rows, snapshot["snapshot_id"], dict(snapshot["summary"] or {})
+        )
+        if sample_size:
+            metrics.sample = [
+                row.asDict()
+                for row in self.spark.sql(
+                    f"SELECT * FROM {table_path} "
+                    f"VERSION AS OF {metrics.snapshot_id} LIMIT {sample_size}"
+                ).collect()
+            ]
+        return metrics
 
     def read_from_table(
         self, table_name: str, limit: int = 10, offset: int = 0
@@ -111,10 +545,46 @@ class SparkManager:
             ).collect()
         return self.spark.sql(f"SELECT * FROM {table_path}").collect()
 
-    def read_from_csv(self, file_path: str) -> DataFrame:
-        """Read data from a CSV file"""
+    def read_from_csv(
+        self, file_path: str, schema: Optional[SparkSchemaSpec] = None
+    ) -> DataFrame:
+        """
+        Read data from a CSV file, gzipped if its name ends in .gz.
+
+        With a schema the columns are parsed as the given types, otherwise
+        they are inferred in an extra pass over the whole file.
+        """
+        if schema:
+            return self.spark.read.csv(
+                file_path,
+                header=True,
+                schema=", ".join(
+                    f"`{column}` {dtype}" for column, dtype in schema.schema.items()
+                ),
+                # Check the header against the schema's column names rather
+                # than applying the schema by position
+                enforceSchema=False,
+            )
         return self.spark.read.csv(file_path, header=True, inferSchema=True)
 
+    def read_from_parquet(
+        self, file_path: str, schema: Optional[SparkSchemaSpec] = None
+    ) -> DataFrame:
+        """Read data from a Parquet file, casting columns to the schema's types"""
+        df = self.spark.read.parquet(file_path)
+        if schema:
+            df = df.select(
+                *[
+                    (
+                        F.col(column).cast(schema.schema[column]).alias(column)
+                        if column in schema.schema
+                        else F.col(column)
+                    )
+                    for column in df.columns
+                ]
+            )
+        return df
+
     def get_table_metadata(self, table_name: str) -> dict:
         """Get table metadata"""
         table_path = get_s3_table_path(self.namespace, table_name)
@@ -133,11 +603,132 @@ class SparkManager:
                 "schema": [],
             }
 
-    def get_table(self, table_name: str) -> DataFrame:
-        """Get a table"""
+    def call_procedure(
+        self, table_name: str, procedure: str, **arguments: str
+    ) -> list[dict[str, Any]]:
+        """
+        Run an Iceberg procedure on a table and return its result rows.
+        arguments are named procedure arguments, as SQL expressions.
+        """
+        catalog, identifier = get_s3_table_path(self.namespace, table_name).split(
+            ".", 1
+        )
+        named = [f"table => '{identifier}'"]
+        named += [f"{name} => {value}" for name, value in arguments.items()]
+        logging.error(f"Running {procedure} on {table_name}")
+        rows = self.spark.sql(
+            f"CALL {catalog}.system.{procedure}({', '.join(named)})"
+        ).collect()
+        return [row.asDict() for row in rows]
+
+    def rewrite_data_files(
+        self, table_name: str, options: Optional[dict[str, str]] = None
+    ) -> dict[str, Any]:
+        """Compact small data files, and apply delete files, with bin-packing"""
+        arguments = {}
+        if options:
+            pairs = ", ".join(f"'{key}', '{value}'" for key, value in options.items())
+            arguments["options"] = f"map({pairs})"
+        return self.call_procedure(table_name, "rewrite_data_files", **arguments)[0]
+
+    def rewrite_manifests(self, table_name: str) -> dict[str, Any]:
+        """Regroup the table's manifests so planning reads fewer of them"""
+        return self.call_procedure(table_name, "rewrite_manifests")[0]
+
+    def expire_snapshots(
+        self, table_name: str, older_than: datetime, retain_last: int = 1
+    ) -> dict[str, Any]:
+        """Expire snapshots older than older_than, keeping at least retain_last"""
+        return self.call_procedure(
+            table_name,
+            "expire_snapshots",
+            older_than=f"TIMESTAMP '{older_than:%Y-%m-%d %H:%M:%S.%f}'",
+            retain_last=str(retain_last),
+        )[0]
+
+    def remove_orphan_files(
+        self, table_name: str, older_than: datetime
+    ) -> dict[str, Any]:
+        """Delete files under the table location that no snapshot references"""
+        orphans = self.call_procedure(
+            table_name,
+            "remove_orphan_files",
+            older_than=f"TIMESTAMP '{older_than:%Y-%m-%d %H:%M:%S.%f}'",
+        )
+        # One row per deleted file
+        return {"deleted_orphan_files_count": len(orphans)}
+
+    def get_table(
+        self, table_name: str, snapshot_id: Optional[int] = None
+    ) -> DataFrame:
+        """Get a table, as of snapshot_id if it's set"""
         table_path = get_s3_table_path(self.namespace, table_name)
+        if snapshot_id is not None:
+            return self.spark.read.option("snapshot-id", snapshot_id).table(table_path)
         return self.spark.table(table_path)
 
+    def current_snapshot_id(self, table_name: str) -> Optional[int]:
+        """The snapshot a table's main branch is at, None if it has none"""
+        table_path = get_s3_table_path(self.namespace, table_name)
+        rows = self.spark.sql(
+            f"""
+            SELECT snapshot_id FROM {table_path}.history
+            WHERE is_current_ancestor
+            ORDER BY made_current_at DESC
+            LIMIT 1
+            """
+        ).collect()
+        return rows[0]["snapshot_id"] if rows else None
+
+    def read_changes(
+        self,
+        table_name: str,
+        start_snapshot_id: int,
+        end_snapshot_id: int,
+        columns: Optional[list[str]] = None,
+    ) -> DataFrame:
+        """
+        Net changes to a table after start_snapshot_id, up to and including
+        end_snapshot_id. Each row is an inserted or deleted row, with its
+        CHANGE_TYPE_COLUMN set to INSERT or DELETE. An updated row is deleted
+        with its old values and inserted with its new ones.
+
+        With columns, only the changes to those columns are kept. A row whose
+        other columns changed, e.g. one a full load stamped with a new ds, is
+        deleted and inserted with the same values of columns, which cancel
+        out.
+        """
+        view = f"{table_name}_changes_{end_snapshot_id}"
+        self.call_procedure(
+            table_name,
+            "create_changelog_view",
+            options=(
+                f"map('start-snapshot-id', '{start_snapshot_id}', "
+                f"'end-snapshot-id', '{end_snapshot_id}')"
+            ),
+            net_changes="true",
+            changelog_view=f"'{view}'",
+        )
+        changes = self.spark.table(view)
+        if columns is None:
+            return changes
+        columns = [column for column in changes.columns if column in columns]
+        # +1 for each insert of the same values, -1 for each delete
+        net = F.sum(
+            F.when(F.col(CHANGE_TYPE_COLUMN) == "INSERT", 1).otherwise(-1)
+        ).alias("_net")
+        return (
+            changes.groupBy(*columns)
+            .agg(net)
+            .filter(F.col("_net") != 0)
+            .select(
+                *columns,
+                F.when(F.col("_net") > 0, "INSERT")
+                .otherwise("DELETE")
+                .alias(CHANGE_TYPE_COLUMN),
+            )
+        )
+
     def delete_table(self, table_name: str) -> None:
         """Delete a table"""
         table_path = get_s3_table_path(self.namespace, table_name)
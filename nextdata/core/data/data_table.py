@@ -22,8 +22,12 @@ class DataTable:
 
     @property
     def df(self) -> DataFrame:
+        """
+        The table's rows. Filters on the columns the table is partitioned by,
+        e.g. created_at for days(created_at), only read the matching partitions.
+        """
         return self.spark.get_table(self.name)
 
     @property
     def partition_keys(self) -> list[str]:
-        return self.df.schema.fields[0].metadata.get("partition_keys")
+        return self.spark.get_partition_spec(self.name)
@@ -4,6 +4,9 @@ from sqlalchemy.orm import Session, joinedload
 
 from nextdata.core.db.models import (
     Base,
+    CdcCheckpoint,
+    DataQualityResult,
+    SyncedFile,
     EmrJobScript,
     S3DataTable,
     EmrJob,
@@ -21,7 +24,16 @@ class DatabaseManager:
         Base.metadata.create_all(self.engine)
 
     def reset(self):
-        Base.metadata.drop_all(self.engine)
+        # CDC checkpoints describe the source database, not the stack, so
+        # they are kept when the stack is rebuilt
+        Base.metadata.drop_all(
+            self.engine,
+            tables=[
+                table
+                for table in Base.metadata.sorted_tables
+                if table is not CdcCheckpoint.__table__
+            ],
+        )
         self.create_all()
 
     def add_table(self, table: S3DataTable):
@@ -29,6 +41,13 @@ class DatabaseManager:
             session.add(table)
             session.commit()
 
+    def set_table_schema(self, table_name: str, schema: dict[str, str]):
+        with Session(self.engine) as session:
+            session.query(S3DataTable).filter(S3DataTable.name == table_name).update(
+                {S3DataTable.schema: schema}
+            )
+            session.commit()
+
     def add_job(
         self,
         job: EmrJob,
@@ -85,6 +104,10 @@ class DatabaseManager:
                 ).all()
         return table
 
+    def get_tables(self):
+        with Session(self.engine) as session:
+            return session.query(S3DataTable).order_by(S3DataTable.name).all()
+
     def get_job(self, job_name: str):
         with Session(self.engine) as session:
             job = (
@@ -135,3 +158,52 @@ class DatabaseManager:
                 .filter(AwsResource.resource_type == resource_type)
                 .all()
             )
+
+    def get_cdc_checkpoint(self, table_name: str):
+        with Session(self.engine) as session:
+            return session.get(CdcCheckpoint, table_name)
+
+    def set_cdc_checkpoint(self, table_name: str, slot_name: str, lsn: str):
+        with Session(self.engine) as session:
+            session.merge(
+                CdcCheckpoint(table_name=table_name, slot_name=slot_name, lsn=lsn)
+            )
+            session.commit()
+
+    def add_data_quality_results(self, results: list[DataQualityResult]):
+        with Session(self.engine) as session:
+            session.add_all(results)
+            session.commit()
+
+    def get_data_quality_results(self, table_name: str, limit: int = 100):
+        """A table's latest check results, newest first"""
+        with Session(self.engine) as session:
+            return (
+                session.query(DataQualityResult)
+                .filter(DataQualityResult.table_name == table_name)
+                .order_by(DataQualityResult.checked_at.desc())
+                .limit(limit)
+                .all()
+            )
+
+    def get_synced_files(self, table_name: str):
+        with Session(self.engine) as session:
+            return (
+                session.query(SyncedFile)
+                .filter(SyncedFile.table_name == table_name)
+                .all()
+            )
+
+    def set_synced_files(
+        self, table_name: str, files: list[SyncedFile], removed: list[str]
+    ):
+        """Record files as synced and forget the removed ones, in one commit"""
+        with Session(self.engine) as session:
+            for file in files:
+                session.merge(file)
+            if removed:
+                session.query(SyncedFile).filter(
+                    SyncedFile.table_name == table_name,
+                    SyncedFile.name.in_(removed),
+                ).delete()
+            session.commit()
@@ -1,5 +1,16 @@
+from datetime import datetime
 from typing import Optional
-from sqlalchemy import Boolean, Column, Enum, Integer, String, ForeignKey, JSON
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Enum,
+    Float,
+    Integer,
+    String,
+    ForeignKey,
+    JSON,
+)
 from sqlalchemy.orm import DeclarativeBase, mapped_column, relationship, Mapped
 import enum
 
@@ -62,6 +73,53 @@ class S3DataTable(Base):
     )
 
 
+class CdcCheckpoint(Base):
+    """
+    Position a CDC consumer has applied a table's changes up to.
+
+    Keyed by table name rather than by S3DataTable id so it survives the
+    tables being recreated when the stack is rebuilt.
+    """
+
+    __tablename__ = "cdc_checkpoints"
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    slot_name: Mapped[str] = mapped_column(String)
+    lsn: Mapped[str] = mapped_column(String)
+
+
+class SyncedFile(Base):
+    """
+    A file in a table's data directory as it was when last synced, so only
+    new and changed files are ingested again.
+    """
+
+    __tablename__ = "synced_files"
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    size: Mapped[int] = mapped_column(Integer)
+    mtime: Mapped[float] = mapped_column(Float)
+    content_hash: Mapped[str] = mapped_column(String)
+
+
+class DataQualityResult(Base):
+    """
+    Outcome of one data quality check during a table's load, synced from the
+    results table the ETL job writes, see nextdata.core.glue.expectations.
+    """
+
+    __tablename__ = "data_quality_results"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    table_name: Mapped[str] = mapped_column(String, index=True)
+    run_id: Mapped[str] = mapped_column(String)
+    check_type: Mapped[str] = mapped_column(String)
+    column_name: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    severity: Mapped[str] = mapped_column(String)
+    passed: Mapped[bool] = mapped_column(Boolean)
+    observed: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    message: Mapped[str] = mapped_column(String)
+    checked_at: Mapped[datetime] = mapped_column(DateTime)
+
+
 class EmrJob(Base):
     __tablename__ = "emr_jobs"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -75,6 +133,24 @@ class EmrJob(Base):
     sql_table: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     incremental_column: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     is_full_load: Mapped[Optional[bool]] = mapped_column(Boolean, nullable=True)
+    max_partitions: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    target_partition_bytes: Mapped[Optional[int]] = mapped_column(
+        Integer, nullable=True
+    )
+    checkpoint_partitions: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    extraction_engine: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    write_mode: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    merge_strategy: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    columns: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    source_filter: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    partition_by: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    sort_order: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    write_tuning: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
+    expectations: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
+    max_connections: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    retl_mode: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    ingestion_mode: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    cdc_plugin: Mapped[Optional[str]] = mapped_column(String, nullable=True)
 
     script_id: Mapped[int] = mapped_column(ForeignKey("emr_job_scripts.id"))
     script: Mapped["EmrJobScript"] = relationship(back_populates="jobs")
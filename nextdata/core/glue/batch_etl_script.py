@@ -0,0 +1,103 @@
+"""
+Run the default ETL for several tables in one EMR job run.
+
+Every table shares the run's Spark session, so Spark startup and package
+resolution are paid once per batch instead of once per table. Tables are
+extracted concurrently from a bounded thread pool; Spark schedules the
+actions submitted from each thread side by side.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+from typing import Optional
+
+from pydantic import BaseModel, field_validator
+
+from nextdata.core.connections.spark import SparkManager, WriteMetrics
+from nextdata.core.glue.default_etl_script import run_etl
+from nextdata.core.glue.glue_entrypoint import GlueJobArgs, glue_job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class BatchGlueJobArgs(BaseModel):
+    """
+    Arguments for a batch of glue jobs.
+
+    Args:
+        jobs: Arguments for each table's job.
+        max_concurrency: How many tables are extracted at the same time.
+    """
+
+    jobs: list[GlueJobArgs]
+    max_concurrency: Optional[int] = DEFAULT_MAX_CONCURRENCY
+    bucket_arn: str
+    namespace: str
+
+    # Jobs come in as a JSON list from the command line
+    @field_validator("jobs", mode="before")
+    def validate_jobs(cls, v):
+        if isinstance(v, list):
+            return v
+        try:
+            return json.loads(v)
+        except json.JSONDecodeError:
+            raise ValueError("Invalid jobs")
+
+
+def run_batch(
+    spark_manager: SparkManager,
+    batch_args: BatchGlueJobArgs,
+) -> dict[str, Optional[WriteMetrics]]:
+    """
+    Run every job in the batch, at most max_concurrency at a time.
+
+    A failing table doesn't stop the others. Once all of them have finished,
+    the failures are raised together so the run is marked as failed.
+    """
+    spark_context = spark_manager.spark.sparkContext
+
+    def run(job_args: GlueJobArgs) -> Optional[WriteMetrics]:
+        # Tag the thread's Spark jobs so each table is visible in the Spark UI
+        spark_context.setJobGroup(job_args.job_name, f"ETL for {job_args.sql_table}")
+        spark_context.setLocalProperty("spark.scheduler.pool", job_args.sql_table)
+        return run_etl(spark_manager, job_args)
+
+    max_concurrency = batch_args.max_concurrency or DEFAULT_MAX_CONCURRENCY
+    max_workers = max(1, min(max_concurrency, len(batch_args.jobs)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            job_args.job_name: executor.submit(run, job_args)
+            for job_args in batch_args.jobs
+        }
+
+    results = {}
+    errors = {}
+    for job_name, future in futures.items():
+        error = future.exception()
+        if error:
+            logger.error(f"{job_name} failed: {error}")
+            errors[job_name] = error
+        else:
+            results[job_name] = future.result()
+            logger.info(f"{job_name}: {results[job_name] or 'no new rows'}")
+    if errors:
+        raise RuntimeError(
+            f"{len(errors)} of {len(futures)} tables failed: {', '.join(errors)}"
+        ) from next(iter(errors.values()))
+    return results
+
+
+@glue_job(JobArgsType=BatchGlueJobArgs)
+def main(
+    spark_manager: SparkManager,
+    job_args: BatchGlueJobArgs,
+):
+    return run_batch(spark_manager, job_args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Checkpointed extraction for long-running loads.
+
+A plain extraction reads every partition and commits once, so a failure in
+the last partition throws the whole run away. A checkpointed extraction
+commits each group of partition predicates as its own Iceberg append and
+records it in a progress table. A retried run picks up the unfinished plan
+and skips the partitions that are already committed. A plan that can't
+finish, e.g. one whose data fails its audit on every retry, is abandoned
+with the restart_extraction job argument so the next run plans afresh.
+
+The progress table is an append-only log in the table bucket's namespace.
+Each commit to the target table also records the plan and the partitions it
+loaded as snapshot properties, so a run that dies between committing data
+and recording it in the progress table doesn't load those partitions twice.
+"""
+
+from dataclasses import asdict, dataclass, field, replace
+import json
+import logging
+from typing import Callable, Literal, Optional
+import uuid
+
+from pyspark.sql import DataFrame
+import pyspark.sql.functions as F
+
+from nextdata.core.connections.spark import (
+    MergeStrategy,
+    SparkManager,
+    WriteMetrics,
+    WriteMode,
+)
+from nextdata.core.glue.expectations import DataQualityError, ExpectationSuite
+from nextdata.core.glue.partitioning import PartitionStrategy
+from nextdata.util.s3_tables_utils import get_s3_table_path
+
+PROGRESS_TABLE = "nextdata_extraction_progress"
+PROGRESS_SCHEMA = (
+    "plan_id STRING, table_name STRING, event STRING, plan STRING, "
+    "partitions STRING, snapshot_id BIGINT, rows BIGINT"
+)
+PLAN_PROPERTY = "nextdata.extraction.plan"
+PARTITIONS_PROPERTY = "nextdata.extraction.partitions"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ExtractionPlan:
+    """Everything needed to repeat an extraction exactly as it was planned"""
+
+    source_table: str
+    partition_strategy: PartitionStrategy
+    mode: WriteMode
+    columns: Optional[list[str]] = None
+    snapshot_properties: Optional[dict[str, str]] = None
+    merge_keys: Optional[list[str]] = None
+    merge_strategy: Optional[MergeStrategy] = None
+    partition_by: Optional[list[str]] = None
+    sort_order: Optional[list[str]] = None
+    table_properties: Optional[dict[str, str]] = None
+    # Spark SQL condition on the rows an overwrite replaces, e.g. a backfill's
+    # window, all of them if None
+    overwrite_filter: Optional[str] = None
+    # Start and end of a backfill's window, ISO formatted, None for plans of
+    # regular runs. Only a run of the same kind resumes the plan.
+    backfill_window: Optional[list[str]] = None
+    plan_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def as_predicates(self) -> "ExtractionPlan":
+        """The same plan with one explicit predicate per partition"""
+        predicates = self.partition_strategy.to_predicates()
+        return replace(
+            self,
+            partition_strategy=PartitionStrategy(
+                type=self.partition_strategy.type,
+                num_partitions=len(predicates),
+                predicates=predicates,
+                column=self.partition_strategy.column,
+            ),
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self.as_predicates()))
+
+    @classmethod
+    def from_json(cls, value: str) -> "ExtractionPlan":
+        data = json.loads(value)
+        data["partition_strategy"] = PartitionStrategy.from_dict(
+            data["partition_strategy"]
+        )
+        return cls(**data)
+
+
+def parse_partitions(value: Optional[str]) -> set[int]:
+    return {int(index) for index in value.split(",") if index} if value else set()
+
+
+def combine_metrics(metrics: list[WriteMetrics]) -> WriteMetrics:
+    """Totals over several commits, with the snapshot and sample of the last one"""
+
+    def total(name: str) -> Optional[int]:
+        values = [getattr(m, name) for m in metrics if getattr(m, name) is not None]
+        return sum(values) if values else None
+
+    return replace(
+        metrics[-1],
+        rows=total("rows"),
+        added_records=total("added_records"),
+        added_files=total("added_files"),
+        added_bytes=total("added_bytes"),
+    )
+
+
+class ExtractionProgress:
+    """
+    Runs extraction plans for one table in checkpointed groups of partitions.
+    """
+
+    def __init__(self, spark_manager: SparkManager, table_name: str):
+        self.spark_manager = spark_manager
+        self.table_name = table_name
+        self.progress_table = get_s3_table_path(spark_manager.namespace, PROGRESS_TABLE)
+
+    def _record(
+        self,
+        plan_id: str,
+        event: Literal["planned", "committed", "finished", "abandoned"],
+        plan: Optional[str] = None,
+        partitions: Optional[str] = None,
+        snapshot_id: Optional[int] = None,
+        rows: Optional[int] = None,
+    ) -> None:
+        spark = self.spark_manager.spark
+        spark.sql(
+            f"CREATE TABLE IF NOT EXISTS {self.progress_table} "
+            f"({PROGRESS_SCHEMA}, recorded_at TIMESTAMP) USING iceberg"
+        )
+        spark.createDataFrame(
+            [(plan_id, self.table_name, event, plan, partitions, snapshot_id, rows)],
+            PROGRESS_SCHEMA,
+        ).withColumn("recorded_at", F.current_timestamp()).writeTo(
+            self.progress_table
+        ).append()
+
+    def pending_plan(
+        self, backfill_window: Optional[list[str]] = None
+    ) -> Optional[ExtractionPlan]:
+        """
+        The latest plan for the table that never finished and wasn't
+        abandoned, if there is one,
+        of a backfill of backfill_window or, without one, of a regular run.
+        A backfill never resumes a regular run's plan, which would leave the
+        window unloaded, and the other way around, which would leave the
+        watermark where it is.
+        """
+        spark = self.spark_manager.spark
+        if not spark.catalog.tableExists(self.progress_table):
+            return None
+        rows = spark.sql(
+            f"""
+            SELECT p.plan
+            FROM {self.progress_table} p
+            WHERE p.table_name = '{self.table_name}'
+                AND p.event = 'planned'
+                AND NOT EXISTS (
+                    SELECT 1 FROM {self.progress_table} f
+                    WHERE f.plan_id = p.plan_id
+                        AND f.event IN ('finished', 'abandoned')
+                )
+            ORDER BY p.recorded_at DESC
+            """
+        ).collect()
+        for row in rows:
+            plan = ExtractionPlan.from_json(row["plan"])
+            if plan.backfill_window == backfill_window:
+                return plan
+        return None
+
+    def start(self, plan: ExtractionPlan) -> ExtractionPlan:
+        """Record a new plan so a failed run can resume it"""
+        plan = plan.as_predicates()
+        self._record(plan.plan_id, "planned", plan=plan.to_json())
+        return plan
+
+    def abandon(self, plan: ExtractionPlan) -> None:
+        """
+        Stop resuming the plan. Groups it already committed stay in the table,
+        and its snapshot properties, e.g. the watermark, are never committed.
+        """
+        self._record(plan.plan_id, "abandoned")
+
+    def finished_partitions(self, plan: ExtractionPlan) -> set[int]:
+        """Partitions of the plan already committed to the target table"""
+        spark = self.spark_manager.spark
+        finished = set()
+        if spark.catalog.tableExists(self.progress_table):
+            for row in spark.sql(
+                f"""
+                SELECT partitions FROM {self.progress_table}
+                WHERE plan_id = '{plan.plan_id}' AND event = 'committed'
+                """
+            ).collect():
+                finished |= parse_partitions(row["partitions"])
+        table_path = get_s3_table_path(self.spark_manager.namespace, self.table_name)
+        if spark.catalog.tableExists(table_path):
+            # Commits whose progress record was never written
+            for row in spark.sql(
+                f"""
+                SELECT s.summary['{PARTITIONS_PROPERTY}'] AS partitions
+                FROM {table_path}.snapshots s
+                JOIN {table_path}.history h ON s.snapshot_id = h.snapshot_id
+                WHERE h.is_current_ancestor
+                    AND s.summary['{PLAN_PROPERTY}'] = '{plan.plan_id}'
+                """
+            ).collect():
+                finished |= parse_partitions(row["partitions"])
+        return finished
+
+    def run(
+        self,
+        plan: ExtractionPlan,
+        read: Callable[[PartitionStrategy], DataFrame],
+        group_size: int,
+        expectations: Optional[ExpectationSuite] = None,
+    ) -> Optional[WriteMetrics]:
+        """
+        Commit the plan's unfinished partitions, group_size partitions at a time.
+
+        read builds the DataFrame for a strategy holding one group's
+        predicates. The plan's snapshot properties, e.g. the watermark, are
+        only committed with the last group. Returns the combined metrics of
+        this run's commits, or None if every partition was already committed.
+
+        With expectations, each group is audited before it's committed, and a
+        failed check stops the run with the groups before it committed.
+        """
+        predicates = plan.partition_strategy.to_predicates()
+        finished = self.finished_partitions(plan)
+        remaining = [i for i in range(len(predicates)) if i not in finished]
+        groups = [
+            remaining[i : i + group_size] for i in range(0, len(remaining), group_size)
+        ]
+        if finished:
+            logger.info(
+                f"Resuming {self.table_name}: {len(finished)} of {len(predicates)} "
+                "partitions already committed"
+            )
+
+        metrics = []
+        for number, group in enumerate(groups, start=1):
+            partitions = ",".join(str(i) for i in group)
+            properties = {PLAN_PROPERTY: plan.plan_id, PARTITIONS_PROPERTY: partitions}
+            is_last = number == len(groups)
+            if is_last:
+                properties.update(plan.snapshot_properties or {})
+            strategy = replace(
+                plan.partition_strategy,
+                num_partitions=len(group),
+                predicates=[predicates[i] for i in group],
+            )
+            try:
+                group_metrics = self.spark_manager.write_to_table(
+                    table_name=self.table_name,
+                    df=read(strategy),
+                    # Only the first commit of a plan may replace the table
+                    mode=(
+                        "append"
+                        if plan.mode == "overwrite" and (finished or number > 1)
+                        else plan.mode
+                    ),
+                    snapshot_properties=properties,
+                    sample_size=10 if is_last else 0,
+                    merge_keys=plan.merge_keys,
+                    merge_strategy=plan.merge_strategy,
+                    partition_by=plan.partition_by,
+                    sort_order=plan.sort_order,
+                    table_properties=plan.table_properties,
+                    observed_metrics=expectations.metrics() if expectations else None,
+                    staged_metrics=(
+                        expectations.staged_metrics() if expectations else None
+                    ),
+                    audit=expectations.audit if expectations else None,
+                    overwrite_filter=plan.overwrite_filter,
+                )
+            except DataQualityError:
+                # Retrying reads the same partitions, so unless the source is
+                # fixed the plan needs abandoning to get past them
+                logger.error(
+                    f"Group {number} of {len(groups)} of extraction {plan.plan_id} "
+                    f"for {self.table_name} failed its audit. The next run resumes "
+                    "the extraction from this group, run with restart_extraction "
+                    "to abandon it instead."
+                )
+                raise
+            self._record(
+                plan.plan_id,
+                "committed",
+                partitions=partitions,
+                snapshot_id=group_metrics.snapshot_id,
+                rows=group_metrics.rows,
+            )
+            logger.info(
+                f"Committed group {number} of {len(groups)} for {self.table_name}: "
+                f"{group_metrics}"
+            )
+            metrics.append(group_metrics)
+        self._record(plan.plan_id, "finished")
+        return combine_metrics(metrics) if metrics else None
@@ -3,6 +3,7 @@ from typing import Literal, Optional
 from nextdata.core.glue.connections.generic_connection import (
     GenericConnectionGlueJobArgs,
 )
+from nextdata.core.glue.dialects import get_dialect
 
 
 class JDBCGlueJobArgs(GenericConnectionGlueJobArgs):
@@ -17,3 +18,25 @@ class JDBCGlueJobArgs(GenericConnectionGlueJobArgs):
     database: str
     username: str
     password: Optional[str] = None
+
+
+def connect_dbapi(
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str] = None,
+    sslmode: str = "require",
+):
+    """
+    Open a plain DB-API connection to the source database.
+
+    Used for planning queries that are too small to be worth a Spark job, and
+    by the COPY extraction engine. The driver comes from the protocol's
+    dialect and is only imported when it's needed.
+    """
+    return get_dialect(connection_conf.protocol).connect(
+        host=connection_conf.host,
+        port=connection_conf.port,
+        database=connection_conf.database,
+        user=connection_conf.username,
+        password=password or connection_conf.password,
+        sslmode=sslmode,
+    )
@@ -0,0 +1,205 @@
+"""
+Parallel COPY extraction for Postgres sources.
+
+Instead of reading the source row by row through a JDBC ResultSet, each Spark
+task runs ``COPY (SELECT ... WHERE <predicate>) TO STDOUT`` for one partition
+predicate over psycopg2, parses the CSV stream into Arrow record batches and
+hands them to Spark through ``mapInArrow``.
+"""
+
+from contextlib import closing
+import os
+import threading
+from typing import Callable, Iterator, Optional
+
+import pyarrow as pa
+from pyspark.sql import DataFrame, SparkSession
+from pyspark.sql.pandas.types import to_arrow_schema
+from pyspark.sql.types import ArrayType, BinaryType, MapType, StructType
+
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs, connect_dbapi
+from nextdata.core.glue.partitioning import PartitionStrategy, SourceMetadata
+
+# Bytes of CSV parsed into each record batch
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+
+UNSUPPORTED_TYPES = (ArrayType, BinaryType, MapType, StructType)
+
+
+def copy_select_list(
+    source: SourceMetadata, columns: Optional[list[str]] = None
+) -> str:
+    """
+    Columns for the COPY query, in the order of the projection if there is one.
+
+    timestamptz columns are converted to UTC so every timestamp in the CSV is
+    naive and parses the same way.
+    """
+    selected = [source.column(name) for name in columns] if columns else source.columns
+    return ", ".join(
+        (
+            f"{column.name} AT TIME ZONE 'UTC' AS {column.name}"
+            if column.data_type == "timestamp with time zone"
+            else column.name
+        )
+        for column in selected
+    )
+
+
+def copy_query(select_list: str, source_table: str, predicate: str) -> str:
+    return (
+        f"COPY (SELECT {select_list} FROM {source_table} WHERE {predicate}) "
+        "TO STDOUT WITH (FORMAT csv)"
+    )
+
+
+def csv_parse_schema(schema: pa.Schema) -> pa.Schema:
+    """Types to parse the CSV into before casting to the Spark schema"""
+    return pa.schema(
+        [
+            (
+                pa.field(field.name, pa.timestamp(field.type.unit))
+                if pa.types.is_timestamp(field.type)
+                else field
+            )
+            for field in schema
+        ]
+    )
+
+
+def read_copy(
+    connection,
+    query: str,
+    schema: pa.Schema,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Stream the output of a COPY query as record batches of the given schema.
+
+    psycopg2 writes the COPY stream into one end of a pipe from a background
+    thread while pyarrow parses the other end, so the partition is never held
+    in memory as a whole.
+    """
+    from pyarrow import csv
+
+    parse_schema = csv_parse_schema(schema)
+    read_fd, write_fd = os.pipe()
+    errors: list[BaseException] = []
+
+    def copy_to_pipe():
+        try:
+            with os.fdopen(write_fd, "wb") as pipe, connection.cursor() as cursor:
+                cursor.copy_expert(query, pipe)
+        except BaseException as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=copy_to_pipe, daemon=True)
+    writer.start()
+    # Closing the read end first makes a blocked writer fail instead of hanging
+    with os.fdopen(read_fd, "rb") as pipe:
+        # pyarrow can't open an empty stream, which is what an empty partition
+        # or a COPY that failed before writing anything looks like
+        reader = (
+            []
+            if not pipe.peek(1)
+            else csv.open_csv(
+                pipe,
+                read_options=csv.ReadOptions(
+                    column_names=parse_schema.names, block_size=block_size
+                ),
+                # COPY quotes values with line breaks, like text or json
+                # columns, and writes the breaks as they are
+                parse_options=csv.ParseOptions(newlines_in_values=True),
+                convert_options=csv.ConvertOptions(
+                    column_types=parse_schema,
+                    # COPY writes NULL as an empty unquoted field and '' as ""
+                    null_values=[""],
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False,
+                    true_values=["t"],
+                    false_values=["f"],
+                ),
+            )
+        )
+        for batch in reader:
+            yield pa.RecordBatch.from_arrays(
+                [
+                    column.cast(field.type)
+                    for column, field in zip(batch.columns, schema)
+                ],
+                schema=schema,
+            )
+    writer.join()
+    if errors:
+        raise errors[0]
+
+
+def copy_partition_reader(
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str],
+    select_list: str,
+    source_table: str,
+    schema: pa.Schema,
+    sslmode: str = "require",
+) -> Callable[[Iterator[pa.RecordBatch]], Iterator[pa.RecordBatch]]:
+    """The function each Spark task runs over its batch of predicates"""
+
+    def read_partitions(
+        predicates: Iterator[pa.RecordBatch],
+    ) -> Iterator[pa.RecordBatch]:
+        with closing(connect_dbapi(connection_conf, password, sslmode)) as connection:
+            for batch in predicates:
+                for predicate in batch.column("predicate").to_pylist():
+                    query = copy_query(select_list, source_table, predicate)
+                    yield from read_copy(connection, query, schema)
+
+    return read_partitions
+
+
+def extract_with_copy(
+    spark: SparkSession,
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str],
+    source: SourceMetadata,
+    source_table: str,
+    partition_strategy: PartitionStrategy,
+    schema: StructType,
+    sslmode: str = "require",
+    columns: Optional[list[str]] = None,
+) -> DataFrame:
+    """
+    Read the source with one COPY per partition predicate.
+
+    schema is the Spark schema of the source table, e.g. from the JDBC
+    reader, so both extraction engines produce the same DataFrame.
+    """
+    if connection_conf.protocol != "postgresql":
+        raise ValueError(
+            f"COPY extraction is not supported for protocol {connection_conf.protocol}"
+        )
+    unsupported = [
+        field.name
+        for field in schema.fields
+        if isinstance(field.dataType, UNSUPPORTED_TYPES)
+    ]
+    if unsupported:
+        raise ValueError(
+            f"COPY extraction does not support columns {unsupported}, "
+            "use the jdbc extraction engine instead"
+        )
+    predicates = partition_strategy.to_predicates()
+    # parallelize slices evenly, so each task gets exactly one predicate
+    predicates_df = spark.sparkContext.parallelize(
+        [(predicate,) for predicate in predicates], len(predicates)
+    ).toDF("predicate string")
+    return predicates_df.mapInArrow(
+        copy_partition_reader(
+            connection_conf,
+            password,
+            copy_select_list(source, columns),
+            source_table,
+            to_arrow_schema(schema),
+            sslmode,
+        ),
+        schema,
+    )
@@ -1,217 +1,366 @@
-from typing import Any
+from contextlib import closing
+import time
+from typing import Any, Optional
 from pyspark.sql import functions as F
-from nextdata.core.connections.spark import SparkManager
+from nextdata.core.connections.spark import (
+    SparkManager,
+    WriteMetrics,
+    write_properties,
+)
 from nextdata.core.glue.connections.dsql import DSQLGlueJobArgs, generate_dsql_password
 from nextdata.core.glue.glue_entrypoint import glue_job, GlueJobArgs
-from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs
+from nextdata.core.glue.checkpoints import ExtractionPlan, ExtractionProgress
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs, connect_dbapi
+from nextdata.core.glue.copy_extractor import extract_with_copy
+from nextdata.core.glue.dialects import Dialect, get_dialect
+from nextdata.core.glue.expectations import (
+    ExpectationSuite,
+    previous_load_rows,
+    record_results,
+)
+from nextdata.core.glue.partitioning import (
+    DEFAULT_MAX_PARTITIONS,
+    DEFAULT_TARGET_PARTITION_BYTES,
+    PartitionStrategy,
+    SourceMetadata,
+    combine_filters,
+    get_partition_strategy,
+    introspect_source,
+    source_subquery,
+)
+from nextdata.core.glue.watermarks import (
+    WatermarkStore,
+    fetch_high_watermark,
+    incremental_filter,
+    serialize_watermark,
+)
 from pyspark.sql import DataFrame
 import logging
 
-from dataclasses import dataclass
-from typing import Literal, Optional
 
+logger = logging.getLogger(__name__)
 
-@dataclass
-class PartitionStrategy:
-    type: Literal["numeric", "hash"]
-    num_partitions: int
-    predicates: Optional[list[str]]
-    column: Optional[str]
-    lower_bound: Optional[str]
-    upper_bound: Optional[str]
 
-    @classmethod
-    def from_dict(cls, data: dict) -> "PartitionStrategy":
-        return cls(**data)
+def connection_settings(
+    job_args: GlueJobArgs,
+) -> tuple[JDBCGlueJobArgs, Optional[str]]:
+    """Connection settings and password of the job's database"""
+    if job_args.connection_type == "dsql":
+        connection_args: dict[str, Any] = job_args.connection_properties
+        connection_conf = DSQLGlueJobArgs(host=connection_args["host"])
+        return connection_conf, generate_dsql_password(connection_conf.host)
+    elif job_args.connection_type == "jdbc":
+        connection_conf = JDBCGlueJobArgs(**job_args.connection_properties)
+        return connection_conf, connection_conf.password
+    raise ValueError(f"Unsupported connection type: {job_args.connection_type}")
 
 
-def get_partition_strategy(
+def run_etl(
     spark_manager: SparkManager,
-    connection_options: dict,
-    table_name: str,
-    incremental_column: Optional[str] = None,
-) -> PartitionStrategy:
-    """Get optimal partition strategy based on table structure"""
-    # Query table metadata to find suitable partition columns
-    metadata_query = f"""
-    SELECT column_name, data_type 
-    FROM information_schema.columns 
-    WHERE table_name = '{table_name}'
+    job_args: GlueJobArgs,
+) -> Optional[WriteMetrics]:
     """
-    columns_df = spark_manager.spark.read.jdbc(
-        url=connection_options["url"],
-        table=f"({metadata_query}) AS tmp",
-        properties=connection_options,
-    )
+    Extract one source table into its Iceberg table.
 
-    # Create a map of column names to their data types
-    column_types = {
-        row["column_name"]: row["data_type"].lower() for row in columns_df.collect()
-    }
-
-    # Look for best partition column in order of preference:
-    # 1. Primary key or identity column
-    # 2. Provided incremental column if numeric
-    # 3. Any indexed numeric column
-    # 4. Hash-based partitioning as fallback
-
-    # Get primary key columns
-    pk_query = f"""
-    SELECT kcu.column_name, c.data_type
-    FROM information_schema.table_constraints tc
-    JOIN information_schema.key_column_usage kcu 
-        ON tc.constraint_name = kcu.constraint_name
-    JOIN information_schema.columns c
-        ON kcu.column_name = c.column_name
-        AND kcu.table_name = c.table_name
-    WHERE tc.table_name = '{table_name}' 
-        AND tc.constraint_type = 'PRIMARY KEY'
+    Returns the metrics of the write, or None if there was nothing to load.
     """
+    # Read source data into a Spark DataFrame
+    connection_conf, password = connection_settings(job_args)
 
-    pk_df = spark_manager.spark.read.jdbc(
-        url=connection_options["url"],
-        table=f"({pk_query}) AS tmp",
-        properties=connection_options,
+    # Driver, URL, SSL and fetch size all depend on the source database
+    dialect = get_dialect(connection_conf.protocol)
+    connection_options = dict(
+        url=dialect.jdbc_url(
+            connection_conf.host, connection_conf.port, connection_conf.database
+        ),
+        dbtable=job_args.sql_table,
+        user=connection_conf.username,
+        password=password,
+        **dialect.jdbc_properties(),
     )
 
-    if pk_df.count() > 0:
-        pk_row = pk_df.first()
-        partition_col = pk_row["column_name"]
-        data_type = pk_row["data_type"].lower()
-        numeric_types = {
-            "integer",
-            "bigint",
-            "smallint",
-            "decimal",
-            "numeric",
-            "real",
-            "double precision",
-        }
-        if data_type in numeric_types:
-            # Get bounds for numeric partition column
-            bounds_query = f"""
-            SELECT MIN({partition_col}) as min_val, 
-                MAX({partition_col}) as max_val,
-                COUNT(*) as row_count
-            FROM {table_name}
-            """
-            bounds = spark_manager.spark.read.jdbc(
+    # Checkpointed runs resume the plan of a run that didn't finish
+    progress = (
+        ExtractionProgress(spark_manager, job_args.sql_table)
+        if job_args.checkpoint_partitions
+        else None
+    )
+    plan = progress.pending_plan(backfill_window(job_args)) if progress else None
+
+    # Plan the extraction over a single DB-API connection rather than Spark
+    start = time.perf_counter()
+    with closing(connect_dbapi(connection_conf, password)) as connection:
+        connect_seconds = time.perf_counter() - start
+        source = introspect_source(connection, job_args.sql_table, dialect)
+        source.timings = {"connect": connect_seconds, **source.timings}
+        if plan and job_args.restart_extraction:
+            logger.warning(
+                f"Abandoning unfinished extraction {plan.plan_id} of "
+                f"{job_args.sql_table}, partitions it committed stay loaded"
+            )
+            progress.abandon(plan)
+            plan = None
+        if plan:
+            kind = f"backfill {plan.backfill_window}" if plan.backfill_window else "run"
+            logger.info(
+                f"Resuming extraction {plan.plan_id} of {job_args.sql_table}, left "
+                f"unfinished by a failed {kind}. Run with restart_extraction to "
+                "abandon it instead."
+            )
+        else:
+            plan = plan_extraction(spark_manager, job_args, connection, source, dialect)
+            if plan is None:
+                return None
+            if progress:
+                plan = progress.start(plan)
+
+    # Projection and filters run in the source database, so unused columns
+    # and rows are never sent to Spark
+    logger.info(f"Source: {plan.source_table}")
+    logger.info(f"Partition strategy: {plan.partition_strategy}")
+
+    def read_source(partition_strategy: PartitionStrategy) -> DataFrame:
+        if job_args.extraction_engine == "copy":
+            # Only the schema is read over JDBC, the rows come from COPY
+            schema = spark_manager.spark.read.jdbc(
+                url=connection_options["url"],
+                table=plan.source_table,
+                properties=connection_options,
+            ).schema
+            source_df = extract_with_copy(
+                spark_manager.spark,
+                connection_conf,
+                password,
+                source,
+                plan.source_table,
+                partition_strategy,
+                schema,
+                columns=plan.columns,
+            )
+        elif partition_strategy.predicates:
+            # Quantile ranges, hash buckets and checkpointed groups of ranges
+            # are read one predicate per partition
+            source_df = spark_manager.spark.read.jdbc(
                 url=connection_options["url"],
-                table=f"({bounds_query}) AS tmp",
+                table=plan.source_table,
+                predicates=partition_strategy.predicates,
                 properties=connection_options,
-            ).first()
-
-            return PartitionStrategy(
-                type="numeric",
-                column=partition_col,
-                lower_bound=bounds["min_val"],
-                upper_bound=bounds["max_val"] + 1,  # Add 1 to include max value
-                num_partitions=min(
-                    100, max(10, bounds["row_count"] // 100000)
-                ),  # 100k rows per partition
             )
         else:
-            logging.info(f"Primary key column {partition_col} is not numeric")
-
-    # Fallback to hash-based partitioning
-    return PartitionStrategy(
-        type="hash",
-        num_partitions=10,
-        predicates=[
-            f"MOD(HASH(CAST(CONCAT({','.join(columns_df.select('column_name').rdd.flatMap(lambda x: x).collect())}) AS VARCHAR)), 10) = {i}"
-            for i in range(10)
-        ],
-        column=None,
-        lower_bound=None,
-        upper_bound=None,
-    )
+            source_df = spark_manager.spark.read.jdbc(
+                url=connection_options["url"],
+                table=plan.source_table,
+                column=partition_strategy.column,
+                lowerBound=partition_strategy.lower_bound,
+                upperBound=partition_strategy.upper_bound,
+                numPartitions=partition_strategy.num_partitions,
+                properties=connection_options,
+            )
+        if (
+            job_args.max_connections
+            and partition_strategy.num_partitions > job_args.max_connections
+        ):
+            # Each task reads its partitions one after another, so no more than
+            # max_connections partitions hold a source connection at once
+            source_df = source_df.coalesce(job_args.max_connections)
+        return source_df.withColumn("ds", F.current_date())
 
+    # Checks are observed during the write and audited before it's published.
+    # Checkpointed groups and backfill windows aren't whole loads, so their
+    # row counts aren't compared with the previous load.
+    expectations = None
+    if job_args.expectations:
+        expectations = ExpectationSuite.from_dicts(
+            job_args.expectations,
+            previous_rows=(
+                None
+                if progress or plan.overwrite_filter
+                else previous_load_rows(
+                    spark_manager, job_args.sql_table, plan.mode == "overwrite"
+                )
+            ),
+        )
+    try:
+        if progress:
+            metrics = progress.run(
+                plan, read_source, job_args.checkpoint_partitions, expectations
+            )
+            if metrics is None:
+                return None
+        else:
+            # The write is the only action on the source, so it is read once
+            metrics = spark_manager.write_to_table(
+                table_name=job_args.sql_table,
+                df=read_source(plan.partition_strategy),
+                mode=plan.mode,
+                snapshot_properties=plan.snapshot_properties,
+                merge_keys=plan.merge_keys,
+                merge_strategy=plan.merge_strategy,
+                partition_by=plan.partition_by,
+                sort_order=plan.sort_order,
+                table_properties=plan.table_properties,
+                observed_metrics=expectations.metrics() if expectations else None,
+                staged_metrics=expectations.staged_metrics() if expectations else None,
+                audit=expectations.audit if expectations else None,
+                overwrite_filter=plan.overwrite_filter,
+            )
+    finally:
+        if expectations:
+            record_results(
+                spark_manager, job_args.sql_table, plan.plan_id, expectations.results
+            )
+    logger.info(str(metrics))
+    for row in metrics.sample:
+        logger.info(f"Sample row: {row}")
+    return metrics
 
-logger = logging.getLogger(__name__)
 
+def backfill_window(job_args: GlueJobArgs) -> Optional[list[str]]:
+    """The run's backfill window as recorded in its plan, None if it isn't one"""
+    if job_args.backfill_from is None and job_args.backfill_to is None:
+        return None
+    return [
+        value.isoformat() if value else None
+        for value in (job_args.backfill_from, job_args.backfill_to)
+    ]
 
-@glue_job(JobArgsType=GlueJobArgs)
-def main(
+
+def plan_extraction(
     spark_manager: SparkManager,
     job_args: GlueJobArgs,
-):
-    # Read source data into a Spark DataFrame
-    base_query = f"SELECT * FROM {job_args.sql_table}"
-    logger.info(f"Base query: {base_query}")
-    connection_conf = None
-    password = None
-    if job_args.connection_type == "dsql":
-        connection_args: dict[str, Any] = job_args.connection_properties
-        connection_conf = DSQLGlueJobArgs(host=connection_args["host"])
-        password = generate_dsql_password(connection_conf.host)
-    elif job_args.connection_type == "jdbc":
-        connection_conf = JDBCGlueJobArgs(**job_args.connection_properties)
-        password = connection_conf.password
-    else:
-        raise ValueError(f"Unsupported connection type: {job_args.connection_type}")
-
-    connection_options = dict(
-        url=f"jdbc:{connection_conf.protocol}://{connection_conf.host}:{connection_conf.port}/{connection_conf.database}",
-        dbtable=job_args.sql_table,
-        user=connection_conf.username,
-        password=password,
-        ssl="true",
-        sslmode="require",
-        driver="org.postgresql.Driver",
-    )
+    connection,
+    source: SourceMetadata,
+    dialect: Dialect,
+) -> Optional[ExtractionPlan]:
+    """
+    Decide what to extract from the source and how to partition the read.
 
-    # Add more JDBC properties for debugging
-    connection_options.update(
-        {
-            "loginTimeout": "60",  # Connection timeout in seconds
-            "logLevel": "2",  # Detailed JDBC logging (1-4)
-            "socketTimeout": "60",  # Socket timeout in seconds
-            "connectTimeout": "60",  # Connect timeout in seconds
-            "tcpKeepAlive": "true",  # Keep-alive in seconds
-        }
-    )
+    Returns None if the table is loaded incrementally and has no new rows.
+    A backfill reads a window of the incremental column instead, and leaves
+    the watermark where it is. It replaces the table's rows in that window,
+    or merges into them on merge tables, so it can be run again.
+    """
+    backfill = job_args.backfill_from is not None or job_args.backfill_to is not None
+    if backfill:
+        mode = "merge" if job_args.write_mode == "merge" else "overwrite"
+    elif job_args.is_full_load:
+        mode = "overwrite"
+    else:
+        mode = job_args.write_mode or "append"
+    merge_keys = None
+    if mode == "merge":
+        merge_keys = [column.name for column in source.primary_key]
+        if not merge_keys:
+            raise ValueError(
+                f"{job_args.sql_table} has no primary key to merge incremental loads on"
+            )
+    source_filter = job_args.source_filter
+    snapshot_properties = None
+    incremental_column = job_args.incremental_column
+    columns = source.projection(job_args.columns)
+    time_range = None
+    overwrite_filter = None
 
-    partition_strategy = get_partition_strategy(
-        spark_manager,
-        connection_options,
-        job_args.sql_table,
-        job_args.incremental_column,
-    )
-    print(f"Partition strategy: {partition_strategy}")
-
-    if partition_strategy.type == "numeric":
-        source_df: DataFrame = spark_manager.spark.read.jdbc(
-            url=connection_options["url"],
-            table=job_args.sql_table,
-            column=partition_strategy.column,
-            lowerBound=partition_strategy.lower_bound,
-            upperBound=partition_strategy.upper_bound,
-            numPartitions=partition_strategy.num_partitions,
-            properties=connection_options,
+    if backfill:
+        if job_args.backfill_from is None or job_args.backfill_to is None:
+            raise ValueError("A backfill needs both backfill_from and backfill_to")
+        if not incremental_column or not source.column(incremental_column):
+            raise ValueError(
+                f"Backfilling {job_args.sql_table} needs its incremental column"
+            )
+        time_range = (job_args.backfill_from, job_args.backfill_to)
+        source_filter = combine_filters(
+            source_filter,
+            f"{incremental_column} >= {dialect.timestamp_literal(time_range[0])} "
+            f"AND {incremental_column} < {dialect.timestamp_literal(time_range[1])}",
         )
-    elif partition_strategy.type == "hash":
-        source_df: DataFrame = (
-            spark_manager.spark.read.option(
-                "numPartitions", partition_strategy.num_partitions
+        if mode == "overwrite":
+            # The same window of the Iceberg table, in Spark SQL
+            start, end = (
+                f"TIMESTAMP '{value:%Y-%m-%d %H:%M:%S}'" for value in time_range
             )
-            .option("predicates", partition_strategy.predicates)
-            .jdbc(
-                url=connection_options["url"],
-                table=job_args.sql_table,
-                properties=connection_options,
+            overwrite_filter = (
+                f"{incremental_column} >= {start} AND {incremental_column} < {end}"
             )
+        logger.info(f"Backfilling rows where {source_filter}")
+    elif incremental_column and not source.column(incremental_column):
+        logger.warning(
+            f"Incremental column {incremental_column} not found in {job_args.sql_table}, "
+            "running a full load instead"
+        )
+        incremental_column = None
+        mode = "overwrite"
+    if incremental_column and not backfill:
+        # Pin the high watermark before reading so the extracted rows and the
+        # committed watermark describe the same slice of the source table
+        watermarks = WatermarkStore(spark_manager)
+        low_watermark = (
+            None
+            if job_args.is_full_load
+            else watermarks.get(job_args.sql_table, incremental_column)
         )
-    logger.info(f"# of rows: {source_df.count()}")
-    source_df.show()
-    # Register the DataFrame as a temp view to use with Spark SQL
-    source_df = source_df.withColumn("ds", F.current_date())
-
-    spark_manager.write_to_table(
-        table_name=job_args.sql_table,
-        df=source_df,
-        mode="overwrite" if job_args.is_full_load else "append",
+        start = time.perf_counter()
+        high_watermark = fetch_high_watermark(
+            connection, job_args.sql_table, incremental_column
+        )
+        source.timings["watermark"] = time.perf_counter() - start
+        if (
+            high_watermark is None
+            or serialize_watermark(high_watermark) == low_watermark
+        ):
+            if not job_args.is_full_load:
+                logger.info(
+                    f"No new rows in {job_args.sql_table} since watermark {low_watermark}"
+                )
+                return None
+        else:
+            source_filter = combine_filters(
+                source_filter,
+                incremental_filter(incremental_column, low_watermark, high_watermark),
+            )
+            snapshot_properties = watermarks.snapshot_properties(
+                incremental_column, high_watermark
+            )
+            logger.info(f"Extracting rows where {source_filter}")
+
+    partition_strategy = get_partition_strategy(
+        connection,
+        source,
+        incremental_column,
+        source_filter,
+        dialect=dialect,
+        target_partition_bytes=job_args.target_partition_bytes
+        or DEFAULT_TARGET_PARTITION_BYTES,
+        max_partitions=job_args.max_partitions or DEFAULT_MAX_PARTITIONS,
+        columns=columns,
+        time_range=time_range,
+        granularity=job_args.backfill_granularity,
+    )
+    return ExtractionPlan(
+        source_table=source_subquery(
+            job_args.sql_table, columns, source_filter, dialect
+        ),
+        partition_strategy=partition_strategy,
+        mode=mode,
+        columns=columns,
+        snapshot_properties=snapshot_properties,
+        merge_keys=merge_keys,
+        merge_strategy=job_args.merge_strategy,
+        partition_by=job_args.partition_by,
+        sort_order=job_args.sort_order,
+        table_properties=write_properties(**(job_args.write_tuning or {})),
+        overwrite_filter=overwrite_filter,
+        backfill_window=backfill_window(job_args),
     )
 
 
+@glue_job(JobArgsType=GlueJobArgs)
+def main(
+    spark_manager: SparkManager,
+    job_args: GlueJobArgs,
+):
+    return run_etl(spark_manager, job_args)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,134 @@
+from contextlib import closing
+import logging
+from typing import Optional
+
+from nextdata.core.connections.spark import SparkManager
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs, connect_dbapi
+from nextdata.core.glue.default_etl_script import connection_settings
+from nextdata.core.glue.glue_entrypoint import glue_job, GlueJobArgs
+from nextdata.core.glue.reverse_etl import (
+    DEFAULT_CONNECTIONS,
+    primary_key,
+    pushed_snapshot,
+    record_pushed_snapshot,
+    target_columns,
+    write_changes,
+    write_with_copy,
+)
+from nextdata.core.glue.table_swap import UnswappableTableError
+
+logger = logging.getLogger(__name__)
+
+
+def run_retl(spark_manager: SparkManager, job_args: GlueJobArgs) -> int:
+    """
+    Copy one Iceberg table into the database table of the same name.
+
+    Only the columns the database table has are copied, so columns the ETL
+    adds, like the ds load date, are left out. Returns the number of rows
+    written.
+    """
+    connection_conf, password = connection_settings(job_args)
+    columns = target_columns(connection_conf, password, job_args.sql_table)
+    if not columns:
+        raise ValueError(f"Target table {job_args.sql_table} does not exist")
+    if job_args.retl_mode == "incremental":
+        return push_changes(spark_manager, job_args, connection_conf, password, columns)
+    df = spark_manager.get_table(job_args.sql_table)
+    return write_with_copy(
+        df.select(*[column for column in df.columns if column in columns]),
+        connection_conf,
+        password,
+        job_args.sql_table,
+        connections=job_args.max_connections or DEFAULT_CONNECTIONS,
+        mode=job_args.retl_mode,
+    )
+
+
+def push_changes(
+    spark_manager: SparkManager,
+    job_args: GlueJobArgs,
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str],
+    columns: list[str],
+) -> int:
+    """
+    Apply the changes to the Iceberg table since the snapshot last pushed,
+    then record the current snapshot as pushed.
+
+    The first run, and any run whose changes can't be read, e.g. because the
+    last pushed snapshot has expired, pushes the whole table instead. It's
+    swapped in, so readers never see the table half pushed, unless the table
+    can't be swapped.
+    """
+    table = job_args.sql_table
+    connections = job_args.max_connections or DEFAULT_CONNECTIONS
+    snapshot_id = spark_manager.current_snapshot_id(table)
+    if snapshot_id is None:
+        logger.info(f"{table} has no snapshots, nothing to push")
+        return 0
+    with closing(connect_dbapi(connection_conf, password)) as connection:
+        keys = primary_key(connection, table)
+        pushed = pushed_snapshot(connection, table)
+    if not keys:
+        raise ValueError(f"Incremental reverse ETL needs a primary key on {table}")
+    if pushed == snapshot_id:
+        logger.info(f"Snapshot {snapshot_id} of {table} was already pushed")
+        return 0
+
+    changes = None
+    if pushed is not None:
+        try:
+            # Only changes to the target's columns, not e.g. to the ds stamp
+            changes = spark_manager.read_changes(
+                table, pushed, snapshot_id, columns
+            ).localCheckpoint()
+            # Checkpointing scans the changelog, which fails if the pushed
+            # snapshot is no longer an ancestor or the changes include delete
+            # files
+            empty = changes.isEmpty()
+        except Exception as e:
+            logger.warning(
+                f"Can't read the changes to {table} since snapshot {pushed}, "
+                f"pushing the whole table: {e}"
+            )
+            changes = None
+    if changes is None:
+        df = spark_manager.get_table(table, snapshot_id)
+        df = df.select(*[column for column in df.columns if column in columns])
+        try:
+            rows = write_with_copy(
+                df, connection_conf, password, table, connections, mode="swap"
+            )
+        except UnswappableTableError as e:
+            logger.warning(f"{e} Truncating and copying it instead.")
+            rows = write_with_copy(
+                df, connection_conf, password, table, connections, mode="overwrite"
+            )
+    elif empty:
+        rows = 0
+    else:
+        rows = write_changes(
+            changes,
+            connection_conf,
+            password,
+            table,
+            keys,
+            connections=connections,
+        )
+    with closing(connect_dbapi(connection_conf, password)) as connection:
+        record_pushed_snapshot(connection, table, snapshot_id)
+    logger.info(f"Pushed {table} up to snapshot {snapshot_id}")
+    return rows
+
+
+@glue_job(JobArgsType=GlueJobArgs)
+def main(
+    spark_manager: SparkManager,
+    job_args: GlueJobArgs,
+):
+    return run_retl(spark_manager, job_args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,577 @@
+"""
+SQL dialects for the JDBC protocols a connection can use.
+
+Each dialect knows everything about a source database that the ETL can't
+express portably, keyed by ``JDBCGlueJobArgs.protocol``: the JDBC driver,
+URL and read options Spark uses, the DB-API driver the planner connects
+with, and the catalog queries and SQL the planner needs.
+
+Every dialect query embeds its literals instead of using query parameters,
+because each DB-API driver has its own parameter style.
+"""
+
+from datetime import datetime
+import importlib
+import json
+from typing import Optional
+
+# Rows fetched per round-trip when reading partitions over JDBC
+DEFAULT_FETCH_SIZE = 10000
+# Number of quantiles sampled when there is no histogram to use
+QUANTILE_RESOLUTION = 100
+# Fraction of the table's blocks sampled to build a histogram for tables
+# that have never been analyzed
+SAMPLE_PERCENT = 1
+
+
+def quote_literal(value: str) -> str:
+    escaped = value.replace("'", "''")
+    return f"'{escaped}'"
+
+
+def import_driver(module: str, package: str, protocol: str):
+    """Import an optional DB-API driver, with a hint about what to install"""
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(
+            f"Connecting to {protocol} sources needs the {package} package"
+        ) from e
+
+
+class Dialect:
+    name: str
+    # JDBC driver class and the Maven package Spark loads it from
+    driver: str
+    driver_package: str
+    fetch_size: int = DEFAULT_FETCH_SIZE
+
+    def jdbc_url(self, host: str, port: int, database: str) -> str:
+        return f"jdbc:{self.name}://{host}:{port}/{database}"
+
+    def ssl_properties(self) -> dict[str, str]:
+        """JDBC properties that require an encrypted connection"""
+        return {}
+
+    def jdbc_properties(self, sslmode: str = "require") -> dict[str, str]:
+        """Driver, fetch size and SSL properties for Spark's JDBC reader"""
+        return {
+            "driver": self.driver,
+            "fetchsize": str(self.fetch_size),
+            **(self.ssl_properties() if sslmode != "disable" else {}),
+        }
+
+    def connect(
+        self,
+        host: str,
+        port: int,
+        database: str,
+        user: str,
+        password: Optional[str],
+        sslmode: str = "require",
+    ):
+        """Open a DB-API connection for planning queries"""
+        raise NotImplementedError
+
+    def introspection_query(self, table_name: str) -> str:
+        """
+        Query returning one row per column of a table:
+        (name, data type, is primary key, histogram bounds, average width,
+        estimated table rows). The last three may be NULL.
+        """
+        raise NotImplementedError
+
+    def row_estimate_query(self, table_name: str) -> Optional[str]:
+        """
+        Query returning (estimated rows, average row bytes) for a table from
+        catalog statistics, without scanning it. Either value may be NULL.
+
+        Postgres doesn't need one: its statistics are part of the planner's
+        introspection query.
+        """
+        return None
+
+    def filtered_row_estimate(
+        self, connection, table_name: str, source_filter: str
+    ) -> Optional[int]:
+        """Rows matching source_filter according to the query planner, if known"""
+        return None
+
+    def histogram_query(self, table_name: str, column: str) -> Optional[str]:
+        """
+        Query returning a column's histogram from catalog statistics as
+        (value, cumulative rows or fraction) rows in ascending value order.
+        """
+        return None
+
+    def bounds_query(
+        self, table_name: str, column: str, source_filter: Optional[str]
+    ) -> str:
+        """
+        Query returning (min, max, quantiles) for a numeric column. Dialects
+        that can't compute quantiles cheaply return NULL quantiles.
+        """
+        where = f" WHERE {source_filter}" if source_filter else ""
+        return f"SELECT MIN({column}), MAX({column}), NULL FROM {table_name}{where}"
+
+    def subquery(self, query: str, alias: str) -> str:
+        return f"({query}) AS {alias}"
+
+    def timestamp_literal(self, value: datetime) -> str:
+        """
+        A timestamp literal comparable with the dialect's date and timestamp
+        columns. Time zones are dropped: boundaries only need to be consistent
+        with each other, not with the column's zone.
+        """
+        return f"TIMESTAMP '{value:%Y-%m-%d %H:%M:%S}'"
+
+    def hash_bucket(self, columns: list[str], num_buckets: int) -> str:
+        """Expression that maps a row to a bucket in [0, num_buckets)"""
+        raise NotImplementedError
+
+    def hash_predicates(self, columns: list[str], num_buckets: int) -> list[str]:
+        """One predicate per bucket, together covering every row exactly once"""
+        expression = self.hash_bucket(columns, num_buckets)
+        return [f"{expression} = {bucket}" for bucket in range(num_buckets)]
+
+
+# Everything the planner needs comes back from this one query: the columns,
+# which of them form the primary key, and the catalog statistics for each
+# column. pg_stats histograms give approximate bounds without scanning the
+# table, and Spark's numeric partitioning keeps rows outside the bounds in the
+# first and last partitions, so approximate bounds never drop rows. Row
+# counts and widths come from pg_class and pg_stats, so the table is never
+# scanned to size the partitions.
+POSTGRES_INTROSPECTION_QUERY = """
+SELECT
+    c.column_name,
+    c.data_type,
+    pk.column_name IS NOT NULL AS is_primary_key,
+    s.histogram_bounds::text AS histogram_bounds,
+    s.avg_width,
+    t.reltuples AS row_estimate
+FROM information_schema.columns c
+LEFT JOIN (
+    SELECT kcu.table_schema, kcu.column_name
+    FROM information_schema.table_constraints tc
+    JOIN information_schema.key_column_usage kcu
+        ON tc.constraint_name = kcu.constraint_name
+        AND tc.table_schema = kcu.table_schema
+        AND tc.table_name = kcu.table_name
+    WHERE tc.table_name = {table_name}
+        AND tc.constraint_type = 'PRIMARY KEY'
+) pk
+    ON pk.column_name = c.column_name
+    AND pk.table_schema = c.table_schema
+LEFT JOIN pg_stats s
+    ON s.schemaname = c.table_schema
+    AND s.tablename = c.table_name
+    AND s.attname = c.column_name
+LEFT JOIN pg_class t
+    ON t.oid = to_regclass(quote_ident(c.table_schema) || '.' || quote_ident(c.table_name))
+WHERE c.table_name = {table_name}
+    AND c.table_schema = current_schema()
+ORDER BY c.ordinal_position
+"""
+
+
+class PostgresDialect(Dialect):
+    name = "postgresql"
+    driver = "org.postgresql.Driver"
+    driver_package = "org.postgresql:postgresql:42.6.0"
+
+    def ssl_properties(self) -> dict[str, str]:
+        return {"ssl": "true", "sslmode": "require"}
+
+    def jdbc_properties(self, sslmode: str = "require") -> dict[str, str]:
+        return {
+            **super().jdbc_properties(sslmode),
+            "loginTimeout": "60",  # Connection timeout in seconds
+            "socketTimeout": "60",  # Socket timeout in seconds
+            "connectTimeout": "60",  # Connect timeout in seconds
+            "tcpKeepAlive": "true",
+        }
+
+    def connect(self, host, port, database, user, password, sslmode="require"):
+        psycopg2 = import_driver("psycopg2", "psycopg2-binary", self.name)
+        return psycopg2.connect(
+            host=host,
+            port=port,
+            dbname=database,
+            user=user,
+            password=password,
+            sslmode=sslmode,
+            connect_timeout=60,
+        )
+
+    def introspection_query(self, table_name: str) -> str:
+        return POSTGRES_INTROSPECTION_QUERY.format(table_name=quote_literal(table_name))
+
+    def filtered_row_estimate(self, connection, table_name, source_filter):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {table_name} WHERE {source_filter}"
+            )
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def bounds_query(self, table_name, column, source_filter):
+        """
+        Bounds and quantiles in one query. Quantiles are computed over the
+        filtered rows, or over a block sample of an unanalyzed table.
+        """
+        fractions = ", ".join(
+            str(i / QUANTILE_RESOLUTION) for i in range(QUANTILE_RESOLUTION + 1)
+        )
+        percentiles = (
+            f"percentile_disc(ARRAY[{fractions}]) WITHIN GROUP (ORDER BY {column})"
+        )
+        if source_filter:
+            quantiles_expression = percentiles
+        else:
+            quantiles_expression = f"""(
+            SELECT {percentiles}
+            FROM {table_name} TABLESAMPLE SYSTEM ({SAMPLE_PERCENT})
+        )"""
+        return f"""
+    SELECT MIN({column}), MAX({column}), {quantiles_expression}
+    FROM {table_name}
+    {f"WHERE {source_filter}" if source_filter else ""}
+    """
+
+    def hash_bucket(self, columns: list[str], num_buckets: int) -> str:
+        values = ", ".join(f"{column}::text" for column in columns)
+        # hashtext returns int4, so widen before ABS to avoid overflowing on -2^31
+        return f"MOD(ABS(hashtext(concat_ws('|', {values}))::bigint), {num_buckets})"
+
+
+class MySQLDialect(Dialect):
+    name = "mysql"
+    driver = "com.mysql.cj.jdbc.Driver"
+    driver_package = "com.mysql:mysql-connector-j:8.4.0"
+
+    def ssl_properties(self) -> dict[str, str]:
+        return {"sslMode": "REQUIRED"}
+
+    def jdbc_properties(self, sslmode: str = "require") -> dict[str, str]:
+        # Connector/J buffers the whole result set unless it fetches with a
+        # server-side cursor
+        return {**super().jdbc_properties(sslmode), "useCursorFetch": "true"}
+
+    def connect(self, host, port, database, user, password, sslmode="require"):
+        pymysql = import_driver("pymysql", "PyMySQL", self.name)
+        return pymysql.connect(
+            host=host,
+            port=port,
+            database=database,
+            user=user,
+            password=password,
+            # Encrypted without verifying the server certificate, like sslmode=require
+            ssl={"check_hostname": False} if sslmode != "disable" else None,
+            connect_timeout=60,
+        )
+
+    def introspection_query(self, table_name: str) -> str:
+        # InnoDB only keeps row counts and widths per table, see row_estimate_query
+        return f"""
+        SELECT COLUMN_NAME, DATA_TYPE, COLUMN_KEY = 'PRI', NULL, NULL, NULL
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = {quote_literal(table_name)}
+        ORDER BY ORDINAL_POSITION
+        """
+
+    def row_estimate_query(self, table_name: str) -> str:
+        return f"""
+        SELECT TABLE_ROWS, AVG_ROW_LENGTH
+        FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = {quote_literal(table_name)}
+        """
+
+    def filtered_row_estimate(self, connection, table_name, source_filter):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN SELECT 1 FROM {table_name} WHERE {source_filter}")
+            names = [column[0].lower() for column in cursor.description]
+            plan = cursor.fetchone()
+        if not plan:
+            return None
+        row = dict(zip(names, plan))
+        if row.get("rows") is None:
+            return None
+        return int(row["rows"] * float(row.get("filtered") or 100) / 100)
+
+    def histogram_query(self, table_name: str, column: str) -> str:
+        # Histograms from ANALYZE TABLE ... UPDATE HISTOGRAM (MySQL 8). Singleton
+        # buckets are [value, cumulative frequency], equi-height buckets are
+        # [lower, upper, cumulative frequency, distinct values]
+        return f"""
+        SELECT
+            CASE WHEN s.HISTOGRAM->>'$."histogram-type"' = 'singleton'
+                THEN b.first_value ELSE b.second_value END,
+            CASE WHEN s.HISTOGRAM->>'$."histogram-type"' = 'singleton'
+                THEN b.second_value ELSE b.third_value END
+        FROM information_schema.COLUMN_STATISTICS s,
+            JSON_TABLE(s.HISTOGRAM, '$.buckets[*]' COLUMNS (
+                position FOR ORDINALITY,
+                first_value VARCHAR(255) PATH '$[0]',
+                second_value VARCHAR(255) PATH '$[1]',
+                third_value VARCHAR(255) PATH '$[2]'
+            )) b
+        WHERE s.SCHEMA_NAME = DATABASE()
+            AND s.TABLE_NAME = {quote_literal(table_name)}
+            AND s.COLUMN_NAME = {quote_literal(column)}
+        ORDER BY b.position
+        """
+
+    def hash_bucket(self, columns: list[str], num_buckets: int) -> str:
+        return f"MOD(CRC32(CONCAT_WS('|', {', '.join(columns)})), {num_buckets})"
+
+
+class MariaDBDialect(MySQLDialect):
+    name = "mariadb"
+    driver = "org.mariadb.jdbc.Driver"
+    driver_package = "org.mariadb.jdbc:mariadb-java-client:3.4.1"
+
+    def ssl_properties(self) -> dict[str, str]:
+        return {"sslMode": "trust"}
+
+    def jdbc_properties(self, sslmode: str = "require") -> dict[str, str]:
+        # The MariaDB driver streams with a plain fetch size
+        return Dialect.jdbc_properties(self, sslmode)
+
+    def histogram_query(self, table_name: str, column: str) -> None:
+        # MariaDB keeps its histograms in a binary format in mysql.column_stats
+        return None
+
+
+class SQLServerDialect(Dialect):
+    name = "sqlserver"
+    driver = "com.microsoft.sqlserver.jdbc.SQLServerDriver"
+    driver_package = "com.microsoft.sqlserver:mssql-jdbc:12.8.1.jre11"
+
+    def jdbc_url(self, host: str, port: int, database: str) -> str:
+        return f"jdbc:sqlserver://{host}:{port};databaseName={database}"
+
+    def ssl_properties(self) -> dict[str, str]:
+        return {"encrypt": "true", "trustServerCertificate": "true"}
+
+    def connect(self, host, port, database, user, password, sslmode="require"):
+        # Encryption follows the FreeTDS configuration of the environment
+        pymssql = import_driver("pymssql", "pymssql", self.name)
+        return pymssql.connect(
+            server=host,
+            port=str(port),
+            database=database,
+            user=user,
+            password=password,
+            login_timeout=60,
+        )
+
+    def introspection_query(self, table_name: str) -> str:
+        return f"""
+        SELECT
+            c.COLUMN_NAME,
+            c.DATA_TYPE,
+            CASE WHEN k.COLUMN_NAME IS NULL THEN 0 ELSE 1 END,
+            NULL,
+            NULL,
+            NULL
+        FROM INFORMATION_SCHEMA.COLUMNS c
+        LEFT JOIN INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+            ON tc.TABLE_SCHEMA = c.TABLE_SCHEMA
+            AND tc.TABLE_NAME = c.TABLE_NAME
+            AND tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
+        LEFT JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE k
+            ON k.CONSTRAINT_NAME = tc.CONSTRAINT_NAME
+            AND k.TABLE_SCHEMA = tc.TABLE_SCHEMA
+            AND k.COLUMN_NAME = c.COLUMN_NAME
+        WHERE c.TABLE_SCHEMA = SCHEMA_NAME() AND c.TABLE_NAME = {quote_literal(table_name)}
+        ORDER BY c.ORDINAL_POSITION
+        """
+
+    def row_estimate_query(self, table_name: str) -> str:
+        # Heap (0) or clustered index (1) partitions hold the table's rows
+        return f"""
+        SELECT
+            SUM(row_count),
+            SUM(used_page_count) * 8192 / NULLIF(SUM(row_count), 0)
+        FROM sys.dm_db_partition_stats
+        WHERE object_id = OBJECT_ID({quote_literal(table_name)}) AND index_id IN (0, 1)
+        """
+
+    def histogram_query(self, table_name: str, column: str) -> str:
+        # Statistics histograms are keyed on the leading column of the
+        # statistics object, there may be several for the same column
+        return f"""
+        SELECT h.range_high_key, SUM(h.range_rows + h.equal_rows) OVER (ORDER BY h.step_number)
+        FROM sys.dm_db_stats_histogram(
+            OBJECT_ID({quote_literal(table_name)}),
+            (
+                SELECT MIN(sc.stats_id)
+                FROM sys.stats_columns sc
+                WHERE sc.object_id = OBJECT_ID({quote_literal(table_name)})
+                    AND sc.stats_column_id = 1
+                    AND COL_NAME(sc.object_id, sc.column_id) = {quote_literal(column)}
+            )
+        ) h
+        ORDER BY h.step_number
+        """
+
+    def timestamp_literal(self, value: datetime) -> str:
+        # SQL Server has no TIMESTAMP literal, its TIMESTAMP is a row version
+        return f"CAST('{value:%Y-%m-%d %H:%M:%S}' AS DATETIME2)"
+
+    def hash_bucket(self, columns: list[str], num_buckets: int) -> str:
+        return f"ABS(CAST(CHECKSUM({', '.join(columns)}) AS BIGINT)) % {num_buckets}"
+
+
+class OracleDialect(Dialect):
+    name = "oracle"
+    driver = "oracle.jdbc.OracleDriver"
+    driver_package = "com.oracle.database.jdbc:ojdbc11:23.5.0.24.07"
+
+    def jdbc_url(self, host: str, port: int, database: str) -> str:
+        # database is the service name
+        return f"jdbc:oracle:thin:@//{host}:{port}/{database}"
+
+    def connect(self, host, port, database, user, password, sslmode="require"):
+        # Oracle encrypts with native network encryption configured on the
+        # server, TLS would need a tcps listener and a wallet
+        oracledb = import_driver("oracledb", "oracledb", self.name)
+        return oracledb.connect(
+            user=user,
+            password=password,
+            host=host,
+            port=port,
+            service_name=database,
+            tcp_connect_timeout=60,
+        )
+
+    def introspection_query(self, table_name: str) -> str:
+        return f"""
+        SELECT
+            c.COLUMN_NAME,
+            c.DATA_TYPE,
+            CASE WHEN pk.COLUMN_NAME IS NULL THEN 0 ELSE 1 END,
+            NULL,
+            c.AVG_COL_LEN,
+            NULL
+        FROM USER_TAB_COLUMNS c
+        LEFT JOIN (
+            SELECT cc.COLUMN_NAME
+            FROM USER_CONSTRAINTS k
+            JOIN USER_CONS_COLUMNS cc ON cc.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+            WHERE k.TABLE_NAME = UPPER({quote_literal(table_name)})
+                AND k.CONSTRAINT_TYPE = 'P'
+        ) pk ON pk.COLUMN_NAME = c.COLUMN_NAME
+        WHERE c.TABLE_NAME = UPPER({quote_literal(table_name)})
+        ORDER BY c.COLUMN_ID
+        """
+
+    def row_estimate_query(self, table_name: str) -> str:
+        return f"""
+        SELECT NUM_ROWS, AVG_ROW_LEN
+        FROM USER_TABLES
+        WHERE TABLE_NAME = UPPER({quote_literal(table_name)})
+        """
+
+    def histogram_query(self, table_name: str, column: str) -> str:
+        # ENDPOINT_NUMBER is cumulative: a bucket number for height-balanced
+        # histograms and a row count for frequency and hybrid ones
+        return f"""
+        SELECT ENDPOINT_VALUE, ENDPOINT_NUMBER
+        FROM USER_TAB_HISTOGRAMS
+        WHERE TABLE_NAME = UPPER({quote_literal(table_name)})
+            AND COLUMN_NAME = UPPER({quote_literal(column)})
+        ORDER BY ENDPOINT_NUMBER
+        """
+
+    def subquery(self, query: str, alias: str) -> str:
+        # Oracle doesn't accept AS before a table alias
+        return f"({query}) {alias}"
+
+    def hash_bucket(self, columns: list[str], num_buckets: int) -> str:
+        values = " || '|' || ".join(columns)
+        # ORA_HASH already returns a bucket in [0, max_bucket]
+        return f"ORA_HASH({values}, {num_buckets - 1})"
+
+
+class DB2Dialect(Dialect):
+    name = "db2"
+    driver = "com.ibm.db2.jcc.DB2Driver"
+    driver_package = "com.ibm.db2:jcc:11.5.9.0"
+
+    def ssl_properties(self) -> dict[str, str]:
+        return {"sslConnection": "true"}
+
+    def connect(self, host, port, database, user, password, sslmode="require"):
+        ibm_db_dbi = import_driver("ibm_db_dbi", "ibm_db", self.name)
+        security = ";SECURITY=SSL" if sslmode != "disable" else ""
+        return ibm_db_dbi.connect(
+            f"DATABASE={database};HOSTNAME={host};PORT={port};PROTOCOL=TCPIP;"
+            f"UID={user};PWD={password};CONNECTTIMEOUT=60{security}",
+            "",
+            "",
+        )
+
+    def introspection_query(self, table_name: str) -> str:
+        # KEYSEQ is the column's position in the primary key, AVGCOLLEN is -1
+        # until RUNSTATS has been run
+        return f"""
+        SELECT
+            COLNAME,
+            TYPENAME,
+            CASE WHEN KEYSEQ IS NULL THEN 0 ELSE 1 END,
+            NULL,
+            NULLIF(AVGCOLLEN, -1),
+            NULL
+        FROM SYSCAT.COLUMNS
+        WHERE TABSCHEMA = CURRENT SCHEMA AND TABNAME = UPPER({quote_literal(table_name)})
+        ORDER BY COLNO
+        """
+
+    def row_estimate_query(self, table_name: str) -> str:
+        # CARD and AVGROWSIZE are -1 until RUNSTATS has been run
+        return f"""
+        SELECT NULLIF(CARD, -1), NULLIF(AVGROWSIZE, -1)
+        FROM SYSCAT.TABLES
+        WHERE TABSCHEMA = CURRENT SCHEMA AND TABNAME = UPPER({quote_literal(table_name)})
+        """
+
+    def histogram_query(self, table_name: str, column: str) -> str:
+        # Quantile statistics, VALCOUNT is the number of rows up to COLVALUE
+        return f"""
+        SELECT COLVALUE, VALCOUNT
+        FROM SYSCAT.COLDIST
+        WHERE TABSCHEMA = CURRENT SCHEMA
+            AND TABNAME = UPPER({quote_literal(table_name)})
+            AND COLNAME = UPPER({quote_literal(column)})
+            AND TYPE = 'Q'
+            AND COLVALUE IS NOT NULL
+        ORDER BY SEQNO
+        """
+
+    def hash_bucket(self, columns: list[str], num_buckets: int) -> str:
+        values = " || '|' || ".join(f"VARCHAR({column})" for column in columns)
+        return f"MOD(ABS(HASH4({values})), {num_buckets})"
+
+
+DIALECTS: dict[str, Dialect] = {
+    dialect.name: dialect
+    for dialect in (
+        PostgresDialect(),
+        MySQLDialect(),
+        MariaDBDialect(),
+        SQLServerDialect(),
+        OracleDialect(),
+        DB2Dialect(),
+    )
+}
+
+
+def get_dialect(protocol: str) -> Dialect:
+    try:
+        return DIALECTS[protocol]
+    except KeyError:
+        raise ValueError(f"Unsupported JDBC protocol: {protocol}")
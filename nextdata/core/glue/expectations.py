@@ -0,0 +1,343 @@
+"""
+Data quality checks computed in the same pass as the write.
+
+Expectations are declared in a table's etl.py:
+
+    expectations = [
+        {"check": "not_null", "column": "id"},
+        {"check": "unique", "column": "id"},
+        {"check": "range", "column": "price", "min": 0},
+        {"check": "row_count_change", "max_decrease": 0.5, "severity": "warn"},
+    ]
+
+Each expectation becomes aggregates observed on the DataFrame being written,
+so they are computed by the write's own tasks instead of by queries over the
+loaded table afterwards. The write is staged on a branch of the Iceberg table
+and only published to main if no check with severity "error" failed, see
+SparkManager.write_to_table. Merges are checked on the rows to merge, before
+the MERGE runs.
+
+Observed metrics can't be distinct aggregates, so a unique check with
+severity "error" counts values and distinct values exactly on the staged
+branch once the write is on it, i.e. over the whole table as it would be
+published, or on the rows to merge. That is one more read of the column.
+A unique check with severity "warn" is observed with approx_count_distinct
+instead. Its estimate can be off either way, so the warning is only logged
+when the apparent duplicates exceed UNIQUENESS_TOLERANCE standard
+deviations of it, up to 1.5% of the load, and a few duplicates in a large
+load go unnoticed.
+
+Results are appended to a results table in the table bucket's namespace,
+which the dev server syncs into nextdata.db.
+"""
+
+from dataclasses import dataclass, fields
+from datetime import datetime
+import logging
+from typing import Any, Literal, Optional, get_args
+
+from pyspark.sql import Column
+import pyspark.sql.functions as F
+
+from nextdata.core.connections.spark import SparkManager
+from nextdata.util.s3_tables_utils import get_s3_table_path
+
+logger = logging.getLogger(__name__)
+
+Severity = Literal["error", "warn"]
+CheckType = Literal["not_null", "unique", "range", "row_count_change"]
+CHECKS: list[str] = list(get_args(CheckType))
+
+# Relative standard deviation of approx_count_distinct in warn-only
+# uniqueness checks, and how many of them the estimate may be off by before
+# duplicates count
+UNIQUENESS_RSD = 0.005
+UNIQUENESS_TOLERANCE = 3
+
+RESULTS_TABLE = "nextdata_check_results"
+RESULTS_SCHEMA = (
+    "table_name STRING, run_id STRING, check_type STRING, column_name STRING, "
+    "severity STRING, passed BOOLEAN, observed DOUBLE, message STRING"
+)
+
+
+@dataclass
+class CheckResult:
+    check: str
+    column: Optional[str]
+    severity: Severity
+    passed: bool
+    observed: Optional[float]
+    message: str
+
+
+class DataQualityError(Exception):
+    """Raised when a check with severity "error" fails, before the write is published"""
+
+    def __init__(self, failures: list[CheckResult]):
+        self.failures = failures
+        super().__init__(
+            "Data quality checks failed: "
+            + "; ".join(failure.message for failure in failures)
+        )
+
+
+@dataclass
+class Expectation:
+    check: CheckType
+    column: Optional[str] = None
+    # Bounds of a range check, either may be left open
+    min: Optional[float] = None
+    max: Optional[float] = None
+    # Allowed change of a load's row count against the previous load, as a
+    # fraction of it
+    max_decrease: Optional[float] = None
+    max_increase: Optional[float] = None
+    severity: Severity = "error"
+
+    @classmethod
+    def from_dict(cls, value: dict[str, Any]) -> "Expectation":
+        unknown = set(value) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown expectation settings {sorted(unknown)}")
+        expectation = cls(**value)
+        if expectation.check not in CHECKS:
+            raise ValueError(
+                f"Unknown check {expectation.check}, expected one of {CHECKS}"
+            )
+        if expectation.severity not in get_args(Severity):
+            raise ValueError(
+                f"Unknown severity {expectation.severity}, expected error or warn"
+            )
+        if expectation.check == "row_count_change":
+            if expectation.max_decrease is None and expectation.max_increase is None:
+                raise ValueError(
+                    "A row_count_change check needs max_decrease or max_increase"
+                )
+        elif not expectation.column:
+            raise ValueError(f"A {expectation.check} check needs a column")
+        if (
+            expectation.check == "range"
+            and expectation.min is None
+            and expectation.max is None
+        ):
+            raise ValueError(f"A range check on {expectation.column} needs min or max")
+        return expectation
+
+    @property
+    def is_exact_unique(self) -> bool:
+        return self.check == "unique" and self.severity == "error"
+
+    def metrics(self, prefix: str) -> dict[str, Column]:
+        """Aggregates to observe during the write, named with prefix"""
+        if self.check == "row_count_change" or self.is_exact_unique:
+            # Compared with the row count every write observes, or counted
+            # over the staged write, see staged_metrics
+            return {}
+        column = F.col(self.column)
+        if self.check == "not_null":
+            return {f"{prefix}_nulls": F.count(F.when(column.isNull(), 1))}
+        if self.check == "unique":
+            return {
+                f"{prefix}_values": F.count(column),
+                f"{prefix}_distinct": F.approx_count_distinct(column, UNIQUENESS_RSD),
+            }
+        outside = F.lit(False)
+        if self.min is not None:
+            outside = outside | (column < F.lit(self.min))
+        if self.max is not None:
+            outside = outside | (column > F.lit(self.max))
+        return {f"{prefix}_out_of_range": F.count(F.when(outside, 1))}
+
+    def staged_metrics(self, prefix: str) -> dict[str, Column]:
+        """Aggregates over the staged write that can't be observed during it"""
+        if not self.is_exact_unique:
+            return {}
+        column = F.col(self.column)
+        return {
+            f"{prefix}_values": F.count(column),
+            f"{prefix}_distinct": F.count_distinct(column),
+        }
+
+    def evaluate(
+        self,
+        observed: dict[str, Any],
+        prefix: str,
+        previous_rows: Optional[int] = None,
+    ) -> CheckResult:
+        rows = observed.get("rows") or 0
+
+        def result(passed: bool, value: Optional[float], message: str) -> CheckResult:
+            return CheckResult(
+                self.check, self.column, self.severity, passed, value, message
+            )
+
+        if self.check == "not_null":
+            nulls = observed[f"{prefix}_nulls"] or 0
+            return result(
+                nulls == 0, nulls, f"{nulls} of {rows} rows have a null {self.column}"
+            )
+        if self.check == "unique":
+            values = observed[f"{prefix}_values"] or 0
+            duplicates = max(0, values - (observed[f"{prefix}_distinct"] or 0))
+            if self.is_exact_unique:
+                return result(
+                    duplicates == 0,
+                    duplicates,
+                    f"{duplicates} duplicate values of {self.column}",
+                )
+            allowed = UNIQUENESS_TOLERANCE * UNIQUENESS_RSD * values
+            return result(
+                duplicates <= allowed,
+                duplicates,
+                f"About {duplicates} duplicate values of {self.column}, "
+                f"up to {allowed:.0f} are within the estimate's error",
+            )
+        if self.check == "range":
+            outside = observed[f"{prefix}_out_of_range"] or 0
+            return result(
+                outside == 0,
+                outside,
+                f"{outside} of {rows} rows have {self.column} outside "
+                f"[{'' if self.min is None else self.min}, "
+                f"{'' if self.max is None else self.max}]",
+            )
+        if not previous_rows:
+            return result(True, None, "No previous load to compare the row count with")
+        change = (rows - previous_rows) / previous_rows
+        passed = (self.max_decrease is None or change >= -self.max_decrease) and (
+            self.max_increase is None or change <= self.max_increase
+        )
+        return result(
+            passed,
+            change,
+            f"{rows} rows against {previous_rows} in the previous load ({change:+.1%})",
+        )
+
+
+class ExpectationSuite:
+    """
+    A table's expectations, observed during a write and audited before it's
+    published. previous_rows is the row count row_count_change checks compare
+    with, they pass when it's unknown.
+    """
+
+    def __init__(
+        self, expectations: list[Expectation], previous_rows: Optional[int] = None
+    ):
+        self.expectations = expectations
+        self.previous_rows = previous_rows
+        self.results: list[CheckResult] = []
+
+    @classmethod
+    def from_dicts(
+        cls, values: list[dict[str, Any]], previous_rows: Optional[int] = None
+    ) -> "ExpectationSuite":
+        return cls([Expectation.from_dict(value) for value in values], previous_rows)
+
+    def metrics(self) -> dict[str, Column]:
+        metrics = {}
+        for index, expectation in enumerate(self.expectations):
+            metrics.update(expectation.metrics(f"check_{index}"))
+        return metrics
+
+    def staged_metrics(self) -> dict[str, Column]:
+        metrics = {}
+        for index, expectation in enumerate(self.expectations):
+            metrics.update(expectation.staged_metrics(f"check_{index}"))
+        return metrics
+
+    def audit(self, observed: dict[str, Any]) -> None:
+        """Evaluate the checks on a write's observed metrics, raising on hard failures"""
+        results = [
+            expectation.evaluate(observed, f"check_{index}", self.previous_rows)
+            for index, expectation in enumerate(self.expectations)
+        ]
+        self.results.extend(results)
+        for result in results:
+            if not result.passed and result.severity == "warn":
+                logger.warning(f"Check {result.check} failed: {result.message}")
+        failures = [
+            result
+            for result in results
+            if not result.passed and result.severity == "error"
+        ]
+        if failures:
+            raise DataQualityError(failures)
+
+
+def record_results(
+    spark_manager: SparkManager,
+    table_name: str,
+    run_id: str,
+    results: list[CheckResult],
+) -> None:
+    """Append a run's check results to the results table"""
+    if not results:
+        return
+    spark = spark_manager.spark
+    results_table = get_s3_table_path(spark_manager.namespace, RESULTS_TABLE)
+    spark.sql(
+        f"CREATE TABLE IF NOT EXISTS {results_table} "
+        f"({RESULTS_SCHEMA}, checked_at TIMESTAMP) USING iceberg"
+    )
+    spark.createDataFrame(
+        [
+            (
+                table_name,
+                run_id,
+                result.check,
+                result.column,
+                result.severity,
+                result.passed,
+                None if result.observed is None else float(result.observed),
+                result.message,
+            )
+            for result in results
+        ],
+        RESULTS_SCHEMA,
+    ).withColumn("checked_at", F.current_timestamp()).writeTo(results_table).append()
+
+
+def read_results(
+    spark_manager: SparkManager, table_name: str, since: Optional[datetime] = None
+) -> list[dict[str, Any]]:
+    """A table's check results from the results table, checked after since"""
+    spark = spark_manager.spark
+    results_table = get_s3_table_path(spark_manager.namespace, RESULTS_TABLE)
+    if not spark.catalog.tableExists(results_table):
+        return []
+    condition = f"table_name = '{table_name}'"
+    if since:
+        condition += f" AND checked_at > TIMESTAMP '{since.isoformat(sep=' ')}'"
+    return [
+        row.asDict()
+        for row in spark.sql(
+            f"SELECT * FROM {results_table} WHERE {condition} ORDER BY checked_at"
+        ).collect()
+    ]
+
+
+def previous_load_rows(
+    spark_manager: SparkManager, table_name: str, overwrite: bool
+) -> Optional[int]:
+    """
+    Row count of the table's previous load: the whole table when loads
+    overwrite it, the latest append otherwise
+    """
+    spark = spark_manager.spark
+    table_path = get_s3_table_path(spark_manager.namespace, table_name)
+    if not spark.catalog.tableExists(table_path):
+        return None
+    key = "total-records" if overwrite else "added-records"
+    rows = spark.sql(
+        f"""
+        SELECT s.summary['{key}'] AS rows
+        FROM {table_path}.snapshots s
+        JOIN {table_path}.history h ON s.snapshot_id = h.snapshot_id
+        WHERE h.is_current_ancestor{"" if overwrite else " AND s.operation = 'append'"}
+        ORDER BY s.committed_at DESC
+        LIMIT 1
+        """
+    ).collect()
+    return int(rows[0]["rows"]) if rows and rows[0]["rows"] is not None else None
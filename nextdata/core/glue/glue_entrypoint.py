@@ -2,18 +2,23 @@
 Decorator for glue jobs. Handles some of the boilerplate for glue jobs.
 """
 
+from datetime import datetime
 import json
 
 from pydantic import BaseModel, ConfigDict, field_validator
 from typing import Any, Callable, Literal, Optional, TypeVar
 from functools import wraps
 import argparse
-from nextdata.core.connections.spark import SparkManager
+from nextdata.core.connections.spark import MergeStrategy, SparkManager
+from nextdata.core.glue.partitioning import TimeGranularity
+from nextdata.core.glue.reverse_etl import RetlWriteMode
 
 T = TypeVar("T")
 SupportedConnectionTypes = Literal[
     "s3", "redshift", "snowflake", "athena", "jdbc", "dsql"
 ]
+ExtractionEngine = Literal["jdbc", "copy"]
+IncrementalWriteMode = Literal["append", "merge"]
 
 
 def add_model(parser: argparse.ArgumentParser, model: BaseModel):
@@ -39,6 +44,37 @@ class GlueJobArgs(BaseModel):
         sql_table: The table to run the SQL query on.
         incremental_column: The column to use for incremental loading.
         is_full_load: Whether the job is a full load.
+        max_partitions: Upper bound on the number of partitions read from the source.
+        target_partition_bytes: Amount of source data each partition should read.
+        extraction_engine: How partitions are read from the source, over JDBC or
+            with Postgres COPY.
+        columns: Columns to extract, all of them if not set.
+        source_filter: SQL predicate applied to the source table before extraction.
+        checkpoint_partitions: Commit the extraction every this many partitions,
+            so a failed run resumes where it stopped. One commit if not set.
+        restart_extraction: Abandon the extraction a failed run left pending
+            and plan afresh instead of resuming it.
+        write_mode: How incremental loads are written, appended or merged into
+            the table on the source's primary key.
+        merge_strategy: Whether merges rewrite data files or write delete files.
+        backfill_from: Start of a historical window of the incremental column to
+            re-extract, instead of loading from the watermark. The table's rows
+            in the window are replaced, or merged into on merge tables.
+        backfill_to: End of the backfill window, exclusive.
+        backfill_granularity: Read the backfill window one day or one hour per
+            partition. Sized from the source's row estimate if not set.
+        max_connections: Upper bound on concurrent connections to the source
+            while reading, or to the target while a reverse ETL job writes. One
+            per partition if not set.
+        partition_by: Iceberg partition transforms the table is created with.
+        sort_order: Fields writes to the table are ordered by.
+        write_tuning: Target file size, distribution mode, compression codec and
+            row group size for writes, see spark.write_properties.
+        expectations: Data quality checks evaluated during the write, see
+            expectations.Expectation.
+        retl_mode: Whether reverse ETL jobs replace the target table's rows,
+            truncating it or swapping in a freshly indexed copy, append to
+            them, or apply the changes since the last push.
     """
 
     job_name: str
@@ -48,6 +84,24 @@ class GlueJobArgs(BaseModel):
     sql_table: str
     incremental_column: Optional[str] = None
     is_full_load: Optional[bool] = True
+    max_partitions: Optional[int] = None
+    target_partition_bytes: Optional[int] = None
+    extraction_engine: Optional[ExtractionEngine] = "jdbc"
+    columns: Optional[list[str]] = None
+    source_filter: Optional[str] = None
+    checkpoint_partitions: Optional[int] = None
+    restart_extraction: Optional[bool] = False
+    write_mode: Optional[IncrementalWriteMode] = "append"
+    merge_strategy: Optional[MergeStrategy] = None
+    backfill_from: Optional[datetime] = None
+    backfill_to: Optional[datetime] = None
+    backfill_granularity: Optional[TimeGranularity] = None
+    max_connections: Optional[int] = None
+    partition_by: Optional[list[str]] = None
+    sort_order: Optional[list[str]] = None
+    write_tuning: Optional[dict[str, Any]] = None
+    expectations: Optional[list[dict[str, Any]]] = None
+    retl_mode: Optional[RetlWriteMode] = "overwrite"
     bucket_arn: str
     namespace: str
 
@@ -63,14 +117,31 @@ class GlueJobArgs(BaseModel):
         except json.JSONDecodeError:
             raise ValueError("Invalid connection properties")
 
-    @field_validator("is_full_load", mode="before")
+    # Lists and dicts come in as JSON from the command line
+    @field_validator(
+        "columns",
+        "partition_by",
+        "sort_order",
+        "write_tuning",
+        "expectations",
+        mode="before",
+    )
+    def validate_json(cls, v, info):
+        if v is None or isinstance(v, (list, dict)):
+            return v
+        try:
+            return json.loads(v)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid {info.field_name}")
+
+    @field_validator("is_full_load", "restart_extraction", mode="before")
     def validate_is_full_load(cls, v):
         if isinstance(v, bool):
             return v
         return v.lower() == "true"
 
 
-def glue_job(JobArgsType: type[GlueJobArgs] = GlueJobArgs):
+def glue_job(JobArgsType: type[BaseModel] = GlueJobArgs):
     def decorator(func: Callable[[SparkManager, JobArgsType], T]) -> Callable[..., T]:
         @wraps(func)
         def glue_job_wrapper(
@@ -93,8 +164,6 @@ def glue_job(JobArgsType: type[GlueJobArgs] = GlueJobArgs):
                     spark_manager=spark_manager,
                     job_args=job_args_resolved,
                 )
-                # TODO: If job is retl, add logic to write to db
-                # TODO: Add tracking for retl output table names and cleanup old tables when new job is run
                 return result
             except Exception as e:
                 # Log any errors and ensure job fails properly
@@ -1,93 +1,618 @@
-from nextdata.core.connections.spark import SparkManager
-from dataclasses import dataclass
-from typing import Literal, Optional
+"""
+Partition planning for JDBC extraction.
+
+The planner introspects the source table over a plain DB-API connection
+instead of Spark, so planning doesn't pay for Spark jobs or extra JDBC
+connections before extraction starts.
+"""
+
+import csv
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import logging
+import math
+import time
+from typing import Any, Callable, Literal, Optional
+
+from nextdata.core.glue.dialects import QUANTILE_RESOLUTION, Dialect, PostgresDialect
+
+logger = logging.getLogger(__name__)
+
+# Numeric data types as the dialects' catalogs name them, lowercased
+NUMERIC_TYPES = {
+    "integer",
+    "int",
+    "bigint",
+    "smallint",
+    "tinyint",
+    "mediumint",
+    "decimal",
+    "numeric",
+    "number",
+    "real",
+    "float",
+    "double",
+    "double precision",
+    "binary_double",
+    "binary_float",
+    "decfloat",
+}
+
+# Date and time types without a timestamp prefix, as the dialects' catalogs
+# name them. Every type starting with "timestamp" is temporal too.
+TEMPORAL_TYPES = {"date", "datetime", "datetime2", "smalldatetime", "datetimeoffset"}
+
+TimeGranularity = Literal["day", "hour"]
+BUCKET_SIZES: dict[str, timedelta] = {
+    "day": timedelta(days=1),
+    "hour": timedelta(hours=1),
+}
+
+# Default amount of source data each Spark task extracts
+DEFAULT_TARGET_PARTITION_BYTES = 128 * 1024 * 1024
+DEFAULT_MAX_PARTITIONS = 100
+# Used to size partitions when the source has no row width statistics
+DEFAULT_ROWS_PER_PARTITION = 100000
+
+# A numeric range is considered skewed when, split into equal-width stripes,
+# one stripe would carry more than this multiple of its fair share of rows
+SKEW_THRESHOLD = 2.0
 
 
 @dataclass
 class PartitionStrategy:
-    type: Literal["numeric", "hash"]
+    type: Literal["numeric", "hash", "quantile", "time"]
     num_partitions: int
-    predicates: Optional[list[str]]
-    column: Optional[str]
-    lower_bound: Optional[str]
-    upper_bound: Optional[str]
+    predicates: Optional[list[str]] = None
+    column: Optional[str] = None
+    lower_bound: Optional[Any] = None
+    upper_bound: Optional[Any] = None
 
     @classmethod
     def from_dict(cls, data: dict) -> "PartitionStrategy":
         return cls(**data)
 
+    def to_predicates(self) -> list[str]:
+        """
+        One predicate per partition, for readers that can't stride a column.
 
-def get_partition_strategy(
-    spark_manager: SparkManager,
-    connection_options: dict,
+        Numeric ranges are split the way Spark's JDBC reader splits them: the
+        first and last partitions are open-ended so rows outside the bounds
+        are still read.
+        """
+        if self.predicates:
+            return self.predicates
+        if self.type != "numeric":
+            return ["1 = 1"]
+        stride = (self.upper_bound - self.lower_bound) // self.num_partitions
+        boundaries = sorted(
+            {self.lower_bound + i * stride for i in range(1, self.num_partitions)}
+            if stride
+            else set()
+        )
+        return range_predicates(self.column, boundaries)
+
+
+@dataclass
+class SourceColumn:
+    name: str
+    data_type: str
+    is_primary_key: bool = False
+    histogram_bounds: Optional[list[str]] = None
+    avg_width: Optional[int] = None
+
+
+@dataclass
+class SourceMetadata:
+    """Everything the planner knows about a source table"""
+
+    table_name: str
+    columns: list[SourceColumn]
+    row_estimate: Optional[int] = None
+    # Average bytes per row, for sources that only keep table-level widths
+    avg_row_width: Optional[int] = None
+    timings: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def column_types(self) -> dict[str, str]:
+        return {column.name: column.data_type for column in self.columns}
+
+    @property
+    def primary_key(self) -> list[SourceColumn]:
+        return [column for column in self.columns if column.is_primary_key]
+
+    @property
+    def row_width(self) -> Optional[int]:
+        """Average row width in bytes, if every column has statistics"""
+        return self.row_width_for(None)
+
+    def row_width_for(self, columns: Optional[list[str]]) -> Optional[int]:
+        """Average width in bytes of the given columns, or of the whole row"""
+        selected = [self.column(name) for name in columns] if columns else self.columns
+        widths = [column.avg_width for column in selected]
+        if widths and None not in widths:
+            return sum(widths)
+        if self.avg_row_width and selected:
+            # Assume the selected columns take their share of the row
+            return max(1, self.avg_row_width * len(selected) // len(self.columns))
+        return None
+
+    def column(self, name: str) -> Optional[SourceColumn]:
+        return next((column for column in self.columns if column.name == name), None)
+
+    def projection(self, columns: Optional[list[str]]) -> Optional[list[str]]:
+        """
+        Columns to select for a requested projection, or None for all of them.
+
+        Partition predicates are applied to the projected subquery, so the
+        primary key is always selected.
+        """
+        if not columns:
+            return None
+        missing = [name for name in columns if not self.column(name)]
+        if missing:
+            raise ValueError(f"Columns {missing} not found in {self.table_name}")
+        return list(columns) + [
+            column.name for column in self.primary_key if column.name not in columns
+        ]
+
+
+def combine_filters(*filters: Optional[str]) -> Optional[str]:
+    """AND together the filters that are set"""
+    filters = [f"({source_filter})" for source_filter in filters if source_filter]
+    return " AND ".join(filters) or None
+
+
+def source_subquery(
     table_name: str,
-    incremental_column: str | None = None,
-) -> PartitionStrategy:
-    """Get optimal partition strategy based on table structure"""
-    # Query table metadata to find suitable partition columns
-    metadata_query = f"""
-    SELECT column_name, data_type 
-    FROM information_schema.columns 
-    WHERE table_name = '{table_name}'
-    """
-    columns_df = spark_manager.spark.read.jdbc(
-        url=connection_options["url"],
-        table=f"({metadata_query}) AS tmp",
-        properties=connection_options,
+    columns: Optional[list[str]] = None,
+    source_filter: Optional[str] = None,
+    dialect: Optional[Dialect] = None,
+) -> str:
+    """
+    What Spark reads from: the table itself, or a subquery that does the
+    projection and filtering in the source database.
+    """
+    if not columns and not source_filter:
+        return table_name
+    select_list = ", ".join(columns) if columns else "*"
+    where = f" WHERE {source_filter}" if source_filter else ""
+    dialect = dialect or PostgresDialect()
+    return dialect.subquery(f"SELECT {select_list} FROM {table_name}{where}", "src")
+
+
+def parse_pg_array(value: Optional[str]) -> Optional[list[str]]:
+    """Parse the text form of a Postgres array, e.g. pg_stats.histogram_bounds"""
+    if not value or value == "{}":
+        return None
+    reader = csv.reader([value[1:-1]], quotechar='"', escapechar="\\")
+    return next(reader)
+
+
+def introspect_source(
+    connection, table_name: str, dialect: Optional[Dialect] = None
+) -> SourceMetadata:
+    """
+    Read columns, primary key and statistics for a table.
+
+    Postgres returns everything in one round-trip. Other dialects keep row
+    counts and widths per table, which takes a second catalog query.
+    """
+    dialect = dialect or PostgresDialect()
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute(dialect.introspection_query(table_name))
+        rows = cursor.fetchall()
+    if not rows:
+        raise ValueError(f"Table {table_name} not found in source database")
+
+    columns = [
+        SourceColumn(
+            name=column_name,
+            data_type=data_type.lower(),
+            is_primary_key=bool(is_primary_key),
+            histogram_bounds=parse_pg_array(histogram_bounds),
+            avg_width=avg_width,
+        )
+        for column_name, data_type, is_primary_key, histogram_bounds, avg_width, _ in rows
+    ]
+    row_estimate = rows[0][5]
+    avg_row_width = None
+    row_estimate_query = dialect.row_estimate_query(table_name)
+    if row_estimate_query:
+        with connection.cursor() as cursor:
+            cursor.execute(row_estimate_query)
+            row_estimate, avg_row_width = cursor.fetchone() or (None, None)
+    # reltuples is -1 (or 0 before Postgres 14) when the table was never
+    # analyzed, other catalogs report 0 or NULL
+    row_estimate = int(row_estimate) if row_estimate and row_estimate > 0 else None
+    return SourceMetadata(
+        table_name=table_name,
+        columns=columns,
+        row_estimate=row_estimate,
+        avg_row_width=int(avg_row_width) if avg_row_width else None,
+        timings={"introspect": time.perf_counter() - start},
     )
 
-    # Look for best partition column in order of preference:
-    # 1. Primary key or identity column
-    # 2. Provided incremental column if numeric
-    # 3. Any indexed numeric column
-    # 4. Hash-based partitioning as fallback
-
-    pk_query = f"""
-    SELECT kcu.column_name
-    FROM information_schema.table_constraints tc
-    JOIN information_schema.key_column_usage kcu 
-        ON tc.constraint_name = kcu.constraint_name
-    WHERE tc.table_name = '{table_name}' 
-        AND tc.constraint_type = 'PRIMARY KEY'
-    """
-
-    pk_df = spark_manager.spark.read.jdbc(
-        url=connection_options["url"],
-        table=f"({pk_query}) AS tmp",
-        properties=connection_options,
+
+def estimate_rows(
+    connection,
+    source: SourceMetadata,
+    source_filter: Optional[str],
+    dialect: Optional[Dialect] = None,
+) -> Optional[int]:
+    """
+    Estimate how many rows a read returns without scanning the table.
+
+    Unfiltered reads use the catalog's row estimate. Filtered reads, and
+    tables that were never analyzed, use the row estimate from the source's
+    query planner when the dialect can get one. A filtered read falls back
+    to the size of the whole table.
+    """
+    if source.row_estimate and not source_filter:
+        return source.row_estimate
+    dialect = dialect or PostgresDialect()
+    start = time.perf_counter()
+    estimate = dialect.filtered_row_estimate(
+        connection, source.table_name, source_filter or "1 = 1"
     )
+    source.timings["estimate"] = time.perf_counter() - start
+    return estimate if estimate is not None else source.row_estimate
 
-    if pk_df.count() > 0:
-        partition_col = pk_df.first()["column_name"]
-        # Get bounds for numeric partition column
-        bounds_query = f"""
-        SELECT MIN({partition_col}) as min_val, 
-               MAX({partition_col}) as max_val,
-               COUNT(*) as row_count
-        FROM {table_name}
-        """
-        bounds = spark_manager.spark.read.jdbc(
-            url=connection_options["url"],
-            table=f"({bounds_query}) AS tmp",
-            properties=connection_options,
-        ).first()
 
-        return PartitionStrategy(
-            type="numeric",
-            column=partition_col,
-            lower_bound=bounds["min_val"],
-            upper_bound=bounds["max_val"] + 1,  # Add 1 to include max value
-            num_partitions=min(
-                100, max(10, bounds["row_count"] // 100000)
-            ),  # 100k rows per partition
+def num_partitions_for(
+    row_count: Optional[int],
+    row_width: Optional[int],
+    target_partition_bytes: int = DEFAULT_TARGET_PARTITION_BYTES,
+    max_partitions: int = DEFAULT_MAX_PARTITIONS,
+) -> int:
+    """Number of partitions that puts roughly target_partition_bytes in each"""
+    if row_count is None:
+        logger.warning("No row estimate for the source, using the maximum partitions")
+        return max_partitions
+    if row_width:
+        rows_per_partition = max(1, target_partition_bytes // row_width)
+    else:
+        rows_per_partition = DEFAULT_ROWS_PER_PARTITION
+    return min(max_partitions, max(1, math.ceil(row_count / rows_per_partition)))
+
+
+def _log_timings(source: SourceMetadata) -> None:
+    breakdown = " ".join(
+        f"{step}={seconds * 1000:.0f}ms" for step, seconds in source.timings.items()
+    )
+    total = sum(source.timings.values()) * 1000
+    logger.info(
+        f"Planner timings for {source.table_name}: {breakdown} total={total:.0f}ms"
+    )
+
+
+def is_skewed(quantiles: list[Decimal], num_partitions: int) -> bool:
+    """
+    Cheap skew check on equal-frequency quantiles.
+
+    Each gap between consecutive quantiles holds the same share of rows, so
+    counting how many quantiles land in each equal-width stripe of
+    [min, max] approximates how many rows each numeric partition would get.
+    """
+    lower, upper = quantiles[0], quantiles[-1]
+    if upper <= lower or len(quantiles) < 3:
+        return False
+    # A histogram can't show skew finer than its own buckets
+    stripes = min(num_partitions, len(quantiles) - 1)
+    width = (upper - lower) / stripes
+    counts = [0] * stripes
+    for value in quantiles:
+        counts[min(int((value - lower) / width), stripes - 1)] += 1
+    return max(counts) / len(quantiles) > SKEW_THRESHOLD / stripes
+
+
+def quantile_boundaries(quantiles: list[Decimal], num_partitions: int) -> list[Decimal]:
+    """Pick the interior cut points that split the quantiles into equal-row ranges"""
+    last = len(quantiles) - 1
+    cut_points = {
+        quantiles[round(i * last / num_partitions)] for i in range(1, num_partitions)
+    }
+    # Cut points equal to the minimum would produce an empty first range
+    return sorted(point for point in cut_points if point > quantiles[0])
+
+
+def range_predicates(
+    column: str, boundaries: list[Any], literal: Callable[[Any], str] = str
+) -> list[str]:
+    """
+    Explicit range predicates covering every row, including NULLs.
+    literal renders a boundary as SQL, numbers are rendered as they are.
+    """
+    if not boundaries:
+        return ["1 = 1"]
+    boundaries = [literal(boundary) for boundary in boundaries]
+    predicates = [f"{column} < {boundaries[0]} OR {column} IS NULL"]
+    for lower, upper in zip(boundaries, boundaries[1:]):
+        predicates.append(f"{column} >= {lower} AND {column} < {upper}")
+    predicates.append(f"{column} >= {boundaries[-1]}")
+    return predicates
+
+
+def is_temporal(data_type: str) -> bool:
+    return data_type.startswith("timestamp") or data_type in TEMPORAL_TYPES
+
+
+def as_datetime(value: Any) -> datetime:
+    """Bounds of date columns come back as dates, and as strings from some drivers"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def truncate_time(value: datetime, granularity: TimeGranularity) -> datetime:
+    value = value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == "day" else value
+
+
+def time_boundaries(
+    lower_bound: datetime,
+    upper_bound: datetime,
+    num_partitions: int,
+    granularity: Optional[TimeGranularity] = None,
+) -> tuple[TimeGranularity, list[datetime]]:
+    """
+    Interior boundaries that split [lower_bound, upper_bound] into ranges of
+    whole days or hours.
+
+    Without a granularity, days are used when there are at least as many days
+    as partitions and hours otherwise, and adjacent buckets are joined so there
+    are at most num_partitions ranges. With one, every bucket is its own range.
+    """
+    join_buckets = granularity is None
+    if join_buckets:
+        days = (upper_bound - lower_bound) / BUCKET_SIZES["day"]
+        granularity = "day" if days >= num_partitions else "hour"
+    bucket = BUCKET_SIZES[granularity]
+    start = truncate_time(lower_bound, granularity)
+    num_buckets = math.floor((upper_bound - start) / bucket) + 1
+    buckets_per_range = math.ceil(num_buckets / num_partitions) if join_buckets else 1
+    step = bucket * buckets_per_range
+    return granularity, [
+        start + i * step for i in range(1, math.ceil(num_buckets / buckets_per_range))
+    ]
+
+
+def quantiles_from_histogram(
+    histogram: list[tuple[Any, Any]], resolution: int = QUANTILE_RESOLUTION
+) -> Optional[list[Decimal]]:
+    """
+    Equal-frequency quantiles from a histogram of (value, cumulative rows)
+    pairs, where the cumulative rows may also be a cumulative fraction.
+    """
+    points = [
+        (Decimal(str(value)), Decimal(str(cumulative)))
+        for value, cumulative in histogram
+        if value is not None and cumulative is not None
+    ]
+    if len(points) < 2:
+        return None
+    total = points[-1][1]
+    if total <= 0:
+        return None
+    quantiles = [points[0][0]]
+    position = 0
+    for i in range(1, resolution + 1):
+        target = total * i / resolution
+        while points[position][1] < target:
+            position += 1
+        quantiles.append(points[position][0])
+    return quantiles
+
+
+def _numeric_bounds(
+    connection,
+    source: SourceMetadata,
+    column: SourceColumn,
+    source_filter: Optional[str],
+    dialect: Dialect,
+) -> tuple[Any, Any, Optional[list[Decimal]]]:
+    """
+    Get (min, max, quantiles) for a numeric column.
+
+    Quantiles come from the catalog histogram when it describes the rows
+    being read: pg_stats for Postgres, and the dialect's histogram query
+    otherwise. Without one, the dialect's bounds query computes them in the
+    same query as the bounds if it can.
+    """
+    if source.row_estimate and not source_filter:
+        quantiles = None
+        if column.histogram_bounds:
+            quantiles = [Decimal(value) for value in column.histogram_bounds]
+        else:
+            histogram_query = dialect.histogram_query(source.table_name, column.name)
+            if histogram_query:
+                start = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute(histogram_query)
+                    quantiles = quantiles_from_histogram(cursor.fetchall())
+                source.timings["histogram"] = time.perf_counter() - start
+        if quantiles:
+            return quantiles[0], quantiles[-1], quantiles
+
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            dialect.bounds_query(source.table_name, column.name, source_filter)
+        )
+        lower_bound, upper_bound, quantiles = cursor.fetchone()
+    source.timings["bounds"] = time.perf_counter() - start
+    if quantiles:
+        quantiles = [Decimal(str(value)) for value in quantiles if value is not None]
+    return lower_bound, upper_bound, quantiles or None
+
+
+def _time_bounds(
+    connection,
+    source: SourceMetadata,
+    column: SourceColumn,
+    source_filter: Optional[str],
+) -> tuple[Optional[datetime], Optional[datetime]]:
+    """Get (min, max) of a date or timestamp column over the rows being read"""
+    where = f" WHERE {source_filter}" if source_filter else ""
+    start = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT MIN({column.name}), MAX({column.name}) "
+            f"FROM {source.table_name}{where}"
         )
+        lower_bound, upper_bound = cursor.fetchone()
+    source.timings["bounds"] = time.perf_counter() - start
+    if lower_bound is None:
+        return None, None
+    return as_datetime(lower_bound), as_datetime(upper_bound)
 
-    # Fallback to hash-based partitioning
+
+def time_partition_strategy(
+    column: str,
+    lower_bound: datetime,
+    upper_bound: datetime,
+    num_partitions: int,
+    dialect: Dialect,
+    granularity: Optional[TimeGranularity] = None,
+) -> PartitionStrategy:
+    """Split a date or timestamp column into ranges of whole days or hours"""
+    granularity, boundaries = time_boundaries(
+        lower_bound, upper_bound, num_partitions, granularity
+    )
+    logger.info(
+        f"Splitting {column} on {len(boundaries)} {granularity} boundaries "
+        f"between {lower_bound} and {upper_bound}"
+    )
     return PartitionStrategy(
-        type="hash",
-        num_partitions=10,
-        predicates=[
-            f"MOD(HASH(CAST(CONCAT({','.join(columns_df.select('column_name').rdd.flatMap(lambda x: x).collect())}) AS VARCHAR)), 10) = {i}"
-            for i in range(10)
-        ],
+        type="time",
+        column=column,
+        num_partitions=len(boundaries) + 1,
+        predicates=range_predicates(column, boundaries, dialect.timestamp_literal),
     )
+
+
+def get_partition_strategy(
+    connection,
+    source: SourceMetadata,
+    incremental_column: Optional[str] = None,
+    source_filter: Optional[str] = None,
+    dialect: Optional[Dialect] = None,
+    target_partition_bytes: int = DEFAULT_TARGET_PARTITION_BYTES,
+    max_partitions: int = DEFAULT_MAX_PARTITIONS,
+    columns: Optional[list[str]] = None,
+    time_range: Optional[tuple[datetime, datetime]] = None,
+    granularity: Optional[TimeGranularity] = None,
+) -> PartitionStrategy:
+    """
+    Get optimal partition strategy based on table structure.
+
+    Bounds come from catalog statistics when they are available. A bounds
+    query only runs when the table has no statistics, or when source_filter
+    restricts the read to a slice (e.g. an incremental delta) that the
+    statistics don't describe. The table is never counted: the number of
+    partitions comes from estimated rows and the width of the selected
+    columns, targeting target_partition_bytes per partition up to
+    max_partitions.
+
+    Numeric keys are split into equal-width ranges unless the quantiles show
+    that would be skewed, in which case the ranges are cut at the quantiles so
+    each partition carries roughly the same number of rows. Tables without a
+    numeric key are split into day or hour ranges of the incremental column
+    when it is a date or timestamp, and into hash buckets using the dialect's
+    hash function otherwise.
+
+    A time_range [start, end) on the incremental column, e.g. a backfill
+    window, is always split into time ranges, one per day or hour when a
+    granularity is given.
+    """
+    # Look for best partition column in order of preference:
+    # 1. Primary key or identity column
+    # 2. Provided incremental column if it's a date or timestamp
+    # 3. Hash-based partitioning as fallback
+    dialect = dialect or PostgresDialect()
+    time_column = source.column(incremental_column) if incremental_column else None
+    if time_column and not is_temporal(time_column.data_type):
+        time_column = None
+    if time_range and not time_column:
+        raise ValueError(
+            f"A time range needs a date or timestamp incremental column, "
+            f"{incremental_column} isn't one"
+        )
+    try:
+        num_partitions = num_partitions_for(
+            estimate_rows(connection, source, source_filter, dialect),
+            source.row_width_for(columns),
+            target_partition_bytes,
+            max_partitions,
+        )
+        if time_range:
+            start, end = time_range
+            return time_partition_strategy(
+                time_column.name,
+                start,
+                # The end of the range is exclusive
+                end - timedelta(microseconds=1),
+                num_partitions,
+                dialect,
+                granularity,
+            )
+        primary_key = source.primary_key
+        if primary_key:
+            partition_col = primary_key[0]
+            if partition_col.data_type in NUMERIC_TYPES:
+                lower_bound, upper_bound, quantiles = _numeric_bounds(
+                    connection, source, partition_col, source_filter, dialect
+                )
+                if quantiles and is_skewed(quantiles, num_partitions):
+                    boundaries = quantile_boundaries(quantiles, num_partitions)
+                    logger.info(
+                        f"Values of {partition_col.name} are skewed, "
+                        f"splitting on {len(boundaries)} quantile boundaries"
+                    )
+                    return PartitionStrategy(
+                        type="quantile",
+                        column=partition_col.name,
+                        num_partitions=len(boundaries) + 1,
+                        predicates=range_predicates(partition_col.name, boundaries),
+                    )
+                if lower_bound is not None:
+                    return PartitionStrategy(
+                        type="numeric",
+                        column=partition_col.name,
+                        lower_bound=int(float(lower_bound)),
+                        # Add 1 to include max value
+                        upper_bound=int(float(upper_bound)) + 1,
+                        num_partitions=num_partitions,
+                    )
+            else:
+                logger.info(f"Primary key column {partition_col.name} is not numeric")
+
+        if time_column:
+            lower_bound, upper_bound = _time_bounds(
+                connection, source, time_column, source_filter
+            )
+            if lower_bound is not None:
+                return time_partition_strategy(
+                    time_column.name,
+                    lower_bound,
+                    upper_bound,
+                    num_partitions,
+                    dialect,
+                    granularity,
+                )
+
+        # Fallback to hash-based partitioning, on the primary key if there is one
+        # and on the whole (projected) row otherwise
+        hash_columns = [column.name for column in primary_key] or columns
+        hash_columns = hash_columns or [column.name for column in source.columns]
+        return PartitionStrategy(
+            type="hash",
+            num_partitions=num_partitions,
+            predicates=dialect.hash_predicates(hash_columns, num_partitions),
+        )
+    finally:
+        _log_timings(source)
@@ -0,0 +1,420 @@
+"""
+Distributed reverse ETL into Postgres.
+
+Each Spark task streams its partition of a table straight into the target
+database with ``COPY ... FROM STDIN`` over its own connection. Record batches
+are written as CSV into one end of a pipe while psycopg2 copies from the
+other, so nothing is collected on the driver and no task holds its whole
+partition in memory. The number of partitions, and so of concurrent
+connections to the target, is capped by ``connections``.
+
+Overwrites either truncate the target and copy into it, or copy into an
+unindexed staging table that is then indexed and swapped in for the target,
+see table_swap. Swapping is faster for indexed tables and readers never see
+the table empty or half loaded. A truncating overwrite isn't atomic: the
+TRUNCATE commits before the tasks copy, so readers see the table empty and
+then filling up, and a failed run leaves it half loaded.
+
+Incremental runs only push what changed in the Iceberg table since the
+snapshot they last pushed, which is recorded in STATE_TABLE in the target
+database. Each task copies its share of the changes into a temporary table
+and applies them to the target with one DELETE and one upsert on the
+target's primary key.
+
+Each task commits its own COPY. A task that fails before committing rolls
+its partition back and Spark's retry loads it again, but one that fails
+after its commit is retried too, and its partition is loaded twice. Applying
+changes again is harmless, so incremental runs don't have that problem.
+"""
+
+from contextlib import closing
+import itertools
+import logging
+import os
+import threading
+from typing import Callable, Iterable, Iterator, Literal, Optional
+
+import pyarrow as pa
+from pyarrow import csv
+from pyspark.sql import DataFrame
+import pyspark.sql.functions as F
+
+from nextdata.core.connections.spark import CHANGE_TYPE_COLUMN
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs, connect_dbapi
+from nextdata.core.glue.copy_extractor import UNSUPPORTED_TYPES
+from nextdata.core.glue.table_swap import abort_swap, finish_swap, prepare_swap
+
+logger = logging.getLogger(__name__)
+
+# How a reverse ETL run writes the target table:
+# - append: copies the rows into it
+# - overwrite: truncates it, then copies the rows into it. Not atomic, the
+#   TRUNCATE commits on its own and a failed run leaves the table half loaded
+# - swap: copies the rows into a staging table swapped in for it in one
+#   transaction, see table_swap
+# - incremental: applies the changes since the last pushed snapshot
+RetlWriteMode = Literal["append", "overwrite", "swap", "incremental"]
+
+DEFAULT_CONNECTIONS = 8
+
+# Last Iceberg snapshot pushed to each table of the target database
+STATE_TABLE = "nextdata_retl_state"
+# Temporary table each task copies its changes into
+CHANGES_TABLE = "nextdata_retl_changes"
+
+# COPY reads an empty unquoted field as NULL and "" as an empty string,
+# which is how pyarrow writes them
+WRITE_OPTIONS = csv.WriteOptions(include_header=False)
+ROWS_SCHEMA = pa.schema([("rows", pa.int64())])
+
+
+def copy_statement(target_table: str, columns: list[str]) -> str:
+    return f"COPY {target_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+
+
+def write_copy(
+    connection,
+    statement: str,
+    batches: Iterator[pa.RecordBatch],
+    before: Iterable[str] = (),
+    after: Iterable[str] = (),
+) -> int:
+    """
+    Stream record batches into a COPY FROM STDIN and commit it, in one
+    transaction with the before and after statements. Returns the number of
+    rows written.
+
+    psycopg2 reads the COPY input from one end of a pipe in a background
+    thread while the batches are written to the other end as CSV. If reading
+    the batches fails, the COPY is rolled back rather than committed with
+    the rows it got so far.
+    """
+    with connection.cursor() as cursor:
+        for before_statement in before:
+            cursor.execute(before_statement)
+    read_fd, write_fd = os.pipe()
+    errors: list[BaseException] = []
+
+    def copy_from_pipe():
+        try:
+            with os.fdopen(read_fd, "rb") as pipe, connection.cursor() as cursor:
+                cursor.copy_expert(statement, pipe)
+        except BaseException as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=copy_from_pipe, daemon=True)
+    reader.start()
+    rows = 0
+    try:
+        with os.fdopen(write_fd, "wb") as pipe:
+            for batch in batches:
+                csv.write_csv(batch, pipe, WRITE_OPTIONS)
+                rows += batch.num_rows
+    except BrokenPipeError:
+        # The COPY failed and closed its end, its error is raised below
+        pass
+    except BaseException:
+        reader.join()
+        connection.rollback()
+        raise
+    reader.join()
+    if errors:
+        connection.rollback()
+        raise errors[0]
+    try:
+        with connection.cursor() as cursor:
+            for after_statement in after:
+                cursor.execute(after_statement)
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+    return rows
+
+
+def copy_partition_writer(
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str],
+    statement: str,
+    sslmode: str = "require",
+    before: Iterable[str] = (),
+    after: Iterable[str] = (),
+) -> Callable[[Iterator[pa.RecordBatch]], Iterator[pa.RecordBatch]]:
+    """The function each Spark task runs over its partition"""
+
+    def write_partition(batches: Iterator[pa.RecordBatch]) -> Iterator[pa.RecordBatch]:
+        first = next(batches, None)
+        rows = 0
+        # Empty partitions don't open a connection
+        if first is not None:
+            with closing(
+                connect_dbapi(connection_conf, password, sslmode)
+            ) as connection:
+                rows = write_copy(
+                    connection,
+                    statement,
+                    itertools.chain([first], batches),
+                    before,
+                    after,
+                )
+        yield pa.RecordBatch.from_pydict({"rows": [rows]}, schema=ROWS_SCHEMA)
+
+    return write_partition
+
+
+def execute(
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str],
+    statements: list[str],
+    sslmode: str = "require",
+) -> None:
+    """Run statements against the target in one transaction"""
+    with closing(connect_dbapi(connection_conf, password, sslmode)) as connection:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+        connection.commit()
+
+
+def target_columns(
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str],
+    target_table: str,
+    sslmode: str = "require",
+) -> list[str]:
+    """Columns of the target table, in order. Empty if it doesn't exist."""
+    schema, _, table = target_table.rpartition(".")
+    with closing(connect_dbapi(connection_conf, password, sslmode)) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = COALESCE(%s, current_schema())
+                    AND table_name = %s
+                ORDER BY ordinal_position
+                """,
+                (schema or None, table),
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def primary_key(connection, target_table: str) -> list[str]:
+    """Primary key columns of the target table, in order"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT a.attname
+            FROM pg_index i
+                JOIN pg_attribute a
+                    ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            WHERE i.indrelid = to_regclass(%s) AND i.indisprimary
+            ORDER BY array_position(i.indkey::int2[], a.attnum)
+            """,
+            (target_table,),
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def pushed_snapshot(connection, target_table: str) -> Optional[int]:
+    """The Iceberg snapshot last pushed to target_table, if any"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                target_table text PRIMARY KEY,
+                snapshot_id bigint NOT NULL,
+                pushed_at timestamptz NOT NULL DEFAULT now()
+            )
+            """
+        )
+        cursor.execute(
+            f"SELECT snapshot_id FROM {STATE_TABLE} WHERE target_table = %s",
+            (target_table,),
+        )
+        row = cursor.fetchone()
+    connection.commit()
+    return row[0] if row else None
+
+
+def record_pushed_snapshot(connection, target_table: str, snapshot_id: int) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {STATE_TABLE} (target_table, snapshot_id)
+            VALUES (%s, %s)
+            ON CONFLICT (target_table) DO UPDATE
+                SET snapshot_id = EXCLUDED.snapshot_id, pushed_at = now()
+            """,
+            (target_table, snapshot_id),
+        )
+    connection.commit()
+
+
+def change_statements(
+    target_table: str, columns: list[str], keys: list[str]
+) -> tuple[list[str], list[str]]:
+    """
+    Statements run before and after a task copies its changes into
+    CHANGES_TABLE: one creating the table, then one deleting the deleted
+    rows from the target and one upserting the inserted rows into it.
+    """
+    column_list = ", ".join(columns)
+    key_list = ", ".join(keys)
+    matches_key = " AND ".join(f"t.{key} = c.{key}" for key in keys)
+    updates = ", ".join(
+        f"{column} = EXCLUDED.{column}" for column in columns if column not in keys
+    )
+    on_conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+    before = [
+        f"""
+        CREATE TEMPORARY TABLE {CHANGES_TABLE} ON COMMIT DROP AS
+        SELECT {column_list}, NULL::text AS {CHANGE_TYPE_COLUMN}
+        FROM {target_table} WITH NO DATA
+        """
+    ]
+    after = [
+        f"""
+        DELETE FROM {target_table} t USING {CHANGES_TABLE} c
+        WHERE c.{CHANGE_TYPE_COLUMN} = 'DELETE' AND {matches_key}
+        """,
+        f"""
+        INSERT INTO {target_table} ({column_list})
+        SELECT {column_list} FROM {CHANGES_TABLE}
+        WHERE {CHANGE_TYPE_COLUMN} = 'INSERT'
+        ON CONFLICT ({key_list}) {on_conflict}
+        """,
+    ]
+    return before, after
+
+
+def check_writable(df: DataFrame, connection_conf: JDBCGlueJobArgs) -> None:
+    if connection_conf.protocol != "postgresql":
+        raise ValueError(
+            f"Reverse ETL is not supported for protocol {connection_conf.protocol}"
+        )
+    unsupported = [
+        field.name
+        for field in df.schema.fields
+        if isinstance(field.dataType, UNSUPPORTED_TYPES)
+    ]
+    if unsupported:
+        raise ValueError(f"Reverse ETL does not support columns {unsupported}")
+
+
+def write_with_copy(
+    df: DataFrame,
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str],
+    target_table: str,
+    connections: int = DEFAULT_CONNECTIONS,
+    mode: RetlWriteMode = "append",
+    sslmode: str = "require",
+) -> int:
+    """
+    Write df into an existing Postgres table, one COPY per partition, over
+    at most connections connections at a time. The columns of df are copied
+    into the target's columns of the same name.
+
+    In overwrite mode the target is truncated first, in its own transaction,
+    in swap mode its rows are replaced atomically by swapping in a staging
+    table. Returns the number of rows written.
+    """
+    check_writable(df, connection_conf)
+    if mode == "incremental":
+        raise ValueError("Incremental reverse ETL writes changes, see write_changes")
+    if mode == "overwrite":
+        execute(connection_conf, password, [f"TRUNCATE {target_table}"], sslmode)
+    if df.rdd.getNumPartitions() > connections:
+        # Merged without a shuffle, each task copies several partitions
+        df = df.coalesce(connections)
+    if mode != "swap":
+        rows = copy_dataframe(df, connection_conf, password, target_table, sslmode)
+        logger.info(f"Copied {rows} rows into {target_table}")
+        return rows
+
+    with closing(connect_dbapi(connection_conf, password, sslmode)) as connection:
+        swap = prepare_swap(connection, target_table)
+        try:
+            rows = copy_dataframe(df, connection_conf, password, swap.staging, sslmode)
+            logger.info(f"Copied {rows} rows into {swap.staging}")
+            finish_swap(connection, swap)
+        except BaseException:
+            abort_swap(connection, swap)
+            raise
+    logger.info(f"Swapped {swap.staging} in for {target_table}")
+    return rows
+
+
+def write_changes(
+    changes: DataFrame,
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str],
+    target_table: str,
+    keys: list[str],
+    connections: int = DEFAULT_CONNECTIONS,
+    sslmode: str = "require",
+) -> int:
+    """
+    Apply the changes of an Iceberg changelog view to a Postgres table with
+    primary key keys, over at most connections connections at a time.
+    Returns the number of rows inserted, updated or deleted.
+    """
+    check_writable(changes, connection_conf)
+    columns = [column for column in changes.columns if column != CHANGE_TYPE_COLUMN]
+    # A table with duplicate keys would upsert the same row twice
+    inserts = (
+        changes.where(F.col(CHANGE_TYPE_COLUMN) == "INSERT")
+        .drop(CHANGE_TYPE_COLUMN)
+        .dropDuplicates(keys)
+    )
+    # An updated row is deleted and inserted again. Only its upsert is
+    # applied, so a task deleting it can't undo another task's insert.
+    deletes = (
+        changes.where(F.col(CHANGE_TYPE_COLUMN) == "DELETE")
+        .select(*keys)
+        .join(inserts.select(*keys), keys, "left_anti")
+    )
+    df = (
+        inserts.withColumn(CHANGE_TYPE_COLUMN, F.lit("INSERT"))
+        .unionByName(
+            deletes.withColumn(CHANGE_TYPE_COLUMN, F.lit("DELETE")),
+            allowMissingColumns=True,
+        )
+        .select(*columns, CHANGE_TYPE_COLUMN)
+    )
+    if df.rdd.getNumPartitions() > connections:
+        df = df.coalesce(connections)
+    before, after = change_statements(target_table, columns, keys)
+    rows = copy_dataframe(
+        df, connection_conf, password, CHANGES_TABLE, sslmode, before, after
+    )
+    logger.info(f"Applied {rows} changes to {target_table}")
+    return rows
+
+
+def copy_dataframe(
+    df: DataFrame,
+    connection_conf: JDBCGlueJobArgs,
+    password: Optional[str],
+    target_table: str,
+    sslmode: str = "require",
+    before: Iterable[str] = (),
+    after: Iterable[str] = (),
+) -> int:
+    """Run one COPY per partition of df, returns the number of rows copied"""
+    written = (
+        df.mapInArrow(
+            copy_partition_writer(
+                connection_conf,
+                password,
+                copy_statement(target_table, df.columns),
+                sslmode,
+                before,
+                after,
+            ),
+            "rows long",
+        )
+        .agg(F.sum("rows").alias("rows"))
+        .collect()
+    )
+    return written[0]["rows"] or 0
@@ -0,0 +1,438 @@
+"""
+Reloading a Postgres table by swapping in a freshly loaded copy.
+
+The new rows are copied into a staging table with the target's columns,
+defaults and check constraints but none of its indexes, so the load doesn't
+maintain any. The indexes, primary key, unique and foreign key constraints
+are then built in one pass each, the staging table is analyzed and given
+the target's grants, and a single transaction renames the target out of the
+way and the staging table, its indexes and constraints into place. Readers
+see the old rows until that commit and the new ones after it, and only wait
+for the renames.
+
+The staging table also gets the target's row level security and its
+policies, its replica identity and its owner. Tables with triggers, or in a
+publication, aren't swapped: whether a reload should fire the triggers is
+up to their author, and a subscriber would see a new table it was never
+synced with.
+
+The replaced table is dropped after the swap. Staging and replaced tables
+left behind by a run that failed are dropped at the start of the next one.
+"""
+
+from dataclasses import dataclass, field
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+STAGING_SUFFIX = "__nd_staging"
+OLD_SUFFIX = "__nd_old"
+
+# Longest identifier Postgres keeps, longer ones are truncated
+MAX_IDENTIFIER_LENGTH = 63
+
+# Replica identities other than the default and USING INDEX, by relreplident
+REPLICA_IDENTITIES = {"f": "FULL", "n": "NOTHING"}
+
+
+def quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def suffixed(name: str, suffix: str) -> str:
+    """name with suffix, shortened so the suffix isn't truncated away"""
+    return name[: MAX_IDENTIFIER_LENGTH - len(suffix)] + suffix
+
+
+class UnswappableTableError(ValueError):
+    """Raised before anything is written when a table can't be swapped"""
+
+
+@dataclass
+class TableIndex:
+    """An index of the target, or the constraint it backs"""
+
+    name: str
+    # Everything after USING in the index definition, or the constraint
+    # definition
+    definition: str
+    unique: bool = False
+    constraint: bool = False
+
+
+@dataclass
+class TableSwap:
+    """A target table and the staging table that replaces it"""
+
+    schema: str
+    table: str
+    indexes: list[TableIndex] = field(default_factory=list)
+    foreign_keys: dict[str, str] = field(default_factory=dict)
+    grants: list[tuple[str, str]] = field(default_factory=list)
+    # Sequences owned by the target's columns, e.g. of serial columns
+    owned_sequences: dict[str, str] = field(default_factory=dict)
+    # Sequences of identity columns, the staging table's continue from them
+    identity_sequences: dict[str, str] = field(default_factory=dict)
+    # Row level security policies, by name, from AS on, and whether row
+    # level security is enabled and forced
+    policies: dict[str, str] = field(default_factory=dict)
+    row_security: bool = False
+    force_row_security: bool = False
+    # relreplident of the target, and the index it names if it's "i"
+    replica_identity: str = "d"
+    replica_identity_index: Optional[str] = None
+    # Role to hand the staging table to, if the target isn't the current user's
+    owner: Optional[str] = None
+
+    @property
+    def target(self) -> str:
+        return f"{quote(self.schema)}.{quote(self.table)}"
+
+    @property
+    def staging_name(self) -> str:
+        return suffixed(self.table, STAGING_SUFFIX)
+
+    @property
+    def staging(self) -> str:
+        return f"{quote(self.schema)}.{quote(self.staging_name)}"
+
+    @property
+    def old_name(self) -> str:
+        return suffixed(self.table, OLD_SUFFIX)
+
+    @property
+    def old(self) -> str:
+        return f"{quote(self.schema)}.{quote(self.old_name)}"
+
+
+def _resolve(cursor, target_table: str) -> tuple[str, str]:
+    cursor.execute(
+        """
+        SELECT n.nspname, c.relname
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.oid = to_regclass(%s)
+        """,
+        (target_table,),
+    )
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"Target table {target_table} does not exist")
+    return row
+
+
+def _dependents(cursor, target: str) -> list[str]:
+    """Views and foreign keys that would follow the replaced table"""
+    cursor.execute(
+        """
+        SELECT DISTINCT r.ev_class::regclass::text
+        FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+        WHERE d.classid = 'pg_rewrite'::regclass
+            AND d.refobjid = %(target)s::regclass
+            AND r.ev_class <> %(target)s::regclass
+        UNION
+        SELECT conrelid::regclass::text FROM pg_constraint
+        WHERE confrelid = %(target)s::regclass AND conrelid <> confrelid
+        """,
+        {"target": target},
+    )
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+def _triggers(cursor, target: str) -> list[str]:
+    """Triggers on the target, other than those enforcing foreign keys"""
+    cursor.execute(
+        """
+        SELECT tgname FROM pg_trigger
+        WHERE tgrelid = %s::regclass AND NOT tgisinternal
+        ORDER BY tgname
+        """,
+        (target,),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _publications(cursor, schema: str, table: str) -> list[str]:
+    cursor.execute(
+        """
+        SELECT pubname FROM pg_publication_tables
+        WHERE schemaname = %s AND tablename = %s
+        ORDER BY pubname
+        """,
+        (schema, table),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def describe_table(cursor, target_table: str) -> TableSwap:
+    """
+    Indexes, constraints, grants, sequences, policies and settings the
+    staging table needs
+    """
+    schema, table = _resolve(cursor, target_table)
+    swap = TableSwap(schema, table)
+    for objects, reason in (
+        (_dependents(cursor, swap.target), "depend on it"),
+        (_triggers(cursor, swap.target), "are triggers on it"),
+        (_publications(cursor, schema, table), "publish it"),
+    ):
+        if objects:
+            raise UnswappableTableError(
+                f"{target_table} can't be swapped, {objects} {reason}. "
+                'Use retl_mode = "overwrite" instead.'
+            )
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid), contype
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'x', 'f')
+        ORDER BY contype = 'f', conname
+        """,
+        (swap.target,),
+    )
+    for name, definition, constraint_type in cursor.fetchall():
+        if constraint_type == "f":
+            swap.foreign_keys[name] = definition
+        else:
+            swap.indexes.append(TableIndex(name, definition, constraint=True))
+    # Indexes that don't back a constraint
+    cursor.execute(
+        """
+        SELECT c.relname, pg_get_indexdef(i.indexrelid), i.indisunique
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass
+            AND NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid
+            )
+        ORDER BY c.relname
+        """,
+        (swap.target,),
+    )
+    for name, definition, unique in cursor.fetchall():
+        swap.indexes.append(
+            TableIndex(name, definition.split(" USING ", 1)[1], unique=unique)
+        )
+    cursor.execute(
+        """
+        SELECT
+            CASE WHEN a.grantee = 0 THEN 'PUBLIC'
+                ELSE quote_ident(pg_get_userbyid(a.grantee)) END,
+            a.privilege_type
+        FROM pg_class c, aclexplode(c.relacl) a
+        WHERE c.oid = %s::regclass AND a.grantee <> c.relowner
+        """,
+        (swap.target,),
+    )
+    swap.grants = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT s.oid::regclass::text, a.attname
+        FROM pg_depend d
+            JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+            JOIN pg_attribute a
+                ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+        WHERE d.refobjid = %s::regclass AND d.deptype = 'a'
+        """,
+        (swap.target,),
+    )
+    swap.owned_sequences = dict(cursor.fetchall())
+    cursor.execute(
+        """
+        SELECT attname, pg_get_serial_sequence(%(target)s, attname)
+        FROM pg_attribute
+        WHERE attrelid = %(target)s::regclass AND attidentity <> ''
+            AND NOT attisdropped
+        """,
+        {"target": swap.target},
+    )
+    swap.identity_sequences = dict(cursor.fetchall())
+    cursor.execute(
+        """
+        SELECT
+            pol.polname,
+            CASE WHEN pol.polpermissive THEN 'PERMISSIVE' ELSE 'RESTRICTIVE' END,
+            CASE pol.polcmd
+                WHEN 'r' THEN 'SELECT' WHEN 'a' THEN 'INSERT'
+                WHEN 'w' THEN 'UPDATE' WHEN 'd' THEN 'DELETE' ELSE 'ALL' END,
+            (
+                SELECT string_agg(
+                    CASE WHEN r = 0 THEN 'PUBLIC'
+                        ELSE quote_ident(pg_get_userbyid(r)) END,
+                    ', '
+                )
+                FROM unnest(pol.polroles) r
+            ),
+            pg_get_expr(pol.polqual, pol.polrelid),
+            pg_get_expr(pol.polwithcheck, pol.polrelid)
+        FROM pg_policy pol
+        WHERE pol.polrelid = %s::regclass
+        ORDER BY pol.polname
+        """,
+        (swap.target,),
+    )
+    for name, kind, command, roles, using, check in cursor.fetchall():
+        swap.policies[name] = (
+            f"AS {kind} FOR {command} TO {roles}"
+            + (f" USING ({using})" if using else "")
+            + (f" WITH CHECK ({check})" if check else "")
+        )
+    cursor.execute(
+        """
+        SELECT
+            c.relrowsecurity,
+            c.relforcerowsecurity,
+            c.relreplident,
+            (
+                SELECT i.relname FROM pg_index x JOIN pg_class i
+                    ON i.oid = x.indexrelid
+                WHERE x.indrelid = c.oid AND x.indisreplident
+            ),
+            CASE WHEN pg_get_userbyid(c.relowner) <> current_user
+                THEN quote_ident(pg_get_userbyid(c.relowner)) END
+        FROM pg_class c
+        WHERE c.oid = %s::regclass
+        """,
+        (swap.target,),
+    )
+    (
+        swap.row_security,
+        swap.force_row_security,
+        swap.replica_identity,
+        swap.replica_identity_index,
+        swap.owner,
+    ) = cursor.fetchone()
+    return swap
+
+
+def drop_stale_tables(cursor, swap: TableSwap) -> None:
+    cursor.execute(f"DROP TABLE IF EXISTS {swap.staging}")
+    cursor.execute(f"DROP TABLE IF EXISTS {swap.old}")
+
+
+def prepare_swap(connection, target_table: str) -> TableSwap:
+    """
+    Create an empty staging table without indexes to load target_table's
+    new rows into.
+    """
+    with connection.cursor() as cursor:
+        swap = describe_table(cursor, target_table)
+        drop_stale_tables(cursor, swap)
+        cursor.execute(
+            f"""
+            CREATE TABLE {swap.staging} (
+                LIKE {swap.target} INCLUDING DEFAULTS INCLUDING GENERATED
+                INCLUDING IDENTITY INCLUDING CONSTRAINTS INCLUDING STORAGE
+                INCLUDING COMMENTS
+            )
+            """
+        )
+    connection.commit()
+    return swap
+
+
+def finish_swap(connection, swap: TableSwap) -> None:
+    """
+    Index the loaded staging table and swap it in for the target, then drop
+    the replaced table.
+    """
+    staging_index = {
+        index.name: suffixed(index.name, STAGING_SUFFIX) for index in swap.indexes
+    }
+    with connection.cursor() as cursor:
+        for index in swap.indexes:
+            name = quote(staging_index[index.name])
+            if index.constraint:
+                cursor.execute(
+                    f"ALTER TABLE {swap.staging} "
+                    f"ADD CONSTRAINT {name} {index.definition}"
+                )
+            else:
+                unique = "UNIQUE " if index.unique else ""
+                cursor.execute(
+                    f"CREATE {unique}INDEX {name} ON {swap.staging} "
+                    f"USING {index.definition}"
+                )
+        for name, definition in swap.foreign_keys.items():
+            cursor.execute(
+                f"ALTER TABLE {swap.staging} ADD CONSTRAINT {quote(name)} {definition}"
+            )
+        for grantee, privilege in swap.grants:
+            cursor.execute(f"GRANT {privilege} ON {swap.staging} TO {grantee}")
+        for name, definition in swap.policies.items():
+            cursor.execute(
+                f"CREATE POLICY {quote(name)} ON {swap.staging} {definition}"
+            )
+        if swap.row_security:
+            cursor.execute(f"ALTER TABLE {swap.staging} ENABLE ROW LEVEL SECURITY")
+        if swap.force_row_security:
+            cursor.execute(f"ALTER TABLE {swap.staging} FORCE ROW LEVEL SECURITY")
+        if swap.replica_identity == "i":
+            name = quote(staging_index[swap.replica_identity_index])
+            cursor.execute(
+                f"ALTER TABLE {swap.staging} REPLICA IDENTITY USING INDEX {name}"
+            )
+        elif swap.replica_identity in REPLICA_IDENTITIES:
+            cursor.execute(
+                f"ALTER TABLE {swap.staging} "
+                f"REPLICA IDENTITY {REPLICA_IDENTITIES[swap.replica_identity]}"
+            )
+        cursor.execute(f"ANALYZE {swap.staging}")
+        # Last, granting and analyzing need the current user to own it
+        if swap.owner:
+            cursor.execute(f"ALTER TABLE {swap.staging} OWNER TO {swap.owner}")
+    connection.commit()
+    logger.info(f"Indexed {swap.staging}, swapping it in for {swap.target}")
+
+    with connection.cursor() as cursor:
+        # Index and constraint names are unique per schema, so the replaced
+        # table's are moved out of the way first
+        cursor.execute(f"ALTER TABLE {swap.target} RENAME TO {quote(swap.old_name)}")
+        for column, sequence in swap.identity_sequences.items():
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, %s), last_value, "
+                f"is_called) FROM {sequence}",
+                (swap.staging, column),
+            )
+        for index in swap.indexes:
+            old_name = quote(suffixed(index.name, OLD_SUFFIX))
+            if index.constraint:
+                cursor.execute(
+                    f"ALTER TABLE {swap.old} "
+                    f"RENAME CONSTRAINT {quote(index.name)} TO {old_name}"
+                )
+            else:
+                cursor.execute(
+                    f"ALTER INDEX {quote(swap.schema)}.{quote(index.name)} "
+                    f"RENAME TO {old_name}"
+                )
+        cursor.execute(f"ALTER TABLE {swap.staging} RENAME TO {quote(swap.table)}")
+        for index in swap.indexes:
+            name = quote(staging_index[index.name])
+            if index.constraint:
+                cursor.execute(
+                    f"ALTER TABLE {swap.target} "
+                    f"RENAME CONSTRAINT {name} TO {quote(index.name)}"
+                )
+            else:
+                cursor.execute(
+                    f"ALTER INDEX {quote(swap.schema)}.{name} "
+                    f"RENAME TO {quote(index.name)}"
+                )
+        # Otherwise the sequences would be dropped with the replaced table
+        for sequence, column in swap.owned_sequences.items():
+            cursor.execute(
+                f"ALTER SEQUENCE {sequence} OWNED BY {swap.target}.{quote(column)}"
+            )
+    connection.commit()
+
+    # Outside the swap, so readers of the replaced table don't hold it up
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {swap.old}")
+    connection.commit()
+
+
+def abort_swap(connection, swap: TableSwap) -> None:
+    connection.rollback()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {swap.staging}")
+    connection.commit()
@@ -0,0 +1,114 @@
+"""
+Watermark tracking for incremental ETL loads.
+
+The watermark for a table is the highest value of its incremental column that
+has been committed to the Iceberg table. It is stored as a snapshot summary
+property on the commit that loaded the data, so it only advances when that
+commit succeeds and rolls back together with the table.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+import logging
+from typing import Any, Optional
+
+from nextdata.core.connections.spark import SparkManager
+from nextdata.util.s3_tables_utils import get_s3_table_path
+
+WATERMARK_PROPERTY_PREFIX = "nextdata.watermark."
+
+logger = logging.getLogger(__name__)
+
+
+def format_sql_literal(value: Any) -> str:
+    """Render a watermark value as a SQL literal for the source database"""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=" ")
+    elif isinstance(value, date):
+        value = value.isoformat()
+    # Strings are always quoted, even ones that look like numbers, e.g. a
+    # varchar watermark of 00123. Stored watermarks of numeric columns are
+    # quoted too, which the source casts to the column's type.
+    escaped = str(value).replace("'", "''")
+    return f"'{escaped}'"
+
+
+def serialize_watermark(value: Any) -> str:
+    """Serialize a watermark value so it can be stored as a snapshot property"""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def incremental_filter(
+    column: str,
+    low_watermark: Optional[str],
+    high_watermark: Any,
+) -> str:
+    """
+    Build the predicate that selects rows between two watermarks.
+
+    The upper bound pins the extraction to the high watermark read before the
+    load, so rows that arrive while the job is running are picked up by the
+    next run instead of being read twice.
+    """
+    upper = f"{column} <= {format_sql_literal(high_watermark)}"
+    if low_watermark is None:
+        return f"({upper} OR {column} IS NULL)"
+    return f"{column} > {format_sql_literal(low_watermark)} AND {upper}"
+
+
+def fetch_high_watermark(connection, table_name: str, column: str) -> Any:
+    """Get the current maximum value of the incremental column in the source table"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT MAX({column}) FROM {table_name}")
+        return cursor.fetchone()[0]
+
+
+class WatermarkStore:
+    """
+    Reads and writes per-table watermarks.
+
+    Watermarks live in the snapshot summary of the target Iceberg table under
+    ``nextdata.watermark.<column>``. Writing one means passing the properties
+    from ``snapshot_properties`` to ``SparkManager.write_to_table``.
+    """
+
+    def __init__(self, spark_manager: SparkManager):
+        self.spark_manager = spark_manager
+
+    @staticmethod
+    def property_name(column: str) -> str:
+        return f"{WATERMARK_PROPERTY_PREFIX}{column}"
+
+    def get(self, table_name: str, column: str) -> Optional[str]:
+        """Get the last committed watermark for a table, or None if there isn't one"""
+        table_path = get_s3_table_path(self.spark_manager.namespace, table_name)
+        key = self.property_name(column)
+        if not self.spark_manager.spark.catalog.tableExists(table_path):
+            return None
+        rows = self.spark_manager.spark.sql(
+            f"""
+            SELECT s.summary['{key}'] AS watermark
+            FROM {table_path}.snapshots s
+            JOIN {table_path}.history h ON s.snapshot_id = h.snapshot_id
+            WHERE h.is_current_ancestor AND s.summary['{key}'] IS NOT NULL
+            ORDER BY s.committed_at DESC
+            LIMIT 1
+            """
+        ).collect()
+        if not rows:
+            return None
+        watermark = rows[0]["watermark"]
+        logger.info(f"Last committed watermark for {table_name}.{column}: {watermark}")
+        return watermark
+
+    def snapshot_properties(self, column: str, value: Any) -> dict[str, str]:
+        """Snapshot properties that record a watermark when the write commits"""
+        return {self.property_name(column): serialize_watermark(value)}
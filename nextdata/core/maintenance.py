@@ -0,0 +1,220 @@
+"""
+Maintenance of the project's Iceberg tables.
+
+Every ETL run commits a snapshot and adds data files, and every commit adds
+a manifest. Left alone, reads plan over more and more small files and
+manifests, and the metadata keeps every snapshot ever written. Maintenance
+looks at a table's file, manifest and snapshot counts and runs the Iceberg
+procedures whose thresholds are crossed: compacting data files, rewriting
+manifests and expiring old snapshots.
+
+Watermarks and checkpointed extractions are recorded as nextdata.*
+properties in snapshot summaries, so the latest snapshot carrying them is
+never expired.
+
+Removing orphan files lists the whole table location and is only run when
+asked for explicitly.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import logging
+from typing import Any, Literal, Optional, get_args
+
+from nextdata.core.connections.spark import DEFAULT_TARGET_FILE_SIZE_BYTES, SparkManager
+from nextdata.util.s3_tables_utils import get_s3_table_path
+
+logger = logging.getLogger(__name__)
+
+MaintenanceAction = Literal[
+    "rewrite_data_files", "rewrite_manifests", "expire_snapshots", "remove_orphan_files"
+]
+ACTIONS: list[str] = list(get_args(MaintenanceAction))
+
+# Snapshot summary properties the ETL reads back, see watermarks.py and
+# checkpoints.py
+PROTECTED_PROPERTY_PREFIX = "nextdata."
+
+
+@dataclass
+class MaintenanceThresholds:
+    """When each maintenance action is due, and what it keeps"""
+
+    # Data files smaller than this count as small. rewrite_data_files
+    # rewrites files under 75% of the target file size by default.
+    small_file_bytes: int = DEFAULT_TARGET_FILE_SIZE_BYTES * 3 // 4
+    small_files: int = 100
+    delete_files: int = 50
+    manifests: int = 50
+    snapshots: int = 100
+    snapshot_retention: timedelta = timedelta(days=7)
+    retain_last: int = 10
+    orphan_retention: timedelta = timedelta(days=3)
+
+
+@dataclass
+class TableStats:
+    data_files: int = 0
+    small_files: int = 0
+    delete_files: int = 0
+    manifests: int = 0
+    snapshots: int = 0
+    total_bytes: int = 0
+
+
+@dataclass
+class MaintenanceReport:
+    table_name: str
+    before: TableStats
+    after: Optional[TableStats] = None
+    actions: list[str] = field(default_factory=list)
+    results: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        if not self.actions:
+            return f"{self.table_name}: nothing to do"
+        after = self.after or self.before
+        counts = ", ".join(
+            f"{name.replace('_', ' ')} {getattr(self.before, name)} -> "
+            f"{getattr(after, name)}"
+            for name in ("data_files", "delete_files", "manifests", "snapshots")
+        )
+        return f"{self.table_name}: {', '.join(self.actions)} ({counts})"
+
+
+class TableMaintenance:
+    """Decides which maintenance a table needs and runs it through SparkManager"""
+
+    def __init__(
+        self,
+        spark_manager: SparkManager,
+        thresholds: Optional[MaintenanceThresholds] = None,
+    ):
+        self.spark_manager = spark_manager
+        self.thresholds = thresholds or MaintenanceThresholds()
+
+    def stats(self, table_name: str) -> TableStats:
+        """File, manifest and snapshot counts from the table's metadata tables"""
+        table_path = get_s3_table_path(self.spark_manager.namespace, table_name)
+        row = self.spark_manager.spark.sql(
+            f"""
+            SELECT
+                (SELECT COUNT(*) FROM {table_path}.data_files) AS data_files,
+                (
+                    SELECT COUNT(*) FROM {table_path}.data_files
+                    WHERE file_size_in_bytes < {self.thresholds.small_file_bytes}
+                ) AS small_files,
+                (SELECT COUNT(*) FROM {table_path}.delete_files) AS delete_files,
+                (SELECT COUNT(*) FROM {table_path}.manifests) AS manifests,
+                (SELECT COUNT(*) FROM {table_path}.snapshots) AS snapshots,
+                (
+                    SELECT COALESCE(SUM(file_size_in_bytes), 0)
+                    FROM {table_path}.data_files
+                ) AS total_bytes
+            """
+        ).collect()[0]
+        return TableStats(**{name: int(row[name] or 0) for name in row.asDict()})
+
+    def due_actions(self, stats: TableStats) -> list[str]:
+        """Actions whose thresholds the table has crossed"""
+        thresholds = self.thresholds
+        actions = []
+        if (
+            stats.small_files >= thresholds.small_files
+            or stats.delete_files >= thresholds.delete_files
+        ):
+            actions.append("rewrite_data_files")
+        if stats.manifests >= thresholds.manifests:
+            actions.append("rewrite_manifests")
+        if stats.snapshots >= thresholds.snapshots:
+            actions.append("expire_snapshots")
+        return actions
+
+    def protected_since(self, table_name: str) -> Optional[datetime]:
+        """
+        Commit time of the oldest snapshot the ETL may still read properties
+        from: the latest snapshot carrying each nextdata.* property.
+        """
+        table_path = get_s3_table_path(self.spark_manager.namespace, table_name)
+        rows = self.spark_manager.spark.sql(
+            f"""
+            SELECT MIN(committed_at) AS committed_at
+            FROM (
+                SELECT key, MAX(s.committed_at) AS committed_at
+                FROM {table_path}.snapshots s
+                JOIN {table_path}.history h ON s.snapshot_id = h.snapshot_id
+                LATERAL VIEW explode(map_keys(s.summary)) k AS key
+                WHERE h.is_current_ancestor
+                    AND key LIKE '{PROTECTED_PROPERTY_PREFIX}%'
+                GROUP BY key
+            )
+            """
+        ).collect()
+        return rows[0]["committed_at"] if rows else None
+
+    def run_action(self, table_name: str, action: str) -> dict[str, Any]:
+        thresholds = self.thresholds
+        now = datetime.now()
+        if action == "rewrite_data_files":
+            return self.spark_manager.rewrite_data_files(
+                table_name,
+                {
+                    # Commit compacted file groups as they finish, so an ETL
+                    # commit in the meantime only conflicts with one group
+                    "partial-progress.enabled": "true",
+                    # Apply merge-on-read delete files while compacting
+                    "delete-file-threshold": "1",
+                },
+            )
+        if action == "rewrite_manifests":
+            return self.spark_manager.rewrite_manifests(table_name)
+        if action == "expire_snapshots":
+            older_than = now - thresholds.snapshot_retention
+            protected = self.protected_since(table_name)
+            if protected and protected < older_than:
+                logger.info(
+                    f"Keeping snapshots of {table_name} since {protected}, "
+                    "they hold the latest watermark or extraction checkpoint"
+                )
+                older_than = protected
+            return self.spark_manager.expire_snapshots(
+                table_name, older_than, thresholds.retain_last
+            )
+        if action == "remove_orphan_files":
+            return self.spark_manager.remove_orphan_files(
+                table_name, now - thresholds.orphan_retention
+            )
+        raise ValueError(
+            f"Unknown maintenance action {action}, expected one of {ACTIONS}"
+        )
+
+    def run(
+        self,
+        table_name: str,
+        actions: Optional[list[str]] = None,
+        dry_run: bool = False,
+    ) -> MaintenanceReport:
+        """
+        Run the given actions, or the ones that are due, and report the
+        table's counts before and after. A dry run only reports what is due.
+        """
+        unknown = [action for action in actions or [] if action not in ACTIONS]
+        if unknown:
+            raise ValueError(
+                f"Unknown maintenance actions {unknown}, expected some of {ACTIONS}"
+            )
+        before = self.stats(table_name)
+        # Compaction first, so expiry can drop the snapshots it replaced
+        actions = [
+            action
+            for action in ACTIONS
+            if action in (actions if actions else self.due_actions(before))
+        ]
+        report = MaintenanceReport(table_name, before, actions=actions)
+        if dry_run or not actions:
+            return report
+        for action in actions:
+            report.results[action] = self.run_action(table_name, action)
+        report.after = self.stats(table_name)
+        logger.info(str(report))
+        return report
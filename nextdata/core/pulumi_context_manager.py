@@ -1,19 +1,17 @@
+import importlib.resources
+import importlib.util
 import json
+import os
+from pathlib import Path
 import subprocess
 from typing import Literal
+
 import click
 import pulumi
-import pulumi_aws as aws
 from pulumi import automation as auto
-from pathlib import Path
-
-import os
+import pulumi_aws as aws
 
 from nextdata.cli.types import StackOutputs
-import importlib.util
-import importlib.resources
-
-
 from nextdata.core.db.db_manager import DatabaseManager
 from nextdata.core.db.models import (
     AwsResource,
@@ -25,9 +23,18 @@ from nextdata.core.db.models import (
     S3DataTable,
 )
 from nextdata.util.framework_magic import (
+    get_cdc_settings,
     get_connection_args,
     get_connection_name,
+    get_expectations,
+    get_extraction_engine,
     get_incremental_column,
+    get_partition_settings,
+    get_retl_settings,
+    get_source_options,
+    get_table_layout,
+    get_write_settings,
+    get_write_tuning,
     has_custom_glue_job,
 )
 
@@ -93,6 +100,7 @@ class PulumiContextManager:
         self._glue_catalog_database = None
         self._glue_job_bucket = None
         self._glue_etl_job_script = None
+        self._glue_retl_job_script = None
 
     @property
     def iam_role(self) -> aws.iam.Role:
@@ -624,14 +632,53 @@ class PulumiContextManager:
             s3_path="scripts/default_etl_script.py",
             bucket=glue_job_bucket.bucket,
         ).apply(lambda args: self.db_manager.add_script(EmrJobScript(**args)))
+        # Runs the default ETL for several tables in one job run
+        glue_batch_job_script = aws.s3.BucketObject(
+            "glue-batch-job-script.py",
+            bucket=glue_job_bucket.id,
+            key="scripts/batch_etl_script.py",
+            source=pulumi.asset.FileAsset(
+                importlib.resources.files("nextdata")
+                / "core"
+                / "glue"
+                / "batch_etl_script.py"
+            ),
+            opts=pulumi.ResourceOptions(depends_on=[glue_job_bucket]),
+        )
+        pulumi.Output.all(
+            name="scripts/batch_etl_script.py",
+            s3_path="scripts/batch_etl_script.py",
+            bucket=glue_job_bucket.bucket,
+        ).apply(lambda args: self.db_manager.add_script(EmrJobScript(**args)))
+        # Copies a table into the database table of the same name
+        glue_retl_job_script = aws.s3.BucketObject(
+            "glue-retl-job-script.py",
+            bucket=glue_job_bucket.id,
+            key="scripts/default_retl_script.py",
+            source=pulumi.asset.FileAsset(
+                importlib.resources.files("nextdata")
+                / "core"
+                / "glue"
+                / "default_retl_script.py"
+            ),
+            opts=pulumi.ResourceOptions(depends_on=[glue_job_bucket]),
+        )
+        pulumi.Output.all(
+            name="scripts/default_retl_script.py",
+            s3_path="scripts/default_retl_script.py",
+            bucket=glue_job_bucket.bucket,
+        ).apply(lambda args: self.db_manager.add_script(EmrJobScript(**args)))
         # self._glue_catalog_database = glue_catalog_database
         pulumi.export("emr-app", emr_app.name)
         pulumi.export("emr-app-arn", emr_app.arn)
         pulumi.export("glue-job-bucket", glue_job_bucket.bucket)
         pulumi.export("glue-job-bucket-arn", glue_job_bucket.arn)
         pulumi.export("glue-etl-job-script", glue_etl_job_script.key)
+        pulumi.export("glue-batch-job-script", glue_batch_job_script.key)
+        pulumi.export("glue-retl-job-script", glue_retl_job_script.key)
         self._glue_job_bucket = glue_job_bucket
         self._glue_etl_job_script = glue_etl_job_script
+        self._glue_retl_job_script = glue_retl_job_script
 
     def _ensure_base_resources(self):
         """Ensure bucket and namespace exist"""
@@ -843,7 +890,7 @@ COPY --from=builder /output/venv.tar.gz /
         if has_custom_glue_job(table_path / f"{job_type}.py"):
             script_key = f"scripts/{table_path.name}/{job_type}.py"
             custom_script = aws.s3.BucketObject(
-                f"glue-etl-job-script-{table_path.name}.py",
+                f"glue-{job_type}-job-script-{table_path.name}.py",
                 bucket=self.glue_job_bucket.id,
                 key=script_key,
                 source=pulumi.asset.FileAsset(table_path / f"{job_type}.py"),
@@ -855,7 +902,7 @@ COPY --from=builder /output/venv.tar.gz /
                 bucket=bucket_name,
             ).apply(lambda args: self.db_manager.add_script(EmrJobScript(**args)))
         else:
-            script_key = "scripts/default_etl_script.py"
+            script_key = f"scripts/default_{job_type}_script.py"
 
         # Get the connection name from the etl.py file by checking connection_name variable
         connection_name = get_connection_name(table_path / f"{job_type}.py")
@@ -876,6 +923,14 @@ COPY --from=builder /output/venv.tar.gz /
             venv_s3_path = self._package_requirements(requirements)
 
         incremental_column = get_incremental_column(table_path / f"{job_type}.py")
+        partition_settings = get_partition_settings(table_path / f"{job_type}.py")
+        extraction_engine = get_extraction_engine(table_path / f"{job_type}.py")
+        cdc_settings = get_cdc_settings(table_path / f"{job_type}.py")
+        source_options = get_source_options(table_path / f"{job_type}.py")
+        write_settings = get_write_settings(table_path / f"{job_type}.py")
+        table_layout = get_table_layout(table_path / f"{job_type}.py")
+        write_tuning = get_write_tuning(table_path / f"{job_type}.py")
+        expectations = get_expectations(table_path / f"{job_type}.py")
         if job_type == "etl":
             pulumi.Output.all(
                 script_arn=self._glue_etl_job_script.arn,
@@ -891,6 +946,14 @@ COPY --from=builder /output/venv.tar.gz /
                         sql_table=table_path.name,
                         incremental_column=incremental_column,
                         is_full_load=False,
+                        **partition_settings,
+                        extraction_engine=extraction_engine,
+                        **cdc_settings,
+                        **source_options,
+                        **write_settings,
+                        **table_layout,
+                        **write_tuning,
+                        **expectations,
                         script_id=self.db_manager.get_script_by_name(script_key).id,
                         requirements=requirements,
                         venv_s3_path=venv_s3_path,
@@ -900,16 +963,37 @@ COPY --from=builder /output/venv.tar.gz /
                 )
             )
         elif job_type == "retl":
-            pass
+            retl_settings = get_retl_settings(table_path / f"{job_type}.py")
+            pulumi.Output.all(
+                script_arn=self._glue_retl_job_script.arn,
+                input_table=self._tables[table_path.name].name,
+            ).apply(
+                lambda args: self.db_manager.add_job(
+                    EmrJob(
+                        name=f"{self.config.project_slug}-{table_path.name}-{job_type}",
+                        job_type=JobType.RETL,
+                        connection_name=connection_name,
+                        connection_type=ConnectionType(connection_args.connection_type),
+                        connection_properties=json.dumps(connection_args.model_dump()),
+                        sql_table=table_path.name,
+                        **retl_settings,
+                        script_id=self.db_manager.get_script_by_name(script_key).id,
+                        requirements=requirements,
+                        venv_s3_path=venv_s3_path,
+                    ),
+                    input_tables=[self.db_manager.get_table_by_name(table_path.name)],
+                    output_tables=[],
+                )
+            )
 
     def _discover_etl_scripts(self):
-        """Discover etl scripts in the data directory and setup glue jobs for them."""
+        """Discover etl and retl scripts in the data directory and setup glue jobs for them."""
         for table_path in self.config.data_dir.iterdir():
             # Check if the table path is a directory. If so, check if there's an etl.py file.
             if table_path.is_dir():
-                etl_script_path = table_path / "etl.py"
-                if etl_script_path.exists():
-                    self._setup_glue_job(table_path, "etl")
+                for job_type in ("etl", "retl"):
+                    if (table_path / f"{job_type}.py").exists():
+                        self._setup_glue_job(table_path, job_type)
 
     def _construct_pulumi_program(self):
         """Initial program for stack creation"""
@@ -64,7 +64,24 @@ const uploadFile = async (
     method: "POST",
     body: formData,
   });
-  return response.json();
+  const upload = await response.json();
+  if (upload.status === "error") {
+    throw new Error(upload.error);
+  }
+  // The table is written in the background, poll until it's done
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+    const statusResponse = await fetch(
+      `http://localhost:8000/api/uploads/${upload.upload_id}`
+    );
+    const status = await statusResponse.json();
+    if (status.status === "error") {
+      throw new Error(status.error);
+    }
+    if (status.status === "success") {
+      return status;
+    }
+  }
 };
 
 export function ParsedCSV({
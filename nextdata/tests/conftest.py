@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+import shutil
+import socket
+import subprocess
+
+import pytest
+
+
+def _postgres_bin_dir():
+    """Directory with initdb and pg_ctl, from PATH or pg_config"""
+    initdb = shutil.which("initdb")
+    if initdb:
+        return Path(initdb).parent
+    pg_config = shutil.which("pg_config")
+    if pg_config:
+        bin_dir = subprocess.run(
+            [pg_config, "--bindir"], capture_output=True, text=True
+        ).stdout.strip()
+        if (Path(bin_dir) / "initdb").exists():
+            return Path(bin_dir)
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def postgres_dsn(tmp_path_factory):
+    """
+    DSN of a Postgres server with logical replication enabled.
+
+    Uses NEXTDATA_TEST_POSTGRES_DSN if it is set, otherwise starts a
+    throwaway server with the local Postgres binaries. Tests are skipped
+    when neither is available.
+    """
+    if os.environ.get("NEXTDATA_TEST_POSTGRES_DSN"):
+        yield os.environ["NEXTDATA_TEST_POSTGRES_DSN"]
+        return
+    bin_dir = _postgres_bin_dir()
+    if bin_dir is None:
+        pytest.skip("Postgres binaries not found")
+    data_dir = tmp_path_factory.mktemp("postgres")
+    port = _free_port()
+    subprocess.run(
+        [bin_dir / "initdb", "-D", data_dir, "-U", "postgres", "--auth=trust"],
+        check=True,
+        capture_output=True,
+    )
+    options = f"-c wal_level=logical -c port={port} -k {data_dir}"
+    subprocess.run(
+        [bin_dir / "pg_ctl", "-D", data_dir, "-o", options, "-w", "start"],
+        check=True,
+        capture_output=True,
+    )
+    try:
+        yield f"host=127.0.0.1 port={port} dbname=postgres user=postgres"
+    finally:
+        subprocess.run(
+            [bin_dir / "pg_ctl", "-D", data_dir, "-m", "immediate", "stop"],
+            capture_output=True,
+        )
@@ -0,0 +1,486 @@
+from datetime import datetime
+import pytest
+from unittest.mock import MagicMock, patch
+
+from pyspark.sql import Row
+
+from nextdata.cli.types import SparkSchemaSpec
+
+from nextdata.core.connections.spark import (
+    DEFAULT_TABLE_PROPERTIES,
+    SparkManager,
+    WriteMetrics,
+    write_properties,
+)
+
+
+def test_write_metrics_from_summary():
+    metrics = WriteMetrics.from_summary(
+        "books",
+        rows=1000,
+        snapshot_id=42,
+        summary={
+            "added-records": "1000",
+            "added-data-files": "4",
+            "added-files-size": "52428800",
+        },
+    )
+    assert metrics.added_records == 1000
+    assert metrics.added_files == 4
+    assert metrics.added_bytes == 52428800
+    assert str(metrics) == (
+        "Wrote 1000 rows to books (snapshot 42: 1000 records, 4 files, 52428800 bytes)"
+    )
+
+
+def mock_sql_result(statement: str, properties: list, snapshots: list) -> MagicMock:
+    """Result of spark.sql for the table property and snapshot queries"""
+    result = MagicMock()
+    if statement.startswith("SHOW TBLPROPERTIES"):
+        result.collect.return_value = properties
+    else:
+        result.collect.return_value = snapshots
+    return result
+
+
+@patch("nextdata.core.connections.spark.F")
+@patch("nextdata.core.connections.spark.Observation")
+@patch.object(SparkManager, "create_spark_session")
+def test_write_to_table_single_pass(
+    mock_create_spark_session, mock_observation, mock_functions
+):
+    mock_observation.return_value.get = {"rows": 3}
+    spark = mock_create_spark_session.return_value
+    spark.catalog.tableExists.return_value = False
+    spark.sql.return_value.collect.side_effect = [
+        [{"snapshot_id": 7, "summary": {"added-records": "3"}}],
+        [],  # sample
+    ]
+    df = MagicMock()
+    df.dtypes = [("id", "bigint")]
+    observed_df = df.observe.return_value
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    metrics = manager.write_to_table("books", df, sample_size=5)
+
+    # A full overwrite replaces the rows, not the table and its partition spec
+    observed_df.writeTo.return_value.overwrite.assert_called_once()
+    observed_df.write.mode.assert_not_called()
+    # Nothing but the write runs on the DataFrame
+    df.limit.assert_not_called()
+    df.count.assert_not_called()
+    df.show.assert_not_called()
+    assert metrics.rows == 3
+    assert metrics.snapshot_id == 7
+    assert metrics.added_records == 3
+    assert "VERSION AS OF 7 LIMIT 5" in spark.sql.call_args[0][0]
+    create = spark.sql.call_args_list[0][0][0]
+    assert "'write.parquet.compression-codec' = 'zstd'" in create
+    assert "'write.distribution-mode' = 'hash'" in create
+
+
+@patch("nextdata.core.connections.spark.F")
+@patch("nextdata.core.connections.spark.Observation")
+@patch.object(SparkManager, "create_spark_session")
+def test_audited_write_is_published_after_audit(
+    mock_create_spark_session, mock_observation, mock_functions
+):
+    mock_observation.return_value.get = {"rows": 3, "check_0_nulls": 0}
+    spark = mock_create_spark_session.return_value
+    spark.sql.side_effect = lambda statement: mock_sql_result(
+        statement,
+        properties=[],
+        snapshots=[Row(snapshot_id=9, summary={"added-records": "3"})],
+    )
+    df = MagicMock()
+    df.dtypes = [("id", "bigint")]
+    observed_df = df.observe.return_value
+    audit = MagicMock()
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    metrics = manager.write_to_table(
+        "books",
+        df,
+        mode="append",
+        sample_size=0,
+        observed_metrics={"check_0_nulls": MagicMock()},
+        audit=audit,
+    )
+
+    # The checks are observed in the same pass as the write
+    assert len(df.observe.call_args[0]) == 3
+    audit.assert_called_once_with({"rows": 3, "check_0_nulls": 0})
+    assert metrics.observed == {"rows": 3, "check_0_nulls": 0}
+    statements = [c[0][0] for c in spark.sql.call_args_list]
+    branch = next(s for s in statements if "CREATE BRANCH" in s).split()[-1]
+    observed_df.writeTo.assert_called_once_with(
+        f"s3tablesbucket.test.books.branch_{branch}"
+    )
+    publish = next(s for s in statements if "fast_forward" in s)
+    assert f"to => '{branch}'" in publish
+    assert statements[-1].endswith(f"DROP BRANCH IF EXISTS {branch}")
+
+
+@patch("nextdata.core.connections.spark.F")
+@patch("nextdata.core.connections.spark.Observation")
+@patch.object(SparkManager, "create_spark_session")
+def test_staged_metrics_are_counted_on_the_branch(
+    mock_create_spark_session, mock_observation, mock_functions
+):
+    mock_observation.return_value.get = {"rows": 3}
+    spark = mock_create_spark_session.return_value
+    spark.sql.side_effect = lambda statement: mock_sql_result(
+        statement,
+        properties=[],
+        snapshots=[Row(snapshot_id=9, summary={"added-records": "3"})],
+    )
+    staged = {"check_0_values": 3, "check_0_distinct": 2}
+    spark.table.return_value.agg.return_value.first.return_value.asDict.return_value = (
+        staged
+    )
+    df = MagicMock()
+    df.dtypes = [("id", "bigint")]
+    audit = MagicMock()
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    manager.write_to_table(
+        "books",
+        df,
+        mode="append",
+        sample_size=0,
+        audit=audit,
+        staged_metrics={"check_0_values": MagicMock(), "check_0_distinct": MagicMock()},
+    )
+
+    # Distinct counts can't be observed, they're read back from the staged write
+    branch = spark.table.call_args[0][0]
+    assert branch.startswith("s3tablesbucket.test.books.branch_audit_")
+    audit.assert_called_once_with({"rows": 3, **staged})
+
+
+@patch("nextdata.core.connections.spark.F")
+@patch("nextdata.core.connections.spark.Observation")
+@patch.object(SparkManager, "create_spark_session")
+def test_failed_audit_never_reaches_main(
+    mock_create_spark_session, mock_observation, mock_functions
+):
+    mock_observation.return_value.get = {"rows": 3}
+    spark = mock_create_spark_session.return_value
+    spark.sql.side_effect = lambda statement: mock_sql_result(
+        statement, properties=[], snapshots=[]
+    )
+    df = MagicMock()
+    df.dtypes = [("id", "bigint")]
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    with pytest.raises(ValueError, match="bad rows"):
+        manager.write_to_table(
+            "books",
+            df,
+            mode="append",
+            sample_size=0,
+            audit=MagicMock(side_effect=ValueError("bad rows")),
+        )
+
+    statements = [c[0][0] for c in spark.sql.call_args_list]
+    assert not any("fast_forward" in s for s in statements)
+    assert "DROP BRANCH IF EXISTS audit_" in statements[-1]
+
+
+@patch("nextdata.core.connections.spark.F")
+@patch("nextdata.core.connections.spark.Observation")
+@patch.object(SparkManager, "create_spark_session")
+def test_filtered_overwrite_replaces_matching_rows(
+    mock_create_spark_session, mock_observation, mock_functions
+):
+    mock_observation.return_value.get = {"rows": 3}
+    spark = mock_create_spark_session.return_value
+    spark.sql.side_effect = lambda statement: mock_sql_result(
+        statement, properties=[], snapshots=[]
+    )
+    df = MagicMock()
+    df.dtypes = [("id", "bigint"), ("created_at", "timestamp")]
+    observed_df = df.observe.return_value
+    window = "created_at >= TIMESTAMP '2024-01-01 00:00:00'"
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    manager.write_to_table("books", df, sample_size=0, overwrite_filter=window)
+
+    statements = [c[0][0] for c in spark.sql.call_args_list]
+    branch = next(s for s in statements if "CREATE BRANCH" in s).split()[-1]
+    # The window's rows are deleted and the new ones appended on the branch,
+    # then both are published to main at once
+    target = f"s3tablesbucket.test.books.branch_{branch}"
+    assert f"DELETE FROM {target} WHERE {window}" in statements
+    observed_df.writeTo.assert_called_once_with(target)
+    observed_df.writeTo.return_value.append.assert_called_once()
+    observed_df.writeTo.return_value.overwrite.assert_not_called()
+    assert any(f"to => '{branch}'" in s for s in statements if "fast_forward" in s)
+
+
+@patch("nextdata.core.connections.spark.F")
+@patch.object(SparkManager, "create_spark_session")
+def test_write_to_table_merge(mock_create_spark_session, mock_functions):
+    spark = mock_create_spark_session.return_value
+    spark.sql.side_effect = lambda statement: mock_sql_result(
+        statement,
+        properties=[{"key": "write.merge.mode", "value": "copy-on-write"}],
+        snapshots=[{"snapshot_id": 8, "summary": {"added-records": "2"}}],
+    )
+    df = MagicMock()
+    df.dtypes = [("id", "bigint"), ("title", "string")]
+    delta = df.localCheckpoint.return_value
+    delta.agg.return_value.first.return_value.asDict.return_value = {"rows": 2}
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    metrics = manager.write_to_table(
+        "books",
+        df,
+        mode="merge",
+        merge_keys=["id"],
+        merge_strategy="merge-on-read",
+        snapshot_properties={"nextdata.watermark.id": "10"},
+        sample_size=0,
+    )
+
+    statements = [c[0][0] for c in spark.sql.call_args_list]
+    assert any("'write.merge.mode' = 'merge-on-read'" in s for s in statements)
+    merge = next(s for s in statements if "MERGE INTO" in s)
+    assert "USING _merge_books s" in merge
+    assert "ON t.id = s.id" in merge
+    # The MERGE reads a checkpoint of df, not df itself
+    df.localCheckpoint.assert_called_once_with()
+    delta.createOrReplaceTempView.assert_called_once_with("_merge_books")
+    df.createOrReplaceTempView.assert_not_called()
+    spark.catalog.dropTempView.assert_called_once_with("_merge_books")
+    delta.unpersist.assert_called_once_with()
+    df.write.mode.assert_not_called()
+    # The watermark is committed right after the MERGE
+    writer = spark.createDataFrame.return_value.writeTo.return_value
+    writer.option.assert_called_once_with(
+        "snapshot-property.nextdata.watermark.id", "10"
+    )
+    assert metrics.snapshot_id == 8
+    # Counted on the checkpoint
+    assert metrics.rows == 2
+
+
+@patch("nextdata.core.connections.spark.F")
+@patch.object(SparkManager, "create_spark_session")
+def test_write_to_table_merge_audits_the_delta(mock_create_spark_session, _):
+    spark = mock_create_spark_session.return_value
+    df = MagicMock()
+    df.dtypes = [("id", "bigint")]
+    delta = df.localCheckpoint.return_value
+    observed = {"rows": 2, "check_0_nulls": 1}
+    delta.agg.return_value.first.return_value.asDict.return_value = observed
+    audit = MagicMock(side_effect=ValueError("null ids"))
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    with pytest.raises(ValueError, match="null ids"):
+        manager.write_to_table(
+            "books",
+            df,
+            mode="merge",
+            merge_keys=["id"],
+            observed_metrics={"check_0_nulls": MagicMock()},
+            audit=audit,
+        )
+
+    audit.assert_called_once_with(observed)
+    # The table is never merged into
+    assert not any("MERGE INTO" in c[0][0] for c in spark.sql.call_args_list)
+    delta.unpersist.assert_called_once_with()
+
+
+@patch.object(SparkManager, "create_spark_session")
+def test_write_to_table_merge_needs_keys(mock_create_spark_session):
+    df = MagicMock()
+    df.dtypes = [("id", "bigint")]
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    with pytest.raises(ValueError, match="needs merge keys"):
+        manager.write_to_table("books", df, mode="merge")
+
+
+@patch.object(SparkManager, "create_spark_session")
+def test_create_table_with_partition_spec_and_sort_order(mock_create_spark_session):
+    spark = mock_create_spark_session.return_value
+    spark.catalog.tableExists.return_value = False
+    df = MagicMock()
+    df.dtypes = [("id", "bigint"), ("created_at", "timestamp"), ("ds", "date")]
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    created = manager.create_table_from_df(
+        "books",
+        df,
+        partition_by=["days(created_at)", "bucket(16, id)", "identity(ds)"],
+        sort_order=["created_at", "id DESC NULLS LAST"],
+    )
+
+    create, alter = [c[0][0] for c in spark.sql.call_args_list]
+    assert created
+    assert create.endswith(
+        "USING iceberg PARTITIONED BY (days(created_at), bucket(16, id), ds)"
+    )
+    assert alter.endswith("WRITE ORDERED BY created_at, id DESC NULLS LAST")
+
+
+@patch.object(SparkManager, "create_spark_session")
+def test_create_table_keeps_existing_table(mock_create_spark_session):
+    spark = mock_create_spark_session.return_value
+    spark.catalog.tableExists.return_value = True
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    assert not manager.create_table_from_df("books", MagicMock(), partition_by=["ds"])
+    spark.sql.assert_not_called()
+
+
+@pytest.mark.parametrize("spec", ["days(a, b)", "id; DROP TABLE x", "md5(id)"])
+@patch.object(SparkManager, "create_spark_session")
+def test_create_table_rejects_invalid_transforms(mock_create_spark_session, spec):
+    mock_create_spark_session.return_value.catalog.tableExists.return_value = False
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    with pytest.raises(ValueError, match="Invalid partition transform"):
+        manager.create_table_from_df("books", MagicMock(), partition_by=[spec])
+
+
+@patch.object(SparkManager, "create_spark_session")
+def test_get_partition_spec(mock_create_spark_session):
+    mock_create_spark_session.return_value.sql.return_value.collect.return_value = [
+        {"col_name": "id", "data_type": "bigint"},
+        {"col_name": "", "data_type": ""},
+        {"col_name": "# Partitioning", "data_type": ""},
+        {"col_name": "Part 0", "data_type": "days(created_at)"},
+        {"col_name": "Part 1", "data_type": "ds"},
+        {"col_name": "", "data_type": ""},
+        {"col_name": "# Metadata Columns", "data_type": ""},
+    ]
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    assert manager.get_partition_spec("books") == ["days(created_at)", "ds"]
+
+
+@patch.object(SparkManager, "create_spark_session")
+def test_set_table_properties_only_changes_differences(mock_create_spark_session):
+    spark = mock_create_spark_session.return_value
+    spark.sql.side_effect = lambda statement: mock_sql_result(
+        statement,
+        properties=[
+            {"key": key, "value": value}
+            for key, value in DEFAULT_TABLE_PROPERTIES.items()
+        ],
+        snapshots=[],
+    )
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    assert manager.set_table_properties("books", DEFAULT_TABLE_PROPERTIES) == {}
+    changed = manager.set_table_properties(
+        "books",
+        {**DEFAULT_TABLE_PROPERTIES, **write_properties(distribution_mode="range")},
+    )
+
+    assert changed == {"write.distribution-mode": "range"}
+    assert spark.sql.call_args[0][0].endswith(
+        "SET TBLPROPERTIES ('write.distribution-mode' = 'range')"
+    )
+
+
+def test_write_properties():
+    assert write_properties() == {}
+    assert write_properties(
+        target_file_size_bytes=256 * 1024 * 1024, compression_codec="snappy"
+    ) == {
+        "write.target-file-size-bytes": "268435456",
+        "write.spark.advisory-partition-size-bytes": "268435456",
+        "write.parquet.compression-codec": "snappy",
+    }
+
+
+@patch.object(SparkManager, "create_spark_session")
+def test_maintenance_procedures(mock_create_spark_session):
+    spark = mock_create_spark_session.return_value
+    spark.sql.return_value.collect.return_value = [
+        Row(rewritten_data_files_count=12, added_data_files_count=1)
+    ]
+
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+    result = manager.rewrite_data_files("books", {"partial-progress.enabled": "true"})
+    assert result == {"rewritten_data_files_count": 12, "added_data_files_count": 1}
+    assert spark.sql.call_args[0][0] == (
+        "CALL s3tablesbucket.system.rewrite_data_files(table => 'test.books', "
+        "options => map('partial-progress.enabled', 'true'))"
+    )
+
+    manager.expire_snapshots("books", datetime(2024, 5, 1, 12), retain_last=10)
+    assert spark.sql.call_args[0][0] == (
+        "CALL s3tablesbucket.system.expire_snapshots(table => 'test.books', "
+        "older_than => TIMESTAMP '2024-05-01 12:00:00.000000', retain_last => 10)"
+    )
+
+
+@patch.object(SparkManager, "create_spark_session")
+def test_read_from_csv_with_schema_skips_inference(mock_create_spark_session):
+    spark = mock_create_spark_session.return_value
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+
+    manager.read_from_csv(
+        "/tmp/books.csv.gz",
+        SparkSchemaSpec(schema={"id": "LONG", "price": "DOUBLE"}),
+    )
+
+    args, kwargs = spark.read.csv.call_args
+    assert args == ("/tmp/books.csv.gz",)
+    assert kwargs["schema"] == "`id` LONG, `price` DOUBLE"
+    assert "inferSchema" not in kwargs
+
+
+@patch.object(SparkManager, "create_spark_session")
+def test_read_changes(mock_create_spark_session):
+    spark = mock_create_spark_session.return_value
+    spark.sql.return_value.collect.return_value = [
+        Row(changelog_view="books_changes_20")
+    ]
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+
+    changes = manager.read_changes("books", 10, 20)
+
+    assert spark.sql.call_args[0][0] == (
+        "CALL s3tablesbucket.system.create_changelog_view(table => 'test.books', "
+        "options => map('start-snapshot-id', '10', 'end-snapshot-id', '20'), "
+        "net_changes => true, changelog_view => 'books_changes_20')"
+    )
+    spark.table.assert_called_once_with("books_changes_20")
+    assert changes is spark.table.return_value
+
+
+@patch("nextdata.core.connections.spark.F")
+@patch.object(SparkManager, "create_spark_session")
+def test_read_changes_to_columns(mock_create_spark_session, mock_functions):
+    spark = mock_create_spark_session.return_value
+    changelog = spark.table.return_value
+    changelog.columns = ["id", "title", "ds", "_change_type", "_change_ordinal"]
+    mock_functions.col.return_value.__gt__.return_value = MagicMock()
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+
+    changes = manager.read_changes("books", 10, 20, ["id", "title", "price"])
+
+    # Deletes and inserts of the same values of the columns cancel out, so
+    # rows that only got a new ds aren't changes
+    changelog.groupBy.assert_called_once_with("id", "title")
+    net = changelog.groupBy.return_value.agg.return_value.filter.return_value
+    assert changes is net.select.return_value
+    assert net.select.call_args[0][:2] == ("id", "title")
+
+
+@patch.object(SparkManager, "create_spark_session")
+def test_get_table_as_of_snapshot(mock_create_spark_session):
+    spark = mock_create_spark_session.return_value
+    manager = SparkManager(bucket_arn="arn", namespace="test")
+
+    manager.get_table("books", snapshot_id=20)
+
+    spark.read.option.assert_called_once_with("snapshot-id", 20)
+    spark.read.option.return_value.table.assert_called_once_with(
+        "s3tablesbucket.test.books"
+    )
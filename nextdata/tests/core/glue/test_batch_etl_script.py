@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+# test_default_etl_script imports the ETL modules under its own patches, so
+# they're only imported here once the tests run
+@pytest.fixture
+def batch_etl_script():
+    from nextdata.core.glue import batch_etl_script
+
+    return batch_etl_script
+
+
+def make_job_args(batch_etl_script, sql_table: str):
+    return batch_etl_script.GlueJobArgs(
+        job_name=f"{sql_table}-job",
+        connection_name="test_connection",
+        connection_type="jdbc",
+        connection_properties={"host": "localhost"},
+        sql_table=sql_table,
+        bucket_arn="arn:aws:s3tables:us-east-1:123456789012:bucket/test",
+        namespace="test",
+    )
+
+
+def make_batch_args(batch_etl_script, tables: list[str], max_concurrency: int = 2):
+    return batch_etl_script.BatchGlueJobArgs(
+        jobs=[make_job_args(batch_etl_script, table) for table in tables],
+        max_concurrency=max_concurrency,
+        bucket_arn="arn:aws:s3tables:us-east-1:123456789012:bucket/test",
+        namespace="test",
+    )
+
+
+def test_batch_args_round_trip_through_argument_list(batch_etl_script):
+    from nextdata.core.connections.emr import to_argument_list
+
+    batch_args = make_batch_args(batch_etl_script, ["orders", "customers"])
+    arguments = to_argument_list(batch_args)
+    parsed = dict(zip(arguments[::2], arguments[1::2]))
+
+    assert json.loads(parsed["--jobs"])[1]["sql_table"] == "customers"
+    assert (
+        batch_etl_script.BatchGlueJobArgs(**{k[2:]: v for k, v in parsed.items()})
+        == batch_args
+    )
+
+
+def test_run_batch_bounds_concurrency(batch_etl_script):
+    running = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def fake_run_etl(spark_manager, job_args):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return None
+
+    tables = ["a", "b", "c", "d", "e"]
+    with patch("nextdata.core.glue.batch_etl_script.run_etl", side_effect=fake_run_etl):
+        results = batch_etl_script.run_batch(
+            MagicMock(), make_batch_args(batch_etl_script, tables, max_concurrency=2)
+        )
+
+    assert peak == 2
+    assert list(results) == [f"{table}-job" for table in tables]
+
+
+def test_run_batch_runs_every_table_before_raising(batch_etl_script):
+    def fake_run_etl(spark_manager, job_args):
+        if job_args.sql_table == "broken":
+            raise ValueError("source is down")
+        return None
+
+    with patch(
+        "nextdata.core.glue.batch_etl_script.run_etl", side_effect=fake_run_etl
+    ) as mock_run_etl:
+        with pytest.raises(RuntimeError, match="1 of 3 tables failed: broken-job"):
+            batch_etl_script.run_batch(
+                MagicMock(),
+                make_batch_args(batch_etl_script, ["orders", "broken", "customers"]),
+            )
+
+    assert mock_run_etl.call_count == 3
@@ -0,0 +1,156 @@
+from dataclasses import replace
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from nextdata.core.connections.spark import WriteMetrics
+from nextdata.core.glue.checkpoints import (
+    PARTITIONS_PROPERTY,
+    PLAN_PROPERTY,
+    ExtractionPlan,
+    ExtractionProgress,
+)
+from nextdata.core.glue.expectations import DataQualityError
+from nextdata.core.glue.partitioning import PartitionStrategy
+
+
+@pytest.fixture
+def plan():
+    return ExtractionPlan(
+        source_table="orders",
+        partition_strategy=PartitionStrategy(
+            type="numeric",
+            num_partitions=4,
+            column="id",
+            lower_bound=Decimal(0),
+            upper_bound=Decimal(400),
+        ),
+        mode="overwrite",
+        snapshot_properties={"nextdata.watermark.id": "400"},
+    )
+
+
+@pytest.fixture
+def spark_manager():
+    spark_manager = MagicMock()
+    spark_manager.namespace = "test"
+    spark_manager.write_to_table.side_effect = lambda **kwargs: WriteMetrics(
+        table_name=kwargs["table_name"], rows=100, snapshot_id=1, added_files=1
+    )
+    return spark_manager
+
+
+def test_plan_round_trips_as_predicates(plan):
+    restored = ExtractionPlan.from_json(plan.to_json())
+
+    assert restored.plan_id == plan.plan_id
+    assert restored.partition_strategy.predicates == [
+        "id < 100 OR id IS NULL",
+        "id >= 100 AND id < 200",
+        "id >= 200 AND id < 300",
+        "id >= 300",
+    ]
+    assert restored.snapshot_properties == plan.snapshot_properties
+
+
+@patch("nextdata.core.glue.checkpoints.F")
+def test_run_commits_each_group(mock_functions, plan, spark_manager):
+    progress = ExtractionProgress(spark_manager, "orders")
+    with patch.object(progress, "finished_partitions", return_value=set()):
+        metrics = progress.run(plan, MagicMock(), group_size=3)
+
+    writes = [c.kwargs for c in spark_manager.write_to_table.call_args_list]
+    assert [w["mode"] for w in writes] == ["overwrite", "append"]
+    assert writes[0]["snapshot_properties"] == {
+        PLAN_PROPERTY: plan.plan_id,
+        PARTITIONS_PROPERTY: "0,1,2",
+    }
+    # The watermark is only committed once every partition is loaded
+    assert writes[1]["snapshot_properties"]["nextdata.watermark.id"] == "400"
+    assert metrics.rows == 200
+    assert metrics.added_files == 2
+
+
+@patch("nextdata.core.glue.checkpoints.F")
+def test_run_skips_finished_partitions(mock_functions, plan, spark_manager):
+    read = MagicMock()
+    progress = ExtractionProgress(spark_manager, "orders")
+    with patch.object(progress, "finished_partitions", return_value={0, 1, 3}):
+        progress.run(plan, read, group_size=2)
+
+    strategy = read.call_args[0][0]
+    assert strategy.predicates == ["id >= 200 AND id < 300"]
+    # A resumed overwrite must not replace the partitions already loaded
+    assert spark_manager.write_to_table.call_args.kwargs["mode"] == "append"
+
+
+@patch("nextdata.core.glue.checkpoints.F")
+def test_run_stops_at_a_failed_audit(mock_functions, plan, spark_manager):
+    spark_manager.write_to_table.side_effect = [
+        WriteMetrics(table_name="orders", rows=100, snapshot_id=1),
+        DataQualityError([]),
+    ]
+    progress = ExtractionProgress(spark_manager, "orders")
+    with (
+        patch.object(progress, "finished_partitions", return_value=set()),
+        patch.object(progress, "_record") as record,
+        pytest.raises(DataQualityError),
+    ):
+        progress.run(plan, MagicMock(), group_size=2)
+
+    # The plan stays pending until it's resumed or abandoned
+    assert [c.args[1] for c in record.call_args_list] == ["committed"]
+
+
+def test_pending_plan_skips_abandoned_plans(plan, spark_manager):
+    spark_manager.spark.catalog.tableExists.return_value = True
+    spark_manager.spark.sql.return_value.collect.return_value = []
+    progress = ExtractionProgress(spark_manager, "orders")
+
+    with patch.object(progress, "_record") as record:
+        progress.abandon(plan)
+    assert progress.pending_plan() is None
+
+    record.assert_called_once_with(plan.plan_id, "abandoned")
+    query = spark_manager.spark.sql.call_args[0][0]
+    assert "f.event IN ('finished', 'abandoned')" in query
+
+
+def test_finished_partitions_include_unrecorded_commits(plan, spark_manager):
+    spark_manager.spark.catalog.tableExists.return_value = True
+    spark_manager.spark.sql.return_value.collect.side_effect = [
+        [{"partitions": "0,1"}],
+        [{"partitions": "0,1"}, {"partitions": "2"}],
+    ]
+
+    progress = ExtractionProgress(spark_manager, "orders")
+    assert progress.finished_partitions(plan) == {0, 1, 2}
+
+
+@pytest.mark.parametrize(
+    "window, resumed",
+    [
+        (None, "incremental"),
+        (["2024-01-01T00:00:00", "2024-02-01T00:00:00"], "backfill"),
+        # Another window doesn't resume either plan
+        (["2023-01-01T00:00:00", "2023-02-01T00:00:00"], None),
+    ],
+)
+def test_pending_plan_of_the_same_kind_of_run(plan, spark_manager, window, resumed):
+    incremental = replace(plan, plan_id="incremental")
+    backfill = replace(
+        plan,
+        plan_id="backfill",
+        backfill_window=["2024-01-01T00:00:00", "2024-02-01T00:00:00"],
+    )
+    # Newest first, a backfill was started while an incremental plan was pending
+    spark_manager.spark.sql.return_value.collect.return_value = [
+        {"plan": backfill.to_json()},
+        {"plan": incremental.to_json()},
+    ]
+    progress = ExtractionProgress(spark_manager, "orders")
+
+    pending = progress.pending_plan(window)
+
+    assert (pending and pending.plan_id) == resumed
@@ -0,0 +1,149 @@
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pyarrow as pa
+import pytest
+from pyspark.sql.pandas.types import to_arrow_schema
+from pyspark.sql.types import (
+    ArrayType,
+    BooleanType,
+    DateType,
+    DecimalType,
+    LongType,
+    StringType,
+    StructField,
+    StructType,
+    TimestampType,
+)
+
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs
+from nextdata.core.glue.copy_extractor import (
+    copy_query,
+    copy_select_list,
+    extract_with_copy,
+    read_copy,
+)
+from nextdata.core.glue.partitioning import (
+    PartitionStrategy,
+    SourceColumn,
+    SourceMetadata,
+)
+
+SPARK_SCHEMA = StructType(
+    [
+        StructField("id", LongType()),
+        StructField("title", StringType()),
+        StructField("in_stock", BooleanType()),
+        StructField("created_at", TimestampType()),
+        StructField("published", DateType()),
+        StructField("price", DecimalType(10, 2)),
+    ]
+)
+
+
+def copy_connection(data: bytes, error: Exception = None):
+    """A connection whose COPY writes data to the output file"""
+    connection = MagicMock()
+    cursor = connection.cursor.return_value.__enter__.return_value
+
+    def copy_expert(query, file):
+        file.write(data)
+        if error:
+            raise error
+
+    cursor.copy_expert.side_effect = copy_expert
+    return connection
+
+
+def test_copy_query():
+    source = SourceMetadata(
+        "books",
+        [
+            SourceColumn("id", "bigint"),
+            SourceColumn("created_at", "timestamp with time zone"),
+        ],
+    )
+    assert copy_query(copy_select_list(source), "books", "id < 10") == (
+        "COPY (SELECT id, created_at AT TIME ZONE 'UTC' AS created_at FROM books "
+        "WHERE id < 10) TO STDOUT WITH (FORMAT csv)"
+    )
+
+
+def test_read_copy():
+    data = b'1,"",t,2024-01-01 12:00:00,2024-01-02,1.50\n2,,f,,,\n' * 1000
+    schema = to_arrow_schema(SPARK_SCHEMA)
+    batches = list(read_copy(copy_connection(data), "COPY", schema, block_size=4096))
+
+    table = pa.Table.from_batches(batches)
+    assert len(batches) > 1
+    assert table.schema == schema
+    assert table.num_rows == 2000
+    # Quoted empty strings stay strings, unquoted empty fields are NULL
+    assert table.slice(0, 2).to_pylist() == [
+        {
+            "id": 1,
+            "title": "",
+            "in_stock": True,
+            "created_at": datetime(2024, 1, 1, 12, tzinfo=timezone.utc),
+            "published": date(2024, 1, 2),
+            "price": Decimal("1.50"),
+        },
+        {
+            "id": 2,
+            "title": None,
+            "in_stock": False,
+            "created_at": None,
+            "published": None,
+            "price": None,
+        },
+    ]
+
+
+def test_read_copy_multiline_values():
+    title = "line one\nline two\r\n" + "x" * 100
+    data = f'1,"{title}",t,,,\n'.encode() * 200
+    schema = to_arrow_schema(SPARK_SCHEMA)
+    batches = list(read_copy(copy_connection(data), "COPY", schema, block_size=4096))
+
+    table = pa.Table.from_batches(batches)
+    assert len(batches) > 1
+    assert table.num_rows == 200
+    assert set(table.column("title").to_pylist()) == {title}
+
+
+def test_read_copy_empty_partition():
+    schema = to_arrow_schema(SPARK_SCHEMA)
+    assert list(read_copy(copy_connection(b""), "COPY", schema)) == []
+
+
+def test_read_copy_raises_copy_errors():
+    schema = to_arrow_schema(SPARK_SCHEMA)
+    with pytest.raises(RuntimeError, match="connection lost"):
+        list(
+            read_copy(
+                copy_connection(b"", RuntimeError("connection lost")), "COPY", schema
+            )
+        )
+
+
+def test_extract_with_copy_rejects_unsupported_columns():
+    connection_conf = JDBCGlueJobArgs(
+        protocol="postgresql",
+        host="localhost",
+        port=5432,
+        database="postgres",
+        username="postgres",
+    )
+    schema = StructType([StructField("tags", ArrayType(StringType()))])
+    strategy = PartitionStrategy(type="hash", num_partitions=1, predicates=["1 = 1"])
+    with pytest.raises(ValueError, match="tags"):
+        extract_with_copy(
+            MagicMock(),
+            connection_conf,
+            None,
+            SourceMetadata("books", []),
+            "books",
+            strategy,
+            schema,
+        )
@@ -41,7 +41,22 @@ with patch(
     "pyspark.sql.functions.current_date"
 ) as mock_current_date:
     mock_current_date.return_value = Mock(spec=Column)
-    from nextdata.core.glue.default_etl_script import main
+    from nextdata.core.glue.default_etl_script import main, plan_extraction, run_etl
+    from nextdata.core.glue.dialects import PostgresDialect
+    from nextdata.core.glue.glue_entrypoint import GlueJobArgs
+    from nextdata.core.glue.partitioning import (
+        PartitionStrategy,
+        SourceColumn,
+        SourceMetadata,
+    )
+
+numeric_strategy = PartitionStrategy(
+    type="numeric",
+    num_partitions=10,
+    column="id",
+    lower_bound=1,
+    upper_bound=1001,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -53,17 +68,32 @@ def mock_spark_context():
         SparkContext._active_spark_context = None
 
 
+@patch(
+    "nextdata.core.glue.default_etl_script.get_partition_strategy",
+    return_value=numeric_strategy,
+)
+@patch("nextdata.core.glue.default_etl_script.introspect_source")
+@patch("nextdata.core.glue.default_etl_script.connect_dbapi")
 @patch("argparse.ArgumentParser.parse_args")
-def test_main_dsql_connection(mock_parse_args):
+def test_main_dsql_connection(
+    mock_parse_args,
+    mock_connect_dbapi,
+    mock_introspect_source,
+    mock_get_partition_strategy,
+):
     # Reset mock call counts
     mock_jdbc.reset_mock()
+    mock_df.reset_mock()
     mock_spark_manager.write_to_table.reset_mock()
     mock_dsql_args_class.reset_mock()
     mock_generate_password_func.reset_mock()
+    # No columns declared in etl.py
+    mock_introspect_source.return_value.projection.return_value = None
 
     # Mock DSQL configuration
     mock_dsql_config = MagicMock()
-    mock_dsql_config.protocol = "dsql"
+    # DSQL is Postgres compatible and uses the Postgres driver
+    mock_dsql_config.protocol = "postgresql"
     mock_dsql_config.host = "test-host"
     mock_dsql_config.port = "5439"
     mock_dsql_config.database = "test_db"
@@ -99,12 +129,16 @@ def test_main_dsql_connection(mock_parse_args):
     mock_dsql_args_class.assert_called_once_with(host="test-host")
     mock_generate_password_func.assert_called_once_with(mock_dsql_config.host)
 
+    # Planning runs over a DB-API connection instead of Spark
+    mock_connect_dbapi.assert_called_once_with(mock_dsql_config, "test_password")
+    mock_introspect_source.assert_called_once()
+
     # Get the call arguments without accessing the Java properties
-    assert mock_jdbc.called, "JDBC read was not called"
+    assert mock_jdbc.call_count == 1, "Only the source read should go through JDBC"
     call_args = mock_jdbc.call_args[1]
 
     # Verify the URL and table name
-    assert "jdbc:dsql://" in call_args["url"]
+    assert "jdbc:postgresql://" in call_args["url"]
     assert "test-host" in call_args["url"]
     assert call_args["table"] == "test_table"
 
@@ -113,7 +147,7 @@ def test_main_dsql_connection(mock_parse_args):
     assert isinstance(props, dict)
     assert props["user"] == "test_user"
     assert props["password"] == "test_password"
-    assert props["ssl"] == True
+    assert props["ssl"] == "true"
     assert props["sslmode"] == "require"
 
     # Verify write_to_table was called
@@ -122,12 +156,28 @@ def test_main_dsql_connection(mock_parse_args):
     assert write_args["table_name"] == "test_table"
     assert write_args["mode"] == "overwrite"  # since is_full_load is True
 
+    # The write is the only pass over the source
+    mock_df.count.assert_not_called()
+    mock_df.show.assert_not_called()
+
 
+@patch(
+    "nextdata.core.glue.default_etl_script.get_partition_strategy",
+    return_value=numeric_strategy,
+)
+@patch("nextdata.core.glue.default_etl_script.introspect_source")
+@patch("nextdata.core.glue.default_etl_script.connect_dbapi")
 @patch("argparse.ArgumentParser.parse_args")
-def test_main_jdbc_connection(mock_parse_args):
+def test_main_jdbc_connection(
+    mock_parse_args,
+    mock_connect_dbapi,
+    mock_introspect_source,
+    mock_get_partition_strategy,
+):
     # Reset mock call counts
     mock_jdbc.reset_mock()
     mock_spark_manager.write_to_table.reset_mock()
+    mock_introspect_source.return_value.projection.return_value = None
 
     # Mock JDBC configuration
     mock_jdbc_config = MagicMock()
@@ -183,7 +233,7 @@ def test_main_jdbc_connection(mock_parse_args):
     assert isinstance(props, dict)
     assert props["user"] == "test_user"
     assert props["password"] == "test_pass"
-    assert props["ssl"] == True
+    assert props["ssl"] == "true"
     assert props["sslmode"] == "require"
 
     # Verify write_to_table was called
@@ -214,3 +264,132 @@ def test_main_unsupported_connection(mock_parse_args):
     # Verify that unsupported connection type raises ValueError
     with pytest.raises(ValueError, match="1 validation error"):
         main(spark_manager=mock_spark_manager)
+
+
+@pytest.mark.parametrize(
+    "write_mode, mode, overwrite_filter",
+    [
+        (
+            "append",
+            "overwrite",
+            "created_at >= TIMESTAMP '2024-01-01 00:00:00' "
+            "AND created_at < TIMESTAMP '2024-02-01 00:00:00'",
+        ),
+        ("merge", "merge", None),
+    ],
+)
+@patch(
+    "nextdata.core.glue.default_etl_script.get_partition_strategy",
+    return_value=numeric_strategy,
+)
+def test_backfill_replaces_its_window(_, write_mode, mode, overwrite_filter):
+    job_args = GlueJobArgs(
+        job_name="test_etl",
+        connection_name="test_conn",
+        connection_type="jdbc",
+        connection_properties={},
+        sql_table="books",
+        bucket_arn="arn:aws:s3:::test-bucket",
+        namespace="test",
+        is_full_load=False,
+        incremental_column="created_at",
+        write_mode=write_mode,
+        backfill_from="2024-01-01",
+        backfill_to="2024-02-01",
+    )
+    source = SourceMetadata(
+        "books",
+        [
+            SourceColumn("id", "bigint", is_primary_key=True),
+            SourceColumn("created_at", "timestamp without time zone"),
+        ],
+    )
+
+    plan = plan_extraction(
+        MagicMock(), job_args, MagicMock(), source, PostgresDialect()
+    )
+
+    # Running the backfill again replaces the same rows instead of adding them
+    assert plan.mode == mode
+    assert plan.overwrite_filter == overwrite_filter
+    assert plan.snapshot_properties is None
+
+
+@patch("nextdata.core.glue.default_etl_script.plan_extraction")
+@patch("nextdata.core.glue.default_etl_script.ExtractionProgress")
+@patch("nextdata.core.glue.default_etl_script.introspect_source")
+@patch("nextdata.core.glue.default_etl_script.connect_dbapi")
+def test_backfill_doesnt_resume_a_pending_incremental_plan(
+    _, __, mock_progress, mock_plan_extraction
+):
+    progress = mock_progress.return_value
+    # Only the incremental plan is pending, a backfill has none to resume
+    progress.pending_plan.side_effect = lambda window: (
+        None if window else MagicMock(plan_id="incremental")
+    )
+    job_args = GlueJobArgs(
+        job_name="test_etl",
+        connection_name="test_conn",
+        connection_type="jdbc",
+        connection_properties={
+            "protocol": "postgresql",
+            "host": "test-host",
+            "port": 5432,
+            "database": "test_db",
+            "username": "test_user",
+        },
+        sql_table="books",
+        bucket_arn="arn:aws:s3:::test-bucket",
+        namespace="test",
+        is_full_load=False,
+        incremental_column="created_at",
+        checkpoint_partitions=2,
+        backfill_from="2024-01-01",
+        backfill_to="2024-02-01",
+    )
+
+    run_etl(MagicMock(), job_args)
+
+    progress.pending_plan.assert_called_once_with(
+        ["2024-01-01T00:00:00", "2024-02-01T00:00:00"]
+    )
+    # The backfill is planned and run, the incremental plan stays pending
+    mock_plan_extraction.assert_called_once()
+    progress.start.assert_called_once_with(mock_plan_extraction.return_value)
+    assert progress.run.call_args[0][0] is progress.start.return_value
+
+
+@patch("nextdata.core.glue.default_etl_script.plan_extraction")
+@patch("nextdata.core.glue.default_etl_script.ExtractionProgress")
+@patch("nextdata.core.glue.default_etl_script.introspect_source")
+@patch("nextdata.core.glue.default_etl_script.connect_dbapi")
+def test_restart_extraction_abandons_the_pending_plan(
+    _, __, mock_progress, mock_plan_extraction
+):
+    progress = mock_progress.return_value
+    pending = progress.pending_plan.return_value
+    job_args = GlueJobArgs(
+        job_name="test_etl",
+        connection_name="test_conn",
+        connection_type="jdbc",
+        connection_properties={
+            "protocol": "postgresql",
+            "host": "test-host",
+            "port": 5432,
+            "database": "test_db",
+            "username": "test_user",
+        },
+        sql_table="books",
+        bucket_arn="arn:aws:s3:::test-bucket",
+        namespace="test",
+        is_full_load=False,
+        incremental_column="created_at",
+        checkpoint_partitions=2,
+        restart_extraction="true",
+    )
+
+    run_etl(MagicMock(), job_args)
+
+    progress.abandon.assert_called_once_with(pending)
+    mock_plan_extraction.assert_called_once()
+    assert progress.run.call_args[0][0] is progress.start.return_value
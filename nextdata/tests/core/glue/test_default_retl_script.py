@@ -0,0 +1,136 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs
+from nextdata.core.glue.default_retl_script import push_changes
+from nextdata.core.glue.glue_entrypoint import GlueJobArgs
+from nextdata.core.glue.table_swap import UnswappableTableError
+
+MODULE = "nextdata.core.glue.default_retl_script"
+
+CONNECTION = JDBCGlueJobArgs(
+    protocol="postgresql",
+    host="localhost",
+    port=5432,
+    database="postgres",
+    username="postgres",
+)
+
+
+@pytest.fixture
+def job_args():
+    return GlueJobArgs(
+        job_name="books-retl",
+        connection_name="pg",
+        connection_type="jdbc",
+        connection_properties={},
+        sql_table="books",
+        retl_mode="incremental",
+        max_connections=4,
+        bucket_arn="arn",
+        namespace="test",
+    )
+
+
+@pytest.fixture
+def target():
+    """The target database's primary key and pushed snapshot, and writers"""
+    with patch(f"{MODULE}.connect_dbapi"), patch(
+        f"{MODULE}.primary_key", return_value=["id"]
+    ), patch(f"{MODULE}.pushed_snapshot") as pushed, patch(
+        f"{MODULE}.record_pushed_snapshot"
+    ) as record, patch(
+        f"{MODULE}.write_changes", return_value=3
+    ) as write_changes, patch(
+        f"{MODULE}.write_with_copy", return_value=100
+    ) as write_with_copy:
+        yield MagicMock(
+            pushed=pushed,
+            record=record,
+            write_changes=write_changes,
+            write_with_copy=write_with_copy,
+        )
+
+
+def spark_manager(snapshot_id):
+    manager = MagicMock()
+    manager.current_snapshot_id.return_value = snapshot_id
+    changes = manager.read_changes.return_value.localCheckpoint.return_value
+    changes.isEmpty.return_value = False
+    return manager
+
+
+def test_push_changes_since_the_pushed_snapshot(job_args, target):
+    target.pushed.return_value = 10
+    manager = spark_manager(20)
+
+    assert push_changes(manager, job_args, CONNECTION, None, ["id", "title"]) == 3
+
+    # Only changes to the target's columns are pushed
+    manager.read_changes.assert_called_once_with("books", 10, 20, ["id", "title"])
+    args, kwargs = target.write_changes.call_args
+    assert args[0] is manager.read_changes.return_value.localCheckpoint.return_value
+    assert args[3:] == ("books", ["id"])
+    assert kwargs == {"connections": 4}
+    target.write_with_copy.assert_not_called()
+    target.record.assert_called_once()
+    assert target.record.call_args[0][1:] == ("books", 20)
+
+
+def test_first_push_copies_the_whole_table(job_args, target):
+    target.pushed.return_value = None
+    manager = spark_manager(20)
+
+    assert push_changes(manager, job_args, CONNECTION, None, ["id", "title"]) == 100
+
+    manager.get_table.assert_called_once_with("books", 20)
+    # Swapped in, readers never see the table half pushed
+    assert target.write_with_copy.call_args.kwargs["mode"] == "swap"
+    manager.read_changes.assert_not_called()
+    assert target.record.call_args[0][1:] == ("books", 20)
+
+
+def test_whole_table_is_truncated_and_copied_if_it_cant_be_swapped(job_args, target):
+    target.pushed.return_value = None
+    target.write_with_copy.side_effect = [
+        UnswappableTableError("books can't be swapped"),
+        100,
+    ]
+
+    assert push_changes(spark_manager(20), job_args, CONNECTION, None, ["id"]) == 100
+
+    assert [call.kwargs["mode"] for call in target.write_with_copy.call_args_list] == [
+        "swap",
+        "overwrite",
+    ]
+    assert target.record.call_args[0][1:] == ("books", 20)
+
+
+def test_unreadable_changes_push_the_whole_table(job_args, target):
+    target.pushed.return_value = 10
+    manager = spark_manager(20)
+    manager.read_changes.return_value.localCheckpoint.side_effect = RuntimeError(
+        "Delete files are currently not supported in changelog"
+    )
+
+    assert push_changes(manager, job_args, CONNECTION, None, ["id", "title"]) == 100
+
+    target.write_changes.assert_not_called()
+    assert target.record.call_args[0][1:] == ("books", 20)
+
+
+def test_nothing_to_push(job_args, target):
+    target.pushed.return_value = 20
+
+    assert push_changes(spark_manager(20), job_args, CONNECTION, None, ["id"]) == 0
+
+    target.write_changes.assert_not_called()
+    target.write_with_copy.assert_not_called()
+    target.record.assert_not_called()
+
+
+def test_push_changes_needs_a_primary_key(job_args, target):
+    with patch(f"{MODULE}.primary_key", return_value=[]):
+        with pytest.raises(ValueError, match="primary key on books"):
+            push_changes(spark_manager(20), job_args, CONNECTION, None, ["id"])
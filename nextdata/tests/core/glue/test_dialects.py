@@ -0,0 +1,118 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from nextdata.core.glue.dialects import get_dialect
+
+
+@pytest.mark.parametrize(
+    "protocol, expected",
+    [
+        (
+            "postgresql",
+            "MOD(ABS(hashtext(concat_ws('|', id::text, name::text))::bigint), 4)",
+        ),
+        ("mysql", "MOD(CRC32(CONCAT_WS('|', id, name)), 4)"),
+        ("mariadb", "MOD(CRC32(CONCAT_WS('|', id, name)), 4)"),
+        ("sqlserver", "ABS(CAST(CHECKSUM(id, name) AS BIGINT)) % 4"),
+        ("oracle", "ORA_HASH(id || '|' || name, 3)"),
+        ("db2", "MOD(ABS(HASH4(VARCHAR(id) || '|' || VARCHAR(name))), 4)"),
+    ],
+)
+def test_hash_bucket(protocol, expected):
+    assert get_dialect(protocol).hash_bucket(["id", "name"], 4) == expected
+
+
+def test_hash_predicates():
+    predicates = get_dialect("oracle").hash_predicates(["id"], 3)
+    assert predicates == [
+        "ORA_HASH(id, 2) = 0",
+        "ORA_HASH(id, 2) = 1",
+        "ORA_HASH(id, 2) = 2",
+    ]
+
+
+def test_unsupported_protocol():
+    with pytest.raises(ValueError, match="Unsupported JDBC protocol"):
+        get_dialect("sybase")
+
+
+@pytest.mark.parametrize(
+    "protocol, url",
+    [
+        ("postgresql", "jdbc:postgresql://db:5432/shop"),
+        ("mysql", "jdbc:mysql://db:5432/shop"),
+        ("mariadb", "jdbc:mariadb://db:5432/shop"),
+        ("sqlserver", "jdbc:sqlserver://db:5432;databaseName=shop"),
+        ("oracle", "jdbc:oracle:thin:@//db:5432/shop"),
+        ("db2", "jdbc:db2://db:5432/shop"),
+    ],
+)
+def test_jdbc_url(protocol, url):
+    assert get_dialect(protocol).jdbc_url("db", 5432, "shop") == url
+
+
+def test_jdbc_properties():
+    postgres = get_dialect("postgresql").jdbc_properties()
+    assert postgres["driver"] == "org.postgresql.Driver"
+    assert postgres["fetchsize"] == "10000"
+    assert postgres["sslmode"] == "require"
+
+    # Connector/J only streams rows with a server-side cursor
+    mysql = get_dialect("mysql").jdbc_properties()
+    assert mysql["useCursorFetch"] == "true"
+    assert mysql["sslMode"] == "REQUIRED"
+    assert "useCursorFetch" not in get_dialect("mariadb").jdbc_properties()
+
+    assert "encrypt" not in get_dialect("sqlserver").jdbc_properties("disable")
+    assert get_dialect("oracle").jdbc_properties() == {
+        "driver": "oracle.jdbc.OracleDriver",
+        "fetchsize": "10000",
+    }
+
+
+def test_missing_dbapi_driver():
+    with patch("importlib.import_module", side_effect=ImportError):
+        with pytest.raises(ImportError, match="needs the ibm_db package"):
+            get_dialect("db2").connect("db", 50000, "shop", "user", "secret")
+
+
+def test_timestamp_literal():
+    value = datetime(2024, 3, 1, 12, 30, 5, 123, tzinfo=timezone.utc)
+    assert get_dialect("postgresql").timestamp_literal(value) == (
+        "TIMESTAMP '2024-03-01 12:30:05'"
+    )
+    assert get_dialect("sqlserver").timestamp_literal(value) == (
+        "CAST('2024-03-01 12:30:05' AS DATETIME2)"
+    )
+
+
+def test_subquery_alias():
+    assert get_dialect("mysql").subquery("SELECT 1", "src") == "(SELECT 1) AS src"
+    assert get_dialect("oracle").subquery("SELECT 1", "src") == "(SELECT 1) src"
+
+
+@pytest.mark.parametrize("protocol", ["mysql", "sqlserver", "oracle", "db2"])
+def test_catalog_queries_embed_literals(protocol):
+    dialect = get_dialect(protocol)
+    for query in (
+        dialect.introspection_query("o'brien"),
+        dialect.row_estimate_query("o'brien"),
+        dialect.histogram_query("o'brien", "id"),
+    ):
+        assert "'o''brien'" in query
+        assert "%(" not in query
+
+
+def test_mysql_filtered_row_estimate():
+    connection = MagicMock()
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.description = [("id",), ("rows",), ("filtered",)]
+    cursor.fetchone.return_value = (1, 2000, 25.0)
+
+    estimate = get_dialect("mysql").filtered_row_estimate(
+        connection, "books", "id > 10"
+    )
+    assert estimate == 500
+    assert cursor.execute.call_args[0][0] == "EXPLAIN SELECT 1 FROM books WHERE id > 10"
@@ -0,0 +1,140 @@
+from unittest.mock import patch
+
+import pytest
+
+from nextdata.core.glue.expectations import (
+    DataQualityError,
+    Expectation,
+    ExpectationSuite,
+)
+
+
+@pytest.mark.parametrize(
+    "value, error",
+    [
+        ({"check": "not_null"}, "needs a column"),
+        ({"check": "range", "column": "price"}, "needs min or max"),
+        ({"check": "row_count_change"}, "needs max_decrease or max_increase"),
+        ({"check": "sorted", "column": "id"}, "Unknown check"),
+        ({"check": "unique", "column": "id", "severity": "fatal"}, "Unknown severity"),
+        ({"check": "unique", "column": "id", "threshold": 1}, "Unknown expectation"),
+    ],
+)
+def test_invalid_expectations(value, error):
+    with pytest.raises(ValueError, match=error):
+        Expectation.from_dict(value)
+
+
+@patch("nextdata.core.glue.expectations.F")
+def test_metrics_are_named_by_check(mock_functions):
+    suite = ExpectationSuite.from_dicts(
+        [
+            {"check": "not_null", "column": "id"},
+            {"check": "unique", "column": "id"},
+            {"check": "row_count_change", "max_decrease": 0.5},
+            {"check": "not_null", "column": "title"},
+            {"check": "unique", "column": "isbn", "severity": "warn"},
+        ]
+    )
+    assert list(suite.metrics()) == [
+        "check_0_nulls",
+        "check_3_nulls",
+        "check_4_values",
+        "check_4_distinct",
+    ]
+    # Only warnings may use the estimate, errors count distinct values exactly
+    assert list(suite.staged_metrics()) == ["check_1_values", "check_1_distinct"]
+
+
+def test_audit_passes_clean_load():
+    suite = ExpectationSuite.from_dicts(
+        [
+            {"check": "not_null", "column": "id"},
+            {"check": "unique", "column": "id"},
+            {"check": "range", "column": "price", "min": 0, "max": 100},
+            {"check": "row_count_change", "max_decrease": 0.5},
+        ],
+        previous_rows=900,
+    )
+    suite.audit(
+        {
+            "rows": 1000,
+            "check_0_nulls": 0,
+            "check_1_values": 1000,
+            "check_1_distinct": 1000,
+            "check_2_out_of_range": 0,
+        }
+    )
+    assert all(result.passed for result in suite.results)
+    assert suite.results[3].observed == pytest.approx(1000 / 900 - 1)
+
+
+def test_audit_raises_on_hard_failures_only():
+    suite = ExpectationSuite.from_dicts(
+        [
+            {"check": "not_null", "column": "id"},
+            {"check": "unique", "column": "id", "severity": "warn"},
+            {"check": "row_count_change", "max_decrease": 0.5},
+        ],
+        previous_rows=1000,
+    )
+    with pytest.raises(DataQualityError) as error:
+        suite.audit(
+            {
+                "rows": 400,
+                "check_0_nulls": 2,
+                "check_1_values": 398,
+                "check_1_distinct": 390,
+            }
+        )
+    assert [failure.check for failure in error.value.failures] == [
+        "not_null",
+        "row_count_change",
+    ]
+    # The warning is recorded with the failures
+    assert [result.passed for result in suite.results] == [False, False, False]
+    assert suite.results[1].observed == 8
+
+
+@pytest.mark.parametrize(
+    "distinct, passed",
+    [
+        # approx_count_distinct can over- and underestimate
+        (1000100, True),
+        (999000, True),
+        (980000, False),
+    ],
+)
+def test_unique_warning_allows_for_the_estimate_error(distinct, passed):
+    suite = ExpectationSuite.from_dicts(
+        [{"check": "unique", "column": "id", "severity": "warn"}]
+    )
+    suite.audit(
+        {
+            "rows": 1000000,
+            "check_0_values": 1000000,
+            "check_0_distinct": distinct,
+        }
+    )
+    assert suite.results[0].passed == passed
+
+
+def test_unique_error_fails_on_any_duplicate():
+    suite = ExpectationSuite.from_dicts([{"check": "unique", "column": "id"}])
+    with pytest.raises(DataQualityError, match="1 duplicate values of id"):
+        suite.audit(
+            {
+                "rows": 1000000,
+                "check_0_values": 1000000,
+                "check_0_distinct": 999999,
+            }
+        )
+
+
+def test_row_count_change_without_previous_load():
+    suite = ExpectationSuite.from_dicts(
+        [{"check": "row_count_change", "max_increase": 0.1}]
+    )
+    suite.audit({"rows": 10})
+    assert suite.results[0].passed
+    assert suite.results[0].observed is None
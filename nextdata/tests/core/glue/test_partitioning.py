@@ -0,0 +1,378 @@
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+
+from nextdata.core.glue.dialects import get_dialect
+from nextdata.core.glue.partitioning import (
+    PartitionStrategy,
+    combine_filters,
+    get_partition_strategy,
+    introspect_source,
+    is_skewed,
+    num_partitions_for,
+    parse_pg_array,
+    quantiles_from_histogram,
+    range_predicates,
+    source_subquery,
+    time_boundaries,
+)
+
+
+def mock_connection(*results):
+    """A DB-API connection whose cursor returns each result in turn"""
+    connection = MagicMock()
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchall.side_effect = [r for r in results if isinstance(r, list)]
+    cursor.fetchone.side_effect = [r for r in results if isinstance(r, tuple)]
+    return connection, cursor
+
+
+def explain(rows):
+    return ([{"Plan": {"Plan Rows": rows, "Plan Width": 4}}],)
+
+
+# 50M rows of 56 bytes each
+INTROSPECTION_ROWS = [
+    ("id", "bigint", True, "{1,12500000,25000000,37500000,50000000}", 8, 5e7),
+    ("name", "text", False, None, 40, 5e7),
+    ("created_at", "timestamp without time zone", False, None, 8, 5e7),
+]
+
+
+def test_parse_pg_array():
+    assert parse_pg_array("{1,2,3}") == ["1", "2", "3"]
+    assert parse_pg_array('{"a,b",c}') == ["a,b", "c"]
+    assert parse_pg_array("{}") is None
+    assert parse_pg_array(None) is None
+
+
+def test_introspect_source_single_round_trip():
+    connection, cursor = mock_connection(INTROSPECTION_ROWS)
+    source = introspect_source(connection, "books")
+
+    assert cursor.execute.call_count == 1
+    assert source.column_types == {
+        "id": "bigint",
+        "name": "text",
+        "created_at": "timestamp without time zone",
+    }
+    assert [c.name for c in source.primary_key] == ["id"]
+    assert source.row_estimate == 50000000
+    assert source.row_width == 56
+    assert "introspect" in source.timings
+
+
+def test_introspect_source_missing_table():
+    connection, _ = mock_connection([])
+    with pytest.raises(ValueError, match="not found"):
+        introspect_source(connection, "missing")
+
+
+def test_numeric_strategy_from_statistics():
+    connection, cursor = mock_connection(INTROSPECTION_ROWS)
+    source = introspect_source(connection, "books")
+    strategy = get_partition_strategy(connection, source)
+
+    # Bounds and sizes come from pg_stats, so planning is a single query
+    assert cursor.execute.call_count == 1
+    assert strategy.type == "numeric"
+    assert strategy.column == "id"
+    assert strategy.lower_bound == 1
+    assert strategy.upper_bound == 50000001
+    # 50M rows * 56 bytes in 128MiB partitions
+    assert strategy.num_partitions == 21
+
+
+def test_numeric_strategy_without_statistics():
+    rows = [
+        (name, dtype, pk, None, None, -1.0)
+        for name, dtype, pk, _, _, _ in INTROSPECTION_ROWS
+    ]
+    connection, cursor = mock_connection(rows, explain(5000000), (5, 5000000, None))
+    source = introspect_source(connection, "books")
+    strategy = get_partition_strategy(connection, source)
+
+    queries = [c[0][0] for c in cursor.execute.call_args_list]
+    assert len(queries) == 3
+    assert queries[1].startswith("EXPLAIN")
+    assert not any("COUNT(*)" in query for query in queries)
+    assert strategy.lower_bound == 5
+    assert strategy.upper_bound == 5000001
+    # No row widths, so fall back to 100k rows per partition
+    assert strategy.num_partitions == 50
+    assert "bounds" in source.timings
+    assert "estimate" in source.timings
+
+
+def test_filtered_read_uses_bounds_query():
+    connection, cursor = mock_connection(
+        INTROSPECTION_ROWS,
+        explain(100),
+        (900000, 1000000, list(range(900000, 1000001, 1000))),
+    )
+    source = introspect_source(connection, "books")
+    strategy = get_partition_strategy(
+        connection, source, "created_at", "created_at > '2024-01-01'"
+    )
+
+    explain_query, bounds_query = [c[0][0] for c in cursor.execute.call_args_list[1:]]
+    assert explain_query.endswith("WHERE created_at > '2024-01-01'")
+    assert "WHERE created_at > '2024-01-01'" in bounds_query
+    assert strategy.lower_bound == 900000
+    assert strategy.upper_bound == 1000001
+    assert strategy.num_partitions == 1
+
+
+def test_range_predicates_cover_all_rows():
+    assert range_predicates("id", [10, 20]) == [
+        "id < 10 OR id IS NULL",
+        "id >= 10 AND id < 20",
+        "id >= 20",
+    ]
+
+
+def test_skew_check():
+    uniform = [Decimal(i) for i in range(0, 101)]
+    assert not is_skewed(uniform, 10)
+    # Half the rows sit in the bottom 1% of the id space
+    clustered = [Decimal(i) / 100 for i in range(0, 51)] + [
+        Decimal(i * 20) for i in range(3, 53)
+    ]
+    assert is_skewed(clustered, 10)
+
+
+def test_quantile_strategy_on_skewed_statistics():
+    # Dense ids at the start of the range, then sparse ids up to 10M
+    histogram = [str(i) for i in range(0, 1000, 20)] + [
+        str(i) for i in range(200000, 10000001, 200000)
+    ]
+    # 1342 byte rows put ~100k rows in each 128MiB partition
+    rows = [
+        ("id", "bigint", True, "{" + ",".join(histogram) + "}", 8, 2e6),
+        ("name", "text", False, None, 1334, 2e6),
+    ]
+    connection, cursor = mock_connection(rows)
+    source = introspect_source(connection, "books")
+    strategy = get_partition_strategy(connection, source)
+
+    assert cursor.execute.call_count == 1
+    assert strategy.type == "quantile"
+    assert strategy.column == "id"
+    assert strategy.num_partitions == len(strategy.predicates) == 20
+    assert strategy.predicates[0] == "id < 100 OR id IS NULL"
+    assert strategy.predicates[-1].startswith("id >= ")
+
+
+def test_quantiles_computed_with_bounds_for_filtered_reads():
+    quantiles = [1] * 90 + list(range(2, 13))
+    connection, cursor = mock_connection(
+        INTROSPECTION_ROWS, explain(2000000), (1, 1000000, quantiles)
+    )
+    source = introspect_source(connection, "books")
+    strategy = get_partition_strategy(
+        connection, source, "id", "id > 0", target_partition_bytes=56 * 100000
+    )
+
+    bounds_query = cursor.execute.call_args[0][0]
+    assert "percentile_disc" in bounds_query
+    assert "TABLESAMPLE" not in bounds_query
+    assert strategy.type == "quantile"
+    assert strategy.num_partitions <= 20
+
+
+def test_hash_strategy_for_non_numeric_key():
+    rows = [
+        ("isbn", "text", True, None, 20, 3e7),
+        ("title", "text", False, None, 80, 3e7),
+    ]
+    connection, cursor = mock_connection(rows)
+    source = introspect_source(connection, "books")
+    strategy = get_partition_strategy(connection, source, dialect=get_dialect("mysql"))
+
+    assert cursor.execute.call_count == 1
+    assert strategy.type == "hash"
+    # Partition count follows the estimated size instead of a fixed 10
+    assert strategy.num_partitions == len(strategy.predicates) == 23
+    assert strategy.predicates[0] == "MOD(CRC32(CONCAT_WS('|', isbn)), 23) = 0"
+
+
+def test_time_strategy_for_timestamp_incremental_column():
+    rows = [
+        ("isbn", "text", True, None, 20, 3e7),
+        ("title", "text", False, None, 80, 3e7),
+        ("created_at", "timestamp with time zone", False, None, 8, 3e7),
+    ]
+    connection, cursor = mock_connection(
+        rows, (datetime(2024, 1, 1, 5), datetime(2024, 3, 1, 12))
+    )
+    source = introspect_source(connection, "books")
+    strategy = get_partition_strategy(connection, source, "created_at")
+
+    assert "MIN(created_at), MAX(created_at)" in cursor.execute.call_args[0][0]
+    assert strategy.type == "time"
+    assert strategy.num_partitions == len(strategy.predicates) <= 25
+    # Ranges start at midnight and span whole days
+    assert strategy.predicates[0] == (
+        "created_at < TIMESTAMP '2024-01-04 00:00:00' OR created_at IS NULL"
+    )
+    assert strategy.predicates[-1].startswith("created_at >= TIMESTAMP '2024-03-")
+
+
+def test_time_boundaries_use_hours_for_short_ranges():
+    granularity, boundaries = time_boundaries(
+        datetime(2024, 1, 1, 10, 30), datetime(2024, 1, 1, 13, 10), 10
+    )
+
+    assert granularity == "hour"
+    assert boundaries == [datetime(2024, 1, 1, hour) for hour in (11, 12, 13)]
+
+
+def test_backfill_window_split_per_day():
+    connection, cursor = mock_connection(INTROSPECTION_ROWS, explain(300000))
+    source = introspect_source(connection, "books")
+    strategy = get_partition_strategy(
+        connection,
+        source,
+        "created_at",
+        "created_at >= TIMESTAMP '2024-01-01 00:00:00'",
+        time_range=(datetime(2024, 1, 1), datetime(2024, 1, 4)),
+        granularity="day",
+    )
+
+    # The window replaces the numeric key and its bounds query
+    assert cursor.execute.call_count == 2
+    assert strategy.type == "time"
+    assert strategy.predicates == [
+        "created_at < TIMESTAMP '2024-01-02 00:00:00' OR created_at IS NULL",
+        "created_at >= TIMESTAMP '2024-01-02 00:00:00' "
+        "AND created_at < TIMESTAMP '2024-01-03 00:00:00'",
+        "created_at >= TIMESTAMP '2024-01-03 00:00:00'",
+    ]
+
+
+def test_time_range_needs_temporal_column():
+    connection, _ = mock_connection(INTROSPECTION_ROWS)
+    source = introspect_source(connection, "books")
+    with pytest.raises(ValueError, match="date or timestamp"):
+        get_partition_strategy(
+            connection, source, "name", time_range=(date(2024, 1, 1), date(2024, 2, 1))
+        )
+
+
+def test_num_partitions_for():
+    mib = 1024 * 1024
+    assert num_partitions_for(1000, 100, target_partition_bytes=mib) == 1
+    assert num_partitions_for(10**6, 1000, target_partition_bytes=100 * mib) == 10
+    # The cap defaults to 100 but can be raised
+    assert num_partitions_for(10**9, 1000) == 100
+    assert num_partitions_for(10**9, 1000, max_partitions=500) == 500
+    # Without row widths, fall back to a fixed number of rows per partition
+    assert num_partitions_for(10**6, None) == 10
+
+
+def test_numeric_strategy_to_predicates():
+    strategy = PartitionStrategy(
+        type="numeric", column="id", lower_bound=1, upper_bound=101, num_partitions=4
+    )
+    # Same strides as Spark's JDBC reader, with open-ended first and last ranges
+    assert strategy.to_predicates() == [
+        "id < 26 OR id IS NULL",
+        "id >= 26 AND id < 51",
+        "id >= 51 AND id < 76",
+        "id >= 76",
+    ]
+
+
+def test_source_subquery():
+    assert source_subquery("books") == "books"
+    assert (
+        source_subquery("books", ["id", "title"], combine_filters("lang = 'en'", None))
+        == "(SELECT id, title FROM books WHERE (lang = 'en')) AS src"
+    )
+    assert combine_filters("a = 1", "b > 2") == "(a = 1) AND (b > 2)"
+    assert combine_filters(None, None) is None
+
+
+def test_projection_sizes_partitions_by_selected_columns():
+    connection, _ = mock_connection(INTROSPECTION_ROWS)
+    source = introspect_source(connection, "books")
+
+    # The primary key is always selected so partition predicates can use it
+    columns = source.projection(["created_at"])
+    assert columns == ["created_at", "id"]
+    assert source.projection(None) is None
+    with pytest.raises(ValueError, match="blurb"):
+        source.projection(["blurb"])
+
+    # 50M rows of 16 projected bytes rather than 56
+    strategy = get_partition_strategy(connection, source, columns=columns)
+    assert strategy.num_partitions == 6
+
+
+def test_quantiles_from_histogram():
+    # Cumulative row counts, as Oracle, DB2 and SQL Server report them
+    histogram = [(1, 10), (100, 20), (1000, 90), (5000, 100)]
+    assert quantiles_from_histogram(histogram, resolution=4) == [
+        Decimal(1),
+        Decimal(1000),
+        Decimal(1000),
+        Decimal(1000),
+        Decimal(5000),
+    ]
+    # Cumulative fractions, as MySQL reports them
+    assert quantiles_from_histogram([("5", "0.5"), ("9", "1.0")], resolution=2) == [
+        Decimal(5),
+        Decimal(5),
+        Decimal(9),
+    ]
+    assert quantiles_from_histogram([(1, 10)]) is None
+
+
+def test_mysql_plan_from_catalog_statistics():
+    rows = [
+        ("id", "INT", 1, None, None, None),
+        ("title", "VARCHAR", 0, None, None, None),
+    ]
+    # Skewed: most rows have ids at the low end
+    histogram = [(str(i), str(i / 100)) for i in range(1, 91)] + [
+        (str(10**6 * i), str(0.9 + i / 100)) for i in range(1, 11)
+    ]
+    connection, cursor = mock_connection(rows, (2 * 10**7, 100), histogram)
+    cursor.fetchall.side_effect = [rows, histogram]
+    dialect = get_dialect("mysql")
+
+    source = introspect_source(connection, "books", dialect)
+    assert source.row_estimate == 2 * 10**7
+    assert source.row_width == 100
+    assert source.row_width_for(["title"]) == 50
+
+    strategy = get_partition_strategy(connection, source, dialect=dialect)
+    # Columns, table statistics and the histogram, the table is never read
+    assert cursor.execute.call_count == 3
+    assert "COLUMN_STATISTICS" in cursor.execute.call_args[0][0]
+    assert strategy.type == "quantile"
+    assert strategy.num_partitions > 1
+
+
+def test_oracle_plan_without_statistics():
+    rows = [("ID", "NUMBER", 1, None, None, None)]
+    connection, cursor = mock_connection(rows, (None, None), (1, 1000, None))
+    dialect = get_dialect("oracle")
+
+    source = introspect_source(connection, "books", dialect)
+    strategy = get_partition_strategy(
+        connection, source, source_filter="ID > 0", dialect=dialect, max_partitions=8
+    )
+
+    # No estimate at all, so the read is spread over max_partitions
+    assert cursor.execute.call_args[0][0] == (
+        "SELECT MIN(ID), MAX(ID), NULL FROM books WHERE ID > 0"
+    )
+    assert strategy.type == "numeric"
+    assert strategy.num_partitions == 8
+    assert (
+        source_subquery("books", ["ID"], "ID > 0", dialect)
+        == "(SELECT ID FROM books WHERE ID > 0) src"
+    )
@@ -0,0 +1,189 @@
+from datetime import date
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pyarrow as pa
+import pytest
+from pyspark.sql.types import (
+    LongType,
+    MapType,
+    StringType,
+    StructField,
+    StructType,
+)
+
+from nextdata.core.glue.connections.jdbc import JDBCGlueJobArgs
+from nextdata.core.glue.reverse_etl import (
+    CHANGES_TABLE,
+    change_statements,
+    copy_statement,
+    primary_key,
+    pushed_snapshot,
+    record_pushed_snapshot,
+    write_copy,
+    write_with_copy,
+)
+
+BOOKS = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("title", pa.string()),
+        ("price", pa.decimal128(10, 2)),
+        ("published", pa.date32()),
+    ]
+)
+
+
+@pytest.fixture
+def connection(postgres_dsn):
+    import psycopg2
+
+    connection = psycopg2.connect(postgres_dsn)
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS retl_books")
+        cursor.execute(
+            "CREATE TABLE retl_books (id bigint PRIMARY KEY, title text, "
+            "price numeric(10, 2), published date)"
+        )
+    connection.commit()
+    yield connection
+    connection.rollback()
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE retl_books")
+        cursor.execute("DROP TABLE IF EXISTS nextdata_retl_state")
+    connection.commit()
+    connection.close()
+
+
+def rows(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT * FROM retl_books ORDER BY id")
+        return cursor.fetchall()
+
+
+def test_copy_statement():
+    assert copy_statement("public.books", ["id", "title"]) == (
+        "COPY public.books (id, title) FROM STDIN WITH (FORMAT csv)"
+    )
+
+
+def test_write_copy(connection):
+    batches = [
+        pa.record_batch(
+            [
+                [1, 2],
+                ["Dune", ""],
+                [Decimal("9.99"), None],
+                [date(1965, 8, 1), None],
+            ],
+            schema=BOOKS,
+        ),
+        pa.record_batch(
+            [[3], [None], [Decimal("1.50")], [date(1815, 12, 23)]], schema=BOOKS
+        ),
+    ]
+    statement = copy_statement("retl_books", BOOKS.names)
+    assert write_copy(connection, statement, iter(batches)) == 3
+    # Empty strings and nulls stay apart
+    assert rows(connection) == [
+        (1, "Dune", Decimal("9.99"), date(1965, 8, 1)),
+        (2, "", None, None),
+        (3, None, Decimal("1.50"), date(1815, 12, 23)),
+    ]
+
+
+def test_write_copy_rolls_back_when_reading_fails(connection):
+    def batches():
+        yield pa.record_batch([[1], ["Dune"], [None], [None]], schema=BOOKS)
+        raise RuntimeError("executor lost")
+
+    statement = copy_statement("retl_books", BOOKS.names)
+    with pytest.raises(RuntimeError, match="executor lost"):
+        write_copy(connection, statement, batches())
+    assert rows(connection) == []
+
+
+def test_write_copy_raises_copy_errors(connection):
+    batch = pa.record_batch([["not a number"]], names=["id"])
+    with pytest.raises(Exception, match="invalid input syntax"):
+        write_copy(connection, copy_statement("retl_books", ["id"]), iter([batch]))
+    assert rows(connection) == []
+
+
+@pytest.mark.parametrize(
+    "protocol, schema, error",
+    [
+        (
+            "mysql",
+            StructType([StructField("id", LongType())]),
+            "not supported for protocol mysql",
+        ),
+        (
+            "postgresql",
+            StructType(
+                [
+                    StructField("id", LongType()),
+                    StructField("tags", MapType(StringType(), StringType())),
+                ]
+            ),
+            "tags",
+        ),
+    ],
+)
+def test_write_with_copy_rejects(protocol, schema, error):
+    connection_conf = JDBCGlueJobArgs(
+        protocol=protocol,
+        host="localhost",
+        port=5432,
+        database="postgres",
+        username="postgres",
+    )
+    df = MagicMock()
+    df.schema = schema
+    with pytest.raises(ValueError, match=error):
+        write_with_copy(df, connection_conf, None, "books")
+    df.mapInArrow.assert_not_called()
+
+
+def test_write_copy_applies_changes(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO retl_books VALUES (1, 'Dune', 9.99, NULL), "
+            "(2, 'Emma', 5, NULL), (3, 'Ulysses', 7, NULL)"
+        )
+    connection.commit()
+    # Updates 2, deletes 3 and inserts 4
+    changes = pa.record_batch(
+        [
+            [2, 3, 4],
+            ["Emma!", None, "Beloved"],
+            [Decimal("6.00"), None, Decimal("8.00")],
+            [None, None, date(1987, 9, 2)],
+            ["INSERT", "DELETE", "INSERT"],
+        ],
+        schema=BOOKS.append(pa.field("_change_type", pa.string())),
+    )
+    before, after = change_statements("retl_books", BOOKS.names, ["id"])
+    statement = copy_statement(CHANGES_TABLE, changes.schema.names)
+
+    for _ in range(2):
+        # Applying the same changes again changes nothing
+        assert write_copy(connection, statement, iter([changes]), before, after) == 3
+        assert rows(connection) == [
+            (1, "Dune", Decimal("9.99"), None),
+            (2, "Emma!", Decimal("6.00"), None),
+            (4, "Beloved", Decimal("8.00"), date(1987, 9, 2)),
+        ]
+
+
+def test_change_statements_for_key_only_tables():
+    _, after = change_statements("tags", ["tag"], ["tag"])
+    assert after[1].strip().endswith("ON CONFLICT (tag) DO NOTHING")
+
+
+def test_pushed_snapshots(connection):
+    assert primary_key(connection, "retl_books") == ["id"]
+    assert pushed_snapshot(connection, "retl_books") is None
+    record_pushed_snapshot(connection, "retl_books", 10)
+    record_pushed_snapshot(connection, "retl_books", 20)
+    assert pushed_snapshot(connection, "retl_books") == 20
@@ -0,0 +1,261 @@
+import pytest
+
+from nextdata.core.glue.table_swap import (
+    UnswappableTableError,
+    abort_swap,
+    finish_swap,
+    prepare_swap,
+    suffixed,
+)
+
+
+@pytest.fixture
+def connection(postgres_dsn):
+    import psycopg2
+
+    connection = psycopg2.connect(postgres_dsn)
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS swap_books, swap_authors CASCADE")
+        cursor.execute("DROP VIEW IF EXISTS swap_titles")
+        cursor.execute("CREATE TABLE swap_authors (id bigint PRIMARY KEY)")
+        cursor.execute("INSERT INTO swap_authors VALUES (1), (2)")
+        cursor.execute(
+            """
+            CREATE TABLE swap_books (
+                id serial PRIMARY KEY,
+                isbn text UNIQUE,
+                title text NOT NULL CHECK (title <> ''),
+                author_id bigint REFERENCES swap_authors (id),
+                price numeric(10, 2) DEFAULT 0
+            )
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX swap_books_cheap ON swap_books (price) WHERE price < 10"
+        )
+        cursor.execute("GRANT SELECT ON swap_books TO PUBLIC")
+        cursor.execute(
+            "INSERT INTO swap_books (isbn, title, author_id) "
+            "VALUES ('a', 'Dune', 1), ('b', 'Emma', 2)"
+        )
+    connection.commit()
+    yield connection
+    connection.rollback()
+    with connection.cursor() as cursor:
+        cursor.execute("DROP VIEW IF EXISTS swap_titles")
+        cursor.execute("DROP PUBLICATION IF EXISTS swap_books_publication")
+        cursor.execute("DROP TABLE IF EXISTS swap_books, swap_authors CASCADE")
+        cursor.execute(
+            "DROP TABLE IF EXISTS swap_books__nd_staging, swap_books__nd_old"
+        )
+        cursor.execute("DROP FUNCTION IF EXISTS swap_books_touch")
+        cursor.execute("DROP ROLE IF EXISTS swap_books_owner")
+    connection.commit()
+    connection.close()
+
+
+def query(connection, sql, *args):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, args)
+        return cursor.fetchall()
+
+
+def indexes(connection):
+    return query(
+        connection,
+        """
+        SELECT indexname, replace(indexdef, 'swap_books__nd_staging', 'swap_books')
+        FROM pg_indexes WHERE tablename = 'swap_books' ORDER BY indexname
+        """,
+    )
+
+
+def test_swap(connection):
+    before = indexes(connection)
+    swap = prepare_swap(connection, "swap_books")
+    # The staging table has the target's columns, but no indexes yet
+    assert query(
+        connection,
+        "SELECT count(*) FROM pg_indexes WHERE tablename = %s",
+        swap.staging_name,
+    ) == [(0,)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {swap.staging} (id, isbn, title, author_id, price) "
+            "VALUES (10, 'c', 'Emma', 2, 5), (11, 'd', 'Ulysses', 1, 20)"
+        )
+    connection.commit()
+    # Readers still see the old rows
+    assert query(connection, "SELECT title FROM swap_books ORDER BY id") == [
+        ("Dune",),
+        ("Emma",),
+    ]
+    connection.commit()
+
+    finish_swap(connection, swap)
+
+    assert query(connection, "SELECT id, title FROM swap_books ORDER BY id") == [
+        (10, "Emma"),
+        (11, "Ulysses"),
+    ]
+    assert indexes(connection) == before
+    constraints = query(
+        connection,
+        "SELECT conname, contype FROM pg_constraint "
+        "WHERE conrelid = 'swap_books'::regclass ORDER BY conname",
+    )
+    assert [name for name, _ in constraints] == [
+        "swap_books_author_id_fkey",
+        "swap_books_isbn_key",
+        "swap_books_pkey",
+        "swap_books_title_check",
+    ]
+    assert query(
+        connection,
+        "SELECT has_table_privilege('public', 'swap_books', 'SELECT')",
+    ) == [(True,)]
+    # The serial column's sequence moved over with the table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO swap_books (isbn, title) VALUES ('e', 'Beloved') "
+            "RETURNING id"
+        )
+        assert cursor.fetchone() == (3,)
+        with pytest.raises(Exception, match="check constraint"):
+            cursor.execute("INSERT INTO swap_books (title) VALUES ('')")
+    connection.rollback()
+    assert query(
+        connection,
+        "SELECT to_regclass(%s), to_regclass(%s)",
+        "swap_books__nd_staging",
+        "swap_books__nd_old",
+    ) == [(None, None)]
+
+
+def test_failed_swap_keeps_the_target(connection):
+    swap = prepare_swap(connection, "swap_books")
+    with connection.cursor() as cursor:
+        # Breaks the primary key, so building it fails
+        cursor.execute(
+            f"INSERT INTO {swap.staging} (id, title) VALUES (1, 'a'), (1, 'b')"
+        )
+    connection.commit()
+    with pytest.raises(Exception, match="could not create unique index"):
+        finish_swap(connection, swap)
+    abort_swap(connection, swap)
+    assert query(connection, "SELECT count(*) FROM swap_books") == [(2,)]
+    assert indexes(connection)[0][0] == "swap_books_cheap"
+    assert query(connection, "SELECT to_regclass(%s)", swap.staging_name) == [(None,)]
+
+
+def test_prepare_swap_drops_stale_tables(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE swap_books__nd_staging (id int)")
+        cursor.execute("CREATE TABLE swap_books__nd_old (id int)")
+    connection.commit()
+    swap = prepare_swap(connection, "swap_books")
+    assert query(connection, "SELECT to_regclass('swap_books__nd_old')") == [(None,)]
+    # The stale staging table was replaced by one shaped like the target
+    assert query(
+        connection,
+        "SELECT count(*) FROM information_schema.columns WHERE table_name = %s",
+        swap.staging_name,
+    ) == [(5,)]
+    abort_swap(connection, swap)
+
+
+def test_prepare_swap_rejects_dependent_views(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE VIEW swap_titles AS SELECT title FROM swap_books")
+    connection.commit()
+    with pytest.raises(ValueError, match="swap_titles"):
+        prepare_swap(connection, "swap_books")
+
+
+@pytest.mark.parametrize(
+    "statement, error",
+    [
+        (
+            "CREATE TRIGGER swap_books_touched BEFORE UPDATE ON swap_books "
+            "FOR EACH ROW EXECUTE FUNCTION swap_books_touch()",
+            "swap_books_touched",
+        ),
+        (
+            "CREATE PUBLICATION swap_books_publication FOR TABLE swap_books",
+            "swap_books_publication",
+        ),
+    ],
+)
+def test_prepare_swap_rejects_triggers_and_publications(connection, statement, error):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE FUNCTION swap_books_touch() RETURNS trigger "
+            "LANGUAGE plpgsql AS 'BEGIN RETURN NEW; END'"
+        )
+        cursor.execute(statement)
+    connection.commit()
+    with pytest.raises(UnswappableTableError, match=error):
+        prepare_swap(connection, "swap_books")
+
+
+def test_swap_keeps_row_security_replica_identity_and_owner(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE ROLE swap_books_owner")
+        cursor.execute(
+            "CREATE POLICY cheap ON swap_books AS RESTRICTIVE FOR SELECT "
+            "TO PUBLIC USING (price < 10)"
+        )
+        cursor.execute("ALTER TABLE swap_books ENABLE ROW LEVEL SECURITY")
+        cursor.execute("ALTER TABLE swap_books FORCE ROW LEVEL SECURITY")
+        cursor.execute("ALTER TABLE swap_books ALTER COLUMN isbn SET NOT NULL")
+        cursor.execute(
+            "ALTER TABLE swap_books REPLICA IDENTITY USING INDEX swap_books_isbn_key"
+        )
+        # Someone other than the user the job connects as
+        cursor.execute("ALTER TABLE swap_books OWNER TO swap_books_owner")
+    connection.commit()
+
+    finish_swap(connection, prepare_swap(connection, "swap_books"))
+
+    assert query(
+        connection,
+        "SELECT polname, polpermissive, polcmd, pg_get_expr(polqual, polrelid) "
+        "FROM pg_policy WHERE polrelid = 'swap_books'::regclass",
+    ) == [("cheap", False, "r", "(price < (10)::numeric)")]
+    assert query(
+        connection,
+        "SELECT relrowsecurity, relforcerowsecurity, relreplident, "
+        "pg_get_userbyid(relowner) FROM pg_class WHERE oid = 'swap_books'::regclass",
+    ) == [(True, True, "i", "swap_books_owner")]
+    assert query(
+        connection,
+        "SELECT indexrelid::regclass::text FROM pg_index "
+        "WHERE indrelid = 'swap_books'::regclass AND indisreplident",
+    ) == [("swap_books_isbn_key",)]
+
+
+def test_prepare_swap_needs_the_target(connection):
+    with pytest.raises(ValueError, match="does not exist"):
+        prepare_swap(connection, "missing_books")
+
+
+def test_suffixed_keeps_the_suffix():
+    name = suffixed("b" * 70, "__nd_old")
+    assert len(name) == 63
+    assert name.endswith("__nd_old")
+
+
+def test_swap_continues_identity_columns(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE swap_books CASCADE")
+        cursor.execute(
+            "CREATE TABLE swap_books (id bigint GENERATED BY DEFAULT AS IDENTITY, "
+            "title text)"
+        )
+        cursor.execute("INSERT INTO swap_books (title) VALUES ('Dune'), ('Emma')")
+    connection.commit()
+    swap = prepare_swap(connection, "swap_books")
+    finish_swap(connection, swap)
+    assert query(
+        connection, "INSERT INTO swap_books (title) VALUES ('Beloved') RETURNING id"
+    ) == [(3,)]
@@ -0,0 +1,63 @@
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+from nextdata.core.glue.watermarks import (
+    WatermarkStore,
+    format_sql_literal,
+    incremental_filter,
+    serialize_watermark,
+)
+
+
+def test_format_sql_literal():
+    assert format_sql_literal(42) == "42"
+    assert format_sql_literal(Decimal("1.50")) == "1.50"
+    assert format_sql_literal("1024") == "'1024'"
+    assert format_sql_literal("00123") == "'00123'"
+    assert format_sql_literal(datetime(2024, 1, 2, 3, 4, 5)) == "'2024-01-02 03:04:05'"
+    assert format_sql_literal("2024-01-02 03:04:05") == "'2024-01-02 03:04:05'"
+    assert format_sql_literal("o'brien") == "'o''brien'"
+    assert format_sql_literal("NaN") == "'NaN'"
+
+
+def test_incremental_filter():
+    # First load has no low watermark, so NULLs are picked up once
+    assert (
+        incremental_filter("id", None, 100) == "(id <= 100 OR id IS NULL)"
+    ), "initial filter should only be bounded above"
+    assert incremental_filter("id", "50", 100) == "id > '50' AND id <= 100"
+    assert (
+        incremental_filter("created_at", "2024-01-01 00:00:00", datetime(2024, 1, 2))
+        == "created_at > '2024-01-01 00:00:00' AND created_at <= '2024-01-02 00:00:00'"
+    )
+
+
+def test_snapshot_properties_round_trip():
+    store = WatermarkStore(MagicMock())
+    properties = store.snapshot_properties("created_at", datetime(2024, 1, 2))
+    assert properties == {"nextdata.watermark.created_at": "2024-01-02 00:00:00"}
+    assert serialize_watermark(datetime(2024, 1, 2)) == "2024-01-02 00:00:00"
+
+
+def test_get_watermark():
+    spark_manager = MagicMock()
+    spark_manager.namespace = "test"
+    spark_manager.spark.catalog.tableExists.return_value = True
+    spark_manager.spark.sql.return_value.collect.return_value = [{"watermark": "99"}]
+
+    store = WatermarkStore(spark_manager)
+    assert store.get("test_table", "id") == "99"
+    query = spark_manager.spark.sql.call_args[0][0]
+    assert "s3tablesbucket.test.test_table.snapshots" in query
+    assert "summary['nextdata.watermark.id']" in query
+    assert "is_current_ancestor" in query
+
+
+def test_get_watermark_missing_table():
+    spark_manager = MagicMock()
+    spark_manager.spark.catalog.tableExists.return_value = False
+
+    store = WatermarkStore(spark_manager)
+    assert store.get("test_table", "id") is None
+    spark_manager.spark.sql.assert_not_called()
@@ -0,0 +1,223 @@
+import json
+import struct
+from unittest.mock import MagicMock, call, patch
+
+from nextdata.core.cdc import (
+    Change,
+    PgOutputDecoder,
+    ReplicationSlot,
+    Wal2JsonDecoder,
+    compact,
+    lsn_to_int,
+    merge_statement,
+    read_transactions,
+    sync_changes,
+)
+from nextdata.core.db.db_manager import DatabaseManager
+
+RELATION_ID = 16384
+
+
+def pg_tuple(*values):
+    data = struct.pack("!H", len(values))
+    for value in values:
+        if value is None:
+            data += b"n"
+        elif value is ...:
+            data += b"u"
+        else:
+            data += b"t" + struct.pack("!I", len(value)) + value.encode()
+    return data
+
+
+RELATION = (
+    b"R"
+    + struct.pack("!I", RELATION_ID)
+    + b"public\0books\0d"
+    + struct.pack("!H", 2)
+    + b"\x01id\0"
+    + struct.pack("!Ii", 20, -1)
+    + b"\x00title\0"
+    + struct.pack("!Ii", 25, -1)
+)
+BEGIN = b"B" + struct.pack("!QqI", 0, 0, 1)
+COMMIT = b"C" + struct.pack("!BQQq", 0, 0, 0, 0)
+
+
+def insert(*values):
+    return b"I" + struct.pack("!I", RELATION_ID) + b"N" + pg_tuple(*values)
+
+
+def update(old_key, *values):
+    old = b"K" + pg_tuple(*old_key) if old_key else b""
+    return b"U" + struct.pack("!I", RELATION_ID) + old + b"N" + pg_tuple(*values)
+
+
+def delete(*key):
+    return b"D" + struct.pack("!I", RELATION_ID) + b"K" + pg_tuple(*key)
+
+
+def test_lsn_to_int():
+    assert lsn_to_int("0/16B3748") == 0x16B3748
+    assert lsn_to_int("1/0") > lsn_to_int("0/FFFFFFFF")
+
+
+def test_pgoutput_decoder():
+    decoder = PgOutputDecoder()
+    assert decoder.decode(RELATION) is None
+    assert decoder.decode(BEGIN) == ("begin", None)
+
+    _, inserted = decoder.decode(insert("1", "Dune"))
+    assert inserted == Change("insert", "books", {"id": "1", "title": "Dune"})
+
+    _, updated = decoder.decode(update(("1", None), "2", ...))
+    assert updated.operation == "update"
+    assert updated.values == {"id": "2"}
+    assert updated.old_key == {"id": "1", "title": None}
+    assert updated.unchanged == {"title"}
+
+    _, deleted = decoder.decode(delete("2", None))
+    assert deleted.operation == "delete"
+    assert deleted.values == {"id": "2", "title": None}
+    assert decoder.decode(COMMIT) == ("commit", None)
+
+
+def test_wal2json_decoder():
+    decoder = Wal2JsonDecoder()
+    message = {
+        "action": "U",
+        "schema": "public",
+        "table": "books",
+        "columns": [
+            {"name": "id", "type": "bigint", "value": 1},
+            {"name": "title", "type": "text", "value": None},
+        ],
+        "identity": [{"name": "id", "type": "bigint", "value": 1}],
+    }
+    _, change = decoder.decode(json.dumps(message))
+    assert change == Change(
+        "update", "books", {"id": "1", "title": None}, old_key={"id": "1"}
+    )
+    assert decoder.decode('{"action": "C"}') == ("commit", None)
+
+
+def test_read_transactions_skips_applied_commits():
+    messages = [
+        ("0/10", RELATION),
+        ("0/10", BEGIN),
+        ("0/10", insert("1", "Dune")),
+        ("0/20", COMMIT),
+        ("0/30", BEGIN),
+        ("0/30", insert("2", "Emma")),
+        ("0/40", COMMIT),
+    ]
+    transactions = list(read_transactions(messages, "pgoutput", "books", "0/20"))
+    assert [t.commit_lsn for t in transactions] == ["0/40"]
+    assert transactions[0].changes[0].values == {"id": "2", "title": "Emma"}
+
+
+def test_compact_keeps_last_change_per_key():
+    changes = [
+        Change("insert", "books", {"id": "1", "title": "Dune"}),
+        Change("update", "books", {"id": "1"}, unchanged={"title"}),
+        Change("insert", "books", {"id": "2", "title": "Emma"}),
+        Change("delete", "books", {"id": "2"}),
+        # Key change: row 3 moves to 4
+        Change("update", "books", {"id": "4", "title": "Ulysses"}, old_key={"id": "3"}),
+    ]
+    compacted = compact(changes, ["id"])
+    assert compacted == [
+        # The unchanged title is filled in from the earlier insert
+        Change("update", "books", {"id": "1", "title": "Dune"}),
+        Change("delete", "books", {"id": "2"}),
+        Change("delete", "books", {"id": "3"}),
+        Change("update", "books", {"id": "4", "title": "Ulysses"}, old_key={"id": "3"}),
+    ]
+
+
+def test_merge_statement():
+    statement = merge_statement(
+        "s3tablesbucket.test.books",
+        "_cdc_books",
+        ["id"],
+        ["id", "title"],
+        {"ds": "current_date()"},
+    )
+    assert "ON t.id = s.id" in statement
+    assert "WHEN MATCHED AND s._op = 'delete' THEN DELETE" in statement
+    assert (
+        "title = CASE WHEN array_contains(s._unchanged, 'title') "
+        "THEN t.title ELSE s.title END"
+    ) in statement
+    assert "INSERT (id, title, ds) VALUES (s.id, s.title, current_date())" in statement
+
+
+@patch("nextdata.core.cdc.apply_changes")
+def test_sync_changes_saves_checkpoint_before_advancing(mock_apply_changes):
+    events = MagicMock()
+    slot = MagicMock(plugin="pgoutput", table_name="books")
+    slot.peek.return_value = [
+        ("0/10", RELATION),
+        ("0/10", BEGIN),
+        ("0/10", insert("1", "Dune")),
+        ("0/20", COMMIT),
+    ]
+    events.attach_mock(slot.advance, "advance")
+    events.attach_mock(mock_apply_changes, "apply_changes")
+
+    checkpoint = sync_changes(slot, MagicMock(), ["id"], None, events.save)
+
+    assert checkpoint == "0/20"
+    assert [name for name, _, _ in events.mock_calls] == [
+        "apply_changes",
+        "save",
+        "advance",
+    ]
+    events.save.assert_called_once_with("0/20")
+
+
+def test_cdc_checkpoint_survives_reset(tmp_path):
+    db_manager = DatabaseManager(tmp_path / "nextdata.db")
+    db_manager.create_all()
+    db_manager.set_cdc_checkpoint("books", "nextdata_books", "0/10")
+    db_manager.set_cdc_checkpoint("books", "nextdata_books", "0/20")
+    db_manager.reset()
+    assert db_manager.get_cdc_checkpoint("books").lsn == "0/20"
+    assert db_manager.get_cdc_checkpoint("missing") is None
+
+
+def test_replication_slot_against_postgres(postgres_dsn):
+    import psycopg2
+
+    connection = psycopg2.connect(postgres_dsn)
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS cdc_books")
+        cursor.execute("CREATE TABLE cdc_books (id bigint PRIMARY KEY, title text)")
+    slot = ReplicationSlot(connection, "nextdata_test_cdc_books", "cdc_books")
+    try:
+        assert slot.ensure()
+        assert not slot.ensure()
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO cdc_books VALUES (1, 'Dune'), (2, 'Emma')")
+            cursor.execute("UPDATE cdc_books SET title = 'Dune Messiah' WHERE id = 1")
+            cursor.execute("DELETE FROM cdc_books WHERE id = 2")
+
+        messages = slot.peek()
+        transactions = list(read_transactions(messages, "pgoutput", "cdc_books"))
+        changes = compact(
+            [change for t in transactions for change in t.changes], ["id"]
+        )
+        assert [(c.operation, c.values["id"]) for c in changes] == [
+            ("update", "1"),
+            ("delete", "2"),
+        ]
+        assert changes[0].values["title"] == "Dune Messiah"
+
+        # Peeking doesn't consume, advancing does
+        assert slot.peek() == messages
+        slot.advance(messages[-1][0])
+        assert slot.peek() == []
+    finally:
+        slot.drop()
+        connection.close()
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from nextdata.core.maintenance import (
+    MaintenanceThresholds,
+    TableMaintenance,
+    TableStats,
+)
+
+
+@pytest.fixture
+def maintenance():
+    return TableMaintenance(
+        MagicMock(), MaintenanceThresholds(small_files=10, manifests=5, snapshots=20)
+    )
+
+
+def test_due_actions(maintenance):
+    assert maintenance.due_actions(TableStats(data_files=8, small_files=8)) == []
+    assert maintenance.due_actions(
+        TableStats(small_files=3, delete_files=60, manifests=5, snapshots=3)
+    ) == ["rewrite_data_files", "rewrite_manifests"]
+    assert maintenance.due_actions(TableStats(snapshots=25)) == ["expire_snapshots"]
+
+
+def test_run_reports_before_and_after(maintenance):
+    before = TableStats(data_files=40, small_files=40, manifests=12, snapshots=12)
+    after = TableStats(data_files=2, manifests=1, snapshots=12)
+    spark_manager = maintenance.spark_manager
+    spark_manager.rewrite_data_files.return_value = {"rewritten_data_files_count": 40}
+    with patch.object(maintenance, "stats", side_effect=[before, after]):
+        report = maintenance.run("orders")
+
+    spark_manager.rewrite_data_files.assert_called_once()
+    spark_manager.rewrite_manifests.assert_called_once_with("orders")
+    spark_manager.expire_snapshots.assert_not_called()
+    assert report.results["rewrite_data_files"] == {"rewritten_data_files_count": 40}
+    assert str(report) == (
+        "orders: rewrite_data_files, rewrite_manifests (data files 40 -> 2, "
+        "delete files 0 -> 0, manifests 12 -> 1, snapshots 12 -> 12)"
+    )
+
+
+def test_dry_run_changes_nothing(maintenance):
+    with patch.object(maintenance, "stats", return_value=TableStats(snapshots=50)):
+        report = maintenance.run("orders", dry_run=True)
+
+    assert report.actions == ["expire_snapshots"]
+    assert report.after is None
+    maintenance.spark_manager.expire_snapshots.assert_not_called()
+
+
+def test_explicit_actions_run_in_order(maintenance):
+    with patch.object(maintenance, "stats", return_value=TableStats()):
+        report = maintenance.run(
+            "orders", ["remove_orphan_files", "rewrite_data_files"]
+        )
+
+    assert report.actions == ["rewrite_data_files", "remove_orphan_files"]
+    maintenance.spark_manager.remove_orphan_files.assert_called_once()
+    with pytest.raises(ValueError, match="Unknown maintenance actions"):
+        maintenance.run("orders", ["vacuum"])
+
+
+def test_expire_snapshots_keeps_latest_watermark(maintenance):
+    watermark_committed_at = datetime.now() - timedelta(days=30)
+    with patch.object(
+        maintenance, "protected_since", return_value=watermark_committed_at
+    ):
+        maintenance.run_action("orders", "expire_snapshots")
+
+    maintenance.spark_manager.expire_snapshots.assert_called_once_with(
+        "orders", watermark_committed_at, 10
+    )
+
+
+def test_expire_snapshots_uses_retention(maintenance):
+    with patch.object(
+        maintenance, "protected_since", return_value=datetime.now() - timedelta(hours=1)
+    ):
+        maintenance.run_action("orders", "expire_snapshots")
+
+    older_than = maintenance.spark_manager.expire_snapshots.call_args[0][1]
+    assert older_than < datetime.now() - timedelta(days=6)
@@ -0,0 +1,152 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from nextdata.util.data_files import (
+    SOURCE_FILE_COLUMN,
+    arrow_to_parquet,
+    changed_files,
+    chunk_batches,
+    data_files,
+    open_dataset,
+    scan_batches,
+    upload_format,
+)
+
+
+@pytest.fixture
+def directory(tmp_path):
+    (tmp_path / "a.csv").write_text("id,price\n1,2\n2,3\n")
+    (tmp_path / "b.csv").write_text("id,price,name\n3,2.5,x\n")
+    (tmp_path / "c.jsonl").write_text('{"id": 4, "price": 1.5, "name": "y"}\n')
+    pq.write_table(pa.table({"id": [5], "price": [9.0]}), tmp_path / "d.parquet")
+    (tmp_path / "notes.txt").write_text("not data")
+    return tmp_path
+
+
+def test_data_files_by_format(directory):
+    files = data_files(directory)
+    assert {name: [path.name for path in paths] for name, paths in files.items()} == {
+        "csv": ["a.csv", "b.csv"],
+        "json": ["c.jsonl"],
+        "parquet": ["d.parquet"],
+    }
+
+
+def test_open_dataset_unifies_schemas(directory):
+    dataset = open_dataset(data_files(directory))
+    # price is an integer in a.csv and a double elsewhere
+    assert dataset.schema == pa.schema(
+        [("id", pa.int64()), ("price", pa.float64()), ("name", pa.string())]
+    )
+    table = pa.Table.from_batches(scan_batches(dataset), dataset.schema)
+    assert sorted(table.column("id").to_pylist()) == [1, 2, 3, 4, 5]
+    assert sorted(table.column("price").to_pylist()) == [1.5, 2.0, 2.5, 3.0, 9.0]
+
+
+def test_open_dataset_with_table_schema(directory):
+    schema = pa.schema([("id", pa.int64()), ("price", pa.float64())])
+    dataset = open_dataset(data_files(directory), schema)
+    table = pa.Table.from_batches(scan_batches(dataset), schema)
+    assert table.schema == schema
+    assert table.num_rows == 5
+
+
+def test_open_dataset_reads_multiline_csv_values(tmp_path):
+    note = "first line\nsecond line " + "x" * 100
+    # Larger than a CSV block, so values span block boundaries
+    rows = "".join(f'{i},"{note}"\n' for i in range(20000))
+    (tmp_path / "notes.csv").write_text("id,note\n" + rows)
+    dataset = open_dataset(data_files(tmp_path))
+    assert dataset.schema == pa.schema([("id", pa.int64()), ("note", pa.string())])
+    table = pa.Table.from_batches(scan_batches(dataset), dataset.schema)
+    assert sorted(table.column("id").to_pylist()) == list(range(20000))
+    assert set(table.column("note").to_pylist()) == {note}
+
+
+def test_open_dataset_needs_files():
+    with pytest.raises(ValueError, match="No data files"):
+        open_dataset({})
+
+
+def test_chunk_batches_bounds_chunk_size():
+    schema = pa.schema([("id", pa.int64())])
+    batches = [
+        pa.record_batch([pa.array(range(i * 100, (i + 1) * 100))], schema=schema)
+        for i in range(10)
+    ]
+    chunks = list(chunk_batches(batches, schema, chunk_bytes=2000))
+    # Each batch of 100 int64s is 800 bytes, so chunks close after three
+    assert [chunk.num_rows for chunk in chunks] == [300, 300, 300, 100]
+    assert sum(chunk.num_rows for chunk in chunks) == 1000
+
+
+def test_scan_batches_records_source_file(directory):
+    schema = pa.schema(
+        [("id", pa.int64()), (SOURCE_FILE_COLUMN, pa.string()), ("name", pa.string())]
+    )
+    dataset = open_dataset(data_files(directory), schema)
+    table = pa.Table.from_batches(scan_batches(dataset, SOURCE_FILE_COLUMN), schema)
+    assert sorted(
+        zip(
+            table.column("id").to_pylist(), table.column(SOURCE_FILE_COLUMN).to_pylist()
+        )
+    ) == [(1, "a.csv"), (2, "a.csv"), (3, "b.csv"), (4, "c.jsonl"), (5, "d.parquet")]
+
+
+def test_changed_files(directory):
+    states, changed = changed_files(data_files(directory), {})
+    assert sorted(path.name for path in changed) == [
+        "a.csv",
+        "b.csv",
+        "c.jsonl",
+        "d.parquet",
+    ]
+    synced = {state.name: state for state in states}
+
+    # Touched without changing its contents
+    a = directory / "a.csv"
+    os.utime(a, (synced["a.csv"].mtime + 10, synced["a.csv"].mtime + 10))
+    (directory / "b.csv").write_text("id,price,name\n3,2.5,z\n")
+    (directory / "e.csv").write_text("id\n6\n")
+    states, changed = changed_files(data_files(directory), synced)
+
+    assert sorted(path.name for path in changed) == ["b.csv", "e.csv"]
+    # The touched file's new mtime is recorded, so it isn't hashed again
+    assert sorted(state.name for state in states) == ["a.csv", "b.csv", "e.csv"]
+    assert all(state.content_hash for state in states)
+
+
+@pytest.mark.parametrize(
+    "filename, expected",
+    [
+        ("books.csv", ("csv", ".csv")),
+        ("Books.CSV.GZ", ("csv", ".csv.gz")),
+        ("books.parquet", ("parquet", ".parquet")),
+        ("books.arrow", ("arrow", ".arrow")),
+        ("books.feather", ("arrow", ".feather")),
+    ],
+)
+def test_upload_format(filename, expected):
+    assert upload_format(filename) == expected
+
+
+def test_upload_format_rejects_unknown_files():
+    with pytest.raises(ValueError, match="Unsupported file books.xlsx"):
+        upload_format("books.xlsx")
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_arrow_to_parquet(tmp_path, stream):
+    table = pa.table({"id": list(range(10)), "title": [str(i) for i in range(10)]})
+    source = tmp_path / "books.arrow"
+    with pa.OSFile(str(source), "wb") as sink:
+        new_writer = pa.ipc.new_stream if stream else pa.ipc.new_file
+        with new_writer(sink, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=3):
+                writer.write_batch(batch)
+
+    assert arrow_to_parquet(source, tmp_path / "books.parquet") == 10
+    assert pq.read_table(tmp_path / "books.parquet").equals(table)
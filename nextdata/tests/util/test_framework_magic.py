@@ -0,0 +1,29 @@
+import os
+
+from nextdata.util.framework_magic import (
+    get_partition_settings,
+    get_source_options,
+    get_write_settings,
+)
+
+
+def test_settings_are_read_from_one_import(tmp_path):
+    etl = tmp_path / "etl.py"
+    imports = tmp_path / "imports.txt"
+    etl.write_text(
+        f"open({str(imports)!r}, 'a').write('x')\n"
+        "write_mode = 'merge'\n"
+        "max_partitions = 8\n"
+    )
+
+    assert get_write_settings(etl)["write_mode"] == "merge"
+    assert get_partition_settings(etl)["max_partitions"] == 8
+    assert get_source_options(etl)["columns"] is None
+    assert imports.read_text() == "x"
+
+    # An edited etl.py is imported again
+    etl.write_text(etl.read_text().replace("'merge'", "'append'"))
+    stat = etl.stat()
+    os.utime(etl, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert get_write_settings(etl)["write_mode"] == "append"
+    assert imports.read_text() == "xx"
@@ -0,0 +1,95 @@
+import gzip
+
+import pyarrow as pa
+import pytest
+
+from nextdata.util.schema_inference import (
+    infer_csv_schema,
+    infer_type,
+    sample_csv,
+    spark_schema,
+)
+
+
+@pytest.mark.parametrize(
+    "values, expected",
+    [
+        (["true", "False", None], pa.bool_()),
+        (["1", "-2", ""], pa.int64()),
+        (["1.25", "3", "-0.5"], pa.decimal128(38, 2)),
+        (["0.1234567890123"], pa.float64()),
+        (["1e-3", "2.5"], pa.float64()),
+        (["1.5", "NaN", "Inf", "-Inf", "+Infinity"], pa.float64()),
+        # Spark doesn't parse these as doubles
+        (["1.5", "nan", "inf"], pa.string()),
+        (["2024-01-31", "2023-12-01"], pa.date32()),
+        (["2024-02-30"], pa.string()),
+        (["2024-01-31 10:00:00", "2024-01-31T10:00"], pa.timestamp("us")),
+        (["2024-01-31T10:00:00Z"], pa.timestamp("us", tz="UTC")),
+        (["12345678901234567890123"], pa.decimal128(38, 0)),
+        (["1", "one"], pa.string()),
+        ([None, ""], pa.string()),
+    ],
+)
+def test_infer_type(values, expected):
+    assert infer_type(pa.chunked_array([pa.array(values, pa.string())])) == expected
+
+
+@pytest.fixture
+def large_csv(tmp_path):
+    # Integers up front, a string value only far into the file
+    lines = ["id,code,price"]
+    lines += [f"{i},{i},{i}.5" for i in range(50000)]
+    lines += [f"{i},x{i},{i}.5" for i in range(50000, 100000)]
+    path = tmp_path / "large.csv"
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_sample_csv_reads_blocks_past_the_head(large_csv):
+    head, blocks = sample_csv(large_csv, head_bytes=64 * 1024, block_bytes=4096)
+    assert head.startswith(b"id,code,price\n")
+    assert head.endswith(b"\n")
+    assert len(blocks) == 16
+    # Blocks start and end on line boundaries
+    assert all(
+        block.endswith(b"\n") and block.split(b"\n")[0].count(b",") == 2
+        for block in blocks
+    )
+
+
+def test_infer_csv_schema_samples_the_whole_file(large_csv):
+    assert infer_csv_schema(large_csv, head_bytes=64 * 1024, block_bytes=4096) == (
+        pa.schema(
+            [
+                ("id", pa.int64()),
+                ("code", pa.string()),
+                ("price", pa.decimal128(38, 1)),
+            ]
+        )
+    )
+    # The head alone misses the strings
+    assert (
+        infer_csv_schema(large_csv, head_bytes=64 * 1024, blocks=0).field("code").type
+        == pa.int64()
+    )
+
+
+def test_spark_schema_keeps_timestamps_naive(tmp_path):
+    path = tmp_path / "events.csv"
+    path.write_text("at,at_utc\n2024-01-31 10:00:00,2024-01-31T10:00:00Z\n")
+    assert spark_schema(infer_csv_schema(path)) == {
+        "at": "TIMESTAMP_NTZ",
+        "at_utc": "TIMESTAMP",
+    }
+
+
+def test_infer_gzipped_csv_schema(tmp_path):
+    path = tmp_path / "books.csv.gz"
+    with gzip.open(path, "wt") as file:
+        file.write("id,title,published\n1,Dune,1965-08-01\n2,Emma,1815-12-23\n")
+    assert spark_schema(infer_csv_schema(path)) == {
+        "id": "LONG",
+        "title": "STRING",
+        "published": "DATE",
+    }
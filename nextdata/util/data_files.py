@@ -0,0 +1,245 @@
+"""
+Reading local data files as streams of Arrow record batches.
+
+CSV, Parquet and newline-delimited JSON files are scanned with
+pyarrow.dataset, which reads several files at once and never holds more
+than its readahead window of batches in memory. Batches are then grouped
+into tables of a bounded size, so each write to Iceberg commits a
+reasonably sized file without the whole directory being loaded first.
+
+A synced table records which file each of its rows came from, and the
+size, mtime and content hash of each file when it was synced. Only new and
+changed files are read again.
+"""
+
+from dataclasses import dataclass
+import hashlib
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from nextdata.util.schema_inference import infer_csv_schema
+
+# Format of each file extension pyarrow.dataset can read
+FILE_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".json": "json",
+    ".ndjson": "json",
+    ".jsonl": "json",
+}
+
+# CSV values may hold quoted line breaks
+CSV_FORMAT = ds.CsvFileFormat(parse_options=pv.ParseOptions(newlines_in_values=True))
+
+# Rows read per batch, and how far ahead batches and files are read
+BATCH_ROWS = 64 * 1024
+BATCH_READAHEAD = 4
+FILE_READAHEAD = 4
+
+# Size of each table handed to the writer
+DEFAULT_CHUNK_BYTES = 128 * 1024 * 1024
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+# Column of synced tables holding the name of the file each row came from
+SOURCE_FILE_COLUMN = "_source_file"
+
+
+@dataclass
+class FileState:
+    """What a data file looked like when it was last synced"""
+
+    name: str
+    size: int
+    mtime: float
+    content_hash: Optional[str] = None
+
+
+def file_state(path: Path) -> FileState:
+    stat = path.stat()
+    return FileState(path.name, stat.st_size, stat.st_mtime)
+
+
+def content_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(HASH_BLOCK_BYTES):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def changed_files(
+    files: dict[str, list[Path]], synced: dict[str, FileState]
+) -> tuple[list[FileState], list[Path]]:
+    """
+    States of files that are new or whose contents changed since they were
+    synced, and their paths. Only files whose size or mtime changed are
+    hashed, a file that was only touched is reported with its new mtime
+    but not as changed.
+    """
+    states, changed = [], []
+    for paths in files.values():
+        for path in paths:
+            state = file_state(path)
+            previous = synced.get(state.name)
+            if (
+                previous
+                and previous.size == state.size
+                and previous.mtime == state.mtime
+            ):
+                continue
+            state.content_hash = content_hash(path)
+            states.append(state)
+            if not previous or previous.content_hash != state.content_hash:
+                changed.append(path)
+    return states, changed
+
+
+def data_files(directory: Path) -> dict[str, list[Path]]:
+    """Readable files directly in directory, by format"""
+    files: dict[str, list[Path]] = {}
+    for path in sorted(Path(directory).iterdir()):
+        file_format = FILE_FORMATS.get(path.suffix.lower())
+        if file_format and path.is_file():
+            files.setdefault(file_format, []).append(path)
+    return files
+
+
+def open_dataset(
+    files: dict[str, list[Path]], schema: Optional[pa.Schema] = None
+) -> ds.Dataset:
+    """
+    One dataset over files of any supported format. Without a schema, the
+    schemas inferred from each file are unified, widening types that
+    disagree, e.g. an integer column in one file and a double in another.
+    """
+    if not files:
+        raise ValueError("No data files to read")
+    if schema is None:
+        # CSVs are sampled throughout, JSON files only read at their start
+        schema = pa.unify_schemas(
+            [
+                (
+                    infer_csv_schema(path)
+                    if file_format == "csv"
+                    else ds.dataset(str(path), format=file_format).schema
+                )
+                for file_format, paths in files.items()
+                for path in paths
+            ],
+            promote_options="permissive",
+        )
+    datasets = [
+        ds.dataset(
+            [str(path) for path in paths],
+            format=CSV_FORMAT if file_format == "csv" else file_format,
+            schema=schema,
+        )
+        for file_format, paths in files.items()
+    ]
+    return datasets[0] if len(datasets) == 1 else ds.dataset(datasets, schema=schema)
+
+
+def scan_batches(
+    dataset: ds.Dataset, source_column: Optional[str] = None
+) -> Iterator[pa.RecordBatch]:
+    """
+    The dataset's rows in batches, reading FILE_READAHEAD files in parallel.
+
+    With source_column, that column of each batch is set to the name of the
+    file its rows were read from.
+    """
+    scanner = dataset.scanner(
+        batch_size=BATCH_ROWS,
+        batch_readahead=BATCH_READAHEAD,
+        fragment_readahead=FILE_READAHEAD,
+        use_threads=True,
+    )
+    if source_column is None:
+        yield from scanner.to_batches()
+        return
+    index = dataset.schema.get_field_index(source_column)
+    column_type = dataset.schema.field(source_column).type
+    for tagged in scanner.scan_batches():
+        batch = tagged.record_batch
+        # A batch never spans files
+        yield batch.set_column(
+            index,
+            source_column,
+            pa.array(
+                [Path(tagged.fragment.path).name] * batch.num_rows, type=column_type
+            ),
+        )
+
+
+def chunk_batches(
+    batches: Iterable[pa.RecordBatch],
+    schema: pa.Schema,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+) -> Iterator[pa.Table]:
+    """Group batches into tables of about chunk_bytes each"""
+    buffered: list[pa.RecordBatch] = []
+    size = 0
+    for batch in batches:
+        if not batch.num_rows:
+            continue
+        buffered.append(batch)
+        size += batch.nbytes
+        if size >= chunk_bytes:
+            yield pa.Table.from_batches(buffered, schema)
+            buffered, size = [], 0
+    if buffered:
+        yield pa.Table.from_batches(buffered, schema)
+
+
+# Format and the suffix an uploaded file is stored with, by file name ending.
+# Gzipped CSVs keep their .gz suffix, which is how Spark knows to
+# decompress them.
+UPLOAD_FORMATS = {
+    ".csv": ("csv", ".csv"),
+    ".csv.gz": ("csv", ".csv.gz"),
+    ".parquet": ("parquet", ".parquet"),
+    ".arrow": ("arrow", ".arrow"),
+    ".arrows": ("arrow", ".arrows"),
+    ".feather": ("arrow", ".feather"),
+    ".ipc": ("arrow", ".ipc"),
+}
+
+
+def upload_format(filename: str) -> tuple[str, str]:
+    """Format and suffix of an uploaded file, from its name"""
+    name = filename.lower()
+    for ending, upload in sorted(
+        UPLOAD_FORMATS.items(), key=lambda item: -len(item[0])
+    ):
+        if name.endswith(ending):
+            return upload
+    raise ValueError(
+        f"Unsupported file {filename}, expected one of {', '.join(UPLOAD_FORMATS)}"
+    )
+
+
+def arrow_to_parquet(source: Path, destination: Path) -> int:
+    """
+    Rewrite an Arrow IPC file or stream as Parquet, which Spark can read,
+    one record batch at a time. Returns the number of rows.
+    """
+    rows = 0
+    with pa.memory_map(str(source)) as file:
+        try:
+            reader = pa.ipc.open_file(file)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            file.seek(0)
+            reader = pa.ipc.open_stream(file)
+            batches = iter(reader)
+        with pq.ParquetWriter(str(destination), reader.schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    return rows
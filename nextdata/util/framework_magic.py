@@ -1,17 +1,34 @@
+from functools import lru_cache
 from pathlib import Path
 import importlib.util
+from types import ModuleType
+from typing import Any, Optional
 
 from nextdata.core.glue.connections.generic_connection import (
     GenericConnectionGlueJobArgs,
 )
 
 
+@lru_cache(maxsize=None)
+def _exec_etl_module(file_path: Path, mtime_ns: int) -> ModuleType:
+    spec = importlib.util.spec_from_file_location("etl_module", file_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_etl_module(file_path: Path) -> ModuleType:
+    """
+    Import an etl.py or retl.py for its settings. Each version of the file is
+    executed once, however many settings are read from it.
+    """
+    return _exec_etl_module(file_path, file_path.stat().st_mtime_ns)
+
+
 def has_custom_glue_job(file_path: Path) -> bool:
     if file_path.exists():
         # Check if the etl.py file has a @glue_job decorator by importing and inspecting
-        spec = importlib.util.spec_from_file_location("etl_module", file_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+        module = load_etl_module(file_path)
 
         for attr_name in dir(module):
             attr = getattr(module, attr_name)
@@ -24,9 +41,7 @@ def has_custom_glue_job(file_path: Path) -> bool:
 
 
 def get_connection_name(file_path: Path) -> str:
-    spec = importlib.util.spec_from_file_location("etl_module", file_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    module = load_etl_module(file_path)
     connection_name = getattr(module, "connection_name", None)
     return connection_name
 
@@ -65,7 +80,110 @@ def get_connection_args(
 
 
 def get_incremental_column(file_path: Path) -> str:
-    spec = importlib.util.spec_from_file_location("etl_module", file_path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    module = load_etl_module(file_path)
     return getattr(module, "incremental_column", "created_at")
+
+
+def get_partition_settings(file_path: Path) -> dict[str, Optional[int]]:
+    """
+    Optional max_partitions, target_partition_bytes and checkpoint_partitions
+    overrides from etl.py
+    """
+    module = load_etl_module(file_path)
+    return {
+        "max_partitions": getattr(module, "max_partitions", None),
+        "target_partition_bytes": getattr(module, "target_partition_bytes", None),
+        "checkpoint_partitions": getattr(module, "checkpoint_partitions", None),
+    }
+
+
+def get_extraction_engine(file_path: Path) -> str:
+    module = load_etl_module(file_path)
+    return getattr(module, "extraction_engine", "jdbc")
+
+
+def get_write_settings(file_path: Path) -> dict[str, Optional[str]]:
+    """
+    write_mode ("append" or "merge") for incremental loads and the
+    merge_strategy ("copy-on-write" or "merge-on-read") from etl.py
+    """
+    module = load_etl_module(file_path)
+    return {
+        "write_mode": getattr(module, "write_mode", "append"),
+        "merge_strategy": getattr(module, "merge_strategy", None),
+    }
+
+
+def get_table_layout(file_path: Path) -> dict[str, Optional[list[str]]]:
+    """
+    partition_by transforms (days(created_at), bucket(16, id), ds, ...) and
+    the sort_order writes are ordered by, from etl.py. Tables are partitioned
+    by the ds load date unless etl.py says otherwise.
+    """
+    module = load_etl_module(file_path)
+    return {
+        "partition_by": getattr(module, "partition_by", ["ds"]),
+        "sort_order": getattr(module, "sort_order", None),
+    }
+
+
+def get_write_tuning(file_path: Path) -> dict[str, Optional[dict[str, Any]]]:
+    """
+    Optional target_file_size_bytes, distribution_mode ("none", "hash" or
+    "range"), compression_codec and row_group_size_bytes from etl.py
+    """
+    module = load_etl_module(file_path)
+    settings = {
+        name: getattr(module, name, None)
+        for name in (
+            "target_file_size_bytes",
+            "distribution_mode",
+            "compression_codec",
+            "row_group_size_bytes",
+        )
+    }
+    return {
+        "write_tuning": {
+            name: value for name, value in settings.items() if value is not None
+        }
+        or None
+    }
+
+
+def get_expectations(file_path: Path) -> dict[str, Optional[list[dict[str, Any]]]]:
+    """
+    Data quality expectations from etl.py, checked during each load. See
+    nextdata.core.glue.expectations for the checks.
+    """
+    module = load_etl_module(file_path)
+    return {"expectations": getattr(module, "expectations", None)}
+
+
+def get_retl_settings(file_path: Path) -> dict[str, Any]:
+    """
+    retl_mode ("overwrite", "swap", "append" or "incremental") and the
+    max_connections opened to the target database, from retl.py
+    """
+    module = load_etl_module(file_path)
+    return {
+        "retl_mode": getattr(module, "retl_mode", "overwrite"),
+        "max_connections": getattr(module, "max_connections", None),
+    }
+
+
+def get_cdc_settings(file_path: Path) -> dict[str, str]:
+    """ingestion_mode ("batch" or "cdc") and cdc_plugin from etl.py"""
+    module = load_etl_module(file_path)
+    return {
+        "ingestion_mode": getattr(module, "ingestion_mode", "batch"),
+        "cdc_plugin": getattr(module, "cdc_plugin", "pgoutput"),
+    }
+
+
+def get_source_options(file_path: Path) -> dict[str, Any]:
+    """columns to project and source_filter to push down to the source, from etl.py"""
+    module = load_etl_module(file_path)
+    return {
+        "columns": getattr(module, "columns", None),
+        "source_filter": getattr(module, "source_filter", None),
+    }
@@ -0,0 +1,206 @@
+"""
+Sampled schema inference for CSV files.
+
+Spark's inferSchema and pyarrow's CSV reader either read the whole file or
+only its first block. Here the types are inferred from the first
+SAMPLE_HEAD_BYTES of the file plus SAMPLE_BLOCKS blocks from random offsets
+in the rest of it, so a column that only turns out to be a string halfway
+through is still caught, without reading the whole file. Gzipped files
+can't be read from an offset, so only their head is sampled.
+
+Every sampled value is read as a string and each column gets the narrowest
+type all its values parse as: boolean, long, decimal, double, date,
+timestamp or string. Fixed-point numbers become decimals with room for
+any integer part, so they keep their exact values.
+"""
+
+import gzip
+import io
+import random
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+SAMPLE_HEAD_BYTES = 4 * 1024 * 1024
+SAMPLE_BLOCKS = 16
+SAMPLE_BLOCK_BYTES = 256 * 1024
+
+# Decimals with more digits after the point are read as doubles
+MAX_DECIMAL_SCALE = 9
+DECIMAL_PRECISION = 38
+
+BOOLEAN_PATTERN = r"^(?i:true|false)$"
+INTEGER_PATTERN = r"^[+-]?\d{1,18}$"
+DECIMAL_PATTERN = r"^[+-]?(\d+\.?\d*|\.\d+)$"
+# Besides numbers, the special values Spark's CSV reader parses as doubles:
+# NaN, Inf and -Inf, and Java's Infinity, all case-sensitive
+SPECIAL_DOUBLES = r"NaN|-?Inf|[+-]?Infinity"
+DOUBLE_PATTERN = rf"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$|^({SPECIAL_DOUBLES})$"
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+TIMESTAMP_PATTERN = r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d{1,9})?)?$"
+TIMESTAMP_TZ_PATTERN = (
+    r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d{1,9})?)?(Z|[+-]\d{2}:?\d{2})$"
+)
+
+# Spark SQL type of each inferred Arrow type
+SPARK_TYPES = {
+    pa.bool_(): "BOOLEAN",
+    pa.int64(): "LONG",
+    pa.float64(): "DOUBLE",
+    pa.date32(): "DATE",
+    # Spark's TIMESTAMP is in the session time zone, naive values stay naive
+    pa.timestamp("us"): "TIMESTAMP_NTZ",
+    pa.timestamp("us", tz="UTC"): "TIMESTAMP",
+    pa.string(): "STRING",
+}
+
+
+def _lines(block: bytes, partial_start: bool) -> bytes:
+    """The complete lines of a block read from some offset in a file"""
+    if partial_start:
+        block = block[block.find(b"\n") + 1 :] if b"\n" in block else b""
+    end = block.rfind(b"\n")
+    return block[: end + 1] if end >= 0 else b""
+
+
+def sample_csv(
+    path: Path,
+    head_bytes: int = SAMPLE_HEAD_BYTES,
+    blocks: int = SAMPLE_BLOCKS,
+    block_bytes: int = SAMPLE_BLOCK_BYTES,
+    seed: Optional[int] = 0,
+) -> tuple[bytes, list[bytes]]:
+    """
+    The head of a CSV file, header included, and the complete lines of
+    blocks read from random offsets after it. Small files are read whole.
+    """
+    path = Path(path)
+    compressed = path.name.lower().endswith(".gz")
+    with (gzip.open if compressed else open)(path, "rb") as file:
+        head = file.read(head_bytes)
+        if len(head) < head_bytes:
+            # The whole file, the last line may not end in a newline
+            return head, []
+        head = _lines(head, partial_start=False)
+        size = path.stat().st_size
+        if compressed or size <= head_bytes + block_bytes:
+            return head, []
+        rng = random.Random(seed)
+        offsets = sorted(
+            rng.sample(
+                range(head_bytes, size - block_bytes),
+                min(blocks, (size - head_bytes) // block_bytes),
+            )
+        )
+        samples = []
+        for offset in offsets:
+            file.seek(offset)
+            samples.append(_lines(file.read(block_bytes), partial_start=True))
+    return head, [sample for sample in samples if sample]
+
+
+def _read_strings(data: bytes, column_names: Optional[list[str]] = None) -> pa.Table:
+    """
+    Parse CSV bytes with every column as a string. Without column_names the
+    first line is the header.
+    """
+    skip_rows = 0
+    if column_names is None:
+        column_names = pv.read_csv(
+            io.BytesIO(data.split(b"\n", 1)[0] + b"\n")
+        ).column_names
+        skip_rows = 1
+    return pv.read_csv(
+        io.BytesIO(data),
+        read_options=pv.ReadOptions(column_names=column_names, skip_rows=skip_rows),
+        parse_options=pv.ParseOptions(newlines_in_values=True),
+        convert_options=pv.ConvertOptions(
+            column_types={name: pa.string() for name in column_names},
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def _all_match(values: pa.ChunkedArray, pattern: str) -> bool:
+    return pc.all(pc.match_substring_regex(values, pattern)).as_py()
+
+
+def _parses_as(values: pa.ChunkedArray, arrow_type: pa.DataType) -> bool:
+    try:
+        values.cast(arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return False
+    return True
+
+
+def infer_type(values: pa.ChunkedArray) -> pa.DataType:
+    """Narrowest type every non-null value of a string column parses as"""
+    values = pc.utf8_trim_whitespace(values.drop_null())
+    values = values.filter(pc.not_equal(values, ""))
+    if len(values) == 0:
+        return pa.string()
+    if _all_match(values, BOOLEAN_PATTERN):
+        return pa.bool_()
+    if _all_match(values, INTEGER_PATTERN):
+        return pa.int64()
+    if _all_match(values, DECIMAL_PATTERN):
+        scale = pc.max(
+            pc.utf8_length(pc.replace_substring_regex(values, r"^[^.]*\.?", ""))
+        ).as_py()
+        if scale <= MAX_DECIMAL_SCALE:
+            return pa.decimal128(DECIMAL_PRECISION, scale)
+    if _all_match(values, DOUBLE_PATTERN):
+        return pa.float64()
+    if _all_match(values, DATE_PATTERN) and _parses_as(values, pa.date32()):
+        return pa.date32()
+    if _all_match(values, TIMESTAMP_PATTERN) and _parses_as(values, pa.timestamp("us")):
+        return pa.timestamp("us")
+    if _all_match(values, TIMESTAMP_TZ_PATTERN) and _parses_as(
+        values, pa.timestamp("us", tz="UTC")
+    ):
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
+
+
+def infer_csv_schema(path: Path, **sample_options) -> pa.Schema:
+    """Arrow schema of a CSV file, inferred from a sample of it"""
+    head, blocks = sample_csv(path, **sample_options)
+    table = _read_strings(head)
+    columns = {name: [table.column(name)] for name in table.column_names}
+    for block in blocks:
+        try:
+            sample = _read_strings(block, column_names=table.column_names)
+        except pa.ArrowInvalid:
+            # Started inside a quoted value that spans lines
+            continue
+        for name in table.column_names:
+            columns[name].append(sample.column(name))
+    return pa.schema(
+        [
+            (
+                name,
+                infer_type(
+                    pa.chunked_array(
+                        [chunk for column in chunks for chunk in column.chunks],
+                        type=pa.string(),
+                    )
+                ),
+            )
+            for name, chunks in columns.items()
+        ]
+    )
+
+
+def spark_type(arrow_type: pa.DataType) -> str:
+    """Spark SQL type for an inferred Arrow type"""
+    if pa.types.is_decimal(arrow_type):
+        return f"DECIMAL({arrow_type.precision},{arrow_type.scale})"
+    return SPARK_TYPES.get(arrow_type, "STRING")
+
+
+def spark_schema(schema: pa.Schema) -> dict[str, str]:
+    """Column names and Spark SQL types, as in SparkSchemaSpec"""
+    return {field.name: spark_type(field.type) for field in schema}